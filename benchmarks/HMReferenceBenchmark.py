@@ -0,0 +1,265 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2024 Huimao Chen
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# https://github.com/chenhuimao/HMLLDB
+
+# Benchmark the scanner of HMReference with the synthetic images of HMReferenceCorpus, no device or process is required.
+# The scanner reads the image through HMReference.HMTargetMemory from a stand-in target, the SB API is not called, but the lldb module must be importable.
+#
+# Usage:
+#   python3 benchmarks/HMReferenceBenchmark.py [--instructions <count>] [--seed <seed>] [--repeat <count>] [--numpy]
+#                                              [--json <path>] [--baseline <path>] [--tolerance <ratio>]
+#
+# Examples:
+#   python3 benchmarks/HMReferenceBenchmark.py
+#   python3 benchmarks/HMReferenceBenchmark.py -i 2000000 -r 5 --json result.json
+#   python3 benchmarks/HMReferenceBenchmark.py --baseline result.json --tolerance 0.2
+
+from typing import Callable, Dict, List, Optional, Tuple
+import json
+import optparse
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+def import_lldb() -> None:
+    # The lldb module is not in the default path, ask lldb for it, such as "lldb -P" on Linux or "xcrun lldb -P" on macOS
+    try:
+        import lldb
+        return
+    except ImportError:
+        pass
+    for command in (["lldb", "-P"], ["xcrun", "lldb", "-P"]):
+        try:
+            lldb_python_path = subprocess.run(command, capture_output=True, text=True, timeout=30).stdout.strip()
+        except (OSError, subprocess.SubprocessError):
+            continue
+        if lldb_python_path and os.path.isdir(lldb_python_path):
+            sys.path.append(lldb_python_path)
+            try:
+                import lldb
+                return
+            except ImportError:
+                sys.path.remove(lldb_python_path)
+    print("Unable to import the lldb module. Please install lldb with the Python bindings, or add its path to PYTHONPATH.")
+    sys.exit(2)
+
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "commands"))
+import_lldb()
+import lldb
+import HMReference
+import HMReferenceIndex
+import HMReferenceScanner
+import HMReferenceCorpus
+
+
+class HMBenchmarkTarget(lldb.SBTarget):
+    # A stand-in of SBTarget that serves ReadMemory from the regions of a synthetic image, it is passed to HMReference.HMTargetMemory
+    region_list: List[Tuple[int, bytes]]  # [(start_address, data)]
+
+    def __init__(self, corpus: HMReferenceCorpus.HMReferenceCorpus):
+        super().__init__()
+        # The code is followed by zeros, so reading the instructions after the last adr/adrp succeeds like reading the following section of a real image
+        self.region_list = [(corpus.code_address, corpus.code + bytes(HMReferenceScanner.adrp_look_ahead_size)), (corpus.data_address, corpus.data)]
+
+    def ReadMemory(self, address: lldb.SBAddress, size: int, error: lldb.SBError) -> Optional[bytes]:
+        # The same signature as SBTarget.ReadMemory. The address has no section because the stand-in target is invalid, so its offset is the load address.
+        # Returns fewer bytes when reading beyond the end of a region
+        address_int = address.GetOffset()
+        for start_address, data in self.region_list:
+            if start_address <= address_int < start_address + len(data):
+                return data[address_int - start_address:address_int - start_address + size]
+        error.SetErrorString(f"memory read failed for {hex(address_int)}")
+        return None
+
+
+def create_recorder(corpus: HMReferenceCorpus.HMReferenceCorpus) -> HMReferenceIndex.HMReferenceRecorder:
+    return HMReferenceIndex.HMReferenceRecorder(corpus.code_address, corpus.image_range)
+
+
+def run_scan(corpus: HMReferenceCorpus.HMReferenceCorpus, use_numpy: bool) -> int:
+    # Scan the code in snippets like "reference", return the number of records
+    memory = HMReference.HMTargetMemory(HMBenchmarkTarget(corpus))
+    recorder = create_recorder(corpus)
+    code_end_address = corpus.code_address + len(corpus.code)
+    span = 4 * 10000
+    current_address = corpus.code_address
+    while current_address < code_end_address:
+        HMReferenceScanner.instruction_analysis(memory, current_address, min(current_address + span, code_end_address), recorder, use_numpy, code_end_address)
+        current_address += span
+    return len(recorder)
+
+
+def run_adrp_logic(corpus: HMReferenceCorpus.HMReferenceCorpus, use_numpy: bool) -> int:
+    # Analyze every adr/adrp instruction with the following instructions, return the number of records
+    memory = HMReference.HMTargetMemory(HMBenchmarkTarget(corpus))
+    recorder = create_recorder(corpus)
+    code = memoryview(corpus.code)
+    look_ahead_size = HMReferenceScanner.adrp_look_ahead_size
+    for offset in corpus.adr_offset_list:
+        HMReferenceScanner.record_adrp_logic(memory, code[offset:offset + 4], corpus.code_address + offset, recorder, code[offset + 4:offset + 4 + look_ahead_size])
+    return len(recorder)
+
+
+def measure(case_function: Callable[[HMReferenceCorpus.HMReferenceCorpus, bool], int], corpus: HMReferenceCorpus.HMReferenceCorpus, use_numpy: bool, repeat: int) -> Tuple[float, int, int]:
+    # Return (the best time in seconds, the number of records, the peak of the allocated memory in bytes)
+    # The instructions per second of record_adrp_logic counts the adr/adrp instructions only
+    # The memory is measured in a separate run, tracemalloc slows down the code
+    best_time = float('inf')
+    record_count = 0
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        record_count = case_function(corpus, use_numpy)
+        best_time = min(best_time, time.perf_counter() - start_time)
+    tracemalloc.start()
+    case_function(corpus, use_numpy)
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best_time, record_count, peak_memory
+
+
+def get_max_rss() -> int:
+    # ru_maxrss is in bytes on macOS, in kilobytes on Linux
+    if resource is None:
+        return 0
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss if sys.platform == 'darwin' else max_rss * 1024
+
+
+def compare_with_baseline(result_list: List[Dict], baseline_path: str, tolerance: float) -> bool:
+    # Return False if a case is slower than the baseline by more than the tolerance
+    with open(baseline_path, 'r') as baseline_file:
+        baseline_dic = {result["name"]: result for result in json.load(baseline_file)["results"]}
+    is_passed = True
+    for result in result_list:
+        baseline = baseline_dic.get(result["name"])
+        if baseline is None:
+            continue
+        ratio = result["instructions_per_second"] / baseline["instructions_per_second"]
+        status = "ok"
+        if ratio < 1 - tolerance:
+            status = "REGRESSION"
+            is_passed = False
+        print(f"{result['name']}: {ratio:.2f}x of baseline, {status}")
+    return is_passed
+
+
+def main() -> int:
+    parser = generate_option_parser()
+    options, args = parser.parse_args()
+    if len(args) > 0 or options.instructions <= 0 or options.repeat <= 0 or not 0 <= options.tolerance < 1:
+        parser.print_usage()
+        return 2
+    if options.numpy and HMReferenceScanner.numpy is None:
+        print("NumPy is not installed.")
+        return 2
+
+    corpus = HMReferenceCorpus.generate_corpus(options.instructions, options.seed)
+    print(corpus.get_description())
+    case_list: List[Tuple[str, Callable, bool, int]] = [
+        ("instruction_analysis", run_scan, False, corpus.instruction_count),
+        ("record_adrp_logic", run_adrp_logic, False, len(corpus.adr_offset_list)),
+    ]
+    if options.numpy:
+        case_list.append(("instruction_analysis_vectorized", run_scan, True, corpus.instruction_count))
+
+    result_list: List[Dict] = []
+    print(f"{'case':<34}{'time(s)':>10}{'inst/s':>14}{'records':>12}{'peak(MB)':>10}")
+    for name, case_function, use_numpy, instruction_count in case_list:
+        best_time, record_count, peak_memory = measure(case_function, corpus, use_numpy, options.repeat)
+        instructions_per_second = instruction_count / best_time if best_time > 0 else 0.0
+        result_list.append({
+            "name": name,
+            "instructions": instruction_count,
+            "seconds": best_time,
+            "instructions_per_second": instructions_per_second,
+            "records": record_count,
+            "peak_memory": peak_memory,
+        })
+        print(f"{name:<34}{best_time:>10.3f}{instructions_per_second:>14.0f}{record_count:>12}{peak_memory / 1024 / 1024:>10.2f}")
+    print(f"Max RSS: {get_max_rss() / 1024 / 1024:.2f}MB")
+
+    if options.json:
+        with open(options.json, 'w') as json_file:
+            json.dump({"instructions": options.instructions, "seed": options.seed, "python": sys.version.split()[0], "results": result_list}, json_file, indent=2)
+        print(f"Saved to {options.json}")
+    if options.baseline and not compare_with_baseline(result_list, options.baseline, options.tolerance):
+        return 1
+    return 0
+
+
+def generate_option_parser() -> optparse.OptionParser:
+    usage = "usage: python3 benchmarks/HMReferenceBenchmark.py [--instructions <count>] [--seed <seed>] [--repeat <count>] [--numpy] [--json <path>] [--baseline <path>] [--tolerance <ratio>]"
+    parser = optparse.OptionParser(usage=usage, prog="HMReferenceBenchmark")
+    parser.add_option("-i", "--instructions",
+                      action="store",
+                      type="int",
+                      default=1000000,
+                      dest="instructions",
+                      help="The number of instructions of the synthetic image")
+    parser.add_option("-s", "--seed",
+                      action="store",
+                      type="int",
+                      default=0,
+                      dest="seed",
+                      help="The seed of the synthetic image, the same seed generates the same image")
+    parser.add_option("-r", "--repeat",
+                      action="store",
+                      type="int",
+                      default=3,
+                      dest="repeat",
+                      help="Run each case several times and take the best time")
+    parser.add_option("-n", "--numpy",
+                      action="store_true",
+                      default=False,
+                      dest="numpy",
+                      help="Also benchmark the vectorized scan")
+    parser.add_option("-j", "--json",
+                      action="store",
+                      default=None,
+                      dest="json",
+                      help="Save the results to a JSON file, it can be used as a baseline")
+    parser.add_option("-b", "--baseline",
+                      action="store",
+                      default=None,
+                      dest="baseline",
+                      help="Compare with the JSON file of a previous run, exit with 1 if a case regresses")
+    parser.add_option("-t", "--tolerance",
+                      action="store",
+                      type="float",
+                      default=0.2,
+                      dest="tolerance",
+                      help="The allowed slowdown ratio compared with the baseline, 0.2 by default")
+    return parser
+
+
+if __name__ == '__main__':
+    sys.exit(main())
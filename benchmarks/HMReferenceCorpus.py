@@ -0,0 +1,271 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2024 Huimao Chen
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# https://github.com/chenhuimao/HMLLDB
+
+# Deterministic synthetic A64 images for benchmarking the scanner of HMReference.
+# The code is a sequence of functions built from the instruction patterns that the compilers emit for iOS apps,
+# and the data is filled with pointers into the image, so the adrp/ldr logic loads realistic values.
+
+from array import array
+from typing import Callable, Dict, List, Optional, Tuple
+import random
+import sys
+
+
+# The default layout of the synthetic image
+default_code_address = 0x100004000
+default_data_gap = 0x4000
+
+# [pattern_name, weight], the share of the patterns in a function body
+default_pattern_weight_dic: Dict[str, int] = {
+    "bl": 12,
+    "b": 4,
+    "adrp_add": 8,
+    "adrp_ldr": 10,
+    "adrp_ldr_register": 2,
+    "adr_nop": 2,
+    "nop_ldr_literal": 2,
+    "ldr_variants": 10,
+    "str_stp": 12,
+    "nop": 3,
+    "other": 35,
+}
+
+nop_word = 0xd503201f
+ret_word = 0xd65f03c0
+
+
+class HMReferenceCorpus:
+    code_address: int
+    code: bytes
+    data_address: int
+    data: bytes
+    adr_offset_list: List[int]  # The offsets of adr/adrp instructions in the code
+    pattern_count_dic: Dict[str, int]  # [pattern_name, count]
+
+    def __init__(self, code_address: int, code: bytes, data_address: int, data: bytes, adr_offset_list: List[int], pattern_count_dic: Dict[str, int]):
+        self.code_address = code_address
+        self.code = code
+        self.data_address = data_address
+        self.data = data
+        self.adr_offset_list = adr_offset_list
+        self.pattern_count_dic = pattern_count_dic
+
+    @property
+    def instruction_count(self) -> int:
+        return len(self.code) // 4
+
+    @property
+    def image_range(self) -> Tuple[int, int]:
+        return self.code_address, self.data_address + len(self.data)
+
+    def get_description(self) -> str:
+        pattern_description = ", ".join(f"{name}:{count}" for name, count in sorted(self.pattern_count_dic.items()))
+        return f"{self.instruction_count} instructions at {hex(self.code_address)}, {len(self.data)} bytes of data at {hex(self.data_address)}\n{pattern_description}"
+
+
+def encode_adr(is_adrp: bool, rd: int, imm21: int) -> int:
+    imm21 &= 0x1fffff
+    return (0x90000000 if is_adrp else 0x10000000) | ((imm21 & 0b11) << 29) | ((imm21 >> 2) << 5) | rd
+
+
+def encode_branch(is_bl: bool, pc: int, target_address: int) -> int:
+    return (0x94000000 if is_bl else 0x14000000) | (((target_address - pc) >> 2) & 0x3ffffff)
+
+
+class HMCorpusGenerator:
+    # Emit the words of a function with the patterns, the state is only the random generator, so the same seed produces the same image
+    random_generator: random.Random
+    code_address: int
+    data_address: int
+    data_size: int
+    code_size: int
+    words: array
+    adr_offset_list: List[int]
+    pattern_count_dic: Dict[str, int]
+    pattern_handler_dic: Dict[str, Callable[[], None]]
+
+    def __init__(self, seed: int, code_address: int, code_size: int, data_address: int, data_size: int):
+        self.random_generator = random.Random(seed)
+        self.code_address = code_address
+        self.code_size = code_size
+        self.data_address = data_address
+        self.data_size = data_size
+        self.words = array('I')
+        self.adr_offset_list = []
+        self.pattern_count_dic = {}
+        self.pattern_handler_dic = {
+            "bl": self.emit_bl,
+            "b": self.emit_b,
+            "adrp_add": self.emit_adrp_add,
+            "adrp_ldr": self.emit_adrp_ldr,
+            "adrp_ldr_register": self.emit_adrp_ldr_register,
+            "adr_nop": self.emit_adr_nop,
+            "nop_ldr_literal": self.emit_nop_ldr_literal,
+            "ldr_variants": self.emit_ldr_variants,
+            "str_stp": self.emit_str_stp,
+            "nop": self.emit_nop,
+            "other": self.emit_other,
+        }
+
+    @property
+    def pc(self) -> int:
+        return self.code_address + len(self.words) * 4
+
+    def register(self) -> int:
+        # x0-x28
+        return self.random_generator.randrange(29)
+
+    def data_target(self, alignment: int) -> int:
+        return self.data_address + self.random_generator.randrange(self.data_size // alignment) * alignment
+
+    def emit_adrp(self, rd: int, target_address: int) -> None:
+        self.adr_offset_list.append(len(self.words) * 4)
+        self.words.append(encode_adr(True, rd, (target_address >> 12) - (self.pc >> 12)))
+
+    def emit_bl(self) -> None:
+        # Call a function anywhere in the image, usually followed by moving the result
+        self.words.append(encode_branch(True, self.pc, self.code_address + self.random_generator.randrange(self.code_size // 4) * 4))
+        self.words.append(0xaa0003e0 | self.register())  # mov xN, x0
+
+    def emit_b(self) -> None:
+        # A near branch in the same function
+        self.words.append(encode_branch(False, self.pc, self.pc + self.random_generator.randrange(-64, 64) * 4))
+
+    def emit_adrp_add(self) -> None:
+        # The address of a literal or a global variable
+        rd = self.register()
+        target_address = self.data_target(1)
+        self.emit_adrp(rd, target_address)
+        self.words.append(0x91000000 | ((target_address & 0xfff) << 10) | (rd << 5) | self.register())
+
+    def emit_adrp_ldr(self) -> None:
+        # Load a slot, such as a selector reference, a class reference or a GOT entry
+        rd = self.register()
+        if self.random_generator.random() < 0.8:
+            target_address = self.data_target(8)
+            self.emit_adrp(rd, target_address)
+            self.words.append(0xf9400000 | (((target_address & 0xfff) >> 3) << 10) | (rd << 5) | self.register())
+        else:
+            target_address = self.data_target(4)
+            self.emit_adrp(rd, target_address)
+            self.words.append(0xb9800000 | (((target_address & 0xfff) >> 2) << 10) | (rd << 5) | self.register())  # ldrsw
+
+    def emit_adrp_ldr_register(self) -> None:
+        # A jump table: adrp, add, ldrsw with the register offset, add, br
+        rd = self.register()
+        index_register = self.register()
+        target_address = self.data_target(4)
+        self.emit_adrp(rd, target_address)
+        self.words.append(0x91000000 | ((target_address & 0xfff) << 10) | (rd << 5) | rd)
+        self.words.append(0xb8a07800 | (index_register << 16) | (rd << 5) | 16)  # ldrsw x16, [xN, xM, lsl #2]
+        self.words.append(0x8b100000 | (rd << 5) | 16)  # add x16, xN, x16
+        self.words.append(0xd61f0200)  # br x16
+
+    def emit_adr_nop(self) -> None:
+        # The result of the linker optimization of adrp+add
+        target_address = self.pc + self.random_generator.randrange(-0x40000, 0x40000) * 4
+        self.adr_offset_list.append(len(self.words) * 4)
+        self.words.append(encode_adr(False, self.register(), target_address - self.pc))
+        self.words.append(nop_word)
+
+    def emit_nop_ldr_literal(self) -> None:
+        # The result of the linker optimization of adrp+ldr
+        self.words.append(nop_word)
+        self.words.append(0x58000000 | ((self.random_generator.randrange(-0x400, 0x400) & 0x7ffff) << 5) | self.register())
+
+    def emit_ldr_variants(self) -> None:
+        # Loads with the register, post-index, pre-index and unsigned offset forms
+        rt, rn, rm = self.register(), self.register(), self.register()
+        variant = self.random_generator.randrange(4)
+        if variant == 0:
+            self.words.append(0xf8607800 | (rm << 16) | (rn << 5) | rt)  # ldr xT, [xN, xM, lsl #3]
+        elif variant == 1:
+            self.words.append(0xf8400400 | ((self.random_generator.randrange(32) * 8) << 12) | (rn << 5) | rt)  # ldr xT, [xN], #imm
+        elif variant == 2:
+            self.words.append(0xf8400c00 | ((self.random_generator.randrange(32) * 8) << 12) | (rn << 5) | rt)  # ldr xT, [xN, #imm]!
+        else:
+            self.words.append(0xf9400000 | (self.random_generator.randrange(64) << 10) | (rn << 5) | rt)  # ldr xT, [xN, #imm]
+
+    def emit_str_stp(self) -> None:
+        rt, rt2, rn = self.register(), self.register(), self.register()
+        if self.random_generator.random() < 0.5:
+            self.words.append(0xf9000000 | (self.random_generator.randrange(64) << 10) | (rn << 5) | rt)  # str xT, [xN, #imm]
+        else:
+            self.words.append(0xa9000000 | (self.random_generator.randrange(-8, 8) & 0x7f) << 15 | (rt2 << 10) | (31 << 5) | rt)  # stp xT, xT2, [sp, #imm]
+
+    def emit_nop(self) -> None:
+        self.words.append(nop_word)
+
+    def emit_other(self) -> None:
+        # Arithmetic, moves, compares and conditional branches, the scanner skips them by the top byte
+        rd, rn, rm = self.register(), self.register(), self.register()
+        self.words.append(self.random_generator.choice([
+            0xaa000000 | (rm << 16) | rd,  # mov xD, xM
+            0x91000000 | (self.random_generator.randrange(256) << 10) | (rn << 5) | rd,  # add xD, xN, #imm
+            0xd1000000 | (self.random_generator.randrange(256) << 10) | (rn << 5) | rd,  # sub xD, xN, #imm
+            0xeb00001f | (rm << 16) | (rn << 5),  # cmp xN, xM
+            0x54000000 | (self.random_generator.randrange(-64, 64) & 0x7ffff) << 5 | self.random_generator.randrange(14),  # b.cond
+            0xb4000000 | (self.random_generator.randrange(-64, 64) & 0x7ffff) << 5 | rd,  # cbz xD
+            0x52800000 | (self.random_generator.randrange(0x10000) << 5) | rd,  # mov wD, #imm
+        ]))
+
+    def emit_function(self, pattern_name_list: List[str], pattern_weight_list: List[int]) -> None:
+        # Prologue, the body and epilogue
+        self.words.append(0xa9bf7bfd)  # stp x29, x30, [sp, #-16]!
+        self.words.append(0x910003fd)  # mov x29, sp
+        for pattern_name in self.random_generator.choices(pattern_name_list, pattern_weight_list, k=self.random_generator.randrange(4, 48)):
+            self.pattern_handler_dic[pattern_name]()
+            self.pattern_count_dic[pattern_name] = self.pattern_count_dic.get(pattern_name, 0) + 1
+        self.words.append(0xa8c17bfd)  # ldp x29, x30, [sp], #16
+        self.words.append(ret_word)
+
+    def generate_data(self) -> bytes:
+        # The slots point to the code(functions, blocks) or the data(strings, classes), a few are zero
+        image_start, image_end = self.code_address, self.data_address + self.data_size
+        slots = array('Q', (0 if self.random_generator.random() < 0.05 else self.random_generator.randrange(image_start, image_end) & ~0b111 for _ in range(self.data_size // 8)))
+        return slots.tobytes()
+
+
+def generate_corpus(instruction_count: int, seed: int = 0, pattern_weight_dic: Optional[Dict[str, int]] = None, code_address: int = default_code_address, data_size: int = 0) -> HMReferenceCorpus:
+    # The data size is a quarter of the code size by default, the same order as a typical app
+    if pattern_weight_dic is None:
+        pattern_weight_dic = default_pattern_weight_dic
+    code_size = instruction_count * 4
+    if data_size <= 0:
+        data_size = max(0x4000, code_size // 4)
+    data_size &= ~0b111
+    data_address = (code_address + code_size + default_data_gap) & ~0x3fff
+
+    generator = HMCorpusGenerator(seed, code_address, code_size, data_address, data_size)
+    pattern_name_list = list(pattern_weight_dic.keys())
+    pattern_weight_list = list(pattern_weight_dic.values())
+    while len(generator.words) < instruction_count:
+        generator.emit_function(pattern_name_list, pattern_weight_list)
+
+    # The last function is cut at the instruction count, drop the adr/adrp instructions beyond it
+    del generator.words[instruction_count:]
+    adr_offset_list = [offset for offset in generator.adr_offset_list if offset < code_size]
+    if sys.byteorder == 'big':
+        generator.words.byteswap()
+    return HMReferenceCorpus(code_address, generator.words.tobytes(), data_address, generator.generate_data(), adr_offset_list, generator.pattern_count_dic)
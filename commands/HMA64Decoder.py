@@ -0,0 +1,798 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2024 Huimao Chen
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# https://github.com/chenhuimao/HMLLDB
+
+from enum import Enum
+
+
+# The decoders and predicates of the A64 instructions, shared by "reference", "edisassemble" and "trace".
+# It does not import lldb, so the worker processes of "reference" and the benchmarks can use it.
+
+
+class HMExtendOption(Enum):
+    uxtw = 0b010
+    lsl = 0b011
+    sxtw = 0b110
+    sxtx = 0b111
+    unknow = 0b1000
+
+
+class HMShift(Enum):
+    lsl = 0b00
+    lsr = 0b01
+    asr = 0b10
+    unknow = 0b11
+
+
+def is_adr_bytes(data: bytes) -> bool:
+    # little endian
+    # ADR <Xd>, <label>
+    return (data[3] & 0x9f) == 0x10
+
+
+def is_adrp_bytes(data: bytes) -> bool:
+    # little endian
+    # ADRP <Xd>, <label>
+    return (data[3] & 0x9f) == 0x90
+
+
+def is_b_bytes(data: bytes) -> bool:
+    # little endian
+    # B <label>
+    return (data[3] & 0xfc) == 0x14
+
+
+def is_bl_bytes(data: bytes) -> bool:
+    # little endian
+    # BL <label>
+    return (data[3] & 0xfc) == 0x94
+
+
+def is_br_bytes(data: bytes) -> bool:
+    # BR <Xn>
+    return ((data[3] & 0xff) == 0xd6) and ((data[2] & 0xff) == 0x1f) and ((data[1] & 0xfc) == 0x00) and ((data[0] & 0x1f) == 0x00)
+
+
+def is_blr_bytes(data: bytes) -> bool:
+    # BLR <Xn>
+    return ((data[3] & 0xff) == 0xd6) and ((data[2] & 0xff) == 0x3f) and ((data[1] & 0xfc) == 0x00) and ((data[0] & 0x1f) == 0x00)
+
+
+# CBNZ
+def is_cbnz_bytes(data: bytes) -> bool:
+    # 32-bit: CBNZ <Wt>, <label>
+    # 64-bit: CBNZ <Xt>, <label>
+    return (data[3] & 0x7f) == 0x35
+
+
+# RET
+def is_ret_bytes(data: bytes) -> bool:
+    # RET {<Xn>}
+    return ((data[3] & 0xff) == 0xd6) and ((data[2] & 0xff) == 0x5f) and ((data[1] & 0xfc) == 0x0) and ((data[0] & 0x1f) == 0x0)
+
+
+# ADD (extended register)
+def is_add_bytes_extended_register(data: bytes) -> bool:
+    # little endian
+    # 32-bit: ADD <Wd|WSP>, <Wn|WSP>, <Wm>{, <extend> {#<amount>}}
+    # 64-bit: ADD <Xd|SP>, <Xn|SP>, <Rm>{, <extend> {#<amount>}}
+    # There are still a few cases that need to be excluded, which are omitted for efficiency.
+    return ((data[3] & 0x7f) == 0x0b) and ((data[2] & 0xe0) == 0x20)
+
+
+# ADD (immediate)
+def is_add_bytes_immediate(data: bytes) -> bool:
+    # little endian
+    # This instruction is used by the alias MOV (to/from SP).
+    # 32-bit: ADD <Wd|WSP>, <Wn|WSP>, #<imm>{, <shift>}
+    # 64-bit: ADD <Xd|SP>, <Xn|SP>, #<imm>{, <shift>}
+    return ((data[3] & 0x7f) == 0x11) and ((data[2] & 0x80) == 0x00)
+
+
+# ADD (shifted register)
+def is_add_bytes_shifted_register(data: bytes) -> bool:
+    # little endian
+    # 32-bit: ADD <Wd>, <Wn>, <Wm>{, <shift> #<amount>}
+    # 64-bit: ADD <Xd>, <Xn>, <Xm>{, <shift> #<amount>}
+    # There are still a few cases that need to be excluded, which are omitted for efficiency.(shift = 0b11, 32bit amount > 31)
+    return ((data[3] & 0x7f) == 0x0b) and ((data[2] & 0x20) == 0x00)
+
+
+# LDR (immediate) Post-index
+def is_ldr_bytes_immediate_post_index(data: bytes) -> bool:
+    # little endian
+    # 32-bit: LDR <Wt>, [<Xn|SP>], #<simm>
+    # 64-bit: LDR <Xt>, [<Xn|SP>], #<simm>
+    return ((data[3] & 0xbf) == 0xb8) and ((data[2] & 0xe0) == 0x40) and ((data[1] & 0x0c) == 0x04)
+
+
+# LDR (immediate) Pre-index
+def is_ldr_bytes_immediate_pre_index(data: bytes) -> bool:
+    # little endian
+    # 32-bit: LDR <Wt>, [<Xn|SP>, #<simm>]!
+    # 64-bit: LDR <Xt>, [<Xn|SP>, #<simm>]!
+    return ((data[3] & 0xbf) == 0xb8) and ((data[2] & 0xe0) == 0x40) and ((data[1] & 0x0c) == 0x0c)
+
+
+# LDR (immediate) Unsigned offset
+def is_ldr_bytes_immediate_unsigned_offset(data: bytes) -> bool:
+    # little endian
+    # 32-bit: LDR <Wt>, [<Xn|SP>{, #<pimm>}]
+    # 64-bit: LDR <Xt>, [<Xn|SP>{, #<pimm>}]
+    return ((data[3] & 0xbf) == 0xb9) and ((data[2] & 0xc0) == 0x40)
+
+
+# LDR (literal)
+def is_ldr_bytes_literal(data: bytes) -> bool:
+    # little endian
+    # 32-bit: LDR <Wt>, <label>
+    # 64-bit: LDR <Xt>, <label>
+    return (data[3] & 0xbf) == 0x18
+
+
+# LDR (register)
+def is_ldr_bytes_register(data: bytes) -> bool:
+    # little endian
+    # 32-bit: LDR <Wt>, [<Xn|SP>, (<Wm>|<Xm>){, <extend> {<amount>}}]
+    # 64-bit: LDR <Xt>, [<Xn|SP>, (<Wm>|<Xm>){, <extend> {<amount>}}]
+    # There are still a few cases that need to be excluded, which are omitted for efficiency
+    return ((data[3] & 0xbf) == 0xb8) and ((data[2] & 0xe0) == 0x60) and ((data[1] & 0x0c) == 0x08)
+
+
+# LDRSW (immediate) Post-index
+def is_ldrsw_bytes_immediate_post_index(data: bytes) -> bool:
+    # little endian
+    # LDRSW <Xt>, [<Xn|SP>], #<simm>
+    return ((data[3] & 0xff) == 0xb8) and ((data[2] & 0xe0) == 0x80) and ((data[1] & 0x0c) == 0x04)
+
+
+# LDRSW (immediate) Pre-index
+def is_ldrsw_bytes_immediate_pre_index(data: bytes) -> bool:
+    # little endian
+    # LDRSW <Xt>, [<Xn|SP>, #<simm>]!
+    return ((data[3] & 0xff) == 0xb8) and ((data[2] & 0xe0) == 0x80) and ((data[1] & 0x0c) == 0x0c)
+
+
+# LDRSW (immediate) Unsigned offset
+def is_ldrsw_bytes_immediate_unsigned_offset(data: bytes) -> bool:
+    # little endian
+    # LDRSW <Xt>, [<Xn|SP>{, #<pimm>}]
+    return ((data[3] & 0xff) == 0xb9) and ((data[2] & 0xc0) == 0x80)
+
+
+# LDRSW (literal)
+def is_ldrsw_bytes_literal(data: bytes) -> bool:
+    # little endian
+    # LDRSW <Xt>, <label>
+    return (data[3] & 0xff) == 0x98
+
+
+# LDRSW (register)
+def is_ldrsw_bytes_register(data: bytes) -> bool:
+    # little endian
+    # LDRSW <Xt>, [<Xn|SP>, (<Wm>|<Xm>){, <extend> {<amount>}}]
+    # There are still a few cases that need to be excluded, which are omitted for efficiency.
+    return ((data[3] & 0xff) == 0xb8) and ((data[2] & 0xe0) == 0xa0) and ((data[1] & 0x0c) == 0x08)
+
+
+# LDAXR
+def is_ldaxr_bytes(data: bytes) -> bool:
+    # 32-bit: LDAXR <Wt>, [<Xn|SP>{, #0}]
+    # 64-bit: LDAXR <Xt>, [<Xn|SP>{, #0}]
+    return ((data[3] & 0xbf) == 0x88) and ((data[2] & 0xff) == 0x5f) and ((data[1] & 0xfc) == 0xfc)
+
+
+# MOV (bitmask immediate)
+def is_mov_bytes_bitmask_immediate(data: bytes) -> bool:
+    # little endian
+    # This is an alias of ORR (immediate)
+    # 32-bit: MOV <Wd|WSP>, #<imm>    is equivalent to ORR <Wd|WSP>, WZR, #<imm>
+    # 64-bit: MOV <Xd|SP>, #<imm>    is equivalent to ORR <Xd|SP>, XZR, #<imm>
+    # There are still a few cases that need to be excluded, which are omitted for efficiency.
+    return ((data[3] & 0x7f) == 0x32) and ((data[2] & 0x80) == 0x00) and ((data[1] & 0x03) == 0x03) and ((data[0] & 0xe0) == 0xe0)
+
+
+# MOV (inverted wide immediate)
+def is_mov_bytes_inverted_wide_immediate(data: bytes) -> bool:
+    # little endian
+    # This is an alias of MOVN
+    # 32-bit: MOV <Wd>, #<imm>    is equivalent to MOVN <Wd>, #<imm16>, LSL #<shift>
+    # 64-bit: MOV <Xd>, #<imm>    is equivalent to MOVN <Xd>, #<imm16>, LSL #<shift>
+    # There are still a few cases that need to be excluded, which are omitted for efficiency.
+    return ((data[3] & 0x7f) == 0x12) and ((data[2] & 0x80) == 0x80)
+
+
+# MOV (register)
+def is_mov_bytes_register(data: bytes) -> bool:
+    # little endian
+    # This is an alias of ORR (shifted register)
+    # 32-bit: MOV <Wd>, <Wm>    is equivalent to ORR <Wd>, WZR, <Wm>
+    # 64-bit: MOV <Xd>, <Xm>    is equivalent to ORR <Xd>, XZR, <Xm>
+    return ((data[3] & 0x7f) == 0x2a) and ((data[2] & 0xe0) == 0x00) and ((data[1] & 0xff) == 0x03) and ((data[0] & 0xe0) == 0xe0)
+
+
+# MOV (to/from SP)
+def is_mov_bytes_to_from_sp(data: bytes) -> bool:
+    # little endian
+    # This is an alias of ADD (immediate)
+    # 32-bit: MOV <Wd|WSP>, <Wn|WSP>    is equivalent to ADD <Wd|WSP>, <Wn|WSP>, #0
+    # 64-bit: MOV <Xd|SP>, <Xn|SP>    is equivalent to ADD <Xd|SP>, <Xn|SP>, #0
+    return ((data[3] & 0x7f) == 0x11) and ((data[2] & 0xff) == 0x00) and ((data[1] & 0xfc) == 0x00)
+
+
+# MOV (wide immediate)
+def is_mov_bytes_wide_immediate(data: bytes) -> bool:
+    # little endian
+    # This is an alias of MOVZ
+    # 32-bit: MOV <Wd>, #<imm>    is equivalent to MOVZ <Wd>, #<imm16>, LSL #<shift>
+    # 64-bit: MOV <Xd>, #<imm>    is equivalent to MOVZ <Xd>, #<imm16>, LSL #<shift>
+    # There are still a few cases that need to be excluded, which are omitted for efficiency.
+    return ((data[3] & 0x7f) == 0x52) and ((data[2] & 0x80) == 0x80)
+
+
+# STR (immediate) Post-index
+def is_str_bytes_immediate_post_index(data: bytes) -> bool:
+    # little endian
+    # 32-bit: STR <Wt>, [<Xn|SP>], #<simm>
+    # 64-bit: STR <Xt>, [<Xn|SP>], #<simm>
+    return ((data[3] & 0xbf) == 0xb8) and ((data[2] & 0xe0) == 0x00) and ((data[1] & 0x0c) == 0x04)
+
+
+# STR (immediate) Pre-index
+def is_str_bytes_immediate_pre_index(data: bytes) -> bool:
+    # little endian
+    # 32-bit: STR <Wt>, [<Xn|SP>, #<simm>]!
+    # 64-bit: STR <Xt>, [<Xn|SP>, #<simm>]!
+    return ((data[3] & 0xbf) == 0xb8) and ((data[2] & 0xe0) == 0x00) and ((data[1] & 0x0c) == 0x0c)
+
+
+# STR (immediate) Unsigned offset
+def is_str_bytes_immediate_unsigned_offset(data: bytes) -> bool:
+    # little endian
+    # 32-bit: STR <Wt>, [<Xn|SP>{, #<pimm>}]
+    # 64-bit: STR <Xt>, [<Xn|SP>{, #<pimm>}]
+    return ((data[3] & 0xbf) == 0xb9) and ((data[2] & 0xc0) == 0x00)
+
+
+# STR (register)
+def is_str_bytes_register(data: bytes) -> bool:
+    # little endian
+    # 32-bit: STR <Wt>, [<Xn|SP>, (<Wm>|<Xm>){, <extend> {<amount>}}]
+    # 64-bit: STR <Xt>, [<Xn|SP>, (<Wm>|<Xm>){, <extend> {<amount>}}]
+    # There are still a few cases that need to be excluded, which are omitted for efficiency.
+    return ((data[3] & 0xbf) == 0xb8) and ((data[2] & 0xe0) == 0x20) and ((data[1] & 0x0c) == 0x08)
+
+
+# STP (Signed offset)
+def is_stp_bytes_signed_offset(data: bytes) -> bool:
+    # little endian
+    # 32-bit: STP <Wt1>, <Wt2>, [<Xn|SP>{, #<imm>}]
+    # 64-bit: STP <Xt1>, <Xt2>, [<Xn|SP>{, #<imm>}]
+    return ((data[3] & 0x7f) == 0x29) and ((data[2] & 0xc0) == 0x0)
+
+
+# STLXR
+def is_stlxr_bytes(data: bytes) -> bool:
+    # little endian
+    # 32-bit: STLXR <Ws>, <Wt>, [<Xn|SP>{, #0}]
+    # 64-bit: STLXR <Ws>, <Xt>, [<Xn|SP>{, #0}]
+    return ((data[3] & 0xbf) == 0x88) and ((data[2] & 0xe0) == 0x0) and ((data[1] & 0xfc) == 0xfc)
+
+
+# STXR
+def is_stxr_bytes(data: bytes) -> bool:
+    # 32-bit: STXR <Ws>, <Wt>, [<Xn|SP>{, #0}]
+    # 64-bit: STXR <Ws>, <Xt>, [<Xn|SP>{, #0}]
+    return ((data[3] & 0xbf) == 0x88) and ((data[2] & 0xe0) == 0x0) and ((data[1] & 0xfc) == 0x7c)
+
+
+# NOP
+def is_nop_bytes(data: bytes) -> bool:
+    # little endian
+    return (data[3] == 0xd5) and (data[2] == 0x03) and (data[1] == 0x20) and (data[0] == 0x1f)
+
+
+# decode adr/adrp and return (Rd, offset)
+def decode_adr_bytes(data: bytes) -> (int, int):
+    # ADR <Xd>, <label>
+    # ADRP <Xd>, <label> (label = offset * 4096)
+    value = int.from_bytes(data, 'little')
+    rd = value & 0b11111
+    immhi = (value >> 5) & 0x7ffff
+    immlo = (value >> 29) & 0b11
+    imm21 = (immhi << 2) | immlo
+    offset = twos_complement_to_int(imm21, 21)
+    return rd, offset
+
+
+# decode b/bl and return label
+def decode_b_bytes(data: bytes) -> int:
+    # B <label>
+    # BL <label>
+    value = int.from_bytes(data, 'little')
+    imm26 = value & 0x3ffffff
+    label = twos_complement_to_int(imm26, 26) * 4
+    return label
+
+
+# decode br/blr, return rn
+def decode_br_bytes(data: bytes) -> int:
+    # BR <Xn>
+    # BLR <Xn>
+    # br x16
+    # br xzr
+    value = int.from_bytes(data, 'little')
+    rn = (value >> 5) & 0b11111
+    return rn
+
+
+# decode ADD (immediate) and return (Rd, Rn, is_64bit, final_immediate)
+def decode_add_bytes_immediate(data: bytes) -> (int, int, bool, int):
+    # 32-bit: ADD <Wd|WSP>, <Wn|WSP>, #<imm>{, <shift>}
+    # 64-bit: ADD <Xd|SP>, <Xn|SP>, #<imm>{, <shift>}
+    # mov x8, sp - (8, 31, True, 0)
+    # add sp, sp, #0x70 - (31, 31, True, 0x70)
+    # add w0, w22, #0x4 - (0, 22, False, 0x4)
+    is_64bit = (data[3] & 0x80) == 0x80
+    value = int.from_bytes(data, 'little')
+    sh = (value >> 22) & 1
+    imm12 = (value >> 10) & 0xfff
+    rd = value & 0b11111
+    rn = (value >> 5) & 0b11111
+    final_immediate = imm12 if sh == 0 else imm12 << 12
+    return rd, rn, is_64bit, final_immediate
+
+
+# decode ADD (shifted register) and return (Rd, Rn, Rm, is_64bit, shift, amount)
+def decode_add_bytes_shifted_register(data: bytes) -> (int, int, int, bool, HMShift, int):
+    # 32-bit: ADD <Wd>, <Wn>, <Wm>{, <shift> #<amount>}
+    # 64-bit: ADD <Xd>, <Xn>, <Xm>{, <shift> #<amount>}
+    # add x0, x20, x8 - (0, 20, 8, True, <HMShift.lsl: 0>, 0)
+    # add x8, x8, x22, lsl #3 - (8, 8, 22, True, <HMShift.lsl: 0>, 3)
+    # add x8, x8, x20, asr #32 - (8, 8, 20, True, <HMShift.asr: 2>, 32)
+    # add w23, w8, w1 - (23, 8, 1, False, <HMShift.lsl: 0>, 0)
+    # add w9, w9, w9, lsl #8 - (9, 9, 9, False, <HMShift.lsl: 0>, 8)
+    # add w8, w9, w8, lsr #31 - (8, 9, 8, False, <HMShift.lsr: 1>, 31)
+    # add xzr, x21, x8 - (31, 21, 8, True, <HMShift.lsl: 0>, 0)
+    # add x8, xzr, x8 - (8, 31, 8, True, <HMShift.lsl: 0>, 0)
+    # add x8, x21, xzr - (8, 21, 31, True, <HMShift.lsl: 0>, 0)
+    is_64bit = (data[3] & 0x80) == 0x80
+    value = int.from_bytes(data, 'little')
+    rd = value & 0b11111
+    rn = (value >> 5) & 0b11111
+    rm = (value >> 16) & 0b11111
+    shift_value = (value >> 22) & 0b11
+    shift = HMShift(shift_value)
+    imm6 = (value >> 10) & 0x3f
+    return rd, rn, rm, is_64bit, shift, imm6
+
+
+# decode LDR (immediate) Post-index and return (Rt, Rn, is_64bit, simm)
+def decode_ldr_bytes_immediate_post_index(data: bytes) -> (int, int, bool, int):
+    # 32-bit: LDR <Wt>, [<Xn|SP>], #<simm>
+    # 64-bit: LDR <Xt>, [<Xn|SP>], #<simm>
+    # ldr x10, [x9], #-0x18 - (10, 9, True, -0x18)
+    # ldr w2, [x24], #0x4 - (2, 24, False, 0x4)
+    # ldr x19, [sp], #0x20 - (19, 31, True, 32)
+    # ldr xzr, [x20], #0x8 - (31, 20, True, 8)
+    is_64bit = (data[3] & 0x40) == 0x40
+    value = int.from_bytes(data, 'little')
+    rt = value & 0b11111
+    rn = (value >> 5) & 0b11111
+    imm9 = (value >> 12) & 0x1ff
+    simm = twos_complement_to_int(imm9, 9)
+    return rt, rn, is_64bit, simm
+
+
+# decode LDR (immediate) Pre-index and return (Rt, Rn, is_64bit, simm)
+def decode_ldr_bytes_immediate_pre_index(data: bytes) -> (int, int, bool, int):
+    # 32-bit: LDR <Wt>, [<Xn|SP>, #<simm>]!
+    # 64-bit: LDR <Xt>, [<Xn|SP>, #<simm>]!
+    # ldr x16, [x8, #-0x8]! - (16, 8, True, -8)
+    # ldr w8, [x26, #0x38]! - (8, 26, False, 0x38)
+    # ldr x9, [sp, #0x8]! - (9, 31, True, 8)
+    # ldr wzr, [x16, #0xf6]! - (31, 16, False, 0xf6)
+    is_64bit = (data[3] & 0x40) == 0x40
+    value = int.from_bytes(data, 'little')
+    rt = value & 0b11111
+    rn = (value >> 5) & 0b11111
+    imm9 = (value >> 12) & 0x1ff
+    simm = twos_complement_to_int(imm9, 9)
+    return rt, rn, is_64bit, simm
+
+
+# decode LDR (immediate) Unsigned offset and return (Rt, Rn, is_64bit, pimm)
+def decode_ldr_bytes_immediate_unsigned_offset(data: bytes) -> (int, int, bool, int):
+    # 32-bit: LDR <Wt>, [<Xn|SP>{, #<pimm>}]
+    # 64-bit: LDR <Xt>, [<Xn|SP>{, #<pimm>}]
+    # ldr x2, [x8] - (2, 8, True, 0)
+    # ldr w8, [x19, #0x8] - (8, 19, False, 8)
+    # ldr x8, [sp, #0x98] - (8, 31, True, 0x98)
+    # ldr xzr, [x8, #0x18] - (31, 8, True, 0x18)
+    is_64bit = (data[3] & 0x40) == 0x40
+    value = int.from_bytes(data, 'little')
+    rt = value & 0b11111
+    rn = (value >> 5) & 0b11111
+    imm12 = (value >> 10) & 0xfff
+    if is_64bit:
+        pimm = imm12 * 8
+    else:
+        pimm = imm12 * 4
+    return rt, rn, is_64bit, pimm
+
+
+# decode LDR (literal), return (Rt, is_64bit, label)
+def decode_ldr_bytes_literal(data: bytes) -> (int, bool, int):
+    # 32-bit: LDR <Wt>, <label>
+    # 64-bit: LDR <Xt>, <label>
+    # 0x104d3307c: ldr w16, 0x104d33084 - (16, False, 8)
+    # 0x10ec81160: ldr x20, #-0xf7c00 - (20, True, -0xf7c00)
+    # 0x107c802e8: ldr wzr, 0x107c8a528 - (31, False, 41536)
+    is_64bit = (data[3] & 0x40) == 0x40
+    value = int.from_bytes(data, 'little')
+    rt = value & 0b11111
+    imm19 = (value >> 5) & 0x7ffff
+    label = twos_complement_to_int(imm19, 19) * 4
+    return rt, is_64bit, label
+
+
+# decode LDR (register) and return (Rt, Rn, Rm, is_64bit, extend, amount)
+def decode_ldr_bytes_register(data: bytes) -> (int, int, int, bool, HMExtendOption, int):
+    # 32-bit: LDR <Wt>, [<Xn|SP>, (<Wm>|<Xm>){, <extend> {<amount>}}]
+    # 64-bit: LDR <Xt>, [<Xn|SP>, (<Wm>|<Xm>){, <extend> {<amount>}}]
+    # ldr x0, [x27, x8] - (0, 27, 8, True, <HMExtendOption.lsl: 3>, 0)
+    # ldr w12, [x20, x9, lsl  #2] - (12, 20, 9, False, <HMExtendOption.lsl: 3>, 2)
+    # ldr w2, [x8, w0, sxtw  #2] - (2, 8, 0, False, <HMExtendOption.sxtw: 6>, 2)
+    # ldr x2, [x21, w8, uxtw] - (2, 21, 8, True, <HMExtendOption.uxtw: 2>, 0)
+    # ldr wzr, [x19, x8] - (31, 19, 8, False, <HMExtendOption.lsl: 3>, 0)
+    # ldr xzr, [sp, xzr] - (31, 31, 31, True, <HMExtendOption.lsl: 3>, 0)
+    is_64bit = (data[3] & 0x40) == 0x40
+    value = int.from_bytes(data, 'little')
+    rt = value & 0b11111
+    rn = (value >> 5) & 0b11111
+    rm = (value >> 16) & 0b11111
+    option = (value >> 13) & 0b111
+    s = (value >> 12) & 0b1
+    if is_64bit:
+        amount = 0 if s == 0 else 3
+    else:
+        amount = 0 if s == 0 else 2
+
+    if option == 0b10:
+        extend = HMExtendOption.uxtw
+    elif option == 0b11:
+        extend = HMExtendOption.lsl
+    elif option == 0b110:
+        extend = HMExtendOption.sxtw
+    elif option == 0b111:
+        extend = HMExtendOption.sxtx
+    else:
+        extend = HMExtendOption.unknow
+    return rt, rn, rm, is_64bit, extend, amount
+
+
+# decode LDRSW (immediate) Post-index and return (Rt, Rn, simm)
+def decode_ldrsw_bytes_immediate_post_index(data: bytes) -> (int, int, int):
+    # LDRSW <Xt>, [<Xn|SP>], #<simm>
+    # ldrsw x8, [x22], #0x4 - (8, 22, 4)
+    # ldrsw x2, [x30], #-0x8 - (2, 30, -8)
+    # ldrsw xzr, [sp], #0x1 - (31, 31, 1)
+    value = int.from_bytes(data, 'little')
+    rt = value & 0b11111
+    rn = (value >> 5) & 0b11111
+    imm9 = (value >> 12) & 0x1ff
+    simm = twos_complement_to_int(imm9, 9)
+    return rt, rn, simm
+
+
+# decode LDRSW (immediate) Pre-index and return (Rt, Rn, simm)
+def decode_ldrsw_bytes_immediate_pre_index(data: bytes) -> (int, int, int):
+    # LDRSW <Xt>, [<Xn|SP>, #<simm>]!
+    # ldrsw x20, [x24, #0x4]! - (20, 24, 4)
+    # ldrsw x2, [x30, #-0x8]! - (2, 30, -8)
+    # ldrsw xzr, [x20, #-0x7c]! - (31, 20, -124)
+    # ldrsw x1, [sp, #0xc]! - (1, 31, 12)
+    value = int.from_bytes(data, 'little')
+    rt = value & 0b11111
+    rn = (value >> 5) & 0b11111
+    imm9 = (value >> 12) & 0x1ff
+    simm = twos_complement_to_int(imm9, 9)
+    return rt, rn, simm
+
+
+# decode LDRSW (immediate) Unsigned offset and return (Rt, Rn, pimm)
+def decode_ldrsw_bytes_immediate_unsigned_offset(data: bytes) -> (int, int, int):
+    # LDRSW <Xt>, [<Xn|SP>{, #<pimm>}]
+    # ldrsw x8, [x20] - (8, 20, 0)
+    # ldrsw x23, [x8, #0xb0c] - (23, 8, 0xb0c)
+    # ldrsw x8, [sp, #0x190] - (8, 31, 0x190)
+    # ldrsw xzr, [x8, #0xc] - (31, 8, 12)
+    value = int.from_bytes(data, 'little')
+    rt = value & 0b11111
+    rn = (value >> 5) & 0b11111
+    imm12 = (value >> 10) & 0xfff
+    pimm = imm12 * 4
+    return rt, rn, pimm
+
+
+# decode LDRSW (literal) and return (Rt, label)
+def decode_ldrsw_bytes_literal(data: bytes) -> (int, int):
+    # LDRSW <Xt>, <label>
+    # 0x110e93dac: ldrsw x2, 0x110e9b194 - (2, 29672)
+    # 0x110eed2d0: ldrsw xzr, 0x110ee36f4 - (31, -0x9bdc)
+    value = int.from_bytes(data, 'little')
+    rt = value & 0b11111
+    imm19 = (value >> 5) & 0x7ffff
+    label = twos_complement_to_int(imm19, 19) * 4
+    return rt, label
+
+
+# decode LDRSW (register) and return (Rt, Rn, Rm, extend, amount)
+def decode_ldrsw_bytes_register(data: bytes) -> (int, int, int, HMExtendOption, int):
+    # LDRSW <Xt>, [<Xn|SP>, (<Wm>|<Xm>){, <extend> {<amount>}}]
+    # ldrsw x8, [x28, x8] - (8, 28, 8, <HMExtendOption.lsl: 3>, 0)
+    # ldrsw x16, [x17, x16, lsl  #2] - (16, 17, 16, <HMExtendOption.lsl: 3>, 2)
+    # ldrsw x8, [x8, w9, uxtw  #2] - (8, 8, 9, <HMExtendOption.uxtw: 2>, 2)
+    # ldrsw x19, [x26, w19, uxtw] - (19, 26, 19, <HMExtendOption.uxtw: 2>, 0)
+    # ldrsw x28, [x24, w1, sxtw  #2] - (28, 24, 1, <HMExtendOption.sxtw: 6>, 2)
+    # ldrsw x28, [x24, w1, sxtw] - (28, 24, 1, <HMExtendOption.sxtw: 6>, 0)
+    # ldrsw xzr, [sp, xzr, lsl  #2] - (31, 31, 31, <HMExtendOption.lsl: 3>, 2)
+    value = int.from_bytes(data, 'little')
+    rt = value & 0b11111
+    rn = (value >> 5) & 0b11111
+    rm = (value >> 16) & 0b11111
+    option = (value >> 13) & 0b111
+    s = (value >> 12) & 1
+    amount = 0 if s == 0 else 2
+    if option == 0b010:
+        extend = HMExtendOption.uxtw
+    elif option == 0b011:
+        extend = HMExtendOption.lsl
+    elif option == 0b110:
+        extend = HMExtendOption.sxtw
+    elif option == 0b111:
+        extend = HMExtendOption.sxtx
+    else:
+        extend = HMExtendOption.unknow
+    return rt, rn, rm, extend, amount
+
+
+# decode MOV (inverted wide immediate) and return (rd, is_64bit, immediate)
+def decode_mov_bytes_inverted_wide_immediate(data: bytes) -> (int, bool, int):
+    # 32-bit: MOV <Wd>, #<imm>    is equivalent to MOVN <Wd>, #<imm16>, LSL #<shift>
+    # 64-bit: MOV <Xd>, #<imm>    is equivalent to MOVN <Xd>, #<imm16>, LSL #<shift>
+    # mov x8, #0x7fffffffffffffff - (8, True, 0x7fffffffffffffff)
+    # mov x9, #-0x1 - (9, True, -1)
+    # mov w8, #0x7f7fffff - (8, False, 0x7f7fffff)
+    # mov xzr, #0x7fffffffffffffff - (31, True, 0x7fffffffffffffff)
+    is_64bit = (data[3] & 0x80) == 0x80
+    value = int.from_bytes(data, 'little')
+    rd = value & 0b11111
+    imm16 = (value >> 5) & 0xffff
+    hw = (value >> 21) & 0b11
+    pos = hw << 4
+    result = imm16 << pos
+    if is_64bit:
+        result = ~result & 0xffffffffffffffff
+        result = twos_complement_to_int(result, 64)
+    else:
+        result = ~result & 0xffffffff
+        result = twos_complement_to_int(result, 32)
+    return rd, is_64bit, result
+
+
+# decode MOV (register) and return (rd, rm, is_64bit)
+def decode_mov_bytes_register(data: bytes) -> (int, int, bool):
+    # 32-bit: MOV <Wd>, <Wm>    is equivalent to ORR <Wd>, WZR, <Wm>
+    # 64-bit: MOV <Xd>, <Xm>    is equivalent to ORR <Xd>, XZR, <Xm>
+    # mov x20, x0 - (20, 0, True)
+    # mov w2, w8 - (2, 8, False)
+    # mov x0, xzr - (0, 31, True)
+    # mov xzr, xzr - (31, 31, True)
+    is_64bit = (data[3] & 0x80) == 0x80
+    value = int.from_bytes(data, 'little')
+    rd = value & 0b11111
+    rm = (value >> 16) & 0b11111
+    return rd, rm, is_64bit
+
+
+# decode MOV (to/from SP) and return (rd, rn, is_64bit)
+def decode_mov_bytes_to_from_sp(data: bytes) -> (int, int, bool):
+    # 32-bit: MOV <Wd|WSP>, <Wn|WSP>    is equivalent to ADD <Wd|WSP>, <Wn|WSP>, #0
+    # 64-bit: MOV <Xd|SP>, <Xn|SP>    is equivalent to ADD <Xd|SP>, <Xn|SP>, #0
+    # mov x9, sp - (9, 31, True)
+    # mov sp, x20 - (31, 20, True)
+    # add w17, w1, #0x0 - (17, 1, False)
+    is_64bit = (data[3] & 0x80) == 0x80
+    value = int.from_bytes(data, 'little')
+    rd = value & 0b11111
+    rn = (value >> 5) & 0b11111
+    return rd, rn, is_64bit
+
+
+# decode MOV (wide immediate) and return (rd, is_64bit, immediate)
+def decode_mov_bytes_wide_immediate(data: bytes) -> (int, bool, int):
+    # 32-bit: MOV <Wd>, #<imm>    is equivalent to MOVZ <Wd>, #<imm16>, LSL #<shift>
+    # 64-bit: MOV <Xd>, #<imm>    is equivalent to MOVZ <Xd>, #<imm16>, LSL #<shift>
+    # mov w8, #0x1 - (8, False, 1)
+    # mov x0, #0x2 - (0, True, 2)
+    # mov w10, #-0x80000000 - (10, False, -0x80000000)
+    # mov x9, #-0x8000000000000000 - (9, True, -0x8000000000000000)
+    # mov xzr, #0x1 - (31, True, 1)
+    is_64bit = (data[3] & 0x80) == 0x80
+    value = int.from_bytes(data, 'little')
+    rd = value & 0b11111
+    imm16 = (value >> 5) & 0xffff
+    hw = (value >> 21) & 0b11
+    pos = hw << 4
+    result = imm16 << pos
+    bit_width = 64 if is_64bit else 32
+    result = twos_complement_to_int(result, bit_width)
+    return rd, is_64bit, result
+
+
+# decode STR (immediate) Post-index and return (rt, rn, is_64bit, simm)
+def decode_str_bytes_immediate_post_index(data: bytes) -> (int, int, bool, int):
+    # 32-bit: STR <Wt>, [<Xn|SP>], #<simm>
+    # 64-bit: STR <Xt>, [<Xn|SP>], #<simm>
+    # str x8, [x22], #0x8 - (8, 22, True, 0x8)
+    # str w0, [x21], #0x4 - (0, 21, False, 0x4)
+    # str x11, [x10], #-0x8 - (11, 10, True, -8)
+    # str wzr, [x22], #0x8 - (31, 22, False, 0x8)
+    # str x21, [sp], #0x10 - (21, 31, True, 0x10)
+    is_64bit = (data[3] & 0x40) == 0x40
+    value = int.from_bytes(data, 'little')
+    rt = value & 0b11111
+    rn = (value >> 5) & 0b11111
+    imm9 = (value >> 12) & 0x1ff
+    simm = twos_complement_to_int(imm9, 9)
+    return rt, rn, is_64bit, simm
+
+
+# decode STR (immediate) Pre-index and return (rt, rn, is_64bit, simm)
+def decode_str_bytes_immediate_pre_index(data: bytes) -> (int, int, bool, int):
+    # 32-bit: STR <Wt>, [<Xn|SP>, #<simm>]!
+    # 64-bit: STR <Xt>, [<Xn|SP>, #<simm>]!
+    # str wzr, [sp, #-0x10]! - (31, 31, False, -0x10)
+    # str xzr, [x23, #0x60]! - (31, 23, True, 0x60)
+    # str w8, [x1, #0x60]! - (8, 1, False, 0x60)
+    is_64bit = (data[3] & 0x40) == 0x40
+    value = int.from_bytes(data, 'little')
+    rt = value & 0b11111
+    rn = (value >> 5) & 0b11111
+    imm9 = (value >> 12) & 0x1ff
+    simm = twos_complement_to_int(imm9, 9)
+    return rt, rn, is_64bit, simm
+
+
+# decode STR (immediate) Unsigned offset and return (rt, rn, is_64bit, pimm)
+def decode_str_bytes_immediate_unsigned_offset(data: bytes) -> (int, int, bool, int):
+    # 32-bit: STR <Wt>, [<Xn|SP>{, #<pimm>}]
+    # 64-bit: STR <Xt>, [<Xn|SP>{, #<pimm>}]
+    # str xzr, [sp, #0x58] - (31, 31, True, 0x58)
+    # str x8, [sp] - (8, 31, True, 0x0)
+    # str w0, [x19, #0x560] - (0, 19, False, 0x560)
+    # str wzr, [x8, #0x50] - (31, 8, False, 0x50)
+    is_64bit = (data[3] & 0x40) == 0x40
+    value = int.from_bytes(data, 'little')
+    rt = value & 0b11111
+    rn = (value >> 5) & 0b11111
+    imm12 = (value >> 10) & 0xfff
+    if is_64bit:
+        pimm = imm12 * 8
+    else:
+        pimm = imm12 * 4
+    return rt, rn, is_64bit, pimm
+
+
+# decode STR (register) and return (Rt, Rn, Rm, is_64bit, extend, amount)
+def decode_str_bytes_register(data: bytes) -> (int, int, int, bool, HMExtendOption, int):
+    # 32-bit: STR <Wt>, [<Xn|SP>, (<Wm>|<Xm>){, <extend> {<amount>}}]
+    # 64-bit: STR <Xt>, [<Xn|SP>, (<Wm>|<Xm>){, <extend> {<amount>}}]
+    # str x0, [x20, x8] - (0, 20, 8, True, <HMExtendOption.lsl: 3>, 0)
+    # str w9, [x0, x8] - (9, 0, 8, False, <HMExtendOption.lsl: 3>, 0)
+    # str x9, [x8, w20, uxtw  #3] - (9, 8, 20, True, <HMExtendOption.uxtw: 2>, 3)
+    # str x0, [x20, w27, sxtw] - (0, 20, 27, True, <HMExtendOption.sxtw: 6>, 0)
+    is_64bit = (data[3] & 0x40) == 0x40
+    value = int.from_bytes(data, 'little')
+    rt = value & 0b11111
+    rn = (value >> 5) & 0b11111
+    rm = (value >> 16) & 0b11111
+    s = (value >> 12) & 1
+    option = (value >> 13) & 0b111
+    if is_64bit:
+        amount = 0 if s == 0 else 3
+    else:
+        amount = 0 if s == 0 else 2
+    if option == 0b10:
+        extend = HMExtendOption.uxtw
+    elif option == 0b11:
+        extend = HMExtendOption.lsl
+    elif option == 0b110:
+        extend = HMExtendOption.sxtw
+    elif option == 0b111:
+        extend = HMExtendOption.sxtx
+    else:
+        extend = HMExtendOption.unknow
+    return rt, rn, rm, is_64bit, extend, amount
+
+
+# decode STP (Signed offset), return (rt, rt2, rn, is_64bit, imm)
+def decode_stp_bytes_signed_offset(data: bytes) -> (int, int, int, bool, int):
+    # 32-bit: STP <Wt1>, <Wt2>, [<Xn|SP>{, #<imm>}]
+    # 64-bit: STP <Xt1>, <Xt2>, [<Xn|SP>{, #<imm>}]
+    # stp x20, x8, [sp] - (20, 8, 31, True, 0)
+    # stp x8, x9, [x29, #-0x70] - (8, 9, 29, True, -0x70)
+    # stp w25, w24, [sp, #0x4] - (25, 24, 31, False, 4)
+    # stp xzr, xzr, [x8] - (31, 31, 8, True, 0)
+    is_64bit = (data[3] & 0x80) == 0x80
+    value = int.from_bytes(data, 'little')
+    rt = value & 0b11111
+    rt2 = (value >> 10) & 0b11111
+    rn = (value >> 5) & 0b11111
+    imm7 = (value >> 15) & 0x7f
+    if is_64bit:
+        imm = twos_complement_to_int(imm7, 7) * 8
+    else:
+        imm = twos_complement_to_int(imm7, 7) * 4
+    return rt, rt2, rn, is_64bit, imm
+
+
+def logical_shift_right(raw_value: int, amount: int, bit_width: int) -> int:
+    raw_value &= (1 << bit_width) - 1
+    result = raw_value >> amount
+    result &= (1 << (bit_width - amount)) - 1
+    return result
+
+
+# uxtw
+def unsigned_extend_word(raw_value: int) -> int:
+    raw_value = raw_value & 0xffffffff
+    return raw_value
+
+
+# sxtw
+def signed_extend_word(raw_value: int) -> int:
+    raw_value = raw_value & 0xffffffff
+    sign_bit = (raw_value >> 31) & 1
+    if sign_bit == 1:
+        result = raw_value | 0xffffffff00000000
+    else:
+        result = raw_value
+    return result
+
+
+def twos_complement_to_int(twos_complement: int, bit_width: int) -> int:
+    mask = (1 << bit_width) - 1
+    twos_complement = twos_complement & mask
+    sign_bit_mask = 1 << (bit_width - 1)
+    if twos_complement & sign_bit_mask == 0:
+        result = twos_complement
+    else:
+        result = twos_complement - (1 << bit_width)
+    return result
+
+
+def calculate_adrp_result(immediate: int, pc_address: int) -> int:
+    # The same as HMCalculationHelper.calculate_adrp_result_with_immediate_and_pc_address
+    return immediate * 4096 + pc_address - pc_address % 4096
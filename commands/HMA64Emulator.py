@@ -0,0 +1,479 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2024 Huimao Chen
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# https://github.com/chenhuimao/HMLLDB
+
+from typing import Callable, List, Optional
+import HMA64Decoder
+
+
+# The kind of an effect
+effect_kind_none = 0  # nop, or an instruction whose result is unknown or discarded(xzr)
+effect_kind_address = 1  # adr/adrp, value is the address
+effect_kind_value = 2  # add/mov, value is the result
+effect_kind_load = 3  # ldr, value is the loaded value(None if the memory cannot be read), memory_address is the loading address
+effect_kind_load_signed_word = 4  # ldrsw, the same as effect_kind_load
+effect_kind_store = 5  # str/stp, memory_address is the storing address
+effect_kind_branch = 6  # br/blr, value is the target address
+
+
+class HMA64Effect:
+    # The decoded effect of an emulated instruction. The fields are set by the kind:
+    # register/is_64bit/value for effect_kind_address and effect_kind_value, all of them for the loads,
+    # memory_address for effect_kind_store, and value for effect_kind_branch.
+    __slots__ = ('address', 'handler', 'kind', 'register', 'is_64bit', 'value', 'memory_address')
+    address: int  # The address of the instruction
+    handler: Callable
+    kind: int
+    register: int  # The register written, -1 if there is none(xzr)
+    is_64bit: bool
+    value: Optional[int]  # Signed, except for effect_kind_branch
+    memory_address: Optional[int]
+
+    def __init__(self, address: int, handler: Callable):
+        # The other fields are set by the handler with the kind
+        self.address = address
+        self.handler = handler
+        self.kind = effect_kind_none
+
+
+class HMA64Emulator:
+    # A small A64 emulator of the common instructions around adr/adrp, shared by "reference" and "edisassemble".
+    # It runs a pre-read buffer from a base address with the known registers, and returns the effect of each instruction.
+    # Memory is only read to load values, through the load_address_value callback(the same as HM.load_address_value).
+    __slots__ = ('raw_values', 'load_address_value', 'stop_index', 'stop_handler')
+    raw_values: List[Optional[int]]  # x0 ~ x30, and x31(sp) for "mov sp", None if the value is unknown
+    load_address_value: Callable[[int], int]
+    stop_index: int  # The index of the instruction that stops the last run, -1 if all instructions are emulated
+    stop_handler: Optional[Callable]  # The handler that stops the last run, None if the instruction is not supported
+
+    def __init__(self, load_address_value: Callable[[int], int]):
+        self.raw_values = [None] * 32
+        self.load_address_value = load_address_value
+        self.stop_index = -1
+        self.stop_handler = None
+
+    def reset(self) -> None:
+        # Forget the registers, so the emulator is reused without creating a new one
+        self.raw_values = [None] * 32
+
+    def has_value(self, index: int) -> bool:
+        return self.raw_values[index] is not None
+
+    def set_raw_value(self, index: int, value: int, is_64bit: bool) -> None:
+        self.raw_values[index] = value & (0xffffffffffffffff if is_64bit else 0xffffffff)
+
+    def set_value(self, index: int, value: int, is_64bit: bool) -> None:
+        # The same as set_raw_value, a negative value is saved as two's complement
+        self.raw_values[index] = value & (0xffffffffffffffff if is_64bit else 0xffffffff)
+
+    def get_raw_value(self, index: int, is_64bit: bool) -> int:
+        raw_value = self.raw_values[index]
+        if raw_value is None:
+            return 0
+        return raw_value if is_64bit else raw_value & 0xffffffff
+
+    def get_value(self, index: int, is_64bit: bool) -> int:
+        # The same as HMA64Decoder.twos_complement_to_int(get_raw_value), inlined because it is called for most instructions
+        raw_value = self.raw_values[index]
+        if raw_value is None:
+            return 0
+        if is_64bit:
+            return raw_value - 0x10000000000000000 if raw_value & 0x8000000000000000 else raw_value
+        raw_value &= 0xffffffff
+        return raw_value - 0x100000000 if raw_value & 0x80000000 else raw_value
+
+    def load_address_value_signed_word(self, address_int: int) -> int:
+        # Same as HM.load_address_value_signed_word
+        value = self.load_address_value(address_int)
+        if value == -1:
+            return -1
+        ldrsw_result = value & 0xFFFFFFFF
+        if ldrsw_result & 0x80000000 > 0:
+            ldrsw_result += 0xFFFFFFFF00000000
+        return ldrsw_result
+
+    def run(self, data, address: int) -> List[HMA64Effect]:
+        # Emulate the instructions in data from the address until an instruction is not supported, or its handler stops.
+        # The stopping instruction has an effect if its handler is called.
+        effect_list: List[HMA64Effect] = []
+        self.stop_index = -1
+        self.stop_handler = None
+        # Local names are faster in the loop
+        table = dispatch_table
+        create_effect = HMA64Effect
+        append_effect = effect_list.append
+        for i in range(0, len(data) - 3, 4):
+            instruction_data = data[i:i+4]
+            # The same as get_handler, inlined because it is called for every instruction
+            word = int.from_bytes(instruction_data, 'little')
+            for mask, value, handler in table[word >> 24]:
+                if word & mask == value:
+                    break
+            else:
+                self.stop_index = i // 4
+                break
+            effect = create_effect(address + i, handler)
+            append_effect(effect)
+            if not handler(self, instruction_data, effect):
+                self.stop_index = i // 4
+                self.stop_handler = handler
+                break
+        return effect_list
+
+
+def get_handler(word: int) -> Optional[Callable[[HMA64Emulator, bytes, HMA64Effect], bool]]:
+    # Only the forms with the same top byte are compared, so the cost does not grow with the number of forms
+    for mask, value, handler in dispatch_table[word >> 24]:
+        if word & mask == value:
+            return handler
+    return None
+
+
+# The handlers of the instructions. Set the effect, return False to stop emulating.
+def emulate_adr(emulator: HMA64Emulator, instruction_data: bytes, effect: HMA64Effect) -> bool:
+    rd, offset = HMA64Decoder.decode_adr_bytes(instruction_data)
+    rd_value = effect.address + offset
+    emulator.set_value(rd, rd_value, True)
+    effect.kind, effect.register, effect.is_64bit, effect.value = effect_kind_address, rd, True, rd_value
+    return True
+
+
+def emulate_adrp(emulator: HMA64Emulator, instruction_data: bytes, effect: HMA64Effect) -> bool:
+    rd, offset = HMA64Decoder.decode_adr_bytes(instruction_data)
+    rd_value = HMA64Decoder.calculate_adrp_result(offset, effect.address)
+    emulator.set_value(rd, rd_value, True)
+    effect.kind, effect.register, effect.is_64bit, effect.value = effect_kind_address, rd, True, rd_value
+    return True
+
+
+def emulate_add_immediate(emulator: HMA64Emulator, instruction_data: bytes, effect: HMA64Effect) -> bool:
+    rd, rn, is_64bit, final_immediate = HMA64Decoder.decode_add_bytes_immediate(instruction_data)
+    if not emulator.has_value(rn):
+        return False
+    rd_value = emulator.get_value(rn, is_64bit) + final_immediate
+    emulator.set_value(rd, rd_value, is_64bit)
+    effect.kind, effect.register, effect.is_64bit, effect.value = effect_kind_value, rd, is_64bit, emulator.get_value(rd, is_64bit)
+    return True
+
+
+def emulate_add_shifted_register(emulator: HMA64Emulator, instruction_data: bytes, effect: HMA64Effect) -> bool:
+    rd, rn, rm, is_64bit, shift, amount = HMA64Decoder.decode_add_bytes_shifted_register(instruction_data)
+    if shift == HMA64Decoder.HMShift.unknow:
+        return False
+    if rd == 31:  # xzr
+        return True
+    if (not emulator.has_value(rn)) and rn != 31:
+        return False
+    if (not emulator.has_value(rm)) and rm != 31:
+        return False
+    rn_raw_value = 0 if rn == 31 else emulator.get_raw_value(rn, is_64bit)
+    rm_raw_value = 0 if rm == 31 else emulator.get_raw_value(rm, is_64bit)
+    bit_width = 64 if is_64bit else 32
+    if amount == 0:
+        rd_raw_value = rn_raw_value + rm_raw_value
+    else:
+        if shift == HMA64Decoder.HMShift.lsl:
+            rm_value_shift = (rm_raw_value << amount) & ((1 << bit_width) - 1)
+        elif shift == HMA64Decoder.HMShift.lsr:
+            rm_value_shift = HMA64Decoder.logical_shift_right(rm_raw_value, amount, bit_width)
+        elif shift == HMA64Decoder.HMShift.asr:
+            rm_value_shift = (rm_raw_value >> amount) & ((1 << bit_width) - 1)
+        else:  # HMShift.unknow
+            return False
+        rd_raw_value = rn_raw_value + rm_value_shift
+
+    emulator.set_raw_value(rd, rd_raw_value, is_64bit)
+    effect.kind, effect.register, effect.is_64bit, effect.value = effect_kind_value, rd, is_64bit, HMA64Decoder.twos_complement_to_int(rd_raw_value, bit_width)
+    return True
+
+
+def set_load_effect(emulator: HMA64Emulator, effect: HMA64Effect, kind: int, rt: int, is_64bit: bool, load_address: int, load_result: int) -> bool:
+    # The loaded value is written to rt unless rt is xzr, return False if the memory cannot be read
+    effect.kind, effect.register, effect.is_64bit, effect.value, effect.memory_address = kind, -1, is_64bit, None, load_address
+    if load_result == -1:
+        return False
+    if rt != 31:  # xzr
+        emulator.set_raw_value(rt, load_result, is_64bit)
+        effect.register = rt
+    effect.value = HMA64Decoder.twos_complement_to_int(load_result, 64 if is_64bit else 32)
+    return True
+
+
+def get_register_offset_address(emulator: HMA64Emulator, rn: int, rm: int, extend: 'HMA64Decoder.HMExtendOption', amount: int) -> Optional[int]:
+    # The address of the register offset forms of ldr/ldrsw/str, None if it is unknown
+    rn_raw_value = emulator.get_raw_value(rn, True)
+    if extend == HMA64Decoder.HMExtendOption.uxtw:
+        rm_raw_value = 0 if rm == 31 else emulator.get_raw_value(rm, False)
+        temp = HMA64Decoder.unsigned_extend_word(rm_raw_value) << amount
+    elif extend == HMA64Decoder.HMExtendOption.lsl:
+        rm_raw_value = 0 if rm == 31 else emulator.get_raw_value(rm, True)
+        temp = rm_raw_value << amount
+    elif extend == HMA64Decoder.HMExtendOption.sxtw:
+        rm_raw_value = 0 if rm == 31 else emulator.get_value(rm, False)
+        temp = HMA64Decoder.signed_extend_word(rm_raw_value) << amount
+    else:
+        return None
+    return HMA64Decoder.twos_complement_to_int(rn_raw_value + temp, 64)
+
+
+def emulate_ldr_immediate_post_index(emulator: HMA64Emulator, instruction_data: bytes, effect: HMA64Effect) -> bool:
+    rt, rn, is_64bit, simm = HMA64Decoder.decode_ldr_bytes_immediate_post_index(instruction_data)
+    if not emulator.has_value(rn):
+        return False
+    rn_value = emulator.get_value(rn, True)
+    load_address = rn_value
+    if not set_load_effect(emulator, effect, effect_kind_load, rt, is_64bit, load_address, emulator.load_address_value(load_address)):
+        return False
+    rn_value += simm
+    emulator.set_value(rn, rn_value, True)
+    return True
+
+
+def emulate_ldr_immediate_pre_index(emulator: HMA64Emulator, instruction_data: bytes, effect: HMA64Effect) -> bool:
+    rt, rn, is_64bit, simm = HMA64Decoder.decode_ldr_bytes_immediate_pre_index(instruction_data)
+    if not emulator.has_value(rn):
+        return False
+    rn_value = emulator.get_value(rn, True)
+    rn_value += simm
+    emulator.set_value(rn, rn_value, True)
+    return set_load_effect(emulator, effect, effect_kind_load, rt, is_64bit, rn_value, emulator.load_address_value(rn_value))
+
+
+def emulate_ldr_immediate_unsigned_offset(emulator: HMA64Emulator, instruction_data: bytes, effect: HMA64Effect) -> bool:
+    rt, rn, is_64bit, pimm = HMA64Decoder.decode_ldr_bytes_immediate_unsigned_offset(instruction_data)
+    if not emulator.has_value(rn):
+        return False
+    load_address = emulator.get_value(rn, True) + pimm
+    return set_load_effect(emulator, effect, effect_kind_load, rt, is_64bit, load_address, emulator.load_address_value(load_address))
+
+
+def emulate_ldr_literal(emulator: HMA64Emulator, instruction_data: bytes, effect: HMA64Effect) -> bool:
+    rt, is_64bit, label = HMA64Decoder.decode_ldr_bytes_literal(instruction_data)
+    load_address = label + effect.address
+    return set_load_effect(emulator, effect, effect_kind_load, rt, is_64bit, load_address, emulator.load_address_value(load_address))
+
+
+def emulate_ldr_register(emulator: HMA64Emulator, instruction_data: bytes, effect: HMA64Effect) -> bool:
+    rt, rn, rm, is_64bit, extend, amount = HMA64Decoder.decode_ldr_bytes_register(instruction_data)
+    if rt == 31:  # xzr
+        return True
+    if extend == HMA64Decoder.HMExtendOption.unknow or extend == HMA64Decoder.HMExtendOption.sxtx:
+        return False
+    if not emulator.has_value(rn):
+        return False
+    if rm != 31 and (not emulator.has_value(rm)):
+        return False
+    load_address = get_register_offset_address(emulator, rn, rm, extend, amount)
+    if load_address is None:
+        return False
+    return set_load_effect(emulator, effect, effect_kind_load, rt, is_64bit, load_address, emulator.load_address_value(load_address))
+
+
+def emulate_ldrsw_immediate_post_index(emulator: HMA64Emulator, instruction_data: bytes, effect: HMA64Effect) -> bool:
+    rt, rn, simm = HMA64Decoder.decode_ldrsw_bytes_immediate_post_index(instruction_data)
+    if not emulator.has_value(rn):
+        return False
+    rn_value = emulator.get_value(rn, True)
+    load_address = rn_value
+    if not set_load_effect(emulator, effect, effect_kind_load_signed_word, rt, True, load_address, emulator.load_address_value_signed_word(load_address)):
+        return False
+    rn_value += simm
+    emulator.set_value(rn, rn_value, True)
+    return True
+
+
+def emulate_ldrsw_immediate_pre_index(emulator: HMA64Emulator, instruction_data: bytes, effect: HMA64Effect) -> bool:
+    rt, rn, simm = HMA64Decoder.decode_ldrsw_bytes_immediate_pre_index(instruction_data)
+    if not emulator.has_value(rn):
+        return False
+    rn_value = emulator.get_value(rn, True)
+    rn_value += simm
+    emulator.set_value(rn, rn_value, True)
+    return set_load_effect(emulator, effect, effect_kind_load_signed_word, rt, True, rn_value, emulator.load_address_value_signed_word(rn_value))
+
+
+def emulate_ldrsw_immediate_unsigned_offset(emulator: HMA64Emulator, instruction_data: bytes, effect: HMA64Effect) -> bool:
+    rt, rn, pimm = HMA64Decoder.decode_ldrsw_bytes_immediate_unsigned_offset(instruction_data)
+    if not emulator.has_value(rn):
+        return False
+    load_address = emulator.get_value(rn, True) + pimm
+    return set_load_effect(emulator, effect, effect_kind_load_signed_word, rt, True, load_address, emulator.load_address_value_signed_word(load_address))
+
+
+def emulate_ldrsw_register(emulator: HMA64Emulator, instruction_data: bytes, effect: HMA64Effect) -> bool:
+    rt, rn, rm, extend, amount = HMA64Decoder.decode_ldrsw_bytes_register(instruction_data)
+    if rt == 31:  # xzr
+        return True
+    if extend == HMA64Decoder.HMExtendOption.unknow or extend == HMA64Decoder.HMExtendOption.sxtx:
+        return False
+    if not emulator.has_value(rn):
+        return False
+    if rm != 31 and (not emulator.has_value(rm)):
+        return False
+    load_address = get_register_offset_address(emulator, rn, rm, extend, amount)
+    if load_address is None:
+        return False
+    return set_load_effect(emulator, effect, effect_kind_load_signed_word, rt, True, load_address, emulator.load_address_value_signed_word(load_address))
+
+
+def emulate_mov_inverted_wide_immediate(emulator: HMA64Emulator, instruction_data: bytes, effect: HMA64Effect) -> bool:
+    rd, is_64bit, immediate = HMA64Decoder.decode_mov_bytes_inverted_wide_immediate(instruction_data)
+    effect.kind, effect.is_64bit = effect_kind_value, is_64bit
+    if rd == 31:  # xzr
+        effect.register, effect.value = -1, immediate
+        return True
+    emulator.set_value(rd, immediate, is_64bit)
+    effect.register, effect.value = rd, emulator.get_value(rd, is_64bit)
+    return True
+
+
+def emulate_mov_register(emulator: HMA64Emulator, instruction_data: bytes, effect: HMA64Effect) -> bool:
+    rd, rm, is_64bit = HMA64Decoder.decode_mov_bytes_register(instruction_data)
+    if rd == 31:  # xzr
+        return True
+    if rm != 31 and (not emulator.has_value(rm)):
+        return False
+    rm_raw_value = 0 if rm == 31 else emulator.get_raw_value(rm, is_64bit)
+    emulator.set_raw_value(rd, rm_raw_value, is_64bit)
+    effect.kind, effect.register, effect.is_64bit, effect.value = effect_kind_value, rd, is_64bit, HMA64Decoder.twos_complement_to_int(rm_raw_value, 64 if is_64bit else 32)
+    return True
+
+
+def emulate_mov_to_from_sp(emulator: HMA64Emulator, instruction_data: bytes, effect: HMA64Effect) -> bool:
+    rd, rn, is_64bit = HMA64Decoder.decode_mov_bytes_to_from_sp(instruction_data)
+    if not emulator.has_value(rn):
+        return False
+    rn_raw_value = emulator.get_raw_value(rn, is_64bit)
+    emulator.set_raw_value(rd, rn_raw_value, is_64bit)
+    effect.kind, effect.register, effect.is_64bit, effect.value = effect_kind_value, rd, is_64bit, HMA64Decoder.twos_complement_to_int(rn_raw_value, 64 if is_64bit else 32)
+    return True
+
+
+def emulate_mov_wide_immediate(emulator: HMA64Emulator, instruction_data: bytes, effect: HMA64Effect) -> bool:
+    rd, is_64bit, immediate = HMA64Decoder.decode_mov_bytes_wide_immediate(instruction_data)
+    effect.kind, effect.is_64bit = effect_kind_value, is_64bit
+    if rd == 31:  # xzr
+        effect.register, effect.value = -1, immediate
+        return True
+    emulator.set_value(rd, immediate, is_64bit)
+    effect.register, effect.value = rd, emulator.get_value(rd, is_64bit)
+    return True
+
+
+def emulate_str_immediate_post_index(emulator: HMA64Emulator, instruction_data: bytes, effect: HMA64Effect) -> bool:
+    rt, rn, is_64bit, simm = HMA64Decoder.decode_str_bytes_immediate_post_index(instruction_data)
+    if not emulator.has_value(rn):
+        return False
+    rn_value = emulator.get_value(rn, True)
+    store_address = rn_value
+    rn_value += simm
+    emulator.set_value(rn, rn_value, is_64bit)
+    effect.kind, effect.memory_address = effect_kind_store, store_address
+    return True
+
+
+def emulate_str_immediate_pre_index(emulator: HMA64Emulator, instruction_data: bytes, effect: HMA64Effect) -> bool:
+    rt, rn, is_64bit, simm = HMA64Decoder.decode_str_bytes_immediate_pre_index(instruction_data)
+    if not emulator.has_value(rn):
+        return False
+    rn_value = emulator.get_value(rn, True)
+    rn_value += simm
+    emulator.set_value(rn, rn_value, is_64bit)
+    effect.kind, effect.memory_address = effect_kind_store, rn_value
+    return True
+
+
+def emulate_str_immediate_unsigned_offset(emulator: HMA64Emulator, instruction_data: bytes, effect: HMA64Effect) -> bool:
+    rt, rn, is_64bit, pimm = HMA64Decoder.decode_str_bytes_immediate_unsigned_offset(instruction_data)
+    if not emulator.has_value(rn):
+        return True
+    effect.kind, effect.memory_address = effect_kind_store, emulator.get_value(rn, True) + pimm
+    return True
+
+
+def emulate_str_register(emulator: HMA64Emulator, instruction_data: bytes, effect: HMA64Effect) -> bool:
+    rt, rn, rm, is_64bit, extend, amount = HMA64Decoder.decode_str_bytes_register(instruction_data)
+    if extend == HMA64Decoder.HMExtendOption.unknow or extend == HMA64Decoder.HMExtendOption.sxtx:
+        return False
+    if not emulator.has_value(rn):
+        return True
+    if rm != 31 and (not emulator.has_value(rm)):
+        return True
+    store_address = get_register_offset_address(emulator, rn, rm, extend, amount)
+    if store_address is not None:
+        effect.kind, effect.memory_address = effect_kind_store, store_address
+    return True
+
+
+def emulate_stp_signed_offset(emulator: HMA64Emulator, instruction_data: bytes, effect: HMA64Effect) -> bool:
+    rt, rt2, rn, is_64bit, imm = HMA64Decoder.decode_stp_bytes_signed_offset(instruction_data)
+    if not emulator.has_value(rn):
+        return True
+    effect.kind, effect.memory_address = effect_kind_store, emulator.get_value(rn, True) + imm
+    return True
+
+
+def emulate_nop(emulator: HMA64Emulator, instruction_data: bytes, effect: HMA64Effect) -> bool:
+    return True
+
+
+def emulate_br(emulator: HMA64Emulator, instruction_data: bytes, effect: HMA64Effect) -> bool:
+    # br/blr leave the instructions, so the emulation stops after the target is known
+    rn = HMA64Decoder.decode_br_bytes(instruction_data)
+    if emulator.has_value(rn):
+        effect.kind, effect.value = effect_kind_branch, emulator.get_raw_value(rn, True)
+    return False
+
+
+# [(mask, value, handler)], the emulated instruction forms. The first matching form is used.
+# "word & mask == value" is the same as the is_*_bytes function of the form in HMA64Decoder.py.
+instruction_form_list = [
+    (0x9f000000, 0x10000000, emulate_adr),
+    (0x9f000000, 0x90000000, emulate_adrp),
+    (0x7f800000, 0x11000000, emulate_add_immediate),
+    (0x7f200000, 0x0b000000, emulate_add_shifted_register),
+    (0xbfe00c00, 0xb8400400, emulate_ldr_immediate_post_index),
+    (0xbfe00c00, 0xb8400c00, emulate_ldr_immediate_pre_index),
+    (0xbfc00000, 0xb9400000, emulate_ldr_immediate_unsigned_offset),
+    (0xbf000000, 0x18000000, emulate_ldr_literal),
+    (0xbfe00c00, 0xb8600800, emulate_ldr_register),
+    (0xffe00c00, 0xb8800400, emulate_ldrsw_immediate_post_index),
+    (0xffe00c00, 0xb8800c00, emulate_ldrsw_immediate_pre_index),
+    (0xffc00000, 0xb9800000, emulate_ldrsw_immediate_unsigned_offset),
+    (0xffe00c00, 0xb8a00800, emulate_ldrsw_register),
+    (0x7f800000, 0x12800000, emulate_mov_inverted_wide_immediate),
+    (0x7fe0ffe0, 0x2a0003e0, emulate_mov_register),
+    (0x7ffffc00, 0x11000000, emulate_mov_to_from_sp),
+    (0x7f800000, 0x52800000, emulate_mov_wide_immediate),
+    (0xbfe00c00, 0xb8000400, emulate_str_immediate_post_index),
+    (0xbfe00c00, 0xb8000c00, emulate_str_immediate_pre_index),
+    (0xbfc00000, 0xb9000000, emulate_str_immediate_unsigned_offset),
+    (0xbfe00c00, 0xb8200800, emulate_str_register),
+    (0x7fc00000, 0x29000000, emulate_stp_signed_offset),
+    (0xffffffff, 0xd503201f, emulate_nop),
+    (0xfffffc1f, 0xd61f0000, emulate_br),  # br
+    (0xfffffc1f, 0xd63f0000, emulate_br),  # blr
+]
+
+# [top_byte, [(mask, value, handler)]], the forms that may match an instruction with the top byte
+dispatch_table = [[entry for entry in instruction_form_list if (top_byte << 24) & entry[0] == entry[1] & 0xff000000] for top_byte in range(256)]
@@ -0,0 +1,442 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2024 Huimao Chen
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# https://github.com/chenhuimao/HMLLDB
+
+import lldb
+from array import array
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+import bisect
+import copy
+import json
+import optparse
+import os
+import shlex
+import time
+import HMLLDBHelpers as HM
+import HMReference
+import HMReferenceIndex
+import HMReferenceMachO
+import HMSymbolication
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# [UUID, call graph]
+g_call_graph_dic: Dict[str, 'HMCallGraph'] = {}
+
+
+class HMCallGraph:
+    # The static call graph of an image at function granularity, built from the b/bl records of the reference index.
+    # The nodes are the functions of LC_FUNCTION_STARTS, and the branch targets outside the functions(such as the stubs).
+    # The edges are saved in CSR(compressed sparse row) format: the callees of node i are columns[row_offsets[i]:row_offsets[i + 1]],
+    # and the callers are saved in the same format. The offsets are relative to the image base.
+    uuid_str: str
+    base_address: int
+    record_count: int  # The record count of the index, the graph is rebuilt if the index changes
+    node_offsets: array  # Sorted
+    function_end_offset: int
+    callee_row_offsets: array
+    callee_columns: array
+    callee_counts: array  # The number of call sites of each edge
+    caller_row_offsets: array
+    caller_columns: array
+    caller_counts: array
+
+    def __init__(self, uuid_str: str, base_address: int, record_count: int, node_offsets: array, function_end_offset: int, callee_row_offsets: array, callee_columns: array, callee_counts: array,
+                 caller_row_offsets: array, caller_columns: array, caller_counts: array):
+        self.uuid_str = uuid_str
+        self.base_address = base_address
+        self.record_count = record_count
+        self.node_offsets = node_offsets
+        self.function_end_offset = function_end_offset
+        self.callee_row_offsets = callee_row_offsets
+        self.callee_columns = callee_columns
+        self.callee_counts = callee_counts
+        self.caller_row_offsets = caller_row_offsets
+        self.caller_columns = caller_columns
+        self.caller_counts = caller_counts
+
+    def __len__(self) -> int:
+        return len(self.node_offsets)
+
+    def rebase(self, base_address: int) -> 'HMCallGraph':
+        # Return the graph of the image loaded at base_address, the arrays are shared
+        if base_address == self.base_address:
+            return self
+        graph = copy.copy(self)
+        graph.base_address = base_address
+        return graph
+
+    def get_edge_count(self) -> int:
+        return len(self.callee_columns)
+
+    def get_address(self, node: int) -> int:
+        return self.node_offsets[node] + self.base_address
+
+    def find_node(self, address: int) -> int:
+        # Return the node containing the address, or -1. A node outside the functions only contains its own address.
+        offset = address - self.base_address
+        node = bisect.bisect_right(self.node_offsets, offset) - 1
+        if node < 0:
+            return -1
+        if self.node_offsets[node] != offset and offset >= self.function_end_offset:
+            return -1
+        return node
+
+    def get_edges(self, node: int, is_caller: bool) -> List[Tuple[int, int]]:
+        # Return [(node, call site count)] of the callees, or the callers
+        if is_caller:
+            row_offsets, columns, counts = self.caller_row_offsets, self.caller_columns, self.caller_counts
+        else:
+            row_offsets, columns, counts = self.callee_row_offsets, self.callee_columns, self.callee_counts
+        return [(columns[i], counts[i]) for i in range(row_offsets[node], row_offsets[node + 1])]
+
+    def traverse(self, root_list: List[int], is_caller: bool, max_depth: int) -> Dict[int, int]:
+        # Breadth-first search from the roots, return [node, depth], the roots are in depth 0. max_depth 0 means the transitive closure.
+        if is_caller:
+            row_offsets, columns = self.caller_row_offsets, self.caller_columns
+        else:
+            row_offsets, columns = self.callee_row_offsets, self.callee_columns
+        depth_dic: Dict[int, int] = {root: 0 for root in root_list}
+        queue = deque(root_list)
+        while queue:
+            node = queue.popleft()
+            depth = depth_dic[node] + 1
+            if 0 < max_depth < depth:
+                continue
+            for i in range(row_offsets[node], row_offsets[node + 1]):
+                next_node = columns[i]
+                if next_node not in depth_dic:
+                    depth_dic[next_node] = depth
+                    queue.append(next_node)
+        return depth_dic
+
+    def get_edge_list(self, node_set: Optional[set]) -> List[Tuple[int, int, int]]:
+        # [(caller, callee, call site count)] between the nodes of node_set, or all edges if node_set is None
+        edge_list: List[Tuple[int, int, int]] = []
+        node_iterable = range(len(self.node_offsets)) if node_set is None else sorted(node_set)
+        for node in node_iterable:
+            for i in range(self.callee_row_offsets[node], self.callee_row_offsets[node + 1]):
+                callee = self.callee_columns[i]
+                if node_set is None or callee in node_set:
+                    edge_list.append((node, callee, self.callee_counts[i]))
+        return edge_list
+
+
+def build_call_graph(index: HMReferenceIndex.HMReferenceIndex, code_layout: HMReferenceMachO.HMCodeLayout, use_numpy: bool = False) -> HMCallGraph:
+    # Map the source and the target of each b/bl record inside the image to the functions, the branches inside a function are ignored
+    if use_numpy and numpy is not None:
+        return build_call_graph_with_numpy(index, code_layout)
+
+    function_start_offsets = code_layout.function_start_offsets
+    function_end_offset = code_layout.function_end_offset
+    first_function_offset = function_start_offsets[0]
+    branch_kind = HMReferenceIndex.kind_branch | HMReferenceIndex.flag_relative_value
+    kind_filter = HMReferenceIndex.kind_mask | HMReferenceIndex.flag_relative_value
+    sources, values, kinds = index.sources, index.values, index.kinds
+    # [(caller_start, callee_start), call site count]
+    edge_count_dic: Dict[Tuple[int, int], int] = {}
+    for row in range(len(kinds)):
+        if kinds[row] & kind_filter != branch_kind:
+            continue
+        source_offset = sources[row]
+        if source_offset < first_function_offset or source_offset >= function_end_offset:
+            continue
+        caller_start = function_start_offsets[bisect.bisect_right(function_start_offsets, source_offset) - 1]
+        target_offset = values[row]
+        if first_function_offset <= target_offset < function_end_offset:
+            callee_start = function_start_offsets[bisect.bisect_right(function_start_offsets, target_offset) - 1]
+        else:
+            callee_start = target_offset
+        if caller_start == callee_start:
+            continue
+        key = (caller_start, callee_start)
+        edge_count_dic[key] = edge_count_dic.get(key, 0) + 1
+
+    node_offset_set = set(function_start_offsets)
+    node_offset_set.update(callee_start for _, callee_start in edge_count_dic)
+    node_offsets = array('Q', sorted(node_offset_set))
+    node_dic = {offset: node for node, offset in enumerate(node_offsets)}
+    edge_list = sorted((node_dic[caller_start], node_dic[callee_start], count) for (caller_start, callee_start), count in edge_count_dic.items())
+    callee_row_offsets, callee_columns, callee_counts = create_csr(len(node_offsets), edge_list)
+    caller_row_offsets, caller_columns, caller_counts = create_csr(len(node_offsets), sorted((callee, caller, count) for caller, callee, count in edge_list))
+    return HMCallGraph(index.uuid_str, index.base_address, len(index), node_offsets, function_end_offset, callee_row_offsets, callee_columns, callee_counts,
+                       caller_row_offsets, caller_columns, caller_counts)
+
+
+def create_csr(node_count: int, edge_list: List[Tuple[int, int, int]]) -> Tuple[array, array, array]:
+    # edge_list is sorted by row
+    row_offsets = array('I', [0]) * (node_count + 1)
+    columns = array('I')
+    counts = array('I')
+    for row, column, count in edge_list:
+        row_offsets[row + 1] += 1
+        columns.append(column)
+        counts.append(count)
+    for node in range(node_count):
+        row_offsets[node + 1] += row_offsets[node]
+    return row_offsets, columns, counts
+
+
+def build_call_graph_with_numpy(index: HMReferenceIndex.HMReferenceIndex, code_layout: HMReferenceMachO.HMCodeLayout) -> HMCallGraph:
+    # The same as build_call_graph, the records are mapped at once
+    function_start_offsets = numpy.frombuffer(code_layout.function_start_offsets, dtype=numpy.uint64).astype(numpy.int64)
+    function_end_offset = code_layout.function_end_offset
+    kinds = numpy.frombuffer(index.kinds, dtype=numpy.uint8)
+    branch_mask = (kinds & (HMReferenceIndex.kind_mask | HMReferenceIndex.flag_relative_value)) == (HMReferenceIndex.kind_branch | HMReferenceIndex.flag_relative_value)
+    source_offsets = numpy.frombuffer(index.sources, dtype=numpy.uint64)[branch_mask].astype(numpy.int64)
+    target_offsets = numpy.frombuffer(index.values, dtype=numpy.uint64)[branch_mask].astype(numpy.int64)
+
+    is_valid_source = (source_offsets >= function_start_offsets[0]) & (source_offsets < function_end_offset)
+    source_offsets = source_offsets[is_valid_source]
+    target_offsets = target_offsets[is_valid_source]
+    caller_starts = function_start_offsets[numpy.searchsorted(function_start_offsets, source_offsets, side='right') - 1]
+    is_function_target = (target_offsets >= function_start_offsets[0]) & (target_offsets < function_end_offset)
+    target_function_indexes = numpy.maximum(numpy.searchsorted(function_start_offsets, target_offsets, side='right') - 1, 0)
+    callee_starts = numpy.where(is_function_target, function_start_offsets[target_function_indexes], target_offsets)
+    is_call = caller_starts != callee_starts
+    caller_starts = caller_starts[is_call]
+    callee_starts = callee_starts[is_call]
+
+    node_offsets = numpy.union1d(function_start_offsets, callee_starts)
+    node_count = len(node_offsets)
+    edge_keys, edge_counts = numpy.unique(numpy.searchsorted(node_offsets, caller_starts) * node_count + numpy.searchsorted(node_offsets, callee_starts), return_counts=True)
+    callers = edge_keys // node_count
+    callees = edge_keys % node_count
+
+    def create_csr_with_numpy(rows, columns, counts) -> Tuple[array, array, array]:
+        order = numpy.lexsort((columns, rows))
+        row_offsets = numpy.zeros(node_count + 1, dtype=numpy.uint32)
+        row_offsets[1:] = numpy.cumsum(numpy.bincount(rows, minlength=node_count))
+        return array('I', row_offsets.tobytes()), array('I', columns[order].astype(numpy.uint32).tobytes()), array('I', counts[order].astype(numpy.uint32).tobytes())
+
+    callee_row_offsets, callee_columns, callee_counts = create_csr_with_numpy(callers, callees, edge_counts)
+    caller_row_offsets, caller_columns, caller_counts = create_csr_with_numpy(callees, callers, edge_counts)
+    return HMCallGraph(index.uuid_str, index.base_address, len(index), array('Q', node_offsets.astype(numpy.uint64).tobytes()), function_end_offset,
+                       callee_row_offsets, callee_columns, callee_counts, caller_row_offsets, caller_columns, caller_counts)
+
+
+def __lldb_init_module(debugger, internal_dict):
+    debugger.HandleCommand('command script add -f HMCallGraph.call_graph callgraph -h "Build the static call graph of an image from the scan results of the reference command."')
+
+
+def call_graph(debugger, command, exe_ctx, result, internal_dict):
+    """
+    Syntax:
+        callgraph [--numpy] [--jobs <count>] <image_name>
+        callgraph [--numpy] --callees <address> [--depth <count>] <image_name>
+        callgraph [--numpy] --callers <address> [--depth <count>] <image_name>
+        callgraph [--numpy] [--callees <address> | --callers <address>] [--depth <count>] --output <path> <image_name>
+
+    Options:
+        --numpy/-n; Build the graph with NumPy. The image is also scanned with NumPy if it is not indexed.
+        --jobs/-j; Scan the image in the specified number of worker processes if it is not indexed, the same as "reference --jobs".
+        --callees/-e; Show the functions called by the function containing the address.
+        --callers/-c; Show the functions calling the function containing the address.
+        --depth/-d; The depth of the callees or the callers, 1 by default. 0 means all depths(the transitive closure).
+        --output/-o; Save the graph to a file. The format is DOT if the extension is ".dot" or ".gv", otherwise JSON. With "--callees" or "--callers", only the reached functions are saved.
+
+    Examples:
+        (lldb) callgraph MyApp
+        (lldb) callgraph -j 8 MyApp
+        (lldb) callgraph -e 0x104a47388 MyApp
+        (lldb) callgraph -c 0x104a47388 -d 0 MyApp
+        (lldb) callgraph -o ~/Desktop/MyApp.dot -e 0x104a47388 -d 3 MyApp
+        (lldb) callgraph -n -o ~/Desktop/MyApp.json MyApp
+
+    Notice:
+        1.The graph is built from the index of the "reference" command, the image is scanned if there is no index.
+        2.The functions are read from LC_FUNCTION_STARTS. The b/bl instructions inside a function are not calls, and the targets outside the functions(such as the stubs) are separate nodes.
+        3.The calls through registers(blr/br) and Objective-C messages are not in the graph, the calls through the stubs end at the stubs.
+
+    This command is implemented in HMCallGraph.py
+    """
+
+    command_args = shlex.split(command)
+    parser = generate_option_parser()
+    try:
+        # options: optparse.Values
+        # args: list
+        (options, args) = parser.parse_args(command_args)
+    except:
+        result.SetError(parser.usage)
+        return
+
+    if len(args) != 1 or (options.callees is not None and options.callers is not None) or options.depth < 0 or options.jobs < 1:
+        HM.DPrint("Error input. Please enter \"help callgraph\" for help.")
+        return
+    if options.numpy and numpy is None:
+        HM.DPrint("NumPy is not installed. Please install it or remove the --numpy option.")
+        return
+    if not HM.is_arm64(exe_ctx.GetTarget()):
+        HM.DPrint("x86_64 architecture does not support the \"callgraph\" command.")
+        return
+
+    root_address_string = options.callees if options.callees is not None else options.callers
+    root_address = -1
+    if root_address_string is not None:
+        is_valid_address, root_address = HM.int_value_from_string(root_address_string)
+        if not is_valid_address:
+            HM.DPrint(f"Invalid address:{root_address_string}")
+            return
+
+    target: lldb.SBTarget = exe_ctx.GetTarget()
+    image_name = args[0]
+    module = HMReference.find_module(target, image_name)
+    if module is None:
+        HM.DPrint(f"Unable to find module:{image_name}. Please enter the \"image list\" command to view all modules.")
+        return
+    graph = load_or_build_call_graph(exe_ctx, module, options.numpy, options.jobs)
+    if graph is None:
+        return
+
+    if root_address == -1:
+        node_set = None
+        if not options.output:
+            HM.DPrint(f"Functions: {len(graph)}, calls: {graph.get_edge_count()}, call sites: {sum(graph.callee_counts)}")
+    else:
+        root_node = graph.find_node(root_address)
+        if root_node == -1:
+            HM.DPrint(f"Unable to find the function of {hex(root_address)} in {image_name}")
+            return
+        is_caller = options.callers is not None
+        depth_dic = graph.traverse([root_node], is_caller, options.depth)
+        node_set = set(depth_dic.keys())
+        if not options.output:
+            print_traverse_result(graph, root_node, depth_dic, is_caller, target)
+
+    if options.output:
+        output_path = os.path.expanduser(options.output)
+        save_call_graph(output_path, graph, node_set, image_name, target)
+        HM.DPrint(f"Save the call graph to {output_path}")
+
+
+def generate_option_parser() -> optparse.OptionParser:
+    usage = "usage: callgraph [--numpy] [--jobs <count>] [--callees <address> | --callers <address>] [--depth <count>] [--output <path>] <image_name>"
+    parser = optparse.OptionParser(usage=usage, prog="callgraph")
+    parser.add_option("-n", "--numpy",
+                      action="store_true",
+                      default=False,
+                      dest="numpy",
+                      help="Build the graph with NumPy")
+    parser.add_option("-j", "--jobs",
+                      action="store",
+                      type="int",
+                      default=HMReference.default_jobs,
+                      dest="jobs",
+                      help="Number of worker processes if the image is scanned")
+    parser.add_option("-e", "--callees",
+                      action="store",
+                      default=None,
+                      dest="callees",
+                      help="Show the functions called by the function containing the address")
+    parser.add_option("-c", "--callers",
+                      action="store",
+                      default=None,
+                      dest="callers",
+                      help="Show the functions calling the function containing the address")
+    parser.add_option("-d", "--depth",
+                      action="store",
+                      type="int",
+                      default=1,
+                      dest="depth",
+                      help="The depth of the callees or the callers, 0 means all depths")
+    parser.add_option("-o", "--output",
+                      action="store",
+                      default=None,
+                      dest="output",
+                      help="Save the graph to a DOT or JSON file")
+    return parser
+
+
+def load_or_build_call_graph(exe_ctx: lldb.SBExecutionContext, module: lldb.SBModule, use_numpy: bool, jobs: int) -> Optional[HMCallGraph]:
+    # Find the graph in memory, otherwise build it from the index. The image is scanned if there is no index.
+    target: lldb.SBTarget = exe_ctx.GetTarget()
+    image_name = HMReference.get_module_name(module)
+    index = HMReference.find_module_index(target, module)
+    if index is None:
+        HM.DPrint(f"Unable to find the index of {image_name}, scan it first.")
+        # The memory budget only splits the batches of several modules, so the default of "reference" is used
+        index_list, _ = HMReference.load_or_scan_module_index_list(exe_ctx, [module], jobs, use_numpy, HMReference.default_memory_budget * 1024 * 1024)
+        if len(index_list) == 0:
+            HM.DPrint(f"Unable to scan {image_name}")
+            return None
+        index = index_list[0]
+
+    graph = g_call_graph_dic.get(index.uuid_str) if index.uuid_str else None
+    if graph is None or graph.record_count != len(index):
+        code_layout = HMReference.get_code_layout(exe_ctx, module)
+        if code_layout is None or len(code_layout) == 0:
+            HM.DPrint(f"Unable to find the functions of {image_name}")
+            return None
+        start_time = time.perf_counter()
+        graph = build_call_graph(index, code_layout, use_numpy)
+        HM.DPrint(f"Build the call graph of {image_name} in {time.perf_counter() - start_time:.2f}s")
+        if index.uuid_str:
+            g_call_graph_dic[index.uuid_str] = graph
+    # The image may be loaded at a different address in another target or after relaunching
+    return graph.rebase(index.base_address)
+
+
+def print_traverse_result(graph: HMCallGraph, root_node: int, depth_dic: Dict[int, int], is_caller: bool, target: lldb.SBTarget) -> None:
+    # Sorted by depth, then by address. The call site counts of depth 1 are printed.
+    node_list = sorted((depth, node) for node, depth in depth_dic.items() if node != root_node)
+    description_list = HMSymbolication.get_symbol_description_list([graph.get_address(node) for _, node in node_list] + [graph.get_address(root_node)], target)
+    relation = "Callers" if is_caller else "Callees"
+    HM.DPrint(f"{relation} of {hex(graph.get_address(root_node))} ({description_list[-1]}):")
+    count_dic = dict(graph.get_edges(root_node, is_caller))
+    line_list: List[str] = []
+    for (depth, node), description in zip(node_list, description_list):
+        call_site_description = f" ({count_dic[node]} call sites)" if depth == 1 and count_dic.get(node, 1) > 1 else ""
+        line_list.append(f"[{depth}] {hex(graph.get_address(node))} {description}{call_site_description}")
+    if len(line_list) > 0:
+        print("\n".join(line_list))
+    HM.DPrint(f"{relation} count:{len(node_list)}")
+
+
+def save_call_graph(path: str, graph: HMCallGraph, node_set: Optional[set], image_name: str, target: lldb.SBTarget) -> None:
+    # The nodes are named by their symbols
+    node_list = list(range(len(graph))) if node_set is None else sorted(node_set)
+    name_list = HMSymbolication.get_symbol_description_list([graph.get_address(node) for node in node_list], target)
+    edge_list = graph.get_edge_list(node_set)
+    extension = os.path.splitext(path)[1].lower()
+    with open(path, 'w') as output_file:
+        if extension in [".dot", ".gv"]:
+            output_file.write(f"digraph {json.dumps(image_name)} {{\n")
+            for node, name in zip(node_list, name_list):
+                output_file.write(f"    n{node} [label={json.dumps(name)}, address=\"{hex(graph.get_address(node))}\"];\n")
+            for caller, callee, count in edge_list:
+                attribute = f" [weight={count}]" if count > 1 else ""
+                output_file.write(f"    n{caller} -> n{callee}{attribute};\n")
+            output_file.write("}\n")
+        else:
+            json.dump({
+                "image": image_name,
+                "uuid": graph.uuid_str,
+                "nodes": [{"id": node, "address": hex(graph.get_address(node)), "name": name} for node, name in zip(node_list, name_list)],
+                "edges": [{"caller": caller, "callee": callee, "count": count} for caller, callee, count in edge_list],
+            }, output_file)
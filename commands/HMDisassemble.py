@@ -24,17 +24,33 @@
 
 import lldb
 from typing import Dict, List, Optional, Tuple
-import HMCalculationHelper
+import optparse
+import bisect
+import os
+import shlex
+import struct
+import time
+import HMA64Decoder
+import HMA64Emulator
+import HMDisassembleAnnotation
 import HMLLDBClassInfo
 import HMLLDBHelpers as HM
 import HMReference
+import HMReferenceMachO
+import HMReferenceScanner
 import HMRegister
-from HMReference import HMExtendOption, HMShift
-from HMRegister import HMRegisterList
+
+
+# [(target index, process unique ID), HMBranchCommentCache], see comment_for_branch_target
+g_branch_comment_cache_dic: Dict[Tuple[int, int], 'HMBranchCommentCache'] = {}
+
+# (file memory, slide) of the image prefilled before launch, see prefill_module_annotation and load_address_value
+g_prefill_memory: Optional[Tuple[HMReferenceScanner.HMMachOFileMemory, int]] = None
 
 
 def __lldb_init_module(debugger, internal_dict):
     debugger.HandleCommand('command script add -f HMDisassemble.enhanced_disassemble edisassemble -h "Enhanced disassemble"')
+    debugger.HandleCommand('command script add -f HMDisassemble.annotation annotation -h "Manage the comments of edisassemble saved on disk."')
 
 
 def enhanced_disassemble(debugger, command, exe_ctx, result, internal_dict):
@@ -47,9 +63,21 @@ def enhanced_disassemble(debugger, command, exe_ctx, result, internal_dict):
         (lldb) edis -a 0x107ad4504
         (lldb) edis -n "-[UIDevice systemVersion]"
 
+    Notice:
+        1. Without options, or with "-f", "-n", "-a"(all three optionally with "-c"), or "-s" with "-e" or "-c", the range is disassembled by one ReadMemory and one ReadInstructions, and the output is formatted by edisassemble.
+        2. Other options are handled by the disassemble command, and its output is enhanced.
+        3. The comments of branch targets are cached per process. They are dropped when the module of the target is unloaded, and resolved again if the memory they loaded has changed.
+        4. The comments of a whole function are saved on disk, see "help annotation".
+
     This command is implemented in HMDisassemble.py
     """
 
+    if HM.is_arm64(exe_ctx.GetTarget()):
+        address_range = get_disassemble_range(exe_ctx, command)
+        if address_range is not None:
+            structured_disassemble(exe_ctx, address_range[0], address_range[1], address_range[2], result)
+            return
+
     return_object = lldb.SBCommandReturnObject()
     debugger.GetCommandInterpreter().HandleCommand(f"disassemble {command}", exe_ctx, return_object)
     if return_object.GetErrorSize() > 0:
@@ -123,6 +151,379 @@ def enhanced_disassemble(debugger, command, exe_ctx, result, internal_dict):
             result.AppendMessage(line)
 
 
+def annotation(debugger, command, exe_ctx, result, internal_dict):
+    """
+    Syntax:
+        annotation --prefill <image_name>
+        annotation --clear [<image_name>]
+
+    Options:
+        --prefill/-p; Calculate the comments of all functions in the image, and save them to disk.
+        --clear/-c; Delete the saved comments of the image, or all saved comments if there is no image name.
+
+    Examples:
+        // Prefill before running the app, lldb reads the memory and symbols from the file
+        (lldb) target create ~/Desktop/DemoApp.app
+        (lldb) target modules load --file DemoApp --slide 0
+        (lldb) annotation -p DemoApp
+
+        (lldb) annotation -c DemoApp
+        (lldb) annotation -c
+
+    Notice:
+        1. When edisassemble disassembles a whole function(without options, or with "-f", "-n", "-a"), its comments are saved in ~/.hmlldb/disassemble, keyed by the UUID of the image and the offset of the function.
+        2. The saved comments are used in the later sessions. The addresses in them are saved relative to their images, so they are still correct after ASLR.
+        3. The memory loaded to calculate the comments is read again before using them. If it has changed, e.g. a lazy symbol pointer is bound, the comments are calculated again.
+        4. Before launch, the pointers of the image are read from its file with the chained fixups decoded, like dyld does. The targets of binds are unknown before launch, so the functions that load them(e.g. from the GOT) are calculated again when they are disassembled in the running app.
+
+    This command is implemented in HMDisassemble.py
+    """
+
+    command_args = shlex.split(command)
+    parser = generate_annotation_option_parser()
+    try:
+        # options: optparse.Values
+        # args: list
+        (options, args) = parser.parse_args(command_args)
+    except:
+        result.SetError(parser.usage)
+        return
+
+    target = exe_ctx.GetTarget()
+    if options.prefill and len(args) == 1:
+        if not HM.is_arm64(target):
+            HM.DPrint("x86_64 architecture does not support the \"annotation\" command.")
+            return
+        module = HMReference.find_module(target, args[0])
+        if module is None:
+            HM.DPrint(f"Unable to find module:{args[0]}. Please enter the \"image list\" command to view all modules.")
+            return
+        prefill_module_annotation(exe_ctx, module)
+    elif options.clear and len(args) <= 1:
+        if len(args) == 0:
+            uuid_list = list(HMDisassembleAnnotation.g_module_annotation_dic.keys())
+            if os.path.isdir(HMDisassembleAnnotation.g_annotation_directory):
+                uuid_list += [file_name[:-len(".hmdis")] for file_name in os.listdir(HMDisassembleAnnotation.g_annotation_directory) if file_name.endswith(".hmdis")]
+        else:
+            module = HMReference.find_module(target, args[0])
+            if module is None or not module.GetUUIDString():
+                HM.DPrint(f"Unable to find module:{args[0]}. Please enter the \"image list\" command to view all modules.")
+                return
+            uuid_list = [module.GetUUIDString()]
+        for uuid_str in set(uuid_list):
+            HMDisassembleAnnotation.g_module_annotation_dic.pop(uuid_str, None)
+            if os.path.isfile(HMDisassembleAnnotation.get_annotation_path(uuid_str)):
+                os.remove(HMDisassembleAnnotation.get_annotation_path(uuid_str))
+        HM.DPrint("Delete the saved comments.")
+    else:
+        HM.DPrint("Error input. Please enter \"help annotation\" for help.")
+
+
+def generate_annotation_option_parser() -> optparse.OptionParser:
+    usage = "usage: annotation --prefill <image_name>\n       annotation --clear [<image_name>]"
+    parser = optparse.OptionParser(usage=usage, prog="annotation")
+    parser.add_option("-p", "--prefill",
+                      action="store_true",
+                      default=False,
+                      dest="prefill",
+                      help="Calculate the comments of all functions in the image, and save them to disk")
+    parser.add_option("-c", "--clear",
+                      action="store_true",
+                      default=False,
+                      dest="clear",
+                      help="Delete the saved comments of the image, or all saved comments")
+    return parser
+
+
+def prefill_module_annotation(exe_ctx: lldb.SBExecutionContext, module: lldb.SBModule) -> None:
+    # Calculate the comments of the code symbols of the module, the same as disassembling them one by one
+    image_name = HMReference.get_module_name(module)
+    module_uuid = module.GetUUIDString()
+    if not module_uuid:
+        HM.DPrint(f"{image_name} has no UUID, its comments cannot be saved.")
+        return
+    target = exe_ctx.GetTarget()
+    if HMReference.get_module_base_address(target, module) == lldb.LLDB_INVALID_ADDRESS:
+        HM.DPrint(f"{image_name} is not loaded. Please enter \"target modules load --file {image_name} --slide 0\" first.")
+        return
+    prefill_memory = None
+    if not exe_ctx.GetProcess().IsValid():
+        prefill_memory = create_prefill_memory(target, module)
+        if prefill_memory is None:
+            HM.DPrint(f"Unable to read the arm64 image of {image_name} from {module.GetFileSpec().fullpath}")
+            return
+    function_range_dic: Dict[int, int] = {}  # [start_address, end_address]
+    for i in range(module.GetNumSymbols()):
+        symbol: lldb.SBSymbol = module.GetSymbolAtIndex(i)
+        if symbol.GetType() != lldb.eSymbolTypeCode:
+            continue
+        start_address = symbol.GetStartAddress().GetLoadAddress(target)
+        end_address = symbol.GetEndAddress().GetLoadAddress(target)
+        if start_address == lldb.LLDB_INVALID_ADDRESS or end_address == lldb.LLDB_INVALID_ADDRESS or start_address % 4 != 0 or end_address <= start_address:
+            continue
+        function_range_dic[start_address] = end_address
+
+    HM.DPrint(f"Calculate the comments of {len(function_range_dic)} functions in {image_name}...")
+    start_time = time.perf_counter()
+    module_annotation = HMDisassembleAnnotation.get_module_annotation(module_uuid)
+    address_map = HMDisassembleAnnotation.HMModuleAddressMap(target)
+    global g_prefill_memory
+    if prefill_memory is not None:
+        # The cached comments of branch targets were calculated with the pointers that are not fixed up
+        drop_branch_comment_cache(target)
+        g_prefill_memory = prefill_memory
+    try:
+        fill_function_annotations(exe_ctx, module, module_annotation, address_map, function_range_dic)
+    finally:
+        if prefill_memory is not None:
+            g_prefill_memory = None
+            drop_branch_comment_cache(target)
+
+    annotation_path = HMDisassembleAnnotation.get_annotation_path(module_uuid)
+    module_annotation.save(annotation_path)
+    HM.DPrint(f"Save the comments of {len(module_annotation)} functions to {annotation_path}, cost {time.perf_counter() - start_time:.2f}s")
+
+
+def fill_function_annotations(exe_ctx: lldb.SBExecutionContext, module: lldb.SBModule, module_annotation: HMDisassembleAnnotation.HMModuleAnnotation, address_map: HMDisassembleAnnotation.HMModuleAddressMap, function_range_dic: Dict[int, int]) -> None:
+    target = exe_ctx.GetTarget()
+    for start_address, end_address in sorted(function_range_dic.items()):
+        address: lldb.SBAddress = lldb.SBAddress(start_address, target)
+        error = lldb.SBError()
+        data: bytes = target.ReadMemory(address, end_address - start_address, error)
+        if not error.Success():
+            continue
+        instruction_list: lldb.SBInstructionList = target.ReadInstructions(address, len(data) // 4)
+        instructions = [instruction_list.GetInstructionAtIndex(i) for i in range(min(instruction_list.GetSize(), len(data) // 4))]
+        comment_list = [instruction.GetComment(target) for instruction in instructions]
+        load_list: List[Tuple[int, int]] = []
+        address_comment_dict = get_comment_dict_with_buffer(exe_ctx, data, start_address, instructions, comment_list, load_list)
+        function_annotation = HMDisassembleAnnotation.create_function_annotation(exe_ctx, address_map, module, start_address, len(data), address_comment_dict, load_list)
+        module_annotation.function_dic[function_annotation.function_offset] = function_annotation
+
+
+def create_prefill_memory(target: lldb.SBTarget, module: lldb.SBModule) -> Optional[Tuple[HMReferenceScanner.HMMachOFileMemory, int]]:
+    # Before launch, lldb reads the pointers of the file that are encoded by the chained fixups. Read them from the file with the fixups decoded instead.
+    # Return (file memory, slide), None if the image is not found in the file
+    try:
+        image_list = HMReferenceMachO.parse_macho_file(module.GetFileSpec().fullpath)
+    except (OSError, struct.error, ValueError):
+        return None
+    for image in image_list:
+        if image.uuid_str == module.GetUUIDString():
+            return HMReferenceScanner.HMMachOFileMemory(image), HMReference.get_module_base_address(target, module) - image.base_address
+    return None
+
+
+def load_address_value(exe_ctx: lldb.SBExecutionContext, address_int: int) -> int:
+    # The same as HM.load_address_value, but the pointers of the image prefilled before launch are read with the fixups decoded
+    if g_prefill_memory is not None:
+        memory, slide = g_prefill_memory
+        file_address = address_int - slide
+        value = memory.load_address_value(file_address)
+        if value != -1:
+            fixup_addresses = memory.image.fixup_addresses
+            index = bisect.bisect_left(fixup_addresses, file_address)
+            if slide != 0 and index < len(fixup_addresses) and fixup_addresses[index] == file_address and memory.image.fixup_values[index] != 0:
+                # The rebase target is an address in the file
+                value += slide
+            return value
+    return HM.load_address_value(exe_ctx, address_int)
+
+
+class HMRangeOptionParser(optparse.OptionParser):
+    # Raise instead of printing the usage and exiting, the unsupported command is handled by "disassemble"
+    def error(self, msg):
+        raise ValueError(msg)
+
+
+def generate_range_option_parser() -> HMRangeOptionParser:
+    # The options of "disassemble" that specify a range only
+    parser = HMRangeOptionParser(prog="edisassemble", add_help_option=False)
+    parser.add_option("-s", "--start-address", action="store", dest="start_address")
+    parser.add_option("-e", "--end-address", action="store", dest="end_address")
+    parser.add_option("-c", "--count", action="store", type="int", dest="count")
+    parser.add_option("-n", "--name", action="store", dest="name")
+    parser.add_option("-a", "--address", action="store", dest="address")
+    parser.add_option("-f", "--frame", action="store_true", default=False, dest="frame")
+    parser.add_option("--force", action="store_true", default=False, dest="force")
+    return parser
+
+
+def get_disassemble_range(exe_ctx: lldb.SBExecutionContext, command: str) -> Optional[Tuple[int, int, bool]]:
+    # Return (start_address, end_address, is_function) of the command, None if the command should be handled by "disassemble".
+    # is_function is True if the range is a whole function, its comments are saved on disk.
+    try:
+        options, args = generate_range_option_parser().parse_args(shlex.split(command))
+    except ValueError:
+        return None
+    if len(args) > 0:
+        return None
+
+    target = exe_ctx.GetTarget()
+    if options.start_address is not None:
+        if options.name is not None or options.address is not None or options.frame:
+            return None
+        is_valid, start_address = HM.int_value_from_string(options.start_address)
+        if not is_valid:
+            return None
+        if options.end_address is not None:
+            is_valid, end_address = HM.int_value_from_string(options.end_address)
+            if not is_valid or options.count is not None:
+                return None
+        elif options.count is not None:
+            end_address = start_address + options.count * 4
+        else:
+            return None
+        is_function = False
+    else:
+        if options.end_address is not None:
+            return None
+        if options.name is not None:
+            if options.address is not None or options.frame:
+                return None
+            symbol = find_symbol_with_name(target, options.name)
+        elif options.address is not None:
+            if options.frame:
+                return None
+            is_valid, address_int = HM.int_value_from_string(options.address)
+            if not is_valid:
+                return None
+            symbol = target.ResolveLoadAddress(address_int).GetSymbol()
+        elif options.count is not None and not options.frame:
+            # "disassemble -c" starts at the pc instead of the start of the function
+            return None
+        else:
+            symbol = exe_ctx.GetFrame().GetSymbol()
+        if symbol is None or not symbol.IsValid():
+            return None
+        start_address = symbol.GetStartAddress().GetLoadAddress(target)
+        end_address = symbol.GetEndAddress().GetLoadAddress(target)
+        is_function = options.count is None
+        if options.count is not None:
+            end_address = start_address + options.count * 4
+
+    if start_address == lldb.LLDB_INVALID_ADDRESS or end_address == lldb.LLDB_INVALID_ADDRESS:
+        return None
+    if start_address % 4 != 0 or end_address <= start_address:
+        return None
+    return start_address, end_address, is_function
+
+
+def find_symbol_with_name(target: lldb.SBTarget, name: str) -> Optional[lldb.SBSymbol]:
+    # Return the symbol if the name matches only one function, otherwise "disassemble" lists all of them
+    symbol = None
+    symbol_context_list: lldb.SBSymbolContextList = target.FindFunctions(name, lldb.eFunctionNameTypeAuto)
+    for i in range(symbol_context_list.GetSize()):
+        context_symbol: lldb.SBSymbol = symbol_context_list.GetContextAtIndex(i).GetSymbol()
+        if not context_symbol.IsValid():
+            return None
+        if symbol is not None and symbol.GetStartAddress().GetLoadAddress(target) != context_symbol.GetStartAddress().GetLoadAddress(target):
+            return None
+        symbol = context_symbol
+    return symbol
+
+
+def structured_disassemble(exe_ctx: lldb.SBExecutionContext, start_address: int, end_address: int, is_function: bool, result: lldb.SBCommandReturnObject) -> None:
+    # Read the range once, comment the instructions with the buffer and format the output like "disassemble"
+    target = exe_ctx.GetTarget()
+    address: lldb.SBAddress = lldb.SBAddress(start_address, target)
+    error = lldb.SBError()
+    data: bytes = target.ReadMemory(address, end_address - start_address, error)
+    if not error.Success():
+        HM.DPrint(error)
+        return
+    instruction_list: lldb.SBInstructionList = target.ReadInstructions(address, len(data) // 4)
+    instruction_count = min(instruction_list.GetSize(), len(data) // 4)
+    instructions = [instruction_list.GetInstructionAtIndex(i) for i in range(instruction_count)]
+    comment_list = [instruction.GetComment(target) for instruction in instructions]
+    address_comment_dict = get_function_comment_dict(exe_ctx, address.GetModule(), data, start_address, instructions, comment_list) if is_function else None
+    if address_comment_dict is None:
+        address_comment_dict = get_comment_dict_with_buffer(exe_ctx, data, start_address, instructions, comment_list)
+
+    pc = lldb.LLDB_INVALID_ADDRESS
+    frame: lldb.SBFrame = exe_ctx.GetFrame()
+    if frame.IsValid():
+        pc = frame.GetPC()
+
+    # [(header, address_str, instruction_str, comment)], header is None if the symbol does not change
+    line_list: List[Tuple[Optional[str], str, str, str]] = []
+    symbol_start_address = lldb.LLDB_INVALID_ADDRESS
+    symbol_end_address = 0
+    for i, instruction in enumerate(instructions):
+        instruction_address = start_address + i * 4
+        header = None
+        if not (symbol_start_address <= instruction_address < symbol_end_address):
+            # Resolve the symbol only when leaving the previous one
+            instruction_sb_address: lldb.SBAddress = instruction.GetAddress()
+            symbol: lldb.SBSymbol = instruction_sb_address.GetSymbol()
+            if symbol.IsValid():
+                symbol_start_address = symbol.GetStartAddress().GetLoadAddress(target)
+                symbol_end_address = symbol.GetEndAddress().GetLoadAddress(target)
+                header = f"{instruction_sb_address.GetModule().GetFileSpec().GetFilename()}`{symbol.GetName()}:"
+            else:
+                symbol_start_address = lldb.LLDB_INVALID_ADDRESS
+                symbol_end_address = 0
+                header = ""
+
+        if symbol_start_address <= instruction_address < symbol_end_address:
+            address_str = f"{hex(instruction_address)} <+{instruction_address - symbol_start_address}>:"
+        else:
+            address_str = f"{hex(instruction_address)}:"
+        instruction_str = f"{instruction.GetMnemonic(target):<6} {instruction.GetOperands(target)}"
+        comment = comment_list[i] if len(comment_list[i]) > 0 else address_comment_dict.get(instruction_address, "")
+        line_list.append((header, address_str, instruction_str, comment))
+
+    address_width = max((len(line[1]) for line in line_list), default=0) + 1
+    for i, (header, address_str, instruction_str, comment) in enumerate(line_list):
+        if header is not None:
+            if i > 0:
+                result.AppendMessage("")
+            if len(header) > 0:
+                result.AppendMessage(header)
+        prefix = "->  " if start_address + i * 4 == pc else "    "
+        line = f"{prefix}{address_str.ljust(address_width)}{instruction_str}"
+        if len(comment) > 0:
+            # The same column as the comment of "disassemble"
+            line = f"{line.ljust(len(prefix) + address_width + 32)} ; {comment}"
+        result.AppendMessage(line.rstrip())
+
+
+def get_function_comment_dict(exe_ctx: lldb.SBExecutionContext, module: lldb.SBModule, data: bytes, start_address: int, instructions: List[lldb.SBInstruction], comment_list: List[str]) -> Optional[Dict[int, str]]:
+    # Find the comments of the function on disk, or calculate and save them. None if the module has no UUID.
+    if not module.IsValid() or not module.GetUUIDString():
+        return None
+    address_comment_dict = HMDisassembleAnnotation.find_comment_dict(exe_ctx, module, start_address, len(data))
+    if address_comment_dict is not None:
+        return address_comment_dict
+    load_list: List[Tuple[int, int]] = []
+    address_comment_dict = get_comment_dict_with_buffer(exe_ctx, data, start_address, instructions, comment_list, load_list)
+    HMDisassembleAnnotation.save_comment_dict(exe_ctx, module, start_address, len(data), address_comment_dict, load_list)
+    return address_comment_dict
+
+
+def get_comment_dict_with_buffer(exe_ctx: lldb.SBExecutionContext, data: bytes, start_address: int, instructions: List[lldb.SBInstruction], comment_list: List[str], load_list: Optional[List[Tuple[int, int]]] = None) -> Dict[int, str]:
+    # The same comments as set_my_comment_in_dict, the instructions are classified and emulated with the buffer.
+    # The memory loaded to calculate the comments is appended to load_list as (address, value).
+    address_comment_dict: Dict[int, str] = {}
+    adr_window_size = 11
+    instruction_count = len(instructions)
+    for i in range(instruction_count):
+        instruction_data = data[i * 4:i * 4 + 4]
+        instruction_address = start_address + i * 4
+        if HMA64Decoder.is_b_bytes(instruction_data) or HMA64Decoder.is_bl_bytes(instruction_data):
+            if len(comment_list[i]) > 0:
+                continue
+            my_comment = comment_for_branch_target(exe_ctx, instruction_address + HMA64Decoder.decode_b_bytes(instruction_data), load_list)
+            update_address_comment_dict(address_comment_dict, instruction_address, my_comment)
+        elif HMA64Decoder.is_adr_bytes(instruction_data) or HMA64Decoder.is_adrp_bytes(instruction_data):
+            if i + adr_window_size > instruction_count:
+                # The window exceeds the range
+                record_adrp_logic(exe_ctx, instructions[i], address_comment_dict, load_list)
+                continue
+            record_adrp_window(exe_ctx, data[i * 4:(i + adr_window_size) * 4], instruction_address, comment_list[i:i + adr_window_size], address_comment_dict, load_list)
+    return address_comment_dict
+
+
 def get_address_from_assemble_line(assemble_line: str) -> int:
     # 0x102b8f544 <+0>:  sub    sp, sp, #0x20
     # -> 0x102b8f544 <+0>:  sub    sp, sp, #0x20
@@ -177,406 +578,80 @@ def record_branch_logic(exe_ctx: lldb.SBExecutionContext, branch_instruction: ll
     update_address_comment_dict(address_comment_dict, branch_instruction.GetAddress().GetLoadAddress(target), my_comment)
 
 
-def record_adrp_logic(exe_ctx: lldb.SBExecutionContext, adrp_instruction: lldb.SBInstruction, address_comment_dict: Dict[int, str]) -> None:
-    # Analyze the specified instructions after adrp in sequence, and analyze up to 10 instructions.
+def record_adrp_logic(exe_ctx: lldb.SBExecutionContext, adrp_instruction: lldb.SBInstruction, address_comment_dict: Dict[int, str], load_list: Optional[List[Tuple[int, int]]] = None) -> None:
+    # Emulate the adr/adrp instruction and up to 10 instructions after it
     target = exe_ctx.GetTarget()
-    register_list = HMRegisterList()
-
-    # Calculate and save the value of adr/adrp instruction
+    instruction_count = 11
     error = lldb.SBError()
-    adrp_data: bytes = target.ReadMemory(adrp_instruction.GetAddress(), 4, error)
+    data: bytes = target.ReadMemory(adrp_instruction.GetAddress(), 4 * instruction_count, error)
     if not error.Success():
         HM.DPrint(error)
         return
-    adrp_instruction_load_address: int = adrp_instruction.GetAddress().GetLoadAddress(target)
-    adrp_rd, adrp_offset = HMReference.decode_adr_bytes(adrp_data)
-    if HMReference.is_adr_bytes(adrp_data):
-        adrp_result = adrp_instruction_load_address + adrp_offset
-    elif HMReference.is_adrp_bytes(adrp_data):
-        adrp_result, _ = HMCalculationHelper.calculate_adrp_result_with_immediate_and_pc_address(adrp_offset, adrp_instruction_load_address)
-    else:
+    if not (HMA64Decoder.is_adr_bytes(data[0:4]) or HMA64Decoder.is_adrp_bytes(data[0:4])):
         HM.DPrint("Not adr/adrp data.")
         return
-    register_list.set_value(adrp_rd, adrp_result, True)
-    adrp_comment = adrp_instruction.GetComment(target)
-    if len(adrp_comment) == 0:
-        my_comment = f"{HMRegister.get_register_name(adrp_rd, True)} = {hex(adrp_result)}"
-        update_address_comment_dict(address_comment_dict, adrp_instruction_load_address, my_comment)
 
-    # Analyze the specified instructions after adr/adrp
-    instruction_count = 10
-    address: lldb.SBAddress = lldb.SBAddress(adrp_instruction_load_address + 4, target)
-    error = lldb.SBError()
-    data: bytes = target.ReadMemory(address, 4 * instruction_count, error)
-    if not error.Success():
-        HM.DPrint(error)
-        return
-    instruction_list: lldb.SBInstructionList = target.ReadInstructions(address, instruction_count)
-    for i in range(instruction_count):
-        instruction_data = data[i*4:i*4+4]
-        instruction: lldb.SBInstruction = instruction_list.GetInstructionAtIndex(i)
-        instruction_load_address: int = instruction.GetAddress().GetLoadAddress(target)
-        comment = instruction.GetComment(target)
-        # adr/adrp
-        if HMReference.is_adr_bytes(instruction_data):
-            rd, offset = HMReference.decode_adr_bytes(instruction_data)
-            rd_value = instruction_load_address + offset
-            register_list.set_value(rd, rd_value, True)
-
-            if len(comment) == 0:
-                my_comment = f"{HMRegister.get_register_name(rd, True)} = {hex(rd_value)}"
-                update_address_comment_dict(address_comment_dict, instruction_load_address, my_comment)
-        elif HMReference.is_adrp_bytes(instruction_data):
-            rd, offset = HMReference.decode_adr_bytes(instruction_data)
-            rd_value, _ = HMCalculationHelper.calculate_adrp_result_with_immediate_and_pc_address(offset, instruction_load_address)
-            register_list.set_value(rd, rd_value, True)
-
-            if len(comment) == 0:
-                my_comment = f"{HMRegister.get_register_name(rd, True)} = {hex(rd_value)}"
-                update_address_comment_dict(address_comment_dict, instruction_load_address, my_comment)
-
-        # add
-        elif HMReference.is_add_bytes_immediate(instruction_data):
-            rd, rn, is_64bit, final_immediate = HMReference.decode_add_bytes_immediate(instruction_data)
-            if not register_list.has_value(rn):
-                break
-            rd_value = register_list.get_value(rn, is_64bit) + final_immediate
-            register_list.set_value(rd, rd_value, is_64bit)
-
-            if len(comment) == 0:
-                result = register_list.get_value(rd, is_64bit)
-                lookup_summary = HM.get_image_lookup_summary_from_address(result)
-                my_comment = f"{HMRegister.get_register_name(rd, is_64bit)} = {hex(result)} {lookup_summary}"
-                update_address_comment_dict(address_comment_dict, instruction_load_address, my_comment)
-        elif HMReference.is_add_bytes_shifted_register(instruction_data):
-            rd, rn, rm, is_64bit, shift, amount = HMReference.decode_add_bytes_shifted_register(instruction_data)
-            if shift == HMShift.unknow:
-                break
-            if rd == 31:  # xzr
-                continue
-            if (not register_list.has_value(rn)) and rn != 31:
-                break
-            if (not register_list.has_value(rm)) and rm != 31:
-                break
-            rn_raw_value = 0 if rn == 31 else register_list.get_raw_value(rn, is_64bit)
-            rm_raw_value = 0 if rm == 31 else register_list.get_raw_value(rm, is_64bit)
-            bit_width = 64 if is_64bit else 32
-            if amount == 0:
-                rd_raw_value = rn_raw_value + rm_raw_value
-            else:
-                if shift == HMShift.lsl:
-                    rm_value_shift = (rm_raw_value << amount) & ((1 << bit_width) - 1)
-                elif shift == HMShift.lsr:
-                    rm_value_shift = HMReference.logical_shift_right(rm_raw_value, amount, bit_width)
-                elif shift == HMShift.asr:
-                    rm_value_shift = (rm_raw_value >> amount) & ((1 << bit_width) - 1)
-                else:  # HMShift.unknow
-                    break
-                rd_raw_value = rn_raw_value + rm_value_shift
-
-            register_list.set_raw_value(rd, rd_raw_value, is_64bit)
-
-            if len(comment) == 0:
-                result = register_list.get_value(rd, is_64bit)
-                lookup_summary = HM.get_image_lookup_summary_from_address(result)
-                my_comment = f"{HMRegister.get_register_name(rd, is_64bit)} = {hex(result)} {lookup_summary}"
-                update_address_comment_dict(address_comment_dict, instruction_load_address, my_comment)
-
-        # ldr
-        elif HMReference.is_ldr_bytes_immediate_post_index(instruction_data):
-            rt, rn, is_64bit, simm = HMReference.decode_ldr_bytes_immediate_post_index(instruction_data)
-            if not register_list.has_value(rn):
-                break
-            rn_value = register_list.get_value(rn, True)
-            load_address = rn_value
-            ldr_result = HM.load_address_value(exe_ctx, load_address)
-            if ldr_result == -1:
-                if len(comment) == 0:
-                    my_comment = HM.get_image_lookup_summary_from_address(load_address)
-                    update_address_comment_dict(address_comment_dict, instruction_load_address, my_comment)
-                break
-            if rt != 31:  # xzr
-                register_list.set_raw_value(rt, ldr_result, is_64bit)
-            rn_value += simm
-            register_list.set_value(rn, rn_value, True)
-
-            # lookup <ldr_result> first, if there is no result, lookup <load_address>
-            if len(comment) == 0 and rt != 31:
-                result = register_list.get_value(rt, is_64bit)
-                lookup_summary = HM.get_image_lookup_summary_from_address(result)
-                if len(lookup_summary) == 0:
-                    lookup_summary = HM.get_image_lookup_summary_from_address(load_address)
-                my_comment = f"{HMRegister.get_register_name(rt, is_64bit)} = {hex(result)} {lookup_summary}"
-                update_address_comment_dict(address_comment_dict, instruction_load_address, my_comment)
-
-        elif HMReference.is_ldr_bytes_immediate_pre_index(instruction_data):
-            rt, rn, is_64bit, simm = HMReference.decode_ldr_bytes_immediate_pre_index(instruction_data)
-            if not register_list.has_value(rn):
-                break
-            rn_value = register_list.get_value(rn, True)
-            rn_value += simm
-            register_list.set_value(rn, rn_value, True)
-            ldr_result = HM.load_address_value(exe_ctx, rn_value)
-            if ldr_result == -1:
-                if len(comment) == 0:
-                    my_comment = HM.get_image_lookup_summary_from_address(rn_value)
-                    update_address_comment_dict(address_comment_dict, instruction_load_address, my_comment)
-                break
-            if rt != 31:  # xzr
-                register_list.set_raw_value(rt, ldr_result, is_64bit)
-
-            if len(comment) == 0 and rt != 31:
-                result = register_list.get_value(rt, is_64bit)
-                lookup_summary = HM.get_image_lookup_summary_from_address(result)
-                if len(lookup_summary) == 0:
-                    lookup_summary = HM.get_image_lookup_summary_from_address(rn_value)
-                my_comment = f"{HMRegister.get_register_name(rt, is_64bit)} = {hex(result)} {lookup_summary}"
-                update_address_comment_dict(address_comment_dict, instruction_load_address, my_comment)
-        elif HMReference.is_ldr_bytes_immediate_unsigned_offset(instruction_data):
-            rt, rn, is_64bit, pimm = HMReference.decode_ldr_bytes_immediate_unsigned_offset(instruction_data)
-            if not register_list.has_value(rn):
-                break
-            rn_value = register_list.get_value(rn, True)
-            load_address = rn_value + pimm
-            ldr_result = HM.load_address_value(exe_ctx, load_address)
-            if ldr_result == -1:
-                if len(comment) == 0:
-                    my_comment = HM.get_image_lookup_summary_from_address(load_address)
-                    update_address_comment_dict(address_comment_dict, instruction_load_address, my_comment)
-                break
-            if rt != 31:  # xzr
-                register_list.set_raw_value(rt, ldr_result, is_64bit)
-
-            if len(comment) == 0 and rt != 31:
-                result = register_list.get_value(rt, is_64bit)
-                lookup_summary = HM.get_image_lookup_summary_from_address(result)
-                if len(lookup_summary) == 0:
-                    lookup_summary = HM.get_image_lookup_summary_from_address(load_address)
-                my_comment = f"{HMRegister.get_register_name(rt, is_64bit)} = {hex(result)} {lookup_summary}"
-                update_address_comment_dict(address_comment_dict, instruction_load_address, my_comment)
-        elif HMReference.is_ldr_bytes_literal(instruction_data):
-            rt, is_64bit, label = HMReference.decode_ldr_bytes_literal(instruction_data)
-            load_address = label + instruction_load_address
-            ldr_result = HM.load_address_value(exe_ctx, load_address)
-            if ldr_result == -1:
-                if len(comment) == 0:
-                    my_comment = HM.get_image_lookup_summary_from_address(load_address)
-                    update_address_comment_dict(address_comment_dict, instruction_load_address, my_comment)
-                break
-            if rt != 31:  # xzr
-                register_list.set_raw_value(rt, ldr_result, is_64bit)
-
-            if len(comment) == 0 and rt != 31:
-                result = register_list.get_value(rt, is_64bit)
-                lookup_summary = HM.get_image_lookup_summary_from_address(result)
-                if len(lookup_summary) == 0:
-                    lookup_summary = HM.get_image_lookup_summary_from_address(load_address)
-                my_comment = f"{HMRegister.get_register_name(rt, is_64bit)} = {hex(result)} {lookup_summary}"
-                update_address_comment_dict(address_comment_dict, instruction_load_address, my_comment)
-        elif HMReference.is_ldr_bytes_register(instruction_data):
-            rt, rn, rm, is_64bit, extend, amount = HMReference.decode_ldr_bytes_register(instruction_data)
-            if rt == 31:  # xzr
-                continue
-            if extend == HMExtendOption.unknow or extend == HMExtendOption.sxtx:
-                break
-            if not register_list.has_value(rn):
-                break
-            if rm != 31 and (not register_list.has_value(rm)):
-                break
-            rn_raw_value = register_list.get_raw_value(rn, True)
-            if extend == HMExtendOption.uxtw:
-                rm_raw_value = 0 if rm == 31 else register_list.get_raw_value(rm, False)
-                temp = HMReference.unsigned_extend_word(rm_raw_value) << amount
-            elif extend == HMExtendOption.lsl:
-                rm_raw_value = 0 if rm == 31 else register_list.get_raw_value(rm, True)
-                temp = rm_raw_value << amount
-            elif extend == HMExtendOption.sxtw:
-                rm_raw_value = 0 if rm == 31 else register_list.get_value(rm, False)
-                temp = HMReference.signed_extend_word(rm_raw_value) << amount
-            else:
-                break
-            load_address = HMRegister.twos_complement_to_int(rn_raw_value + temp, 64)
-            ldr_result = HM.load_address_value(exe_ctx, load_address)
-            if ldr_result == -1:
-                break
-            register_list.set_raw_value(rt, ldr_result, is_64bit)
-
-            if len(comment) == 0:
-                result = register_list.get_value(rt, is_64bit)
-                lookup_summary = HM.get_image_lookup_summary_from_address(result)
-                if len(lookup_summary) == 0:
-                    lookup_summary = HM.get_image_lookup_summary_from_address(load_address)
-                my_comment = f"{HMRegister.get_register_name(rt, is_64bit)} = {hex(result)} {lookup_summary}"
-                update_address_comment_dict(address_comment_dict, instruction_load_address, my_comment)
-
-        # ldrsw
-        elif HMReference.is_ldrsw_bytes_immediate_post_index(instruction_data):
-            rt, rn, simm = HMReference.decode_ldrsw_bytes_immediate_post_index(instruction_data)
-            if not register_list.has_value(rn):
-                break
-            rn_value = register_list.get_value(rn, True)
-            load_address = rn_value
-            ldrsw_result = HM.load_address_value_signed_word(exe_ctx, load_address)
-            if ldrsw_result == -1:
-                break
-            if rt != 31:  # xzr
-                register_list.set_raw_value(rt, ldrsw_result, True)
-            rn_value += simm
-            register_list.set_value(rn, rn_value, True)
-
-            # The ldrsw instruction records the result address in memory
-            if len(comment) == 0 and rt != 31:
-                result = register_list.get_value(rt, True)
-                my_comment = f"{HMRegister.get_register_name(rt, True)} = {hex(result)}"
-                update_address_comment_dict(address_comment_dict, instruction_load_address, my_comment)
-        elif HMReference.is_ldrsw_bytes_immediate_pre_index(instruction_data):
-            rt, rn, simm = HMReference.decode_ldrsw_bytes_immediate_pre_index(instruction_data)
-            if not register_list.has_value(rn):
-                break
-            rn_value = register_list.get_value(rn, True)
-            rn_value += simm
-            register_list.set_value(rn, rn_value, True)
-            ldrsw_result = HM.load_address_value_signed_word(exe_ctx, rn_value)
-            if ldrsw_result == -1:
-                break
-            if rt != 31:  # xzr
-                register_list.set_raw_value(rt, ldrsw_result, True)
-
-            if len(comment) == 0 and rt != 31:
-                result = register_list.get_value(rt, True)
-                my_comment = f"{HMRegister.get_register_name(rt, True)} = {hex(result)}"
-                update_address_comment_dict(address_comment_dict, instruction_load_address, my_comment)
-        elif HMReference.is_ldrsw_bytes_immediate_unsigned_offset(instruction_data):
-            rt, rn, pimm = HMReference.decode_ldrsw_bytes_immediate_unsigned_offset(instruction_data)
-            if not register_list.has_value(rn):
-                break
-            rn_value = register_list.get_value(rn, True)
-            load_address = rn_value + pimm
-            ldrsw_result = HM.load_address_value_signed_word(exe_ctx, load_address)
-            if ldrsw_result == -1:
-                break
-            if rt != 31:  # xzr
-                register_list.set_raw_value(rt, ldrsw_result, True)
-
-            if len(comment) == 0 and rt != 31:
-                result = register_list.get_value(rt, True)
-                my_comment = f"{HMRegister.get_register_name(rt, True)} = {hex(result)}"
-                update_address_comment_dict(address_comment_dict, instruction_load_address, my_comment)
-        elif HMReference.is_ldrsw_bytes_register(instruction_data):
-            rt, rn, rm, extend, amount = HMReference.decode_ldrsw_bytes_register(instruction_data)
-            if rt == 31:  # xzr
-                continue
-            if extend == HMExtendOption.unknow or extend == HMExtendOption.sxtx:
-                break
-            if not register_list.has_value(rn):
-                break
-            if rm != 31 and (not register_list.has_value(rm)):
-                break
-            rn_raw_value = register_list.get_raw_value(rn, True)
-            if extend == HMExtendOption.uxtw:
-                rm_raw_value = 0 if rm == 31 else register_list.get_raw_value(rm, False)
-                temp = HMReference.unsigned_extend_word(rm_raw_value) << amount
-            elif extend == HMExtendOption.lsl:
-                rm_raw_value = 0 if rm == 31 else register_list.get_raw_value(rm, True)
-                temp = rm_raw_value << amount
-            elif extend == HMExtendOption.sxtw:
-                rm_raw_value = 0 if rm == 31 else register_list.get_value(rm, False)
-                temp = HMReference.signed_extend_word(rm_raw_value) << amount
-            else:
-                break
-            load_address = HMRegister.twos_complement_to_int(rn_raw_value + temp, 64)
-            ldrsw_result = HM.load_address_value_signed_word(exe_ctx, load_address)
-            if ldrsw_result == -1:
-                break
-            register_list.set_raw_value(rt, ldrsw_result, True)
-
-            if len(comment) == 0:
-                result = register_list.get_value(rt, True)
-                my_comment = f"{HMRegister.get_register_name(rt, True)} = {hex(result)}"
-                update_address_comment_dict(address_comment_dict, instruction_load_address, my_comment)
-
-        # mov
-        elif HMReference.is_mov_bytes_inverted_wide_immediate(instruction_data):
-            rd, is_64bit, immediate = HMReference.decode_mov_bytes_inverted_wide_immediate(instruction_data)
-            if rd == 31:  # xzr
-                continue
-            register_list.set_value(rd, immediate, is_64bit)
-            if len(comment) == 0:
-                result = register_list.get_value(rd, is_64bit)
-                lookup_summary = HM.get_image_lookup_summary_from_address(result)
-                my_comment = f"{HMRegister.get_register_name(rd, is_64bit)} = {hex(result)} {lookup_summary}"
-                update_address_comment_dict(address_comment_dict, instruction_load_address, my_comment)
-        elif HMReference.is_mov_bytes_register(instruction_data):
-            rd, rm, is_64bit = HMReference.decode_mov_bytes_register(instruction_data)
-            if rd == 31:  # xzr
-                continue
-            if rm != 31 and (not register_list.has_value(rm)):
-                break
-            rm_raw_value = 0 if rm == 31 else register_list.get_raw_value(rm, is_64bit)
-            register_list.set_raw_value(rd, rm_raw_value, is_64bit)
-
-            if len(comment) == 0:
-                result = register_list.get_value(rd, is_64bit)
-                lookup_summary = HM.get_image_lookup_summary_from_address(result)
-                my_comment = f"{HMRegister.get_register_name(rd, is_64bit)} = {hex(result)} {lookup_summary}"
-                update_address_comment_dict(address_comment_dict, instruction_load_address, my_comment)
-        elif HMReference.is_mov_bytes_to_from_sp(instruction_data):
-            rd, rn, is_64bit = HMReference.decode_mov_bytes_to_from_sp(instruction_data)
-            if not register_list.has_value(rn):
-                break
-            rn_raw_value = register_list.get_raw_value(rn, is_64bit)
-            register_list.set_raw_value(rd, rn_raw_value, is_64bit)
-
-            if len(comment) == 0:
-                result = register_list.get_value(rd, is_64bit)
-                lookup_summary = HM.get_image_lookup_summary_from_address(result)
-                my_comment = f"{HMRegister.get_register_name(rd, is_64bit)} = {hex(result)} {lookup_summary}"
-                update_address_comment_dict(address_comment_dict, instruction_load_address, my_comment)
-        elif HMReference.is_mov_bytes_wide_immediate(instruction_data):
-            rd, is_64bit, immediate = HMReference.decode_mov_bytes_wide_immediate(instruction_data)
-            if rd == 31:  # xzr
-                continue
-            register_list.set_value(rd, immediate, is_64bit)
-
-            if len(comment) == 0:
-                result = register_list.get_value(rd, is_64bit)
-                lookup_summary = HM.get_image_lookup_summary_from_address(result)
-                my_comment = f"{HMRegister.get_register_name(rd, is_64bit)} = {hex(result)} {lookup_summary}"
-                update_address_comment_dict(address_comment_dict, instruction_load_address, my_comment)
-
-        # str
-        elif HMReference.is_str_bytes_immediate_post_index(instruction_data):
-            rt, rn, is_64bit, simm = HMReference.decode_str_bytes_immediate_post_index(instruction_data)
-            if not register_list.has_value(rn):
-                break
-            rn_value = register_list.get_value(rn, True)
-            load_address = rn_value
-            rn_value += simm
-            register_list.set_value(rn, rn_value, is_64bit)
-        elif HMReference.is_str_bytes_immediate_pre_index(instruction_data):
-            rt, rn, is_64bit, simm = HMReference.decode_str_bytes_immediate_pre_index(instruction_data)
-            if not register_list.has_value(rn):
-                break
-            rn_value = register_list.get_value(rn, True)
-            rn_value += simm
-            register_list.set_value(rn, rn_value, is_64bit)
-        elif HMReference.is_str_bytes_immediate_unsigned_offset(instruction_data):
-            continue
-        elif HMReference.is_str_bytes_register(instruction_data):
-            rt, rn, rm, is_64bit, extend, amount = HMReference.decode_str_bytes_register(instruction_data)
-            if extend == HMExtendOption.unknow or extend == HMExtendOption.sxtx:
-                break
-            continue
+    adrp_instruction_load_address: int = adrp_instruction.GetAddress().GetLoadAddress(target)
+    instruction_list: lldb.SBInstructionList = target.ReadInstructions(adrp_instruction.GetAddress(), instruction_count)
+    comment_list = [instruction_list.GetInstructionAtIndex(i).GetComment(target) for i in range(instruction_list.GetSize())]
+    record_adrp_window(exe_ctx, data, adrp_instruction_load_address, comment_list, address_comment_dict, load_list)
 
-        # stp
-        elif HMReference.is_stp_bytes_signed_offset(instruction_data):
-            continue
 
-        # nop
-        elif HMReference.is_nop_bytes(instruction_data):
+def record_adrp_window(exe_ctx: lldb.SBExecutionContext, data, adrp_instruction_load_address: int, comment_list: List[str], address_comment_dict: Dict[int, str], load_list: Optional[List[Tuple[int, int]]] = None) -> None:
+    # data starts with the adr/adrp instruction, comment_list[i] is the lldb comment of the instruction i in data.
+    # Emulate them and comment the instructions without lldb comment, see HMA64Emulator.py
+    if load_list is None:
+        emulator = HMA64Emulator.HMA64Emulator(lambda address_int: load_address_value(exe_ctx, address_int))
+    else:
+        emulator = HMA64Emulator.HMA64Emulator(lambda address_int: record_load(exe_ctx, address_int, load_list))
+    for effect in emulator.run(data, adrp_instruction_load_address):
+        if effect.kind not in commented_effect_kind_list:
             continue
-        else:
+        index = (effect.address - adrp_instruction_load_address) // 4
+        if index >= len(comment_list):
             break
+        if len(comment_list[index]) > 0:
+            continue
+        my_comment = comment_for_effect(effect)
+        if len(my_comment) > 0:
+            update_address_comment_dict(address_comment_dict, effect.address, my_comment)
+
+
+# The effects that have a comment, see comment_for_effect
+commented_effect_kind_list = [HMA64Emulator.effect_kind_address, HMA64Emulator.effect_kind_value, HMA64Emulator.effect_kind_load, HMA64Emulator.effect_kind_load_signed_word]
+
+
+def comment_for_effect(effect: HMA64Emulator.HMA64Effect) -> str:
+    kind = effect.kind
+    if kind == HMA64Emulator.effect_kind_address:
+        return f"{HMRegister.get_register_name(effect.register, True)} = {hex(effect.value)}"
+
+    if kind == HMA64Emulator.effect_kind_load and effect.value is None:
+        # The memory cannot be read, lookup the loading address
+        return HM.get_image_lookup_summary_from_address(effect.memory_address)
+    if effect.register < 0:  # xzr, or the memory cannot be read
+        return ""
+    register_name = HMRegister.get_register_name(effect.register, effect.is_64bit)
+    if kind == HMA64Emulator.effect_kind_value:
+        lookup_summary = HM.get_image_lookup_summary_from_address(effect.value)
+        return f"{register_name} = {hex(effect.value)} {lookup_summary}"
+    if kind == HMA64Emulator.effect_kind_load:
+        # lookup <ldr_result> first, if there is no result, lookup <load_address>
+        lookup_summary = HM.get_image_lookup_summary_from_address(effect.value)
+        if len(lookup_summary) == 0:
+            lookup_summary = HM.get_image_lookup_summary_from_address(effect.memory_address)
+        return f"{register_name} = {hex(effect.value)} {lookup_summary}"
+    if kind == HMA64Emulator.effect_kind_load_signed_word:
+        # The ldrsw instruction records the result address in memory
+        return f"{register_name} = {hex(effect.value)}"
+    return ""
+
+
+def record_load(exe_ctx: lldb.SBExecutionContext, address_int: int, load_list: List[Tuple[int, int]]) -> int:
+    # The same as load_address_value, and append (address, value) to load_list
+    value = load_address_value(exe_ctx, address_int)
+    load_list.append((address_int, value))
+    return value
 
 
 def update_address_comment_dict(address_comment_dict: Dict[int, str], address_int: int, comment: str) -> bool:
@@ -597,12 +672,36 @@ def comment_for_branch(exe_ctx: lldb.SBExecutionContext, branch_instruction: lld
     if not error.Success():
         HM.DPrint(error)
         return ""
-    if not (HMReference.is_b_bytes(branch_data) or HMReference.is_bl_bytes(branch_data)):
+    if not (HMA64Decoder.is_b_bytes(branch_data) or HMA64Decoder.is_bl_bytes(branch_data)):
         HM.DPrint("Error branch instruction.")
         return ""
     branch_instruction_load_address: int = branch_instruction.GetAddress().GetLoadAddress(target)
-    branch_label = HMReference.decode_b_bytes(branch_data)
-    branch_target_load_address = branch_instruction_load_address + branch_label
+    branch_label = HMA64Decoder.decode_b_bytes(branch_data)
+    return comment_for_branch_target(exe_ctx, branch_instruction_load_address + branch_label)
+
+
+def comment_for_branch_target(exe_ctx: lldb.SBExecutionContext, branch_target_load_address: int, load_list: Optional[List[Tuple[int, int]]] = None) -> str:
+    # The same branch target, e.g. a stub of objc_msgSend, is called many times, so its comment is cached.
+    # The memory loaded to resolve the comment is appended to load_list as (address, value).
+    cache = get_branch_comment_cache(exe_ctx)
+    branch_comment = cache.get(branch_target_load_address)
+    if branch_comment is None or not branch_comment.is_up_to_date(exe_ctx, cache.stop_id):
+        branch_load_list: List[Tuple[int, int]] = []
+        comment = calculate_comment_for_branch_target(exe_ctx, branch_target_load_address, branch_load_list)
+        branch_comment = HMBranchComment(comment, branch_load_list, cache.stop_id)
+        target = exe_ctx.GetTarget()
+        module: lldb.SBModule = lldb.SBAddress(branch_target_load_address, target).GetModule()
+        if module.IsValid():
+            cache.put(target, module, branch_target_load_address, branch_comment)
+    if load_list is not None:
+        load_list.extend(branch_comment.load_list)
+    return branch_comment.comment
+
+
+def calculate_comment_for_branch_target(exe_ctx: lldb.SBExecutionContext, branch_target_load_address: int, load_list: List[Tuple[int, int]]) -> str:
+    # Find the true target of the branch by the instructions of its target address, e.g. "br x16" of a stub.
+    # The loaded memory is appended to load_list as (address, value).
+    target = exe_ctx.GetTarget()
     address: lldb.SBAddress = lldb.SBAddress(branch_target_load_address, target)
 
     # Read 10 instructions of target address
@@ -617,279 +716,114 @@ def comment_for_branch(exe_ctx: lldb.SBExecutionContext, branch_instruction: lld
     if instruction_count != instruction_list.GetSize():
         return ""
 
-    # Analyze
-    register_list = HMRegisterList()
-    for i in range(instruction_count):
-        instruction_data = data[i*4:i*4+4]
-        instruction: lldb.SBInstruction = instruction_list.GetInstructionAtIndex(i)
-        instruction_load_address: int = instruction.GetAddress().GetLoadAddress(target)
-        comment = instruction.GetComment(target)
-        # adr/adrp
-        if HMReference.is_adr_bytes(instruction_data):
-            rd, offset = HMReference.decode_adr_bytes(instruction_data)
-            rd_value = instruction_load_address + offset
-            register_list.set_value(rd, rd_value, True)
-        elif HMReference.is_adrp_bytes(instruction_data):
-            rd, offset = HMReference.decode_adr_bytes(instruction_data)
-            rd_value, _ = HMCalculationHelper.calculate_adrp_result_with_immediate_and_pc_address(offset, instruction_load_address)
-            register_list.set_value(rd, rd_value, True)
-        # add
-        elif HMReference.is_add_bytes_immediate(instruction_data):
-            rd, rn, is_64bit, final_immediate = HMReference.decode_add_bytes_immediate(instruction_data)
-            if not register_list.has_value(rn):
-                break
-            rd_value = register_list.get_value(rn, is_64bit) + final_immediate
-            register_list.set_value(rd, rd_value, is_64bit)
-        elif HMReference.is_add_bytes_shifted_register(instruction_data):
-            rd, rn, rm, is_64bit, shift, amount = HMReference.decode_add_bytes_shifted_register(instruction_data)
-            if shift == HMShift.unknow:
-                break
-            if rd == 31:  # xzr
-                continue
-            if (not register_list.has_value(rn)) and rn != 31:
-                break
-            if (not register_list.has_value(rm)) and rm != 31:
-                break
-            rn_raw_value = 0 if rn == 31 else register_list.get_raw_value(rn, is_64bit)
-            rm_raw_value = 0 if rm == 31 else register_list.get_raw_value(rm, is_64bit)
-            bit_width = 64 if is_64bit else 32
-            if amount == 0:
-                rd_raw_value = rn_raw_value + rm_raw_value
-            else:
-                if shift == HMShift.lsl:
-                    rm_value_shift = (rm_raw_value << amount) & ((1 << bit_width) - 1)
-                elif shift == HMShift.lsr:
-                    rm_value_shift = HMReference.logical_shift_right(rm_raw_value, amount, bit_width)
-                elif shift == HMShift.asr:
-                    rm_value_shift = (rm_raw_value >> amount) & ((1 << bit_width) - 1)
-                else:  # HMShift.unknow
-                    break
-                rd_raw_value = rn_raw_value + rm_value_shift
-
-            register_list.set_raw_value(rd, rd_raw_value, is_64bit)
-
-        # ldr
-        elif HMReference.is_ldr_bytes_immediate_post_index(instruction_data):
-            rt, rn, is_64bit, simm = HMReference.decode_ldr_bytes_immediate_post_index(instruction_data)
-            if not register_list.has_value(rn):
-                break
-            rn_value = register_list.get_value(rn, True)
-            load_address = rn_value
-            ldr_result = HM.load_address_value(exe_ctx, load_address)
-            if ldr_result == -1:
-                break
-            if rt != 31:  # xzr
-                register_list.set_raw_value(rt, ldr_result, is_64bit)
-            rn_value += simm
-            register_list.set_value(rn, rn_value, True)
-        elif HMReference.is_ldr_bytes_immediate_pre_index(instruction_data):
-            rt, rn, is_64bit, simm = HMReference.decode_ldr_bytes_immediate_pre_index(instruction_data)
-            if not register_list.has_value(rn):
-                break
-            rn_value = register_list.get_value(rn, True)
-            rn_value += simm
-            register_list.set_value(rn, rn_value, True)
-            ldr_result = HM.load_address_value(exe_ctx, rn_value)
-            if ldr_result == -1:
-                break
-            if rt != 31:  # xzr
-                register_list.set_raw_value(rt, ldr_result, is_64bit)
-        elif HMReference.is_ldr_bytes_immediate_unsigned_offset(instruction_data):
-            rt, rn, is_64bit, pimm = HMReference.decode_ldr_bytes_immediate_unsigned_offset(instruction_data)
-            if not register_list.has_value(rn):
-                break
-            rn_value = register_list.get_value(rn, True)
-            load_address = rn_value + pimm
-            ldr_result = HM.load_address_value(exe_ctx, load_address)
-            if ldr_result == -1:
-                break
-            if rt != 31:  # xzr
-                register_list.set_raw_value(rt, ldr_result, is_64bit)
-        elif HMReference.is_ldr_bytes_literal(instruction_data):
-            rt, is_64bit, label = HMReference.decode_ldr_bytes_literal(instruction_data)
-            load_address = label + instruction_load_address
-            ldr_result = HM.load_address_value(exe_ctx, load_address)
-            if ldr_result == -1:
-                break
-            if rt != 31:  # xzr
-                register_list.set_raw_value(rt, ldr_result, is_64bit)
-        elif HMReference.is_ldr_bytes_register(instruction_data):
-            rt, rn, rm, is_64bit, extend, amount = HMReference.decode_ldr_bytes_register(instruction_data)
-            if rt == 31:  # xzr
-                continue
-            if extend == HMExtendOption.unknow or extend == HMExtendOption.sxtx:
-                break
-            if not register_list.has_value(rn):
-                break
-            if rm != 31 and (not register_list.has_value(rm)):
-                break
-            rn_raw_value = register_list.get_raw_value(rn, True)
-            if extend == HMExtendOption.uxtw:
-                rm_raw_value = 0 if rm == 31 else register_list.get_raw_value(rm, False)
-                temp = HMReference.unsigned_extend_word(rm_raw_value) << amount
-            elif extend == HMExtendOption.lsl:
-                rm_raw_value = 0 if rm == 31 else register_list.get_raw_value(rm, True)
-                temp = rm_raw_value << amount
-            elif extend == HMExtendOption.sxtw:
-                rm_raw_value = 0 if rm == 31 else register_list.get_value(rm, False)
-                temp = HMReference.signed_extend_word(rm_raw_value) << amount
-            else:
-                break
-            load_address = HMRegister.twos_complement_to_int(rn_raw_value + temp, 64)
-            ldr_result = HM.load_address_value(exe_ctx, load_address)
-            if ldr_result == -1:
-                break
-            register_list.set_raw_value(rt, ldr_result, is_64bit)
-
-        # ldrsw
-        elif HMReference.is_ldrsw_bytes_immediate_post_index(instruction_data):
-            rt, rn, simm = HMReference.decode_ldrsw_bytes_immediate_post_index(instruction_data)
-            if not register_list.has_value(rn):
-                break
-            rn_value = register_list.get_value(rn, True)
-            load_address = rn_value
-            ldrsw_result = HM.load_address_value_signed_word(exe_ctx, load_address)
-            if ldrsw_result == -1:
-                break
-            if rt != 31:  # xzr
-                register_list.set_raw_value(rt, ldrsw_result, True)
-            rn_value += simm
-            register_list.set_value(rn, rn_value, True)
-        elif HMReference.is_ldrsw_bytes_immediate_pre_index(instruction_data):
-            rt, rn, simm = HMReference.decode_ldrsw_bytes_immediate_pre_index(instruction_data)
-            if not register_list.has_value(rn):
-                break
-            rn_value = register_list.get_value(rn, True)
-            rn_value += simm
-            register_list.set_value(rn, rn_value, True)
-            ldrsw_result = HM.load_address_value_signed_word(exe_ctx, rn_value)
-            if ldrsw_result == -1:
-                break
-            if rt != 31:  # xzr
-                register_list.set_raw_value(rt, ldrsw_result, True)
-        elif HMReference.is_ldrsw_bytes_immediate_unsigned_offset(instruction_data):
-            rt, rn, pimm = HMReference.decode_ldrsw_bytes_immediate_unsigned_offset(instruction_data)
-            if not register_list.has_value(rn):
-                break
-            rn_value = register_list.get_value(rn, True)
-            load_address = rn_value + pimm
-            ldrsw_result = HM.load_address_value_signed_word(exe_ctx, load_address)
-            if ldrsw_result == -1:
-                break
-            if rt != 31:  # xzr
-                register_list.set_raw_value(rt, ldrsw_result, True)
-        elif HMReference.is_ldrsw_bytes_register(instruction_data):
-            rt, rn, rm, extend, amount = HMReference.decode_ldrsw_bytes_register(instruction_data)
-            if rt == 31:  # xzr
-                continue
-            if extend == HMExtendOption.unknow or extend == HMExtendOption.sxtx:
-                break
-            if not register_list.has_value(rn):
-                break
-            if rm != 31 and (not register_list.has_value(rm)):
-                break
-            rn_raw_value = register_list.get_raw_value(rn, True)
-            if extend == HMExtendOption.uxtw:
-                rm_raw_value = 0 if rm == 31 else register_list.get_raw_value(rm, False)
-                temp = HMReference.unsigned_extend_word(rm_raw_value) << amount
-            elif extend == HMExtendOption.lsl:
-                rm_raw_value = 0 if rm == 31 else register_list.get_raw_value(rm, True)
-                temp = rm_raw_value << amount
-            elif extend == HMExtendOption.sxtw:
-                rm_raw_value = 0 if rm == 31 else register_list.get_value(rm, False)
-                temp = HMReference.signed_extend_word(rm_raw_value) << amount
-            else:
-                break
-            load_address = HMRegister.twos_complement_to_int(rn_raw_value + temp, 64)
-            ldrsw_result = HM.load_address_value_signed_word(exe_ctx, load_address)
-            if ldrsw_result == -1:
-                break
-            register_list.set_raw_value(rt, ldrsw_result, True)
-
-        # mov
-        elif HMReference.is_mov_bytes_inverted_wide_immediate(instruction_data):
-            rd, is_64bit, immediate = HMReference.decode_mov_bytes_inverted_wide_immediate(instruction_data)
-            if rd == 31:  # xzr
-                continue
-            register_list.set_value(rd, immediate, is_64bit)
-        elif HMReference.is_mov_bytes_register(instruction_data):
-            rd, rm, is_64bit = HMReference.decode_mov_bytes_register(instruction_data)
-            if rd == 31:  # xzr
-                continue
-            if rm != 31 and (not register_list.has_value(rm)):
-                break
-            rm_raw_value = 0 if rm == 31 else register_list.get_raw_value(rm, is_64bit)
-            register_list.set_raw_value(rd, rm_raw_value, is_64bit)
-        elif HMReference.is_mov_bytes_to_from_sp(instruction_data):
-            rd, rn, is_64bit = HMReference.decode_mov_bytes_to_from_sp(instruction_data)
-            if not register_list.has_value(rn):
-                break
-            rn_raw_value = register_list.get_raw_value(rn, is_64bit)
-            register_list.set_raw_value(rd, rn_raw_value, is_64bit)
-        elif HMReference.is_mov_bytes_wide_immediate(instruction_data):
-            rd, is_64bit, immediate = HMReference.decode_mov_bytes_wide_immediate(instruction_data)
-            if rd == 31:  # xzr
-                continue
-            register_list.set_value(rd, immediate, is_64bit)
-
-        # str
-        elif HMReference.is_str_bytes_immediate_post_index(instruction_data):
-            rt, rn, is_64bit, simm = HMReference.decode_str_bytes_immediate_post_index(instruction_data)
-            if not register_list.has_value(rn):
-                break
-            rn_value = register_list.get_value(rn, True)
-            load_address = rn_value
-            rn_value += simm
-            register_list.set_value(rn, rn_value, is_64bit)
-        elif HMReference.is_str_bytes_immediate_pre_index(instruction_data):
-            rt, rn, is_64bit, simm = HMReference.decode_str_bytes_immediate_pre_index(instruction_data)
-            if not register_list.has_value(rn):
-                break
-            rn_value = register_list.get_value(rn, True)
-            rn_value += simm
-            register_list.set_value(rn, rn_value, is_64bit)
-        elif HMReference.is_str_bytes_immediate_unsigned_offset(instruction_data):
-            continue
-        elif HMReference.is_str_bytes_register(instruction_data):
-            rt, rn, rm, is_64bit, extend, amount = HMReference.decode_str_bytes_register(instruction_data)
-            if extend == HMExtendOption.unknow or extend == HMExtendOption.sxtx:
-                break
-            continue
+    # Analyze until br/blr, see HMA64Emulator.py
+    emulator = HMA64Emulator.HMA64Emulator(lambda address_int: record_load(exe_ctx, address_int, load_list))
+    effect_list = emulator.run(data, branch_target_load_address)
+    if len(effect_list) == 0 or effect_list[-1].kind != HMA64Emulator.effect_kind_branch:
+        return ""
+    instruction: lldb.SBInstruction = instruction_list.GetInstructionAtIndex(emulator.stop_index)
+    comment = instruction.GetComment(target)
+    if len(comment) > 0:
+        return ""
 
-        # stp
-        elif HMReference.is_stp_bytes_signed_offset(instruction_data):
-            continue
+    rn = HMA64Decoder.decode_br_bytes(data[emulator.stop_index * 4:emulator.stop_index * 4 + 4])
+    rn_raw_value = effect_list[-1].value
+    lookup_summary = HM.get_image_lookup_summary_from_address(rn_raw_value)
+    mnemonic: str = instruction.GetMnemonic(target)
+    rn_str = HMRegister.get_register_name(rn, True)
+    my_comment = f"{mnemonic} {rn_str}, {rn_str} = {hex(rn_raw_value)} {lookup_summary}"
+
+    # resolve "x1" register when target is objc_msgSend
+    if 'objc_msgSend' in lookup_summary and 'objc_msgSend$' not in lookup_summary and emulator.has_value(1):
+        x1_value = emulator.get_raw_value(1, True)
+        # Sometimes the summary is missing when using "image lookup", so use the "x/s" command instead.
+        x1_str_return_object = lldb.SBCommandReturnObject()
+        target.GetDebugger().GetCommandInterpreter().HandleCommand(f"x/s {x1_value}", exe_ctx, x1_str_return_object)
+        output_list = x1_str_return_object.GetOutput().split(" ")
+        if len(output_list) >= 2:
+            x1_str_result = output_list[1]
+            my_comment = f"{my_comment}, sel = {x1_str_result}"
+    return my_comment
+
+
+class HMBranchComment:
+    # The comment of a branch target, and the memory loaded to resolve it
+    comment: str
+    load_list: List[Tuple[int, int]]  # [(address, value)]
+    stop_id: int  # The stop ID of the process when the loaded values were read
+
+    def __init__(self, comment: str, load_list: List[Tuple[int, int]], stop_id: int):
+        self.comment = comment
+        self.load_list = load_list
+        self.stop_id = stop_id
+
+    def is_up_to_date(self, exe_ctx: lldb.SBExecutionContext, stop_id: int) -> bool:
+        # The memory only changes while the process is running, e.g. a lazy symbol pointer is bound, so it is read again after that
+        if self.stop_id == stop_id:
+            return True
+        for address_int, value in self.load_list:
+            if load_address_value(exe_ctx, address_int) != value:
+                return False
+        self.stop_id = stop_id
+        return True
+
+
+class HMBranchCommentCache:
+    # The comments of the branch targets in a process, keyed by the load address of the branch target.
+    # The comments are grouped by the module of the branch target, a group is dropped when its module is unloaded or slid.
+    stop_id: int  # The stop ID of the process when the modules were checked
+    comment_dic: Dict[int, HMBranchComment]  # [branch target address, comment]
+    module_dic: Dict[str, Tuple[str, int, List[int]]]  # [UUID(the path if there is no UUID), (path, base_address, [branch target address])]
+
+    def __init__(self):
+        self.stop_id = -1
+        self.comment_dic = {}
+        self.module_dic = {}
+
+    def get(self, address_int: int) -> Optional[HMBranchComment]:
+        return self.comment_dic.get(address_int)
+
+    def put(self, target: lldb.SBTarget, module: lldb.SBModule, address_int: int, branch_comment: HMBranchComment) -> None:
+        path = module.GetFileSpec().fullpath
+        key = module.GetUUIDString() or path
+        if key not in self.module_dic:
+            self.module_dic[key] = (path, HMReference.get_module_base_address(target, module), [])
+        if address_int not in self.comment_dic:
+            self.module_dic[key][2].append(address_int)
+        self.comment_dic[address_int] = branch_comment
+
+    def drop_unloaded_modules(self, target: lldb.SBTarget) -> None:
+        for key, (path, base_address, address_list) in list(self.module_dic.items()):
+            module: lldb.SBModule = target.FindModule(lldb.SBFileSpec(path))
+            if module.IsValid() and (module.GetUUIDString() or path) == key and HMReference.get_module_base_address(target, module) == base_address:
+                continue
+            for address_int in address_list:
+                del self.comment_dic[address_int]
+            del self.module_dic[key]
 
-        # nop
-        elif HMReference.is_nop_bytes(instruction_data):
-            continue
 
-        # special logic
-        elif HMReference.is_br_bytes(instruction_data) or HMReference.is_blr_bytes(instruction_data):
-            if len(comment) > 0:
-                break
-            rn = HMReference.decode_br_bytes(instruction_data)
-            if not register_list.has_value(rn):
-                break
-            rn_raw_value = register_list.get_raw_value(rn, True)
-            lookup_summary = HM.get_image_lookup_summary_from_address(rn_raw_value)
-            mnemonic: str = instruction.GetMnemonic(target)
-            rn_str = HMRegister.get_register_name(rn, True)
-            my_comment = f"{mnemonic} {rn_str}, {rn_str} = {hex(rn_raw_value)} {lookup_summary}"
-
-            # resolve "x1" register when target is objc_msgSend
-            if 'objc_msgSend' in lookup_summary and 'objc_msgSend$' not in lookup_summary and register_list.has_value(1):
-                x1_value = register_list.get_raw_value(1, True)
-                # Sometimes the summary is missing when using "image lookup", so use the "x/s" command instead.
-                x1_str_return_object = lldb.SBCommandReturnObject()
-                target.GetDebugger().GetCommandInterpreter().HandleCommand(f"x/s {x1_value}", exe_ctx, x1_str_return_object)
-                output_list = x1_str_return_object.GetOutput().split(" ")
-                if len(output_list) >= 2:
-                    x1_str_result = output_list[1]
-                    my_comment = f"{my_comment}, sel = {x1_str_result}"
-            return my_comment
-        else:
-            break
+def drop_branch_comment_cache(target: lldb.SBTarget) -> None:
+    target_index = target.GetDebugger().GetIndexOfTarget(target)
+    for key in [key for key in g_branch_comment_cache_dic if key[0] == target_index]:
+        del g_branch_comment_cache_dic[key]
 
-    return ""
 
+def get_branch_comment_cache(exe_ctx: lldb.SBExecutionContext) -> HMBranchCommentCache:
+    target = exe_ctx.GetTarget()
+    process = exe_ctx.GetProcess()
+    is_valid_process = process.IsValid()
+    key = (target.GetDebugger().GetIndexOfTarget(target), process.GetUniqueID() if is_valid_process else 0)
+    cache = g_branch_comment_cache_dic.get(key)
+    if cache is None:
+        # Drop the cache of the previous process of the target
+        for old_key in [old_key for old_key in g_branch_comment_cache_dic if old_key[0] == key[0]]:
+            del g_branch_comment_cache_dic[old_key]
+        cache = HMBranchCommentCache()
+        g_branch_comment_cache_dic[key] = cache
+
+    # Modules are only loaded or unloaded while the process is running, so they are checked once per stop
+    stop_id = process.GetStopID() if is_valid_process else 0
+    if cache.stop_id != stop_id:
+        cache.drop_unloaded_modules(target)
+        cache.stop_id = stop_id
+    return cache
@@ -0,0 +1,334 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2024 Huimao Chen
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# https://github.com/chenhuimao/HMLLDB
+
+import lldb
+from typing import Dict, List, Optional, Tuple
+import os
+import re
+import struct
+import uuid
+import HMLLDBHelpers as HM
+import HMReference
+
+
+g_annotation_directory: str = os.path.join(os.path.expanduser("~"), ".hmlldb", "disassemble")
+
+# [UUID, HMModuleAnnotation], the annotations loaded from disk
+g_module_annotation_dic: Dict[str, 'HMModuleAnnotation'] = {}
+
+# Annotation file of a module. The records are appended, a later record of the same function replaces the former one.
+# header: magic, version, reserved, uuid
+# record: function_offset, function_size, module_count, comment_count, load_count
+#         module_uuid[16] * module_count
+#         comment * comment_count: instruction_offset, reference_count, text_size, text, reference * reference_count
+#         load * load_count: address reference, value reference
+# reference: module_index, offset. It is the base address of the module + offset, or offset itself if module_index is absolute_module_index.
+annotation_magic = b'HMDISANN'
+annotation_version = 1
+annotation_header_format = '<8sII16s'
+annotation_header_size = struct.calcsize(annotation_header_format)
+annotation_record_format = '<QIHII'
+annotation_record_size = struct.calcsize(annotation_record_format)
+annotation_comment_format = '<IHH'
+annotation_comment_size = struct.calcsize(annotation_comment_format)
+reference_format = '<HQ'
+reference_size = struct.calcsize(reference_format)
+absolute_module_index = 0xffff
+
+# The placeholder of an address in the text of a comment
+address_placeholder = '\x00'
+# The hexadecimal numbers in a comment, excluding the negative ones
+hex_number_pattern = re.compile(r'(?<![-\w])0x[0-9a-fA-F]+')
+
+
+class HMModuleAddressMap:
+    # Convert load addresses to references(module UUID, offset) and back in a target
+    target: lldb.SBTarget
+    base_address_dic: Optional[Dict[str, int]]  # [UUID, base address], built when it is used first
+
+    def __init__(self, target: lldb.SBTarget):
+        self.target = target
+        self.base_address_dic = None
+
+    def get_base_address(self, uuid_str: str) -> Optional[int]:
+        if self.base_address_dic is None:
+            self.base_address_dic = {}
+            for i in range(self.target.GetNumModules()):
+                module = self.target.GetModuleAtIndex(i)
+                module_uuid = module.GetUUIDString()
+                if module_uuid:
+                    self.base_address_dic[module_uuid] = HMReference.get_module_base_address(self.target, module)
+        return self.base_address_dic.get(uuid_str)
+
+    def get_reference(self, address_int: int) -> Optional[Tuple[str, int]]:
+        # Return (UUID, offset) of the module that contains the address
+        if address_int < 0:
+            return None
+        module: lldb.SBModule = lldb.SBAddress(address_int, self.target).GetModule()
+        if not module.IsValid():
+            return None
+        module_uuid = module.GetUUIDString()
+        if not module_uuid:
+            return None
+        return module_uuid, address_int - HMReference.get_module_base_address(self.target, module)
+
+
+class HMFunctionAnnotation:
+    # The comments of a function calculated by edisassemble, and the memory loaded to calculate them.
+    # The addresses are saved as references relative to their modules, so they are still valid after ASLR.
+    function_offset: int
+    function_size: int
+    module_uuid_list: List[str]  # The modules of the references
+    comment_list: List[Tuple[int, str, List[Tuple[int, int]]]]  # [(instruction offset, text with address placeholders, [reference])]
+    load_list: List[Tuple[Tuple[int, int], Tuple[int, int]]]  # [(address reference, value reference)]
+    verified_stop_id: int  # The stop ID of the process when the loaded values were checked, -1 if they have not been checked
+
+    def __init__(self, function_offset: int, function_size: int):
+        self.function_offset = function_offset
+        self.function_size = function_size
+        self.module_uuid_list = []
+        self.comment_list = []
+        self.load_list = []
+        self.verified_stop_id = -1
+
+    def add_reference(self, address_map: HMModuleAddressMap, address_int: int) -> Tuple[int, int]:
+        module_reference = address_map.get_reference(address_int)
+        if module_reference is None:
+            return absolute_module_index, address_int & 0xffffffffffffffff
+        module_uuid, offset = module_reference
+        if module_uuid not in self.module_uuid_list:
+            self.module_uuid_list.append(module_uuid)
+        return self.module_uuid_list.index(module_uuid), offset
+
+    def resolve_reference(self, address_map: HMModuleAddressMap, reference: Tuple[int, int]) -> Optional[int]:
+        # None if the module is not loaded
+        module_index, offset = reference
+        if module_index == absolute_module_index:
+            return offset
+        base_address = address_map.get_base_address(self.module_uuid_list[module_index])
+        if base_address is None:
+            return None
+        return base_address + offset
+
+    @staticmethod
+    def create(address_map: HMModuleAddressMap, function_address: int, function_offset: int, function_size: int, address_comment_dict: Dict[int, str], load_list: List[Tuple[int, int]]) -> 'HMFunctionAnnotation':
+        annotation = HMFunctionAnnotation(function_offset, function_size)
+        for address_int, comment in sorted(address_comment_dict.items()):
+            reference_list: List[Tuple[int, int]] = []
+            text_list: List[str] = []
+            last_end = 0
+            for match in hex_number_pattern.finditer(comment):
+                reference = annotation.add_reference(address_map, int(match.group(), 16))
+                if reference[0] == absolute_module_index:
+                    continue
+                text_list.append(comment[last_end:match.start()])
+                text_list.append(address_placeholder)
+                reference_list.append(reference)
+                last_end = match.end()
+            text_list.append(comment[last_end:])
+            annotation.comment_list.append((address_int - function_address, "".join(text_list), reference_list))
+        for address_int, value in dict.fromkeys(load_list):
+            annotation.load_list.append((annotation.add_reference(address_map, address_int), annotation.add_reference(address_map, value)))
+        return annotation
+
+    def get_comment_dict(self, exe_ctx: lldb.SBExecutionContext, address_map: HMModuleAddressMap, function_address: int, stop_id: int) -> Optional[Dict[int, str]]:
+        # Return [address, comment], None if a module is not loaded or the loaded memory has changed
+        if self.verified_stop_id != stop_id:
+            for address_reference, value_reference in self.load_list:
+                address_int = self.resolve_reference(address_map, address_reference)
+                value = self.resolve_reference(address_map, value_reference)
+                if address_int is None or value is None:
+                    return None
+                if HM.load_address_value(exe_ctx, address_int) & 0xffffffffffffffff != value:
+                    return None
+            self.verified_stop_id = stop_id
+
+        address_comment_dict: Dict[int, str] = {}
+        for instruction_offset, text, reference_list in self.comment_list:
+            if len(reference_list) == 0:
+                address_comment_dict[function_address + instruction_offset] = text
+                continue
+            text_list = text.split(address_placeholder)
+            comment_list = [text_list[0]]
+            for reference, next_text in zip(reference_list, text_list[1:]):
+                address_int = self.resolve_reference(address_map, reference)
+                if address_int is None:
+                    return None
+                comment_list.append(hex(address_int))
+                comment_list.append(next_text)
+            address_comment_dict[function_address + instruction_offset] = "".join(comment_list)
+        return address_comment_dict
+
+    def to_bytes(self) -> bytes:
+        data_list = [struct.pack(annotation_record_format, self.function_offset, self.function_size, len(self.module_uuid_list), len(self.comment_list), len(self.load_list))]
+        for module_uuid in self.module_uuid_list:
+            data_list.append(uuid.UUID(module_uuid).bytes)
+        for instruction_offset, text, reference_list in self.comment_list:
+            text_data = text.encode('utf-8', errors='replace')[:0xffff]
+            data_list.append(struct.pack(annotation_comment_format, instruction_offset, len(reference_list), len(text_data)))
+            data_list.append(text_data)
+            for reference in reference_list:
+                data_list.append(struct.pack(reference_format, *reference))
+        for address_reference, value_reference in self.load_list:
+            data_list.append(struct.pack(reference_format, *address_reference))
+            data_list.append(struct.pack(reference_format, *value_reference))
+        return b''.join(data_list)
+
+    @staticmethod
+    def from_buffer(buffer: bytes, offset: int) -> Tuple[Optional['HMFunctionAnnotation'], int]:
+        # Return the annotation and the offset of the next record, the annotation is None if the record is truncated
+        if offset + annotation_record_size > len(buffer):
+            return None, len(buffer)
+        function_offset, function_size, module_count, comment_count, load_count = struct.unpack_from(annotation_record_format, buffer, offset)
+        offset += annotation_record_size
+        annotation = HMFunctionAnnotation(function_offset, function_size)
+        try:
+            for _ in range(module_count):
+                annotation.module_uuid_list.append(str(uuid.UUID(bytes=bytes(buffer[offset:offset + 16]))).upper())
+                offset += 16
+            for _ in range(comment_count):
+                instruction_offset, reference_count, text_size = struct.unpack_from(annotation_comment_format, buffer, offset)
+                offset += annotation_comment_size
+                text = bytes(buffer[offset:offset + text_size]).decode('utf-8', errors='replace')
+                offset += text_size
+                reference_list = [struct.unpack_from(reference_format, buffer, offset + i * reference_size) for i in range(reference_count)]
+                offset += reference_count * reference_size
+                annotation.comment_list.append((instruction_offset, text, reference_list))
+            for _ in range(load_count):
+                address_reference = struct.unpack_from(reference_format, buffer, offset)
+                value_reference = struct.unpack_from(reference_format, buffer, offset + reference_size)
+                offset += 2 * reference_size
+                annotation.load_list.append((address_reference, value_reference))
+        except (struct.error, ValueError):
+            return None, len(buffer)
+        if offset > len(buffer):
+            return None, len(buffer)
+        return annotation, offset
+
+
+class HMModuleAnnotation:
+    # The function annotations of a module, saved in the annotation file of its UUID
+    uuid_str: str
+    function_dic: Dict[int, HMFunctionAnnotation]  # [function offset, annotation]
+    record_count: int  # The records in the file, including the replaced ones
+
+    def __init__(self, uuid_str: str):
+        self.uuid_str = uuid_str
+        self.function_dic = {}
+        self.record_count = 0
+
+    def __len__(self) -> int:
+        return len(self.function_dic)
+
+    def save(self, path: str) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, 'wb') as annotation_file:
+            annotation_file.write(struct.pack(annotation_header_format, annotation_magic, annotation_version, 0, uuid.UUID(self.uuid_str).bytes))
+            for function_annotation in self.function_dic.values():
+                annotation_file.write(function_annotation.to_bytes())
+        # Replace the old file atomically
+        os.replace(temp_path, path)
+        self.record_count = len(self.function_dic)
+
+    def append(self, path: str, function_annotation: HMFunctionAnnotation) -> None:
+        # Append a record instead of rewriting the file, the file is compacted when most of its records are replaced
+        self.function_dic[function_annotation.function_offset] = function_annotation
+        if not os.path.isfile(path) or self.record_count >= 2 * len(self.function_dic) + 64:
+            self.save(path)
+            return
+        with open(path, 'ab') as annotation_file:
+            annotation_file.write(function_annotation.to_bytes())
+        self.record_count += 1
+
+    @staticmethod
+    def load(path: str, uuid_str: str) -> Optional['HMModuleAnnotation']:
+        if not os.path.isfile(path):
+            return None
+        with open(path, 'rb') as annotation_file:
+            buffer = annotation_file.read()
+        if len(buffer) < annotation_header_size:
+            return None
+        magic, version, _, uuid_bytes = struct.unpack_from(annotation_header_format, buffer)
+        if magic != annotation_magic or version != annotation_version or uuid_bytes != uuid.UUID(uuid_str).bytes:
+            return None
+
+        module_annotation = HMModuleAnnotation(uuid_str)
+        offset = annotation_header_size
+        while offset < len(buffer):
+            function_annotation, offset = HMFunctionAnnotation.from_buffer(buffer, offset)
+            if function_annotation is None:
+                # The last record is truncated, e.g. lldb exited while appending it
+                break
+            module_annotation.function_dic[function_annotation.function_offset] = function_annotation
+            module_annotation.record_count += 1
+        return module_annotation
+
+
+def get_annotation_path(uuid_str: str) -> str:
+    return os.path.join(g_annotation_directory, f"{uuid_str}.hmdis")
+
+
+def get_module_annotation(uuid_str: str) -> HMModuleAnnotation:
+    # Load the annotations of the module from disk when they are used first
+    module_annotation = g_module_annotation_dic.get(uuid_str)
+    if module_annotation is None:
+        module_annotation = HMModuleAnnotation.load(get_annotation_path(uuid_str), uuid_str) or HMModuleAnnotation(uuid_str)
+        g_module_annotation_dic[uuid_str] = module_annotation
+    return module_annotation
+
+
+def find_comment_dict(exe_ctx: lldb.SBExecutionContext, module: lldb.SBModule, function_address: int, function_size: int) -> Optional[Dict[int, str]]:
+    # Return [address, comment] of the function if it has been annotated, None if it should be calculated
+    module_uuid = module.GetUUIDString()
+    if not module_uuid:
+        return None
+    target = exe_ctx.GetTarget()
+    function_offset = function_address - HMReference.get_module_base_address(target, module)
+    function_annotation = get_module_annotation(module_uuid).function_dic.get(function_offset)
+    if function_annotation is None or function_annotation.function_size != function_size:
+        return None
+    process = exe_ctx.GetProcess()
+    stop_id = process.GetStopID() if process.IsValid() else 0
+    return function_annotation.get_comment_dict(exe_ctx, HMModuleAddressMap(target), function_address, stop_id)
+
+
+def create_function_annotation(exe_ctx: lldb.SBExecutionContext, address_map: HMModuleAddressMap, module: lldb.SBModule, function_address: int, function_size: int, address_comment_dict: Dict[int, str], load_list: List[Tuple[int, int]]) -> HMFunctionAnnotation:
+    function_offset = function_address - HMReference.get_module_base_address(exe_ctx.GetTarget(), module)
+    function_annotation = HMFunctionAnnotation.create(address_map, function_address, function_offset, function_size, address_comment_dict, load_list)
+    process = exe_ctx.GetProcess()
+    function_annotation.verified_stop_id = process.GetStopID() if process.IsValid() else 0
+    return function_annotation
+
+
+def save_comment_dict(exe_ctx: lldb.SBExecutionContext, module: lldb.SBModule, function_address: int, function_size: int, address_comment_dict: Dict[int, str], load_list: List[Tuple[int, int]]) -> None:
+    # Save the comments of the function, and the memory loaded to calculate them
+    module_uuid = module.GetUUIDString()
+    if not module_uuid:
+        return
+    function_annotation = create_function_annotation(exe_ctx, HMModuleAddressMap(exe_ctx.GetTarget()), module, function_address, function_size, address_comment_dict, load_list)
+    try:
+        get_module_annotation(module_uuid).append(get_annotation_path(module_uuid), function_annotation)
+    except OSError as error:
+        HM.DPrint(f"Failed to save the annotations: {error}")
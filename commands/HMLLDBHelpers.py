@@ -254,9 +254,13 @@ def strip_pac_sign_address(address_int: int, process: lldb.SBProcess = None) ->
     return address_int & mask
 
 
-def get_image_lookup_summary_from_address(address_int: int) -> str:
+def get_image_lookup_summary_from_address(address_int: int, target: Optional[lldb.SBTarget] = None) -> str:
+    # Look up the address in the selected target, or in the target if it is specified
     return_object = lldb.SBCommandReturnObject()
-    lldb.debugger.GetCommandInterpreter().HandleCommand(f"image lookup -a {address_int}", return_object)
+    if target is None:
+        lldb.debugger.GetCommandInterpreter().HandleCommand(f"image lookup -a {address_int}", return_object)
+    else:
+        target.GetDebugger().GetCommandInterpreter().HandleCommand(f"image lookup -a {address_int}", lldb.SBExecutionContext(target), return_object)
     if return_object.GetErrorSize() > 0:
         return ""
     return_object_lines = return_object.GetOutput().splitlines()
@@ -23,36 +23,276 @@
 # https://github.com/chenhuimao/HMLLDB
 
 import lldb
+from array import array
 from datetime import datetime
-from enum import Enum
-from typing import Dict, List, Tuple
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+import bisect
+import collections
+import csv
+import fnmatch
+import heapq
+import itertools
+import json
+import multiprocessing
 import optparse
 import os
 import shlex
-import HMCalculationHelper
+import struct
+import sys
+import tempfile
+import threading
+import time
+import HMA64Emulator
 import HMLLDBClassInfo
 import HMLLDBHelpers as HM
-import HMRegister
-from HMRegister import HMRegisterList
-
-
-g_image_address_target_dic: Dict[str, Dict[int, int]] = {}
-g_image_address_ldr_dic: Dict[str, Dict[int, int]] = {}
-
-
-class HMExtendOption(Enum):
-    uxtw = 0b010
-    lsl = 0b011
-    sxtw = 0b110
-    sxtx = 0b111
-    unknow = 0b1000
-
-
-class HMShift(Enum):
-    lsl = 0b00
-    lsr = 0b01
-    asr = 0b10
-    unknow = 0b11
+import HMReferenceIndex
+import HMReferenceMachO
+import HMReferenceProfile
+import HMReferenceScanner
+import HMSymbolication
+
+
+# [UUID, (image_name, index)], see HMIndexCache
+g_index_cache = HMReferenceIndex.HMIndexCache(512 * 1024 * 1024)
+
+# [UUID, the functions and the data in code]
+g_code_layout_dic: Dict[str, HMReferenceMachO.HMCodeLayout] = {}
+
+# [UUID, Objective-C metadata]
+g_objc_metadata_dic: Dict[str, HMReferenceIndex.HMObjCMetadata] = {}
+
+# The latest scan of "reference --background"
+g_background_scan: Optional['HMBackgroundScan'] = None
+
+# Save the checkpoint of the background scan every 10 seconds
+checkpoint_interval = 10.0
+
+# [section_name, kind] of the Objective-C metadata
+objc_section_kind_dic: Dict[str, int] = {section_name: kind for kind, section_name in HMReferenceIndex.objc_kind_section_name_dic.items()}
+
+# The rows of "--output" are symbolicated in chunks
+output_chunk_size = 1024
+
+# The max length of the CFString saved in the Objective-C metadata
+cfstring_max_length = 1024
+
+# The defaults of "--jobs" and "--memory-budget"(MB), also used by "callgraph" when it scans an image
+default_jobs = 1
+default_memory_budget = 1024
+
+# The estimated memory of scanning an instruction: a record of HMReferenceRecorder(17 bytes) and HMReferenceIndex(21 bytes) at most
+scan_memory_per_instruction = 17 + 21
+
+
+# The page size of HMTargetMemory
+cache_page_size = 0x4000
+
+
+# The memory used by the scanner. Read the live target through the SB API.
+# The values loaded by ldr/ldrsw are read from whole pages cached during the scan, because most of them are in the same few pages(__got, __objc_*, etc.).
+class HMTargetMemory:
+    target: lldb.SBTarget
+    page_dic: Dict[int, Optional[bytes]]  # [page_address, page_data], None if the page cannot be read
+    cache_hit_count: int
+    cache_miss_count: int
+    emulator: HMA64Emulator.HMA64Emulator
+
+    def __init__(self, target: lldb.SBTarget):
+        # Only target.ReadMemory is called, so the benchmark passes a stand-in target
+        self.target = target
+        self.page_dic = {}
+        self.cache_hit_count = 0
+        self.cache_miss_count = 0
+        self.emulator = HMA64Emulator.HMA64Emulator(self.load_address_value)
+
+    def read_memory(self, address_int: int, size: int) -> Optional[bytes]:
+        address: lldb.SBAddress = lldb.SBAddress(address_int, self.target)
+        error = lldb.SBError()
+        data: bytes = self.target.ReadMemory(address, size, error)
+        if not error.Success():
+            HM.DPrint(error)
+            return None
+        return data
+
+    def read_page(self, page_address: int) -> Optional[bytes]:
+        if page_address in self.page_dic:
+            self.cache_hit_count += 1
+            return self.page_dic[page_address]
+        self.cache_miss_count += 1
+        error = lldb.SBError()
+        data: bytes = self.target.ReadMemory(lldb.SBAddress(page_address, self.target), cache_page_size, error)
+        if not error.Success() or data is None or len(data) != cache_page_size:
+            data = None
+        self.page_dic[page_address] = data
+        return data
+
+    def read_cached_memory(self, address_int: int, size: int) -> Optional[bytes]:
+        # Read the memory through the page cache, returns fewer bytes when the following page cannot be read
+        data = b''
+        while len(data) < size:
+            offset = (address_int + len(data)) & (cache_page_size - 1)
+            page_data = self.read_page(address_int + len(data) - offset)
+            if page_data is None:
+                break
+            data += page_data[offset:offset + size - len(data)]
+        return data if len(data) > 0 else None
+
+    def read_c_string(self, address_int: int, max_size: int = 1024) -> str:
+        data = b''
+        while len(data) < max_size:
+            offset = (address_int + len(data)) & (cache_page_size - 1)
+            page_data = self.read_page(address_int + len(data) - offset)
+            if page_data is None:
+                break
+            end = page_data.find(b'\x00', offset)
+            if end != -1:
+                data += page_data[offset:end]
+                break
+            data += page_data[offset:]
+        return data[:max_size].decode('utf-8', errors='replace')
+
+    def load_address_value(self, address_int: int) -> int:
+        # Same as HM.load_address_value
+        if address_int <= 0:
+            return -1
+        offset = address_int & (cache_page_size - 1)
+        page_data = self.read_page(address_int - offset)
+        if page_data is None or offset + 8 > cache_page_size:
+            # The page cannot be read, or the value crosses pages
+            error = lldb.SBError()
+            data: bytes = self.target.ReadMemory(lldb.SBAddress(address_int, self.target), 8, error)
+            if not error.Success() or data is None or len(data) < 8:
+                return -1
+            return int.from_bytes(data, 'little')
+        return int.from_bytes(page_data[offset:offset + 8], 'little')
+
+    def get_cache_description(self) -> str:
+        access_count = self.cache_hit_count + self.cache_miss_count
+        hit_rate = self.cache_hit_count / access_count * 100 if access_count > 0 else 0.0
+        return f"Page cache: {len(self.page_dic)} pages, {access_count} loads, hit rate {hit_rate:.2f}%"
+
+
+# A scan running on a worker thread, see "reference --background".
+# The scanned code is checkpointed, so the scan can resume after it is cancelled or the process is detached.
+class HMBackgroundScan:
+    target: lldb.SBTarget
+    image_name: str
+    uuid_str: str
+    use_numpy: bool
+    snippet_list: List[Tuple[int, int, int]]  # [(start_address, end_address, section_end_address)]
+    recorder: HMReferenceIndex.HMReferenceRecorder
+    module_range_list: List[Tuple[int, int, int, str]]  # See get_module_range_list, it is read before the process runs
+    next_snippet_index: int
+    total_size: int
+    scanned_size: int
+    resumed_size: int  # The size scanned before this run
+    start_time: float
+    state: str  # scanning, finished, cancelled, interrupted, failed
+    cancel_event: threading.Event
+    thread: Optional[threading.Thread]
+
+    def __init__(self, target: lldb.SBTarget, module: lldb.SBModule, use_numpy: bool, code_layout: Optional[HMReferenceMachO.HMCodeLayout] = None):
+        self.target = target
+        self.image_name = get_module_name(module)
+        self.uuid_str = module.GetUUIDString()
+        self.use_numpy = use_numpy
+        self.snippet_list = get_code_snippet_list(target, module, code_layout)
+        base_address = get_module_base_address(target, module)
+        image_range = get_module_address_range(target, module)
+        self.recorder = HMReferenceIndex.HMReferenceRecorder(base_address, image_range)
+        self.module_range_list = get_module_range_list(target)
+        self.next_snippet_index = 0
+        self.total_size = sum(end_address - start_address for start_address, end_address, _ in self.snippet_list)
+        self.scanned_size = 0
+
+        # Resume from the checkpoint
+        checkpoint = HMReferenceIndex.HMReferenceRecorder.load_checkpoint(HMReferenceIndex.get_checkpoint_path(self.uuid_str), self.uuid_str, base_address, image_range)
+        if checkpoint is not None:
+            cursor_offset, self.recorder = checkpoint
+            while self.next_snippet_index < len(self.snippet_list) and self.snippet_list[self.next_snippet_index][0] - base_address < cursor_offset:
+                start_address, end_address, _ = self.snippet_list[self.next_snippet_index]
+                self.scanned_size += end_address - start_address
+                self.next_snippet_index += 1
+
+        self.resumed_size = self.scanned_size
+        self.start_time = time.time()
+        self.state = "scanning"
+        self.cancel_event = threading.Event()
+        self.thread = None
+
+    def start(self) -> None:
+        self.thread = threading.Thread(target=self.run, name="HMReference", daemon=True)
+        self.thread.start()
+
+    def cancel(self) -> None:
+        self.cancel_event.set()
+
+    def is_running(self) -> bool:
+        return self.thread is not None and self.thread.is_alive()
+
+    def run(self) -> None:
+        try:
+            self.scan()
+        except Exception as error:
+            self.state = "failed"
+            self.save_checkpoint()
+            HM.DPrint(f"Background scan of {self.image_name} failed: {error}")
+
+    def scan(self) -> None:
+        memory = HMTargetMemory(self.target)
+        last_checkpoint_time = time.time()
+        while self.next_snippet_index < len(self.snippet_list):
+            if self.cancel_event.is_set():
+                self.state = "cancelled"
+                self.save_checkpoint()
+                return
+            # The memory can only be read when the process is stopped
+            process_state = self.target.GetProcess().GetState()
+            if process_state in [lldb.eStateRunning, lldb.eStateStepping]:
+                time.sleep(0.5)
+                continue
+            if process_state != lldb.eStateStopped:
+                self.state = "interrupted"
+                self.save_checkpoint()
+                HM.DPrint(f"Background scan of {self.image_name} is interrupted, enter \"reference --background {self.image_name}\" to resume it.")
+                return
+
+            start_address, end_address, section_end_address = self.snippet_list[self.next_snippet_index]
+            HMReferenceScanner.instruction_analysis(memory, start_address, end_address, self.recorder, self.use_numpy, section_end_address)
+            self.next_snippet_index += 1
+            self.scanned_size += end_address - start_address
+            if time.time() - last_checkpoint_time > checkpoint_interval:
+                self.save_checkpoint()
+                last_checkpoint_time = time.time()
+
+        index = self.recorder.create_index(self.uuid_str, self.module_range_list)
+        index_path = HMReferenceIndex.get_index_path(self.uuid_str)
+        index.save(index_path)
+        put_index_to_cache(self.image_name, index)
+        checkpoint_path = HMReferenceIndex.get_checkpoint_path(self.uuid_str)
+        if os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+        self.state = "finished"
+        HM.DPrint(f"Background scan of {self.image_name} finished, save the index to {index_path}")
+
+    def save_checkpoint(self) -> None:
+        if self.next_snippet_index < len(self.snippet_list):
+            cursor_offset = self.snippet_list[self.next_snippet_index][0] - self.recorder.base_address
+        else:
+            cursor_offset = HMReferenceIndex.uint64_mask
+        self.recorder.save_checkpoint(HMReferenceIndex.get_checkpoint_path(self.uuid_str), self.uuid_str, cursor_offset, self.module_range_list)
+
+    def get_status_description(self) -> str:
+        percentage = self.scanned_size / self.total_size * 100 if self.total_size > 0 else 100.0
+        description = f"{self.image_name}: {self.state}, {percentage:.2f}%, {len(self.recorder)} records"
+        if self.state == "scanning":
+            elapsed_time = time.time() - self.start_time
+            scanned_size_in_this_run = self.scanned_size - self.resumed_size
+            if scanned_size_in_this_run > 0:
+                remaining_time = elapsed_time / scanned_size_in_this_run * (self.total_size - self.scanned_size)
+                finish_time = datetime.fromtimestamp(time.time() + remaining_time).strftime("%H:%M:%S")
+                description += f", estimated finish time: {finish_time}"
+        return description
 
 
 def __lldb_init_module(debugger, internal_dict):
@@ -62,94 +302,301 @@ def __lldb_init_module(debugger, internal_dict):
 def reference(debugger, command, exe_ctx, result, internal_dict):
     """
     Syntax:
-        reference <address> <image_name>
+        reference [--numpy] [--jobs <count>] [--range <size>] <address> <image_name>
+        reference [--numpy] [--jobs <count>] [--range <size>] [--address-file <path>] [<address> ...] <image_name>
+        reference [--numpy] [--jobs <count>] [--range <size>] [--memory-budget <MB>] --all <address> [<address> ...]
+        reference [--numpy] [--jobs <count>] [--range <size>] [--memory-budget <MB>] <address> [<address> ...] <module_name_pattern>
+        reference [--numpy] [--jobs <count>] [--selector <selector>] [--class <class_name>] [--cfstring <string>] <image_name>
+        reference [--limit <count>] [--offset <count>] [--count-only] [--group-by-function] [--output <path>] ...
+        reference [--numpy] --file <macho_path>
+        reference --profile [<address> ...] <image_name>|<module_name_pattern>
+        reference --cache list|clear
+        reference --cache drop <image_name>
+        reference --cache budget <MB>
+        reference [--numpy] --background <image_name>
+        reference status
+        reference cancel
+
+    Options:
+        --numpy/-n; Classify the instructions of each snippet with NumPy vectorized operations. It requires NumPy to be installed in the Python used by LLDB.
+        --jobs/-j; Scan the code sections in the specified number of worker processes.
+        --range/-r; Query the references to any address in [address, address + size), such as the fields of a struct or a page.
+        --file/-f; Scan the arm64 images of a Mach-O file(thin or fat) on disk and save the indexes, without a target or process.
+        --background/-b; Scan the image on a worker thread and save the index. Enter "reference status" to view the progress, and "reference cancel" to stop it.
+        --address-file/-a; Query the addresses in the file, one address per line. Empty lines and lines starting with "#" are ignored.
+        --all/-A; Query the addresses in all modules. The results of the modules are merged.
+        --memory-budget/-m; The memory budget(MB) of scanning a batch of modules with "--all" or a module name pattern, 1024 by default.
+        --selector/-s; Query the code that references the selector through __objc_selrefs.
+        --class/-c; Query the code that references the class through __objc_classrefs and __objc_superrefs.
+        --cfstring/-S; Query the code that references the constant CFString(__cfstring) with the content.
+        --limit/-l; Show at most the specified number of rows. Only the rows that are shown are symbolicated.
+        --offset/-o; Skip the specified number of rows, used with "--limit" to show the results page by page.
+        --count-only/-C; Show the count of results only.
+        --group-by-function/-g; Show the functions that contain the results and the count of results in each function.
+        --output/-O; Save all results to a file. The format is CSV if the extension is ".csv", otherwise JSON Lines.
+        --cache/-k; Manage the indexes in memory. "list" shows them from the most recently queried, "drop <image_name>" and "clear" remove them from memory(the index files are kept), "budget <MB>" sets the memory budget, 512MB by default.
+        --profile/-p; Scan the modules again(the index is replaced) and print the profile of the scan.
+        --function-starts/-F; Only scan the functions in LC_FUNCTION_STARTS, and skip the data in code(jump tables, literal pools) in LC_DATA_IN_CODE.
 
     Examples:
         (lldb) reference 0x12345678 MyApp
         (lldb) reference 0x12345678 UIKitCore
+        (lldb) reference -n 0x12345678 UIKitCore
+        (lldb) reference -j 16 0x12345678 MyApp
+        (lldb) reference -r 0x40 0x12345678 MyApp
+        (lldb) reference 0x12345678 0x12345680 0x12345688 MyApp
+        (lldb) reference -a ~/Desktop/addresses.txt MyApp
+        (lldb) reference --all 0x12345678
+        (lldb) reference -j 8 -m 512 0x12345678 "libswift*"
+        (lldb) reference -s viewDidLoad MyApp
+        (lldb) reference -c UIPasteboard MyApp
+        (lldb) reference -S "Hello world" MyApp
+        (lldb) reference --all -s setNeedsLayout
+        (lldb) reference -l 100 -o 200 0x12345678 UIKitCore
+        (lldb) reference -g 0x12345678 UIKitCore
+        (lldb) reference -O ~/Desktop/result.csv 0x12345678 UIKitCore
+        (lldb) reference -p UIKitCore
+        (lldb) reference -F 0x12345678 MyApp
+        (lldb) reference --cache list
+        (lldb) reference --cache drop UIKitCore
+        (lldb) reference --cache budget 256
+        (lldb) reference -f ~/Desktop/MyApp.app/MyApp
+        (lldb) reference -b UIKitCore
+        (lldb) reference status
+        (lldb) reference cancel
 
     Notice:
         1.This command is expensive to scan large modules. For example, it takes 40 seconds to scan UIKitCore, and 6 minutes to scan an App belonging to my company.
-        2.This command will consume a lot of memory. Clearing the memory before scanning can speed up the process.
+        2.The scan results are kept in compact arrays(about 21 bytes per record), but scanning large modules still consumes memory. Clearing the memory before scanning can speed up the process.
         3.This command will query the targets of all b/bl instructions and analyze most of the adr/adrp instructions and subsequent instructions.
         4.You should consider the "stub" function and "island" function when using it.
+        5.The worker processes of the "--jobs" option can only read the memory of the image, so a few ldr instructions that load memory outside the image are not analyzed.
+        6.The scan results are saved to "~/.hmlldb/reference/<UUID>.hmref" as offsets relative to the image(or to the other image that a value points into), and kept in memory by UUID. The image is scanned again only when its UUID changes, the results are reused after relaunching and in other targets.
+        7.The "--file" option can build the indexes in advance, such as on a CI machine. The ldr instructions that load a pointer bound to another image are analyzed as loading 0.
+        8.The background scan waits while the process is running. It is checkpointed every 10 seconds, and resumes from the checkpoint after it is cancelled or the process is detached.
+        9.Multiple addresses are answered in one pass over the index, and the results are grouped by address.
+        10.With "--all" or a module name pattern(such as "UIKit*"), the modules without an index are scanned from small to large in batches, and the estimated memory of a batch does not exceed the memory budget.
+        11.The "--selector", "--class" and "--cfstring" options find the slots of the name in the Objective-C metadata sections, which are indexed with the code and saved to "~/.hmlldb/reference/<UUID>.hmobjc".
+        12.The indexes in memory are limited by a memory budget. The least recently queried indexes are evicted, and loaded from disk when they are queried again.
+        13.The profile counts the instructions by class, the instructions analyzed after each adr/adrp and why the analysis stops, the memory loads and the time of each section. It is collected in the serial scan.
+        14.The "--function-starts" option takes effect when the module is scanned. If the load commands cannot be read, the code symbols of the module are used. A section without functions(such as __stubs) is scanned entirely. The functions are also used by "--group-by-function", so only one address of each function is symbolicated.
 
     This command is implemented in HMReference.py
     """
 
+    command_args = shlex.split(command)
+    parser = generate_option_parser()
+    try:
+        # options: optparse.Values
+        # args: list
+        (options, args) = parser.parse_args(command_args)
+    except:
+        result.SetError(parser.usage)
+        return
+
+    use_numpy = options.numpy
+    if use_numpy and HMReferenceScanner.numpy is None:
+        HM.DPrint("NumPy is not installed in the Python used by LLDB, scan without it.")
+        use_numpy = False
+
+    # The file is scanned without a target
+    if options.file:
+        build_index_from_macho_file(os.path.expanduser(options.file), use_numpy, options.function_starts)
+        return
+
+    if options.cache:
+        handle_cache_command(options.cache, args)
+        return
+
+    global g_background_scan
+    if len(args) == 1 and args[0] in ["status", "cancel"]:
+        if g_background_scan is None:
+            HM.DPrint("There is no background scan.")
+        elif args[0] == "status":
+            HM.DPrint(g_background_scan.get_status_description())
+        elif g_background_scan.is_running():
+            g_background_scan.cancel()
+            HM.DPrint(f"Cancel the background scan of {g_background_scan.image_name}, enter \"reference --background {g_background_scan.image_name}\" to resume it.")
+        else:
+            HM.DPrint(f"The background scan of {g_background_scan.image_name} is not running.")
+        return
+
     if not HM.is_arm64(exe_ctx.GetTarget()):
         HM.DPrint("x86_64 architecture does not support the \"reference\" command.")
         return
 
-    command_args: List[str] = command.split()
-    if len(command_args) != 2:
-        HM.DPrint("Error input. Please enter \"help reference\" for help.")
+    target_address_list: List[int] = []
+    is_objc_metadata_query = options.selector is not None or options.class_name is not None or options.cfstring is not None
+    if options.background:
+        if len(args) != 1 or options.all or is_module_name_pattern(args[0]):
+            HM.DPrint("Error input. Please enter \"help reference\" for help.")
+            return
+    else:
+        if len(args) == 0 and not options.all:
+            HM.DPrint("Error input. Please enter \"help reference\" for help.")
+            return
+        # There is no image name when querying all modules
+        address_string_list = args if options.all else args[:-1]
+        if options.address_file:
+            address_file_path = os.path.expanduser(options.address_file)
+            if not os.path.isfile(address_file_path):
+                HM.DPrint(f"The file does not exist:{address_file_path}")
+                return
+            address_string_list += read_address_file(address_file_path)
+        if len(address_string_list) == 0 and not is_objc_metadata_query and not options.profile:
+            HM.DPrint("Error input. Please enter \"help reference\" for help.")
+            return
+        for address_or_name in address_string_list:
+            is_valid_address, target_address_int = HM.int_value_from_string(address_or_name)
+            if not is_valid_address:
+                HM.DPrint(f"Invalid address:{address_or_name}")
+                return
+            if target_address_int not in target_address_list:
+                target_address_list.append(target_address_int)
+
+    if options.jobs < 1:
+        HM.DPrint(f"Invalid jobs:{options.jobs}")
         return
-    address_or_name = command_args[0]
-    is_valid_address, target_address_int = HM.int_value_from_string(address_or_name)
-    if not is_valid_address:
-        HM.DPrint(f"Invalid address:{address_or_name}")
+    range_size = 1
+    if options.range:
+        is_valid_size, range_size = HM.int_value_from_string(options.range)
+        if not is_valid_size or range_size <= 0:
+            HM.DPrint(f"Invalid range size:{options.range}")
+            return
+    if (options.limit is not None and options.limit < 0) or options.offset < 0:
+        HM.DPrint("Invalid limit or offset.")
         return
+    if options.memory_budget <= 0:
+        HM.DPrint(f"Invalid memory budget:{options.memory_budget}")
+        return
+    memory_budget = options.memory_budget * 1024 * 1024
+    if options.profile and options.jobs > 1:
+        HM.DPrint("The profile is collected in the serial scan, ignore the --jobs option.")
+        options.jobs = 1
 
-    image_name = command_args[1]
-    global g_image_address_target_dic, g_image_address_ldr_dic
-
+    HMReferenceScanner.g_scan_profile = HMReferenceProfile.HMScanProfile() if options.profile else None
+    target = exe_ctx.GetTarget()
     start_time = datetime.now().strftime("%H:%M:%S")
     is_first_scan_target_image = False
-    # Find and scan module
-    if image_name not in g_image_address_target_dic:
-        is_first_scan_target_image = True
+    module_list: List[lldb.SBModule] = []
+    if options.all or is_module_name_pattern(args[-1]):
+        # Query the modules matching the pattern
+        module_name_pattern = "*" if options.all else args[-1]
+        module_list = [target.GetModuleAtIndex(i) for i in range(target.GetNumModules()) if fnmatch.fnmatchcase(get_module_name(target.GetModuleAtIndex(i)), module_name_pattern)]
+        if g_background_scan is not None and g_background_scan.is_running():
+            HM.DPrint(f"Skip {g_background_scan.image_name}, it is being scanned in the background.")
+            module_list = [module for module in module_list if module.GetUUIDString() != g_background_scan.uuid_str]
+        if len(module_list) == 0:
+            HM.DPrint(f"Unable to find module:{module_name_pattern}. Please enter the \"image list\" command to view all modules.")
+            return
+        index_list, is_first_scan_target_image = load_or_scan_module_index_list(exe_ctx, module_list, options.jobs, use_numpy, memory_budget, options.profile, options.function_starts)
+    else:
+        image_name = args[-1]
         # Find module
-        target = exe_ctx.GetTarget()
-        target_module: lldb.SBModule = None
-        module_num = target.GetNumModules()
-        for i in range(module_num):
-            module = target.GetModuleAtIndex(i)
-            if image_name == get_module_name(module):
-                target_module = module
-                break
+        target_module = find_module(target, image_name)
         if target_module is None:
             HM.DPrint(f"Unable to find module:{image_name}. Please enter the \"image list\" command to view all modules.")
             return
+        module_uuid: str = target_module.GetUUIDString()
+
+        if g_background_scan is not None and g_background_scan.is_running():
+            if g_background_scan.uuid_str == module_uuid:
+                HM.DPrint(f"{image_name} is being scanned in the background. Please enter \"reference status\" to view the progress.")
+                return
+            if options.background:
+                HM.DPrint(f"{g_background_scan.image_name} is being scanned in the background. Please wait or enter \"reference cancel\".")
+                return
+
+        # Find the index in memory, then on disk, otherwise scan module. The profile requires a scan.
+        index = None if options.profile else find_module_index(target, target_module)
+
+        if options.background:
+            if index is not None:
+                HM.DPrint(f"The index of {image_name} already exists.")
+            elif not module_uuid:
+                HM.DPrint(f"{image_name} has no UUID, the scan cannot be checkpointed.")
+            else:
+                code_layout = get_code_layout(exe_ctx, target_module) if options.function_starts else None
+                g_background_scan = HMBackgroundScan(target, target_module, use_numpy, code_layout)
+                g_background_scan.start()
+                HM.DPrint(f"Scan {image_name} in the background. Please enter \"reference status\" to view the progress.")
+            return
 
-        # Initialize variables corresponding to the module
-        address_target_dic: Dict[int, int] = {}
-        g_image_address_target_dic[image_name] = address_target_dic
-        address_ldr_dic: Dict[int, int] = {}
-        g_image_address_ldr_dic[image_name] = address_ldr_dic
-        # Scan module
-        section_num = target_module.GetNumSections()
-        for i in range(section_num):
-            section = target_module.GetSectionAtIndex(i)
-            scan_section_code(exe_ctx, section, address_target_dic, address_ldr_dic)
+        if index is None:
+            is_first_scan_target_image = True
+            # Initialize variables corresponding to the module
+            recorder = HMReferenceIndex.HMReferenceRecorder(get_module_base_address(target, target_module), get_module_address_range(target, target_module))
+            # Scan module
+            code_layout = get_code_layout(exe_ctx, target_module) if options.function_starts else None
+            if options.function_starts and code_layout is None:
+                HM.DPrint(f"Unable to find the functions of {image_name}, scan the whole code sections.")
+            if options.jobs > 1:
+                scan_module_code_in_parallel(exe_ctx, target_module, recorder, options.jobs, use_numpy, code_layout)
+            else:
+                memory = HMTargetMemory(target)
+                section_num = target_module.GetNumSections()
+                for i in range(section_num):
+                    section = target_module.GetSectionAtIndex(i)
+                    scan_section_code(exe_ctx, memory, section, recorder, use_numpy, code_layout)
+                HM.DPrint(memory.get_cache_description())
+            index = save_module_index(target, target_module, recorder)
+            del recorder
+        index_list = [index]
+        module_list = [target_module]
+
+    if HMReferenceScanner.g_scan_profile is not None:
+        HM.DPrint("Profile of the scan:")
+        print(HMReferenceScanner.g_scan_profile.get_summary())
+        HMReferenceScanner.g_scan_profile = None
+        if len(target_address_list) == 0 and not is_objc_metadata_query:
+            return
+
+    # [(address, label)], the label is printed before the results of the address
+    target_info_list: List[Tuple[int, str]] = [(target_address, f"Address: {hex(target_address)}") for target_address in target_address_list]
+    if is_objc_metadata_query:
+        # Jump from the name to the slots of the metadata sections, then query the code that references the slots
+        name_query_list = [(options.selector, [HMReferenceIndex.objc_kind_selref], "selector"),
+                           (options.class_name, [HMReferenceIndex.objc_kind_classref, HMReferenceIndex.objc_kind_superref], "class"),
+                           (options.cfstring, [HMReferenceIndex.objc_kind_cfstring], "cfstring")]
+        metadata_list = [(module, load_or_scan_objc_metadata(target, module)) for module in module_list]
+        for name, kind_list, description in name_query_list:
+            if name is None:
+                continue
+            slot_count = 0
+            for module, metadata in metadata_list:
+                for slot_address, kind in metadata.find_slots(name, kind_list):
+                    slot_count += 1
+                    target_info_list.append((slot_address, f"{HMReferenceIndex.objc_kind_section_name_dic[kind]}: {hex(slot_address)} ({get_module_name(module)}) {name}"))
+            if slot_count == 0:
+                HM.DPrint(f"Unable to find the {description}:{name}")
+        if len(target_info_list) == 0:
+            return
 
+    # Query all addresses in one pass over the index
+    is_range_query = range_size > 1
+    address_range_list = [(target_address, target_address + range_size) for target_address, _ in target_info_list]
+    target_result_list = find_sources_in_indexes(index_list, address_range_list, False)
+    ldr_result_list = find_sources_in_indexes(index_list, address_range_list, True)
+    show_label = len(target_info_list) > 1 or is_objc_metadata_query
+    if options.output:
+        save_reference_results(os.path.expanduser(options.output), target_info_list, target_result_list, ldr_result_list, target)
+    elif options.count_only:
+        for (_, label), target_results, ldr_results in zip(target_info_list, target_result_list, ldr_result_list):
+            if show_label:
+                HM.DPrint(label)
+            HM.DPrint(f"Scan result count:{len(target_results)}")
+            HM.DPrint(f"Scan result count in memory:{len(ldr_results)}")
+    elif options.group_by_function:
+        code_layout_list = [code_layout for code_layout in (get_code_layout(exe_ctx, module) for module in module_list) if code_layout is not None]
+        row_generator = generate_function_rows(target_result_list, ldr_result_list, target, code_layout_list)
+        print_reference_rows(target_info_list, target_result_list, ldr_result_list, row_generator, lambda row_list: [f"{count}\t{description}" for count, description in row_list], show_label, options.offset, options.limit)
     else:
-        address_target_dic: Dict[int, int] = g_image_address_target_dic[image_name]
-        address_ldr_dic: Dict[int, int] = g_image_address_ldr_dic[image_name]
-
-    # Traverse records and print matching results
-    result_count = 0
-    for key, value in address_target_dic.items():
-        if value == target_address_int:
-            result_count += 1
-            result_address: str = hex(key)
-            if result_count == 1:
-                HM.DPrint("These are the scan results:")
-            print(f"{result_address}: {HM.get_image_lookup_summary_from_address(key)}")
-
-    HM.DPrint(f"Scan result count:{result_count}")
-
-    # Traverse memory records and print matching results
-    result_count = 0
-    for key, value in address_ldr_dic.items():
-        if value == target_address_int:
-            result_count += 1
-            result_address: str = hex(key)
-            if result_count == 1:
-                HM.DPrint("These are the scan results in memory:")
-            print(f"{result_address}: {HM.get_image_lookup_summary_from_address(key)}")
-
-    HM.DPrint(f"Scan result count in memory:{result_count}")
+        def format_row_list(row_list: List[Tuple[int, int]]) -> List[str]:
+            # Symbolicate the rows that are shown only
+            summary_list = HMSymbolication.get_summary_list([result_address for result_address, _ in row_list], target)
+            return [get_reference_result_description(result_address, value, is_range_query, summary) for (result_address, value), summary in zip(row_list, summary_list)]
+        row_generator = generate_reference_rows(target_result_list, ldr_result_list)
+        print_reference_rows(target_info_list, target_result_list, ldr_result_list, row_generator, format_row_list, show_label, options.offset, options.limit)
 
     # Print time when scanning moudle for the first time
     if is_first_scan_target_image:
@@ -158,816 +605,660 @@ def reference(debugger, command, exe_ctx, result, internal_dict):
         HM.DPrint(f"Stop time: {stop_time}")
 
 
-def scan_section_code(exe_ctx: lldb.SBExecutionContext, section: lldb.SBSection, address_target_dic: Dict[int, int], address_ldr_dic: Dict[int, int]) -> None:
+def generate_reference_rows(target_result_list: List[List[Tuple[int, int]]], ldr_result_list: List[List[Tuple[int, int]]]) -> Iterator[Tuple[int, bool, Tuple[int, int]]]:
+    # Yield (target_index, is_ldr, (result_address, value)) in the order of printing
+    for target_index, (target_results, ldr_results) in enumerate(zip(target_result_list, ldr_result_list)):
+        for result in target_results:
+            yield target_index, False, result
+        for result in ldr_results:
+            yield target_index, True, result
+
+
+def generate_function_rows(target_result_list: List[List[Tuple[int, int]]], ldr_result_list: List[List[Tuple[int, int]]], target: lldb.SBTarget,
+                           code_layout_list: List[HMReferenceMachO.HMCodeLayout]) -> Iterator[Tuple[int, bool, Tuple[int, str]]]:
+    # Yield (target_index, is_ldr, (count, function)), the functions of each group are sorted by the count of results.
+    # The results are mapped to the function starts of the layouts, so only one address of each function is symbolicated.
+    code_layout_list = sorted(code_layout_list, key=lambda code_layout: code_layout.base_address)
+    base_address_list = [code_layout.base_address for code_layout in code_layout_list]
+    for target_index, (target_results, ldr_results) in enumerate(zip(target_result_list, ldr_result_list)):
+        for is_ldr, results in [(False, target_results), (True, ldr_results)]:
+            address_list = [result_address for result_address, _ in results]
+            for i, address in enumerate(address_list):
+                layout_index = bisect.bisect_right(base_address_list, address) - 1
+                if layout_index >= 0:
+                    function_start = code_layout_list[layout_index].find_function_start(address)
+                    if function_start != -1:
+                        address_list[i] = function_start
+            description_list = HMSymbolication.get_symbol_description_list(address_list, target)
+            counter = collections.Counter(description_list)
+            for description, count in sorted(counter.items(), key=lambda item: (-item[1], item[0])):
+                yield target_index, is_ldr, (count, description)
+
+
+def print_reference_rows(target_info_list: List[Tuple[int, str]], target_result_list: List[List[Tuple[int, int]]], ldr_result_list: List[List[Tuple[int, int]]],
+                         row_generator: Iterator[Tuple[int, bool, Any]], format_row_list: Callable[[List[Any]], List[str]], show_label: bool, offset: int, limit: Optional[int]) -> None:
+    # Only the rows in [offset, offset + limit) are consumed from the generator and formatted
+    shown_row_list = list(itertools.islice(row_generator, offset, None if limit is None else offset + limit))
+    line_list = format_row_list([row for _, _, row in shown_row_list])
+    # [(target_index, is_ldr), [line]]
+    shown_line_dic: Dict[Tuple[int, bool], List[str]] = {}
+    for (target_index, is_ldr, _), line in zip(shown_row_list, line_list):
+        shown_line_dic.setdefault((target_index, is_ldr), []).append(line)
+
+    for target_index, ((_, label), target_results, ldr_results) in enumerate(zip(target_info_list, target_result_list, ldr_result_list)):
+        if show_label:
+            HM.DPrint(label)
+        # Print matching results
+        target_line_list = shown_line_dic.get((target_index, False), [])
+        if len(target_line_list) > 0:
+            HM.DPrint("These are the scan results:")
+            print("\n".join(target_line_list))
+        HM.DPrint(f"Scan result count:{len(target_results)}")
+
+        # Print matching results in memory
+        ldr_line_list = shown_line_dic.get((target_index, True), [])
+        if len(ldr_line_list) > 0:
+            HM.DPrint("These are the scan results in memory:")
+            print("\n".join(ldr_line_list))
+        HM.DPrint(f"Scan result count in memory:{len(ldr_results)}")
+
+    if offset > 0 or limit is not None:
+        next_offset = offset + len(shown_row_list)
+        if next(row_generator, None) is not None:
+            HM.DPrint(f"Rows {offset} to {next_offset} are shown, enter \"--offset {next_offset}\" to show more.")
+        else:
+            HM.DPrint(f"Rows {offset} to {next_offset} are shown.")
+
+
+def get_reference_result_description(result_address: int, value: int, is_range_query: bool, summary: str) -> str:
+    if is_range_query:
+        # 0x19a7eb730 -> 0x1eef79140: UIKitCore`-[UIControl sendAction:to:forEvent:] + 108
+        return f"{hex(result_address)} -> {hex(value)}: {summary}"
+    return f"{hex(result_address)}: {summary}"
+
+
+def save_reference_results(path: str, target_info_list: List[Tuple[int, str]], target_result_list: List[List[Tuple[int, int]]], ldr_result_list: List[List[Tuple[int, int]]], target: lldb.SBTarget) -> None:
+    # Stream all results to a CSV file, or a JSON Lines file for other extensions. The rows are symbolicated in chunks.
+    is_csv = path.lower().endswith(".csv")
+    field_name_list = ["target", "kind", "address", "value", "summary"]
+    row_generator = generate_reference_rows(target_result_list, ldr_result_list)
+    row_count = 0
+    with open(path, 'w', newline='') as output_file:
+        csv_writer = None
+        if is_csv:
+            csv_writer = csv.writer(output_file)
+            csv_writer.writerow(field_name_list)
+        while True:
+            chunk = list(itertools.islice(row_generator, output_chunk_size))
+            if len(chunk) == 0:
+                break
+            summary_list = HMSymbolication.get_summary_list([result_address for _, _, (result_address, _) in chunk], target)
+            for (target_index, is_ldr, (result_address, value)), summary in zip(chunk, summary_list):
+                row = [hex(target_info_list[target_index][0]), "memory" if is_ldr else "code", hex(result_address), hex(value), summary]
+                if csv_writer is not None:
+                    csv_writer.writerow(row)
+                else:
+                    output_file.write(json.dumps(dict(zip(field_name_list, row))) + "\n")
+            row_count += len(chunk)
+    HM.DPrint(f"Save {row_count} results to {path}")
+
+
+def find_sources_in_indexes(index_list: List[HMReferenceIndex.HMReferenceIndex], address_range_list: List[Tuple[int, int]], is_ldr: bool) -> List[List[Tuple[int, int]]]:
+    # Merge the sorted results of the indexes for each address range
+    result_list_list = [index.find_sources_in_ranges(address_range_list, is_ldr) for index in index_list]
+    return [list(heapq.merge(*result_lists)) for result_lists in zip(*result_list_list)]
+
+
+def is_module_name_pattern(image_name: str) -> bool:
+    return any(c in image_name for c in "*?[")
+
+
+def find_module_index(target: lldb.SBTarget, module: lldb.SBModule, base_address_dic: Optional[Dict[str, int]] = None) -> Optional[HMReferenceIndex.HMReferenceIndex]:
+    # Find the index in memory, then on disk. base_address_dic is the result of get_base_address_dic, it is shared when finding the indexes of many modules.
+    image_name = get_module_name(module)
+    module_uuid: str = module.GetUUIDString()
+    index = g_index_cache.get(module_uuid, image_name)
+    if index is None and module_uuid:
+        index = HMReferenceIndex.HMReferenceIndex.load(HMReferenceIndex.get_index_path(module_uuid), 0)
+        if index is not None:
+            HM.DPrint(f"Load the index from {HMReferenceIndex.get_index_path(module_uuid)}")
+    if index is None:
+        return None
+    put_index_to_cache(image_name, index)
+    # The offsets are rebased lazily, the images may be loaded at different addresses in another target or after relaunching
+    if base_address_dic is None and len(index.module_uuid_list) > 0:
+        base_address_dic = get_base_address_dic(target)
+    module_base_list = [base_address_dic.get(uuid_str, lldb.LLDB_INVALID_ADDRESS) for uuid_str in index.module_uuid_list]
+    return index.rebase(get_module_base_address(target, module), module_base_list)
+
+
+def save_module_index(target: lldb.SBTarget, module: lldb.SBModule, recorder: HMReferenceIndex.HMReferenceRecorder, module_range_list: Optional[List[Tuple[int, int, int, str]]] = None) -> HMReferenceIndex.HMReferenceIndex:
+    # module_range_list is the result of get_module_range_list, it is shared when saving the indexes of many modules
+    module_uuid: str = module.GetUUIDString()
+    if module_range_list is None:
+        module_range_list = get_module_range_list(target)
+    index = recorder.create_index(module_uuid, module_range_list)
+    base_address_dic = {uuid_str: base_address for _, _, base_address, uuid_str in module_range_list}
+    index = index.rebase(recorder.base_address, [base_address_dic.get(uuid_str, lldb.LLDB_INVALID_ADDRESS) for uuid_str in index.module_uuid_list])
+    if module_uuid:
+        index_path = HMReferenceIndex.get_index_path(module_uuid)
+        index.save(index_path)
+        HM.DPrint(f"Save the index to {index_path}")
+        # The checkpoint of the background scan is useless now
+        checkpoint_path = HMReferenceIndex.get_checkpoint_path(module_uuid)
+        if os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+        # The Objective-C metadata is indexed with the code
+        load_or_scan_objc_metadata(target, module)
+    put_index_to_cache(get_module_name(module), index)
+    return index
+
+
+def put_index_to_cache(image_name: str, index: HMReferenceIndex.HMReferenceIndex) -> None:
+    for evicted_image_name in g_index_cache.put(image_name, index):
+        HM.DPrint(f"Evict the index of {evicted_image_name} from memory, the memory budget of indexes is {g_index_cache.budget // 1024 // 1024}MB")
+
+
+def handle_cache_command(action: str, args: List[str]) -> None:
+    if action == "list" and len(args) == 0:
+        HM.DPrint(f"Indexes in memory: {len(g_index_cache)}, {g_index_cache.get_memory_size() / 1024 / 1024:.2f}MB, budget: {g_index_cache.budget // 1024 // 1024}MB")
+        # From the most recently queried to the least
+        for image_name, index in reversed(g_index_cache.items()):
+            storage = "mapped" if index.is_mapped else "heap"
+            print(f"{image_name}: {index.uuid_str or 'no UUID'}, {len(index)} records, {index.get_memory_size() / 1024 / 1024:.2f}MB, {storage}")
+    elif action == "drop" and len(args) == 1:
+        index_list = g_index_cache.drop(args[0])
+        if len(index_list) == 0:
+            HM.DPrint(f"The index of {args[0]} is not in memory.")
+            return
+        for index in index_list:
+            g_objc_metadata_dic.pop(index.uuid_str, None)
+        HM.DPrint(f"Drop the index of {args[0]} from memory.")
+    elif action == "clear" and len(args) == 0:
+        g_index_cache.clear()
+        g_objc_metadata_dic.clear()
+        HM.DPrint("Clear the indexes in memory.")
+    elif action == "budget" and len(args) == 1:
+        is_valid_budget, budget = HM.int_value_from_string(args[0])
+        if not is_valid_budget or budget <= 0:
+            HM.DPrint(f"Invalid budget:{args[0]}")
+            return
+        for evicted_image_name in g_index_cache.set_budget(budget * 1024 * 1024):
+            HM.DPrint(f"Evict the index of {evicted_image_name} from memory.")
+        HM.DPrint(f"Set the memory budget of indexes to {budget}MB.")
+    else:
+        HM.DPrint("Error input. Please enter \"help reference\" for help.")
+
+
+def load_or_scan_objc_metadata(target: lldb.SBTarget, module: lldb.SBModule) -> HMReferenceIndex.HMObjCMetadata:
+    # Find the Objective-C metadata in memory, then on disk, otherwise scan the metadata sections
+    module_uuid: str = module.GetUUIDString()
+    base_address = get_module_base_address(target, module)
+    metadata = g_objc_metadata_dic.get(module_uuid) if module_uuid else None
+    if metadata is None and module_uuid:
+        metadata = HMReferenceIndex.HMObjCMetadata.load(HMReferenceIndex.get_objc_metadata_path(module_uuid), module_uuid, base_address)
+    if metadata is None:
+        metadata = scan_objc_metadata(target, module)
+        if module_uuid:
+            metadata.save(HMReferenceIndex.get_objc_metadata_path(module_uuid))
+    if module_uuid:
+        g_objc_metadata_dic[module_uuid] = metadata
+    # The image may be loaded at a different address in another target or after relaunching
+    return metadata.rebase(base_address)
+
+
+def scan_objc_metadata(target: lldb.SBTarget, module: lldb.SBModule) -> HMReferenceIndex.HMObjCMetadata:
+    # Read the slots of __objc_selrefs, __objc_classrefs, __objc_superrefs and __cfstring, and resolve their names
+    memory = HMTargetMemory(target)
+    metadata = HMReferenceIndex.HMObjCMetadata(module.GetUUIDString(), get_module_base_address(target, module))
+    section_list: List[lldb.SBSection] = []
+    for i in range(module.GetNumSections()):
+        append_leaf_sections(module.GetSectionAtIndex(i), section_list)
+    for section in section_list:
+        kind = objc_section_kind_dic.get(section.GetName())
+        section_load_address = section.GetLoadAddress(target)
+        if kind is None or section_load_address == lldb.LLDB_INVALID_ADDRESS:
+            continue
+        data = memory.read_cached_memory(section_load_address, section.GetByteSize())
+        if data is None:
+            continue
+
+        if kind == HMReferenceIndex.objc_kind_cfstring:
+            # struct { isa, flags, str, length }
+            for offset in range(0, len(data) - 31, 32):
+                flags, string_address, length = struct.unpack_from('<QQQ', data, offset + 8)
+                name = read_cfstring(memory, string_address, length, flags)
+                if name:
+                    metadata.record(section_load_address + offset, kind, name)
+            continue
+
+        for offset in range(0, len(data) - 7, 8):
+            pointer = int.from_bytes(data[offset:offset + 8], 'little')
+            if pointer == 0:
+                continue
+            if kind == HMReferenceIndex.objc_kind_selref:
+                name = memory.read_c_string(pointer)
+            else:
+                name = get_objc_class_name(target, pointer)
+            if name:
+                metadata.record(section_load_address + offset, kind, name)
+    return metadata
+
+
+def read_cfstring(memory: HMTargetMemory, string_address: int, length: int, flags: int) -> str:
+    # The flags of a constant CFString are 0x7c8 for ASCII and 0x7d0 for UTF-16
+    is_utf16 = (flags & 0xff) == 0xd0
+    size = min(length, cfstring_max_length) * (2 if is_utf16 else 1)
+    if size == 0:
+        return ""
+    data = memory.read_cached_memory(string_address, size)
+    if data is None:
+        return ""
+    return data.decode('utf-16-le' if is_utf16 else 'utf-8', errors='replace')
+
+
+def get_objc_class_name(target: lldb.SBTarget, class_address: int) -> str:
+    # The symbol of a class is "OBJC_CLASS_$_<class_name>", and LLDB names it with the class name
+    symbol: lldb.SBSymbol = target.ResolveLoadAddress(class_address).GetSymbol()
+    if not symbol.IsValid():
+        return ""
+    name: str = symbol.GetName()
+    for prefix in ["OBJC_CLASS_$_", "OBJC_METACLASS_$_", "_OBJC_CLASS_$_", "_OBJC_METACLASS_$_"]:
+        if name.startswith(prefix):
+            return name[len(prefix):]
+    return name
+
+
+def load_or_scan_module_index_list(exe_ctx: lldb.SBExecutionContext, module_list: List[lldb.SBModule], jobs: int, use_numpy: bool, memory_budget: int, is_rescan: bool = False, use_function_starts: bool = False) -> Tuple[List[HMReferenceIndex.HMReferenceIndex], bool]:
+    # Skip the modules with an index(unless is_rescan), then scan the others from small to large.
+    # The modules are scanned in batches, and the estimated memory of the recorders in a batch does not exceed memory_budget(unless a module exceeds it).
+    # Return (index_list, whether any module is scanned)
+    target: lldb.SBTarget = exe_ctx.GetTarget()
+    index_list: List[HMReferenceIndex.HMReferenceIndex] = []
+    pending_list: List[Tuple[int, lldb.SBModule]] = []  # [(code_size, module)]
+    base_address_dic = get_base_address_dic(target)
+    for module in module_list:
+        index = None if is_rescan else find_module_index(target, module, base_address_dic)
+        if index is not None:
+            index_list.append(index)
+            continue
+        code_size = get_module_code_size(target, module)
+        if code_size > 0:
+            pending_list.append((code_size, module))
+    pending_list.sort(key=lambda item: item[0])
+
+    batch_list: List[List[lldb.SBModule]] = []
+    batch_memory = 0
+    for code_size, module in pending_list:
+        estimated_memory = code_size // 4 * scan_memory_per_instruction
+        if len(batch_list) == 0 or batch_memory + estimated_memory > memory_budget:
+            batch_list.append([])
+            batch_memory = 0
+        batch_list[-1].append(module)
+        batch_memory += estimated_memory
+    HM.DPrint(f"Modules: {len(module_list)}, indexed: {len(index_list)}, to be scanned: {len(pending_list)} in {len(batch_list)} batches")
+    module_range_list = get_module_range_list(target) if len(batch_list) > 0 else []
+
+    for batch_index, batch in enumerate(batch_list):
+        HM.DPrint(f"Batch {batch_index + 1}/{len(batch_list)}: {', '.join(get_module_name(module) for module in batch)}")
+        recorder_list = [HMReferenceIndex.HMReferenceRecorder(get_module_base_address(target, module), get_module_address_range(target, module)) for module in batch]
+        code_layout_list = [get_code_layout(exe_ctx, module) if use_function_starts else None for module in batch]
+        if jobs > 1:
+            scan_modules_code_in_parallel(exe_ctx, batch, recorder_list, jobs, use_numpy, code_layout_list)
+        else:
+            memory = HMTargetMemory(target)
+            for module, recorder, code_layout in zip(batch, recorder_list, code_layout_list):
+                for i in range(module.GetNumSections()):
+                    scan_section_code(exe_ctx, memory, module.GetSectionAtIndex(i), recorder, use_numpy, code_layout)
+        for module, recorder in zip(batch, recorder_list):
+            index_list.append(save_module_index(target, module, recorder, module_range_list))
+        del recorder_list
+    return index_list, len(pending_list) > 0
+
+
+def get_module_code_size(target: lldb.SBTarget, module: lldb.SBModule) -> int:
+    section_list: List[lldb.SBSection] = []
+    for i in range(module.GetNumSections()):
+        append_leaf_sections(module.GetSectionAtIndex(i), section_list)
+    return sum(section.GetByteSize() for section in section_list if section.GetSectionType() == lldb.eSectionTypeCode and section.GetLoadAddress(target) != lldb.LLDB_INVALID_ADDRESS)
+
+
+def read_address_file(path: str) -> List[str]:
+    # One address per line, the empty lines and comments are ignored
+    address_string_list: List[str] = []
+    with open(path, 'r') as address_file:
+        for line in address_file:
+            line = line.strip()
+            if len(line) == 0 or line.startswith("#"):
+                continue
+            address_string_list.append(line.split()[0])
+    return address_string_list
+
+
+def generate_option_parser() -> optparse.OptionParser:
+    usage = "usage: reference [--numpy] [--jobs <count>] [--range <size>] [--address-file <path>] [<address> ...] <image_name>\n       reference [--numpy] [--jobs <count>] [--range <size>] [--memory-budget <MB>] --all <address> [<address> ...]\n       reference [--numpy] [--jobs <count>] [--selector <selector>] [--class <class_name>] [--cfstring <string>] <image_name>\n       reference [--limit <count>] [--offset <count>] [--count-only] [--group-by-function] [--output <path>] ...\n       reference [--numpy] --file <macho_path>\n       reference --profile [<address> ...] <image_name>|<module_name_pattern>\n       reference --cache list|clear|drop <image_name>|budget <MB>\n       reference [--numpy] --background <image_name>\n       reference status\n       reference cancel"
+    parser = optparse.OptionParser(usage=usage, prog="reference")
+    parser.add_option("-n", "--numpy",
+                      action="store_true",
+                      default=False,
+                      dest="numpy",
+                      help="Classify instructions with NumPy vectorized operations")
+    parser.add_option("-j", "--jobs",
+                      action="store",
+                      type="int",
+                      default=default_jobs,
+                      dest="jobs",
+                      help="Number of worker processes")
+    parser.add_option("-r", "--range",
+                      action="store",
+                      default=None,
+                      dest="range",
+                      help="Query the references to any address in [address, address + size)")
+    parser.add_option("-f", "--file",
+                      action="store",
+                      default=None,
+                      dest="file",
+                      help="Scan the Mach-O file and save the indexes")
+    parser.add_option("-b", "--background",
+                      action="store_true",
+                      default=False,
+                      dest="background",
+                      help="Scan the image on a worker thread")
+    parser.add_option("-a", "--address-file",
+                      action="store",
+                      default=None,
+                      dest="address_file",
+                      help="Query the addresses in the file")
+    parser.add_option("-A", "--all",
+                      action="store_true",
+                      default=False,
+                      dest="all",
+                      help="Query all modules")
+    parser.add_option("-m", "--memory-budget",
+                      action="store",
+                      type="int",
+                      default=default_memory_budget,
+                      dest="memory_budget",
+                      help="The memory budget(MB) of scanning a batch of modules")
+    parser.add_option("-s", "--selector",
+                      action="store",
+                      default=None,
+                      dest="selector",
+                      help="Query the references to the selector")
+    parser.add_option("-c", "--class",
+                      action="store",
+                      default=None,
+                      dest="class_name",
+                      help="Query the references to the class")
+    parser.add_option("-S", "--cfstring",
+                      action="store",
+                      default=None,
+                      dest="cfstring",
+                      help="Query the references to the constant CFString")
+    parser.add_option("-l", "--limit",
+                      action="store",
+                      type="int",
+                      default=None,
+                      dest="limit",
+                      help="Show at most the specified number of rows")
+    parser.add_option("-o", "--offset",
+                      action="store",
+                      type="int",
+                      default=0,
+                      dest="offset",
+                      help="Skip the specified number of rows")
+    parser.add_option("-C", "--count-only",
+                      action="store_true",
+                      default=False,
+                      dest="count_only",
+                      help="Show the count of results only")
+    parser.add_option("-g", "--group-by-function",
+                      action="store_true",
+                      default=False,
+                      dest="group_by_function",
+                      help="Group the results by function")
+    parser.add_option("-O", "--output",
+                      action="store",
+                      default=None,
+                      dest="output",
+                      help="Save all results to a CSV or JSON Lines file")
+    parser.add_option("-k", "--cache",
+                      action="store",
+                      default=None,
+                      dest="cache",
+                      help="Manage the indexes in memory: list, drop <image_name>, clear or budget <MB>")
+    parser.add_option("-F", "--function-starts",
+                      action="store_true",
+                      default=False,
+                      dest="function_starts",
+                      help="Only scan the functions in LC_FUNCTION_STARTS, skip the data in code of LC_DATA_IN_CODE")
+    parser.add_option("-p", "--profile",
+                      action="store_true",
+                      default=False,
+                      dest="profile",
+                      help="Scan the modules again and print the profile of the scan")
+
+    return parser
+
+
+def build_index_from_macho_file(path: str, use_numpy: bool, use_function_starts: bool = False) -> None:
+    # The addresses are the virtual addresses in the file. The index saves the offsets relative to the image base, so it is valid for the loaded image.
+    if not os.path.isfile(path):
+        HM.DPrint(f"Unable to find file:{path}")
+        return
+    try:
+        image_list = HMReferenceMachO.parse_macho_file(path)
+    except (struct.error, ValueError) as error:
+        # The headers are checked, struct.error is raised by the malformed data they point to, such as the chained fixups
+        HM.DPrint(f"Unable to parse {path}: {error}")
+        return
+    if len(image_list) == 0:
+        HM.DPrint(f"Unable to find arm64 image in {path}")
+        return
+
+    for image in image_list:
+        if not image.uuid_str:
+            HM.DPrint(f"The image has no UUID, skip it:{path}")
+            continue
+        start_time = datetime.now().strftime("%H:%M:%S")
+        memory = HMReferenceScanner.HMMachOFileMemory(image)
+        recorder = HMReferenceIndex.HMReferenceRecorder(image.base_address, image.image_range)
+        code_layout = image.code_layout if use_function_starts else None
+        if use_function_starts and code_layout is None:
+            HM.DPrint("The image has no LC_FUNCTION_STARTS, scan the whole code sections.")
+        for section_start, section_end, description in image.code_section_list:
+            HM.DPrint(f"Analyzing section:{description}")
+            for code_start, code_end in get_code_range_list(section_start, section_end, code_layout):
+                HMReferenceScanner.scan_code_range(memory, code_start, code_end, recorder, use_numpy)
+        index = recorder.create_index(image.uuid_str)
+        index_path = HMReferenceIndex.get_index_path(image.uuid_str)
+        index.save(index_path)
+        HM.DPrint(f"Save the index to {index_path}")
+        HM.DPrint(f"Record count:{len(index)}")
+        stop_time = datetime.now().strftime("%H:%M:%S")
+        HM.DPrint(f"Start time: {start_time}")
+        HM.DPrint(f"Stop time: {stop_time}")
+
+
+def scan_section_code(exe_ctx: lldb.SBExecutionContext, memory: HMTargetMemory, section: lldb.SBSection, recorder: HMReferenceIndex.HMReferenceRecorder, use_numpy: bool = False, code_layout: Optional[HMReferenceMachO.HMCodeLayout] = None) -> None:
+    # If code_layout is specified, only the functions are analyzed, the data in code is skipped
     target: lldb.SBTarget = exe_ctx.GetTarget()
     section_type_int = section.GetSectionType()
     if section_type_int == lldb.eSectionTypeContainer:
         sub_sections_num = section.GetNumSubSections()
         for i in range(sub_sections_num):
             sub_section = section.GetSubSectionAtIndex(i)
-            scan_section_code(exe_ctx, sub_section, address_target_dic, address_ldr_dic)
+            scan_section_code(exe_ctx, memory, sub_section, recorder, use_numpy, code_layout)
     elif section_type_int == lldb.eSectionTypeCode:
-        HM.DPrint(f"Analyzing section:{get_description_of_section(section)}")
+        section_description = get_description_of_section(section)
+        HM.DPrint(f"Analyzing section:{section_description}")
         section_load_address_start = section.GetLoadAddress(target)
         section_load_address_end = section.GetLoadAddress(target) + section.GetByteSize()
-        current_address = section_load_address_start
-        span = 4 * 10000
-        snippet_count = int((section_load_address_end - section_load_address_start) / span)
-        # print(f"snippet_count:{snippet_count}")
-        analyzing_snippet_count = 0
-        last_percentage: float = 0.0
-        while current_address + span < section_load_address_end:
-            instruction_analysis(exe_ctx, current_address, current_address + span, address_target_dic, address_ldr_dic)
-            current_address = current_address + span
-            # print percentage if necessary
-            if snippet_count > 120:
-                analyzing_snippet_count += 1
-                percentage = (analyzing_snippet_count / snippet_count) * 100
+        code_range_list = get_code_range_list(section_load_address_start, section_load_address_end, code_layout)
+        profile = HMReferenceScanner.g_scan_profile
+        if profile is not None and profile.is_current_thread():
+            profile.begin_section(len(recorder), memory.cache_hit_count + memory.cache_miss_count, memory.cache_miss_count)
+        for code_start, code_end in code_range_list:
+            HMReferenceScanner.scan_code_range(memory, code_start, code_end, recorder, use_numpy)
+        if profile is not None and profile.is_current_thread():
+            scanned_size = sum(code_end - code_start for code_start, code_end in code_range_list)
+            profile.end_section(section_description, scanned_size, len(recorder), memory.cache_hit_count + memory.cache_miss_count, memory.cache_miss_count)
+
+
+def get_code_range_list(section_start: int, section_end: int, code_layout: Optional[HMReferenceMachO.HMCodeLayout]) -> List[Tuple[int, int]]:
+    # [(start_address, end_address)] to be analyzed in the code section
+    if code_layout is None:
+        return [(section_start, section_end)]
+    return code_layout.get_code_range_list(section_start, section_end)
+
+
+def get_code_layout(exe_ctx: lldb.SBExecutionContext, module: lldb.SBModule) -> Optional[HMReferenceMachO.HMCodeLayout]:
+    # Find the layout in memory, otherwise read LC_FUNCTION_STARTS and LC_DATA_IN_CODE of the loaded image, or use the code symbols of the module
+    target: lldb.SBTarget = exe_ctx.GetTarget()
+    module_uuid: str = module.GetUUIDString()
+    base_address = get_module_base_address(target, module)
+    code_layout = g_code_layout_dic.get(module_uuid) if module_uuid else None
+    if code_layout is None:
+        memory = HMTargetMemory(target)
+        code_layout = HMReferenceMachO.parse_code_layout_in_memory(memory.read_cached_memory, base_address)
+        if code_layout is None:
+            code_layout = get_code_layout_from_symbols(target, module)
+        if code_layout is None:
+            return None
+        if module_uuid:
+            g_code_layout_dic[module_uuid] = code_layout
+    # The image may be loaded at a different address in another target or after relaunching
+    return code_layout.rebase(base_address)
+
+
+def get_code_layout_from_symbols(target: lldb.SBTarget, module: lldb.SBModule) -> Optional[HMReferenceMachO.HMCodeLayout]:
+    # LLDB creates the symbols of LC_FUNCTION_STARTS, so they are used when the load command cannot be read. There is no data in code.
+    base_address = get_module_base_address(target, module)
+    function_start_offset_set = set()
+    for i in range(module.GetNumSymbols()):
+        symbol: lldb.SBSymbol = module.GetSymbolAtIndex(i)
+        if symbol.GetType() != lldb.eSymbolTypeCode:
+            continue
+        start_address = symbol.GetStartAddress().GetLoadAddress(target)
+        if start_address != lldb.LLDB_INVALID_ADDRESS and start_address >= base_address:
+            function_start_offset_set.add(start_address - base_address)
+    if len(function_start_offset_set) == 0:
+        return None
+
+    section_list: List[lldb.SBSection] = []
+    for i in range(module.GetNumSections()):
+        append_leaf_sections(module.GetSectionAtIndex(i), section_list)
+    code_section_list: List[Tuple[int, int]] = []
+    for section in section_list:
+        section_load_address = section.GetLoadAddress(target)
+        if section.GetSectionType() == lldb.eSectionTypeCode and section_load_address != lldb.LLDB_INVALID_ADDRESS:
+            code_section_list.append((section_load_address - base_address, section_load_address - base_address + section.GetByteSize()))
+    return HMReferenceMachO.HMCodeLayout(base_address, array('Q', sorted(function_start_offset_set)), code_section_list, [])
+
+
+def scan_module_code_in_parallel(exe_ctx: lldb.SBExecutionContext, module: lldb.SBModule, recorder: HMReferenceIndex.HMReferenceRecorder, jobs: int, use_numpy: bool, code_layout: Optional[HMReferenceMachO.HMCodeLayout] = None) -> None:
+    scan_modules_code_in_parallel(exe_ctx, [module], [recorder], jobs, use_numpy, [code_layout])
+
+
+def scan_modules_code_in_parallel(exe_ctx: lldb.SBExecutionContext, module_list: List[lldb.SBModule], recorder_list: List[HMReferenceIndex.HMReferenceRecorder], jobs: int, use_numpy: bool,
+                                  code_layout_list: Optional[List[Optional[HMReferenceMachO.HMCodeLayout]]] = None) -> None:
+    # Read the images once and save them to a temporary file, which is mapped by all worker processes.
+    # Each worker analyzes a chunk of a code section. The adr/adrp logic at the end of a chunk reads the following instructions(the overlap) from the same file.
+    # A worker can only read the image of the chunk, so the result of an image does not depend on the other images.
+    target: lldb.SBTarget = exe_ctx.GetTarget()
+    memory = HMTargetMemory(target)
+    region_info_list_list: List[List[Tuple[int, int, int]]] = []
+    task_list: List[Tuple[int, int, int, int, bool]] = []
+    with tempfile.NamedTemporaryFile(prefix="HMReference_", delete=False) as snapshot_file:
+        snapshot_path = snapshot_file.name
+        for module_index, module in enumerate(module_list):
+            section_list: List[lldb.SBSection] = []
+            for i in range(module.GetNumSections()):
+                append_leaf_sections(module.GetSectionAtIndex(i), section_list)
+
+            region_info_list: List[Tuple[int, int, int]] = []
+            region_info_list_list.append(region_info_list)
+            for section in section_list:
+                section_load_address_start = section.GetLoadAddress(target)
+                section_size = section.GetByteSize()
+                if section_load_address_start == lldb.LLDB_INVALID_ADDRESS or section_size == 0:
+                    continue
+                data = memory.read_memory(section_load_address_start, section_size)
+                if data is None:
+                    continue
+                region_info_list.append((section_load_address_start, snapshot_file.tell(), len(data)))
+                snapshot_file.write(data)
+                if section.GetSectionType() != lldb.eSectionTypeCode:
+                    continue
+
+                HM.DPrint(f"Analyzing section:{get_description_of_section(section)}")
+                section_load_address_end = section_load_address_start + section_size
+                span = max(4 * 10000, (section_size // (jobs * 8)) & ~0b11)
+                code_layout = code_layout_list[module_index] if code_layout_list is not None else None
+                for code_start, code_end in get_code_range_list(section_load_address_start, section_load_address_end, code_layout):
+                    for chunk_start in range(code_start, code_end, span):
+                        chunk_end = min(chunk_start + span, code_end)
+                        if chunk_end - chunk_start >= 4:
+                            task_list.append((module_index, chunk_start, chunk_end, code_end, use_numpy))
+
+    try:
+        image_info_list = [(recorder.base_address, (recorder.image_start, recorder.image_end)) for recorder in recorder_list]
+        context = get_multiprocessing_context()
+        with context.Pool(jobs, initializer=HMReferenceScanner.init_worker_memory, initargs=(snapshot_path, region_info_list_list, image_info_list)) as pool:
+            last_percentage: float = 0.0
+            # Merge in the order of the chunks, so the result is the same as scanning in sequence
+            for index, chunk_recorder in enumerate(pool.imap(HMReferenceScanner.scan_chunk_in_worker, task_list)):
+                recorder_list[task_list[index][0]].extend(chunk_recorder)
                 # Print every 5 percent
+                percentage = ((index + 1) / len(task_list)) * 100
                 if percentage - last_percentage > 5.0:
                     last_percentage = percentage
                     print(f"{percentage:.2f}%")
-
-        # analysis last snippet
-        if section_load_address_end - current_address >= 4:
-            instruction_analysis(exe_ctx, current_address, section_load_address_end, address_target_dic, address_ldr_dic)
-
-
-def instruction_analysis(exe_ctx: lldb.SBExecutionContext, start_address: int, end_address: int, address_target_dic: Dict[int, int], address_ldr_dic: Dict[int, int]) -> None:
-    target: lldb.SBTarget = exe_ctx.GetTarget()
-    address: lldb.SBAddress = lldb.SBAddress(start_address, target)
-    error = lldb.SBError()
-    data: bytes = target.ReadMemory(address, end_address - start_address, error)
-    if not error.Success():
-        HM.DPrint(error)
-        return
-    for i in range(0, len(data), 4):
-        instruction_data = data[i:i+4]
-        if is_adrp_bytes(instruction_data) or is_adr_bytes(instruction_data):
-            # Record all adr/adrp logic
-            record_adrp_logic(exe_ctx, instruction_data, start_address + i, address_target_dic, address_ldr_dic)
-        elif is_b_bytes(instruction_data) or is_bl_bytes(instruction_data):
-            # Record all b/bl logic
-            label = decode_b_bytes(instruction_data)
-            address_target_dic[start_address + i] = start_address + i + label
-
-        # For testing
-        # if is_add_bytes_shifted_register(instruction_data):
-        #     current_address: lldb.SBAddress = lldb.SBAddress(start_address + i, target)
-        #     instruction_list: lldb.SBInstructionList = target.ReadInstructions(current_address, 1)
-        #     instruction = instruction_list.GetInstructionAtIndex(0)
-        #     HM.DPrint(f"{hex(start_address + i)}:{instruction} - {decode_add_bytes_shifted_register(instruction_data)}")
-
-    # For testing
-    # instruction_count = int((end_address - start_address) / 4)
-    # instruction_list: lldb.SBInstructionList = target.ReadInstructions(address, instruction_count)
-    # for i in range(instruction_count):
-    #     instruction: lldb.SBInstruction = instruction_list.GetInstructionAtIndex(i)
-    #     mnemonic: str = instruction.GetMnemonic(target)
-    #     if mnemonic == 'add':
-    #         step = i * 4
-    #         instruction_data = data[step:step+4]
-    #         if not (is_add_bytes_shifted_register(instruction_data) or is_add_bytes_extended_register(instruction_data) or is_add_bytes_immediate(instruction_data)):
-    #             load_address_int = start_address + step
-    #             HM.DPrint(f"{hex(load_address_int)}:{instruction}")
-
-
-def is_adr_bytes(data: bytes) -> bool:
-    # little endian
-    # ADR <Xd>, <label>
-    return (data[3] & 0x9f) == 0x10
-
-
-def is_adrp_bytes(data: bytes) -> bool:
-    # little endian
-    # ADRP <Xd>, <label>
-    return (data[3] & 0x9f) == 0x90
-
-
-def is_b_bytes(data: bytes) -> bool:
-    # little endian
-    # B <label>
-    return (data[3] & 0xfc) == 0x14
-
-
-def is_bl_bytes(data: bytes) -> bool:
-    # little endian
-    # BL <label>
-    return (data[3] & 0xfc) == 0x94
-
-
-def is_br_bytes(data: bytes) -> bool:
-    # BR <Xn>
-    return ((data[3] & 0xff) == 0xd6) and ((data[2] & 0xff) == 0x1f) and ((data[1] & 0xfc) == 0x00) and ((data[0] & 0x1f) == 0x00)
-
-
-def is_blr_bytes(data: bytes) -> bool:
-    # BLR <Xn>
-    return ((data[3] & 0xff) == 0xd6) and ((data[2] & 0xff) == 0x3f) and ((data[1] & 0xfc) == 0x00) and ((data[0] & 0x1f) == 0x00)
-
-
-# CBNZ
-def is_cbnz_bytes(data: bytes) -> bool:
-    # 32-bit: CBNZ <Wt>, <label>
-    # 64-bit: CBNZ <Xt>, <label>
-    return (data[3] & 0x7f) == 0x35
-
-
-# RET
-def is_ret_bytes(data: bytes) -> bool:
-    # RET {<Xn>}
-    return ((data[3] & 0xff) == 0xd6) and ((data[2] & 0xff) == 0x5f) and ((data[1] & 0xfc) == 0x0) and ((data[0] & 0x1f) == 0x0)
-
-
-# ADD (extended register)
-def is_add_bytes_extended_register(data: bytes) -> bool:
-    # little endian
-    # 32-bit: ADD <Wd|WSP>, <Wn|WSP>, <Wm>{, <extend> {#<amount>}}
-    # 64-bit: ADD <Xd|SP>, <Xn|SP>, <Rm>{, <extend> {#<amount>}}
-    # There are still a few cases that need to be excluded, which are omitted for efficiency.
-    return ((data[3] & 0x7f) == 0x0b) and ((data[2] & 0xe0) == 0x20)
-
-
-# ADD (immediate)
-def is_add_bytes_immediate(data: bytes) -> bool:
-    # little endian
-    # This instruction is used by the alias MOV (to/from SP).
-    # 32-bit: ADD <Wd|WSP>, <Wn|WSP>, #<imm>{, <shift>}
-    # 64-bit: ADD <Xd|SP>, <Xn|SP>, #<imm>{, <shift>}
-    return ((data[3] & 0x7f) == 0x11) and ((data[2] & 0x80) == 0x00)
-
-
-# ADD (shifted register)
-def is_add_bytes_shifted_register(data: bytes) -> bool:
-    # little endian
-    # 32-bit: ADD <Wd>, <Wn>, <Wm>{, <shift> #<amount>}
-    # 64-bit: ADD <Xd>, <Xn>, <Xm>{, <shift> #<amount>}
-    # There are still a few cases that need to be excluded, which are omitted for efficiency.(shift = 0b11, 32bit amount > 31)
-    return ((data[3] & 0x7f) == 0x0b) and ((data[2] & 0x20) == 0x00)
-
-
-# LDR (immediate) Post-index
-def is_ldr_bytes_immediate_post_index(data: bytes) -> bool:
-    # little endian
-    # 32-bit: LDR <Wt>, [<Xn|SP>], #<simm>
-    # 64-bit: LDR <Xt>, [<Xn|SP>], #<simm>
-    return ((data[3] & 0xbf) == 0xb8) and ((data[2] & 0xe0) == 0x40) and ((data[1] & 0x0c) == 0x04)
-
-
-# LDR (immediate) Pre-index
-def is_ldr_bytes_immediate_pre_index(data: bytes) -> bool:
-    # little endian
-    # 32-bit: LDR <Wt>, [<Xn|SP>, #<simm>]!
-    # 64-bit: LDR <Xt>, [<Xn|SP>, #<simm>]!
-    return ((data[3] & 0xbf) == 0xb8) and ((data[2] & 0xe0) == 0x40) and ((data[1] & 0x0c) == 0x0c)
-
-
-# LDR (immediate) Unsigned offset
-def is_ldr_bytes_immediate_unsigned_offset(data: bytes) -> bool:
-    # little endian
-    # 32-bit: LDR <Wt>, [<Xn|SP>{, #<pimm>}]
-    # 64-bit: LDR <Xt>, [<Xn|SP>{, #<pimm>}]
-    return ((data[3] & 0xbf) == 0xb9) and ((data[2] & 0xc0) == 0x40)
-
-
-# LDR (literal)
-def is_ldr_bytes_literal(data: bytes) -> bool:
-    # little endian
-    # 32-bit: LDR <Wt>, <label>
-    # 64-bit: LDR <Xt>, <label>
-    return (data[3] & 0xbf) == 0x18
-
-
-# LDR (register)
-def is_ldr_bytes_register(data: bytes) -> bool:
-    # little endian
-    # 32-bit: LDR <Wt>, [<Xn|SP>, (<Wm>|<Xm>){, <extend> {<amount>}}]
-    # 64-bit: LDR <Xt>, [<Xn|SP>, (<Wm>|<Xm>){, <extend> {<amount>}}]
-    # There are still a few cases that need to be excluded, which are omitted for efficiency
-    return ((data[3] & 0xbf) == 0xb8) and ((data[2] & 0xe0) == 0x60) and ((data[1] & 0x0c) == 0x08)
-
-
-# LDRSW (immediate) Post-index
-def is_ldrsw_bytes_immediate_post_index(data: bytes) -> bool:
-    # little endian
-    # LDRSW <Xt>, [<Xn|SP>], #<simm>
-    return ((data[3] & 0xff) == 0xb8) and ((data[2] & 0xe0) == 0x80) and ((data[1] & 0x0c) == 0x04)
-
-
-# LDRSW (immediate) Pre-index
-def is_ldrsw_bytes_immediate_pre_index(data: bytes) -> bool:
-    # little endian
-    # LDRSW <Xt>, [<Xn|SP>, #<simm>]!
-    return ((data[3] & 0xff) == 0xb8) and ((data[2] & 0xe0) == 0x80) and ((data[1] & 0x0c) == 0x0c)
-
-
-# LDRSW (immediate) Unsigned offset
-def is_ldrsw_bytes_immediate_unsigned_offset(data: bytes) -> bool:
-    # little endian
-    # LDRSW <Xt>, [<Xn|SP>{, #<pimm>}]
-    return ((data[3] & 0xff) == 0xb9) and ((data[2] & 0xc0) == 0x80)
-
-
-# LDRSW (literal)
-def is_ldrsw_bytes_literal(data: bytes) -> bool:
-    # little endian
-    # LDRSW <Xt>, <label>
-    return (data[3] & 0xff) == 0x98
-
-
-# LDRSW (register)
-def is_ldrsw_bytes_register(data: bytes) -> bool:
-    # little endian
-    # LDRSW <Xt>, [<Xn|SP>, (<Wm>|<Xm>){, <extend> {<amount>}}]
-    # There are still a few cases that need to be excluded, which are omitted for efficiency.
-    return ((data[3] & 0xff) == 0xb8) and ((data[2] & 0xe0) == 0xa0) and ((data[1] & 0x0c) == 0x08)
-
-
-# LDAXR
-def is_ldaxr_bytes(data: bytes) -> bool:
-    # 32-bit: LDAXR <Wt>, [<Xn|SP>{, #0}]
-    # 64-bit: LDAXR <Xt>, [<Xn|SP>{, #0}]
-    return ((data[3] & 0xbf) == 0x88) and ((data[2] & 0xff) == 0x5f) and ((data[1] & 0xfc) == 0xfc)
-
-
-# MOV (bitmask immediate)
-def is_mov_bytes_bitmask_immediate(data: bytes) -> bool:
-    # little endian
-    # This is an alias of ORR (immediate)
-    # 32-bit: MOV <Wd|WSP>, #<imm>    is equivalent to ORR <Wd|WSP>, WZR, #<imm>
-    # 64-bit: MOV <Xd|SP>, #<imm>    is equivalent to ORR <Xd|SP>, XZR, #<imm>
-    # There are still a few cases that need to be excluded, which are omitted for efficiency.
-    return ((data[3] & 0x7f) == 0x32) and ((data[2] & 0x80) == 0x00) and ((data[1] & 0x03) == 0x03) and ((data[0] & 0xe0) == 0xe0)
-
-
-# MOV (inverted wide immediate)
-def is_mov_bytes_inverted_wide_immediate(data: bytes) -> bool:
-    # little endian
-    # This is an alias of MOVN
-    # 32-bit: MOV <Wd>, #<imm>    is equivalent to MOVN <Wd>, #<imm16>, LSL #<shift>
-    # 64-bit: MOV <Xd>, #<imm>    is equivalent to MOVN <Xd>, #<imm16>, LSL #<shift>
-    # There are still a few cases that need to be excluded, which are omitted for efficiency.
-    return ((data[3] & 0x7f) == 0x12) and ((data[2] & 0x80) == 0x80)
-
-
-# MOV (register)
-def is_mov_bytes_register(data: bytes) -> bool:
-    # little endian
-    # This is an alias of ORR (shifted register)
-    # 32-bit: MOV <Wd>, <Wm>    is equivalent to ORR <Wd>, WZR, <Wm>
-    # 64-bit: MOV <Xd>, <Xm>    is equivalent to ORR <Xd>, XZR, <Xm>
-    return ((data[3] & 0x7f) == 0x2a) and ((data[2] & 0xe0) == 0x00) and ((data[1] & 0xff) == 0x03) and ((data[0] & 0xe0) == 0xe0)
-
-
-# MOV (to/from SP)
-def is_mov_bytes_to_from_sp(data: bytes) -> bool:
-    # little endian
-    # This is an alias of ADD (immediate)
-    # 32-bit: MOV <Wd|WSP>, <Wn|WSP>    is equivalent to ADD <Wd|WSP>, <Wn|WSP>, #0
-    # 64-bit: MOV <Xd|SP>, <Xn|SP>    is equivalent to ADD <Xd|SP>, <Xn|SP>, #0
-    return ((data[3] & 0x7f) == 0x11) and ((data[2] & 0xff) == 0x00) and ((data[1] & 0xfc) == 0x00)
-
-
-# MOV (wide immediate)
-def is_mov_bytes_wide_immediate(data: bytes) -> bool:
-    # little endian
-    # This is an alias of MOVZ
-    # 32-bit: MOV <Wd>, #<imm>    is equivalent to MOVZ <Wd>, #<imm16>, LSL #<shift>
-    # 64-bit: MOV <Xd>, #<imm>    is equivalent to MOVZ <Xd>, #<imm16>, LSL #<shift>
-    # There are still a few cases that need to be excluded, which are omitted for efficiency.
-    return ((data[3] & 0x7f) == 0x52) and ((data[2] & 0x80) == 0x80)
-
-
-# STR (immediate) Post-index
-def is_str_bytes_immediate_post_index(data: bytes) -> bool:
-    # little endian
-    # 32-bit: STR <Wt>, [<Xn|SP>], #<simm>
-    # 64-bit: STR <Xt>, [<Xn|SP>], #<simm>
-    return ((data[3] & 0xbf) == 0xb8) and ((data[2] & 0xe0) == 0x00) and ((data[1] & 0x0c) == 0x04)
-
-
-# STR (immediate) Pre-index
-def is_str_bytes_immediate_pre_index(data: bytes) -> bool:
-    # little endian
-    # 32-bit: STR <Wt>, [<Xn|SP>, #<simm>]!
-    # 64-bit: STR <Xt>, [<Xn|SP>, #<simm>]!
-    return ((data[3] & 0xbf) == 0xb8) and ((data[2] & 0xe0) == 0x00) and ((data[1] & 0x0c) == 0x0c)
-
-
-# STR (immediate) Unsigned offset
-def is_str_bytes_immediate_unsigned_offset(data: bytes) -> bool:
-    # little endian
-    # 32-bit: STR <Wt>, [<Xn|SP>{, #<pimm>}]
-    # 64-bit: STR <Xt>, [<Xn|SP>{, #<pimm>}]
-    return ((data[3] & 0xbf) == 0xb9) and ((data[2] & 0xc0) == 0x00)
-
-
-# STR (register)
-def is_str_bytes_register(data: bytes) -> bool:
-    # little endian
-    # 32-bit: STR <Wt>, [<Xn|SP>, (<Wm>|<Xm>){, <extend> {<amount>}}]
-    # 64-bit: STR <Xt>, [<Xn|SP>, (<Wm>|<Xm>){, <extend> {<amount>}}]
-    # There are still a few cases that need to be excluded, which are omitted for efficiency.
-    return ((data[3] & 0xbf) == 0xb8) and ((data[2] & 0xe0) == 0x20) and ((data[1] & 0x0c) == 0x08)
-
-
-# STP (Signed offset)
-def is_stp_bytes_signed_offset(data: bytes) -> bool:
-    # little endian
-    # 32-bit: STP <Wt1>, <Wt2>, [<Xn|SP>{, #<imm>}]
-    # 64-bit: STP <Xt1>, <Xt2>, [<Xn|SP>{, #<imm>}]
-    return ((data[3] & 0x7f) == 0x29) and ((data[2] & 0xc0) == 0x0)
-
-
-# STLXR
-def is_stlxr_bytes(data: bytes) -> bool:
-    # little endian
-    # 32-bit: STLXR <Ws>, <Wt>, [<Xn|SP>{, #0}]
-    # 64-bit: STLXR <Ws>, <Xt>, [<Xn|SP>{, #0}]
-    return ((data[3] & 0xbf) == 0x88) and ((data[2] & 0xe0) == 0x0) and ((data[1] & 0xfc) == 0xfc)
-
-
-# STXR
-def is_stxr_bytes(data: bytes) -> bool:
-    # 32-bit: STXR <Ws>, <Wt>, [<Xn|SP>{, #0}]
-    # 64-bit: STXR <Ws>, <Xt>, [<Xn|SP>{, #0}]
-    return ((data[3] & 0xbf) == 0x88) and ((data[2] & 0xe0) == 0x0) and ((data[1] & 0xfc) == 0x7c)
-
-
-# NOP
-def is_nop_bytes(data: bytes) -> bool:
-    # little endian
-    return (data[3] == 0xd5) and (data[2] == 0x03) and (data[1] == 0x20) and (data[0] == 0x1f)
-
-
-# decode adr/adrp and return (Rd, offset)
-def decode_adr_bytes(data: bytes) -> (int, int):
-    # ADR <Xd>, <label>
-    # ADRP <Xd>, <label> (label = offset * 4096)
-    value = int.from_bytes(data, 'little')
-    rd = value & 0b11111
-    immhi = (value >> 5) & 0x7ffff
-    immlo = (value >> 29) & 0b11
-    imm21 = (immhi << 2) | immlo
-    offset = HMRegister.twos_complement_to_int(imm21, 21)
-    return rd, offset
-
-
-# decode b/bl and return label
-def decode_b_bytes(data: bytes) -> int:
-    # B <label>
-    # BL <label>
-    value = int.from_bytes(data, 'little')
-    imm26 = value & 0x3ffffff
-    label = HMRegister.twos_complement_to_int(imm26, 26) * 4
-    return label
-
-
-# decode br/blr, return rn
-def decode_br_bytes(data: bytes) -> int:
-    # BR <Xn>
-    # BLR <Xn>
-    # br x16
-    # br xzr
-    value = int.from_bytes(data, 'little')
-    rn = (value >> 5) & 0b11111
-    return rn
-
-
-# decode ADD (immediate) and return (Rd, Rn, is_64bit, final_immediate)
-def decode_add_bytes_immediate(data: bytes) -> (int, int, bool, int):
-    # 32-bit: ADD <Wd|WSP>, <Wn|WSP>, #<imm>{, <shift>}
-    # 64-bit: ADD <Xd|SP>, <Xn|SP>, #<imm>{, <shift>}
-    # mov x8, sp - (8, 31, True, 0)
-    # add sp, sp, #0x70 - (31, 31, True, 0x70)
-    # add w0, w22, #0x4 - (0, 22, False, 0x4)
-    is_64bit = (data[3] & 0x80) == 0x80
-    value = int.from_bytes(data, 'little')
-    sh = (value >> 22) & 1
-    imm12 = (value >> 10) & 0xfff
-    rd = value & 0b11111
-    rn = (value >> 5) & 0b11111
-    final_immediate = imm12 if sh == 0 else imm12 << 12
-    return rd, rn, is_64bit, final_immediate
-
-
-# decode ADD (shifted register) and return (Rd, Rn, Rm, is_64bit, shift, amount)
-def decode_add_bytes_shifted_register(data: bytes) -> (int, int, int, bool, HMShift, int):
-    # 32-bit: ADD <Wd>, <Wn>, <Wm>{, <shift> #<amount>}
-    # 64-bit: ADD <Xd>, <Xn>, <Xm>{, <shift> #<amount>}
-    # add x0, x20, x8 - (0, 20, 8, True, <HMShift.lsl: 0>, 0)
-    # add x8, x8, x22, lsl #3 - (8, 8, 22, True, <HMShift.lsl: 0>, 3)
-    # add x8, x8, x20, asr #32 - (8, 8, 20, True, <HMShift.asr: 2>, 32)
-    # add w23, w8, w1 - (23, 8, 1, False, <HMShift.lsl: 0>, 0)
-    # add w9, w9, w9, lsl #8 - (9, 9, 9, False, <HMShift.lsl: 0>, 8)
-    # add w8, w9, w8, lsr #31 - (8, 9, 8, False, <HMShift.lsr: 1>, 31)
-    # add xzr, x21, x8 - (31, 21, 8, True, <HMShift.lsl: 0>, 0)
-    # add x8, xzr, x8 - (8, 31, 8, True, <HMShift.lsl: 0>, 0)
-    # add x8, x21, xzr - (8, 21, 31, True, <HMShift.lsl: 0>, 0)
-    is_64bit = (data[3] & 0x80) == 0x80
-    value = int.from_bytes(data, 'little')
-    rd = value & 0b11111
-    rn = (value >> 5) & 0b11111
-    rm = (value >> 16) & 0b11111
-    shift_value = (value >> 22) & 0b11
-    shift = HMShift(shift_value)
-    imm6 = (value >> 10) & 0x3f
-    return rd, rn, rm, is_64bit, shift, imm6
-
-
-# decode LDR (immediate) Post-index and return (Rt, Rn, is_64bit, simm)
-def decode_ldr_bytes_immediate_post_index(data: bytes) -> (int, int, bool, int):
-    # 32-bit: LDR <Wt>, [<Xn|SP>], #<simm>
-    # 64-bit: LDR <Xt>, [<Xn|SP>], #<simm>
-    # ldr x10, [x9], #-0x18 - (10, 9, True, -0x18)
-    # ldr w2, [x24], #0x4 - (2, 24, False, 0x4)
-    # ldr x19, [sp], #0x20 - (19, 31, True, 32)
-    # ldr xzr, [x20], #0x8 - (31, 20, True, 8)
-    is_64bit = (data[3] & 0x40) == 0x40
-    value = int.from_bytes(data, 'little')
-    rt = value & 0b11111
-    rn = (value >> 5) & 0b11111
-    imm9 = (value >> 12) & 0x1ff
-    simm = HMRegister.twos_complement_to_int(imm9, 9)
-    return rt, rn, is_64bit, simm
-
-
-# decode LDR (immediate) Pre-index and return (Rt, Rn, is_64bit, simm)
-def decode_ldr_bytes_immediate_pre_index(data: bytes) -> (int, int, bool, int):
-    # 32-bit: LDR <Wt>, [<Xn|SP>, #<simm>]!
-    # 64-bit: LDR <Xt>, [<Xn|SP>, #<simm>]!
-    # ldr x16, [x8, #-0x8]! - (16, 8, True, -8)
-    # ldr w8, [x26, #0x38]! - (8, 26, False, 0x38)
-    # ldr x9, [sp, #0x8]! - (9, 31, True, 8)
-    # ldr wzr, [x16, #0xf6]! - (31, 16, False, 0xf6)
-    is_64bit = (data[3] & 0x40) == 0x40
-    value = int.from_bytes(data, 'little')
-    rt = value & 0b11111
-    rn = (value >> 5) & 0b11111
-    imm9 = (value >> 12) & 0x1ff
-    simm = HMRegister.twos_complement_to_int(imm9, 9)
-    return rt, rn, is_64bit, simm
-
-
-# decode LDR (immediate) Unsigned offset and return (Rt, Rn, is_64bit, pimm)
-def decode_ldr_bytes_immediate_unsigned_offset(data: bytes) -> (int, int, bool, int):
-    # 32-bit: LDR <Wt>, [<Xn|SP>{, #<pimm>}]
-    # 64-bit: LDR <Xt>, [<Xn|SP>{, #<pimm>}]
-    # ldr x2, [x8] - (2, 8, True, 0)
-    # ldr w8, [x19, #0x8] - (8, 19, False, 8)
-    # ldr x8, [sp, #0x98] - (8, 31, True, 0x98)
-    # ldr xzr, [x8, #0x18] - (31, 8, True, 0x18)
-    is_64bit = (data[3] & 0x40) == 0x40
-    value = int.from_bytes(data, 'little')
-    rt = value & 0b11111
-    rn = (value >> 5) & 0b11111
-    imm12 = (value >> 10) & 0xfff
-    if is_64bit:
-        pimm = imm12 * 8
-    else:
-        pimm = imm12 * 4
-    return rt, rn, is_64bit, pimm
-
-
-# decode LDR (literal), return (Rt, is_64bit, label)
-def decode_ldr_bytes_literal(data: bytes) -> (int, bool, int):
-    # 32-bit: LDR <Wt>, <label>
-    # 64-bit: LDR <Xt>, <label>
-    # 0x104d3307c: ldr w16, 0x104d33084 - (16, False, 8)
-    # 0x10ec81160: ldr x20, #-0xf7c00 - (20, True, -0xf7c00)
-    # 0x107c802e8: ldr wzr, 0x107c8a528 - (31, False, 41536)
-    is_64bit = (data[3] & 0x40) == 0x40
-    value = int.from_bytes(data, 'little')
-    rt = value & 0b11111
-    imm19 = (value >> 5) & 0x7ffff
-    label = HMRegister.twos_complement_to_int(imm19, 19) * 4
-    return rt, is_64bit, label
-
-
-# decode LDR (register) and return (Rt, Rn, Rm, is_64bit, extend, amount)
-def decode_ldr_bytes_register(data: bytes) -> (int, int, int, bool, HMExtendOption, int):
-    # 32-bit: LDR <Wt>, [<Xn|SP>, (<Wm>|<Xm>){, <extend> {<amount>}}]
-    # 64-bit: LDR <Xt>, [<Xn|SP>, (<Wm>|<Xm>){, <extend> {<amount>}}]
-    # ldr x0, [x27, x8] - (0, 27, 8, True, <HMExtendOption.lsl: 3>, 0)
-    # ldr w12, [x20, x9, lsl  #2] - (12, 20, 9, False, <HMExtendOption.lsl: 3>, 2)
-    # ldr w2, [x8, w0, sxtw  #2] - (2, 8, 0, False, <HMExtendOption.sxtw: 6>, 2)
-    # ldr x2, [x21, w8, uxtw] - (2, 21, 8, True, <HMExtendOption.uxtw: 2>, 0)
-    # ldr wzr, [x19, x8] - (31, 19, 8, False, <HMExtendOption.lsl: 3>, 0)
-    # ldr xzr, [sp, xzr] - (31, 31, 31, True, <HMExtendOption.lsl: 3>, 0)
-    is_64bit = (data[3] & 0x40) == 0x40
-    value = int.from_bytes(data, 'little')
-    rt = value & 0b11111
-    rn = (value >> 5) & 0b11111
-    rm = (value >> 16) & 0b11111
-    option = (value >> 13) & 0b111
-    s = (value >> 12) & 0b1
-    if is_64bit:
-        amount = 0 if s == 0 else 3
-    else:
-        amount = 0 if s == 0 else 2
-
-    if option == 0b10:
-        extend = HMExtendOption.uxtw
-    elif option == 0b11:
-        extend = HMExtendOption.lsl
-    elif option == 0b110:
-        extend = HMExtendOption.sxtw
-    elif option == 0b111:
-        extend = HMExtendOption.sxtx
-    else:
-        extend = HMExtendOption.unknow
-    return rt, rn, rm, is_64bit, extend, amount
-
-
-# decode LDRSW (immediate) Post-index and return (Rt, Rn, simm)
-def decode_ldrsw_bytes_immediate_post_index(data: bytes) -> (int, int, int):
-    # LDRSW <Xt>, [<Xn|SP>], #<simm>
-    # ldrsw x8, [x22], #0x4 - (8, 22, 4)
-    # ldrsw x2, [x30], #-0x8 - (2, 30, -8)
-    # ldrsw xzr, [sp], #0x1 - (31, 31, 1)
-    value = int.from_bytes(data, 'little')
-    rt = value & 0b11111
-    rn = (value >> 5) & 0b11111
-    imm9 = (value >> 12) & 0x1ff
-    simm = HMRegister.twos_complement_to_int(imm9, 9)
-    return rt, rn, simm
-
-
-# decode LDRSW (immediate) Pre-index and return (Rt, Rn, simm)
-def decode_ldrsw_bytes_immediate_pre_index(data: bytes) -> (int, int, int):
-    # LDRSW <Xt>, [<Xn|SP>, #<simm>]!
-    # ldrsw x20, [x24, #0x4]! - (20, 24, 4)
-    # ldrsw x2, [x30, #-0x8]! - (2, 30, -8)
-    # ldrsw xzr, [x20, #-0x7c]! - (31, 20, -124)
-    # ldrsw x1, [sp, #0xc]! - (1, 31, 12)
-    value = int.from_bytes(data, 'little')
-    rt = value & 0b11111
-    rn = (value >> 5) & 0b11111
-    imm9 = (value >> 12) & 0x1ff
-    simm = HMRegister.twos_complement_to_int(imm9, 9)
-    return rt, rn, simm
-
-
-# decode LDRSW (immediate) Unsigned offset and return (Rt, Rn, pimm)
-def decode_ldrsw_bytes_immediate_unsigned_offset(data: bytes) -> (int, int, int):
-    # LDRSW <Xt>, [<Xn|SP>{, #<pimm>}]
-    # ldrsw x8, [x20] - (8, 20, 0)
-    # ldrsw x23, [x8, #0xb0c] - (23, 8, 0xb0c)
-    # ldrsw x8, [sp, #0x190] - (8, 31, 0x190)
-    # ldrsw xzr, [x8, #0xc] - (31, 8, 12)
-    value = int.from_bytes(data, 'little')
-    rt = value & 0b11111
-    rn = (value >> 5) & 0b11111
-    imm12 = (value >> 10) & 0xfff
-    pimm = imm12 * 4
-    return rt, rn, pimm
-
-
-# decode LDRSW (literal) and return (Rt, label)
-def decode_ldrsw_bytes_literal(data: bytes) -> (int, int):
-    # LDRSW <Xt>, <label>
-    # 0x110e93dac: ldrsw x2, 0x110e9b194 - (2, 29672)
-    # 0x110eed2d0: ldrsw xzr, 0x110ee36f4 - (31, -0x9bdc)
-    value = int.from_bytes(data, 'little')
-    rt = value & 0b11111
-    imm19 = (value >> 5) & 0x7ffff
-    label = HMRegister.twos_complement_to_int(imm19, 19) * 4
-    return rt, label
-
-
-# decode LDRSW (register) and return (Rt, Rn, Rm, extend, amount)
-def decode_ldrsw_bytes_register(data: bytes) -> (int, int, int, HMExtendOption, int):
-    # LDRSW <Xt>, [<Xn|SP>, (<Wm>|<Xm>){, <extend> {<amount>}}]
-    # ldrsw x8, [x28, x8] - (8, 28, 8, <HMExtendOption.lsl: 3>, 0)
-    # ldrsw x16, [x17, x16, lsl  #2] - (16, 17, 16, <HMExtendOption.lsl: 3>, 2)
-    # ldrsw x8, [x8, w9, uxtw  #2] - (8, 8, 9, <HMExtendOption.uxtw: 2>, 2)
-    # ldrsw x19, [x26, w19, uxtw] - (19, 26, 19, <HMExtendOption.uxtw: 2>, 0)
-    # ldrsw x28, [x24, w1, sxtw  #2] - (28, 24, 1, <HMExtendOption.sxtw: 6>, 2)
-    # ldrsw x28, [x24, w1, sxtw] - (28, 24, 1, <HMExtendOption.sxtw: 6>, 0)
-    # ldrsw xzr, [sp, xzr, lsl  #2] - (31, 31, 31, <HMExtendOption.lsl: 3>, 2)
-    value = int.from_bytes(data, 'little')
-    rt = value & 0b11111
-    rn = (value >> 5) & 0b11111
-    rm = (value >> 16) & 0b11111
-    option = (value >> 13) & 0b111
-    s = (value >> 12) & 1
-    amount = 0 if s == 0 else 2
-    if option == 0b010:
-        extend = HMExtendOption.uxtw
-    elif option == 0b011:
-        extend = HMExtendOption.lsl
-    elif option == 0b110:
-        extend = HMExtendOption.sxtw
-    elif option == 0b111:
-        extend = HMExtendOption.sxtx
-    else:
-        extend = HMExtendOption.unknow
-    return rt, rn, rm, extend, amount
-
-
-# decode MOV (inverted wide immediate) and return (rd, is_64bit, immediate)
-def decode_mov_bytes_inverted_wide_immediate(data: bytes) -> (int, bool, int):
-    # 32-bit: MOV <Wd>, #<imm>    is equivalent to MOVN <Wd>, #<imm16>, LSL #<shift>
-    # 64-bit: MOV <Xd>, #<imm>    is equivalent to MOVN <Xd>, #<imm16>, LSL #<shift>
-    # mov x8, #0x7fffffffffffffff - (8, True, 0x7fffffffffffffff)
-    # mov x9, #-0x1 - (9, True, -1)
-    # mov w8, #0x7f7fffff - (8, False, 0x7f7fffff)
-    # mov xzr, #0x7fffffffffffffff - (31, True, 0x7fffffffffffffff)
-    is_64bit = (data[3] & 0x80) == 0x80
-    value = int.from_bytes(data, 'little')
-    rd = value & 0b11111
-    imm16 = (value >> 5) & 0xffff
-    hw = (value >> 21) & 0b11
-    pos = hw << 4
-    result = imm16 << pos
-    if is_64bit:
-        result = ~result & 0xffffffffffffffff
-        result = HMRegister.twos_complement_to_int(result, 64)
-    else:
-        result = ~result & 0xffffffff
-        result = HMRegister.twos_complement_to_int(result, 32)
-    return rd, is_64bit, result
-
-
-# decode MOV (register) and return (rd, rm, is_64bit)
-def decode_mov_bytes_register(data: bytes) -> (int, int, bool):
-    # 32-bit: MOV <Wd>, <Wm>    is equivalent to ORR <Wd>, WZR, <Wm>
-    # 64-bit: MOV <Xd>, <Xm>    is equivalent to ORR <Xd>, XZR, <Xm>
-    # mov x20, x0 - (20, 0, True)
-    # mov w2, w8 - (2, 8, False)
-    # mov x0, xzr - (0, 31, True)
-    # mov xzr, xzr - (31, 31, True)
-    is_64bit = (data[3] & 0x80) == 0x80
-    value = int.from_bytes(data, 'little')
-    rd = value & 0b11111
-    rm = (value >> 16) & 0b11111
-    return rd, rm, is_64bit
-
-
-# decode MOV (to/from SP) and return (rd, rn, is_64bit)
-def decode_mov_bytes_to_from_sp(data: bytes) -> (int, int, bool):
-    # 32-bit: MOV <Wd|WSP>, <Wn|WSP>    is equivalent to ADD <Wd|WSP>, <Wn|WSP>, #0
-    # 64-bit: MOV <Xd|SP>, <Xn|SP>    is equivalent to ADD <Xd|SP>, <Xn|SP>, #0
-    # mov x9, sp - (9, 31, True)
-    # mov sp, x20 - (31, 20, True)
-    # add w17, w1, #0x0 - (17, 1, False)
-    is_64bit = (data[3] & 0x80) == 0x80
-    value = int.from_bytes(data, 'little')
-    rd = value & 0b11111
-    rn = (value >> 5) & 0b11111
-    return rd, rn, is_64bit
-
-
-# decode MOV (wide immediate) and return (rd, is_64bit, immediate)
-def decode_mov_bytes_wide_immediate(data: bytes) -> (int, bool, int):
-    # 32-bit: MOV <Wd>, #<imm>    is equivalent to MOVZ <Wd>, #<imm16>, LSL #<shift>
-    # 64-bit: MOV <Xd>, #<imm>    is equivalent to MOVZ <Xd>, #<imm16>, LSL #<shift>
-    # mov w8, #0x1 - (8, False, 1)
-    # mov x0, #0x2 - (0, True, 2)
-    # mov w10, #-0x80000000 - (10, False, -0x80000000)
-    # mov x9, #-0x8000000000000000 - (9, True, -0x8000000000000000)
-    # mov xzr, #0x1 - (31, True, 1)
-    is_64bit = (data[3] & 0x80) == 0x80
-    value = int.from_bytes(data, 'little')
-    rd = value & 0b11111
-    imm16 = (value >> 5) & 0xffff
-    hw = (value >> 21) & 0b11
-    pos = hw << 4
-    result = imm16 << pos
-    bit_width = 64 if is_64bit else 32
-    result = HMRegister.twos_complement_to_int(result, bit_width)
-    return rd, is_64bit, result
-
-
-# decode STR (immediate) Post-index and return (rt, rn, is_64bit, simm)
-def decode_str_bytes_immediate_post_index(data: bytes) -> (int, int, bool, int):
-    # 32-bit: STR <Wt>, [<Xn|SP>], #<simm>
-    # 64-bit: STR <Xt>, [<Xn|SP>], #<simm>
-    # str x8, [x22], #0x8 - (8, 22, True, 0x8)
-    # str w0, [x21], #0x4 - (0, 21, False, 0x4)
-    # str x11, [x10], #-0x8 - (11, 10, True, -8)
-    # str wzr, [x22], #0x8 - (31, 22, False, 0x8)
-    # str x21, [sp], #0x10 - (21, 31, True, 0x10)
-    is_64bit = (data[3] & 0x40) == 0x40
-    value = int.from_bytes(data, 'little')
-    rt = value & 0b11111
-    rn = (value >> 5) & 0b11111
-    imm9 = (value >> 12) & 0x1ff
-    simm = HMRegister.twos_complement_to_int(imm9, 9)
-    return rt, rn, is_64bit, simm
-
-
-# decode STR (immediate) Pre-index and return (rt, rn, is_64bit, simm)
-def decode_str_bytes_immediate_pre_index(data: bytes) -> (int, int, bool, int):
-    # 32-bit: STR <Wt>, [<Xn|SP>, #<simm>]!
-    # 64-bit: STR <Xt>, [<Xn|SP>, #<simm>]!
-    # str wzr, [sp, #-0x10]! - (31, 31, False, -0x10)
-    # str xzr, [x23, #0x60]! - (31, 23, True, 0x60)
-    # str w8, [x1, #0x60]! - (8, 1, False, 0x60)
-    is_64bit = (data[3] & 0x40) == 0x40
-    value = int.from_bytes(data, 'little')
-    rt = value & 0b11111
-    rn = (value >> 5) & 0b11111
-    imm9 = (value >> 12) & 0x1ff
-    simm = HMRegister.twos_complement_to_int(imm9, 9)
-    return rt, rn, is_64bit, simm
-
-
-# decode STR (immediate) Unsigned offset and return (rt, rn, is_64bit, pimm)
-def decode_str_bytes_immediate_unsigned_offset(data: bytes) -> (int, int, bool, int):
-    # 32-bit: STR <Wt>, [<Xn|SP>{, #<pimm>}]
-    # 64-bit: STR <Xt>, [<Xn|SP>{, #<pimm>}]
-    # str xzr, [sp, #0x58] - (31, 31, True, 0x58)
-    # str x8, [sp] - (8, 31, True, 0x0)
-    # str w0, [x19, #0x560] - (0, 19, False, 0x560)
-    # str wzr, [x8, #0x50] - (31, 8, False, 0x50)
-    is_64bit = (data[3] & 0x40) == 0x40
-    value = int.from_bytes(data, 'little')
-    rt = value & 0b11111
-    rn = (value >> 5) & 0b11111
-    imm12 = (value >> 10) & 0xfff
-    if is_64bit:
-        pimm = imm12 * 8
-    else:
-        pimm = imm12 * 4
-    return rt, rn, is_64bit, pimm
-
-
-# decode STR (register) and return (Rt, Rn, Rm, is_64bit, extend, amount)
-def decode_str_bytes_register(data: bytes) -> (int, int, int, bool, HMExtendOption, int):
-    # 32-bit: STR <Wt>, [<Xn|SP>, (<Wm>|<Xm>){, <extend> {<amount>}}]
-    # 64-bit: STR <Xt>, [<Xn|SP>, (<Wm>|<Xm>){, <extend> {<amount>}}]
-    # str x0, [x20, x8] - (0, 20, 8, True, <HMExtendOption.lsl: 3>, 0)
-    # str w9, [x0, x8] - (9, 0, 8, False, <HMExtendOption.lsl: 3>, 0)
-    # str x9, [x8, w20, uxtw  #3] - (9, 8, 20, True, <HMExtendOption.uxtw: 2>, 3)
-    # str x0, [x20, w27, sxtw] - (0, 20, 27, True, <HMExtendOption.sxtw: 6>, 0)
-    is_64bit = (data[3] & 0x40) == 0x40
-    value = int.from_bytes(data, 'little')
-    rt = value & 0b11111
-    rn = (value >> 5) & 0b11111
-    rm = (value >> 16) & 0b11111
-    s = (value >> 12) & 1
-    option = (value >> 13) & 0b111
-    if is_64bit:
-        amount = 0 if s == 0 else 3
-    else:
-        amount = 0 if s == 0 else 2
-    if option == 0b10:
-        extend = HMExtendOption.uxtw
-    elif option == 0b11:
-        extend = HMExtendOption.lsl
-    elif option == 0b110:
-        extend = HMExtendOption.sxtw
-    elif option == 0b111:
-        extend = HMExtendOption.sxtx
-    else:
-        extend = HMExtendOption.unknow
-    return rt, rn, rm, is_64bit, extend, amount
-
-
-# decode STP (Signed offset), return (rt, rt2, rn, is_64bit, imm)
-def decode_stp_bytes_signed_offset(data: bytes) -> (int, int, int, bool, int):
-    # 32-bit: STP <Wt1>, <Wt2>, [<Xn|SP>{, #<imm>}]
-    # 64-bit: STP <Xt1>, <Xt2>, [<Xn|SP>{, #<imm>}]
-    # stp x20, x8, [sp] - (20, 8, 31, True, 0)
-    # stp x8, x9, [x29, #-0x70] - (8, 9, 29, True, -0x70)
-    # stp w25, w24, [sp, #0x4] - (25, 24, 31, False, 4)
-    # stp xzr, xzr, [x8] - (31, 31, 8, True, 0)
-    is_64bit = (data[3] & 0x80) == 0x80
-    value = int.from_bytes(data, 'little')
-    rt = value & 0b11111
-    rt2 = (value >> 10) & 0b11111
-    rn = (value >> 5) & 0b11111
-    imm7 = (value >> 15) & 0x7f
-    if is_64bit:
-        imm = HMRegister.twos_complement_to_int(imm7, 7) * 8
+    finally:
+        os.remove(snapshot_path)
+
+
+def get_code_snippet_list(target: lldb.SBTarget, module: lldb.SBModule, code_layout: Optional[HMReferenceMachO.HMCodeLayout] = None) -> List[Tuple[int, int, int]]:
+    # Return [(start_address, end_address, section_end_address)], the snippets of the code sections analyzed by HMReferenceScanner.instruction_analysis.
+    # If code_layout is specified, section_end_address is the end of the code before the data in code.
+    section_list: List[lldb.SBSection] = []
+    for i in range(module.GetNumSections()):
+        append_leaf_sections(module.GetSectionAtIndex(i), section_list)
+    snippet_list: List[Tuple[int, int, int]] = []
+    span = 4 * 10000
+    for section in section_list:
+        if section.GetSectionType() != lldb.eSectionTypeCode:
+            continue
+        section_load_address_start = section.GetLoadAddress(target)
+        if section_load_address_start == lldb.LLDB_INVALID_ADDRESS:
+            continue
+        section_load_address_end = section_load_address_start + section.GetByteSize()
+        for code_start, code_end in get_code_range_list(section_load_address_start, section_load_address_end, code_layout):
+            for snippet_start in range(code_start, code_end, span):
+                snippet_end = min(snippet_start + span, code_end)
+                if snippet_end - snippet_start >= 4:
+                    snippet_list.append((snippet_start, snippet_end, code_end))
+    return snippet_list
+
+
+def append_leaf_sections(section: lldb.SBSection, section_list: List[lldb.SBSection]) -> None:
+    # Segments without sections(__PAGEZERO, __LINKEDIT) are ignored
+    if section.GetSectionType() == lldb.eSectionTypeContainer:
+        for i in range(section.GetNumSubSections()):
+            append_leaf_sections(section.GetSubSectionAtIndex(i), section_list)
     else:
-        imm = HMRegister.twos_complement_to_int(imm7, 7) * 4
-    return rt, rt2, rn, is_64bit, imm
-
-
-def logical_shift_right(raw_value: int, amount: int, bit_width: int) -> int:
-    raw_value &= (1 << bit_width) - 1
-    result = raw_value >> amount
-    result &= (1 << (bit_width - amount)) - 1
-    return result
-
+        section_list.append(section)
 
-# uxtw
-def unsigned_extend_word(raw_value: int) -> int:
-    raw_value = raw_value & 0xffffffff
-    return raw_value
 
-
-# sxtw
-def signed_extend_word(raw_value: int) -> int:
-    raw_value = raw_value & 0xffffffff
-    sign_bit = (raw_value >> 31) & 1
-    if sign_bit == 1:
-        result = raw_value | 0xffffffff00000000
-    else:
-        result = raw_value
-    return result
+def get_multiprocessing_context() -> multiprocessing.context.BaseContext:
+    # It is unsafe to fork the LLDB process, so the worker processes are spawned.
+    # In LLDB, sys.executable may be the path of lldb instead of the Python interpreter.
+    context = multiprocessing.get_context('spawn')
+    if not os.path.basename(sys.executable).startswith('python'):
+        python_path = os.path.join(sys.exec_prefix, 'bin', 'python3')
+        if os.path.exists(python_path):
+            context.set_executable(python_path)
+    return context
 
 
 def get_description_of_section(section: lldb.SBSection) -> str:
@@ -985,350 +1276,63 @@ def get_module_name(module: lldb.SBModule) -> str:
     return os.path.basename(module.GetFileSpec().GetFilename())
 
 
-def record_adrp_logic(exe_ctx: lldb.SBExecutionContext, adrp_data: bytes, adrp_instruction_load_address: int, address_target_dic: Dict[int, int], address_ldr_dic: Dict[int, int]) -> None:
-    # Analyze the specified instructions after adrp in sequence, and analyze up to 10 instructions.
-    register_list = HMRegisterList()
-    target = exe_ctx.GetTarget()
-
-    # Calculate and save the value of adr/adrp instruction
-    adrp_rd, adrp_offset = decode_adr_bytes(adrp_data)
-    if is_adr_bytes(adrp_data):
-        adrp_result = adrp_instruction_load_address + adrp_offset
-    else:
-        adrp_result, _ = HMCalculationHelper.calculate_adrp_result_with_immediate_and_pc_address(adrp_offset, adrp_instruction_load_address)
-    register_list.set_value(adrp_rd, adrp_result, True)
-
-    # Analyze the specified instructions after adr/adrp
-    instruction_count = 10
-
-    address: lldb.SBAddress = lldb.SBAddress(adrp_instruction_load_address + 4, target)
-    error = lldb.SBError()
-    data: bytes = target.ReadMemory(address, 4 * instruction_count, error)
-    if not error.Success():
-        HM.DPrint(error)
-        return
-    for i in range(0, len(data), 4):
-        instruction_data = data[i:i+4]
-        instruction_load_address = adrp_instruction_load_address + 4 + i
-        # adr/adrp
-        if is_adr_bytes(instruction_data):
-            rd, offset = decode_adr_bytes(instruction_data)
-            rd_value = instruction_load_address + offset
-            register_list.set_value(rd, rd_value, True)
-        elif is_adrp_bytes(instruction_data):
-            rd, offset = decode_adr_bytes(instruction_data)
-            rd_value, _ = HMCalculationHelper.calculate_adrp_result_with_immediate_and_pc_address(offset, instruction_load_address)
-            register_list.set_value(rd, rd_value, True)
-        # add
-        elif is_add_bytes_immediate(instruction_data):
-            rd, rn, is_64bit, final_immediate = decode_add_bytes_immediate(instruction_data)
-            if not register_list.has_value(rn):
-                break
-            rd_value = register_list.get_value(rn, is_64bit) + final_immediate
-            register_list.set_value(rd, rd_value, is_64bit)
-            address_target_dic[instruction_load_address] = register_list.get_value(rd, is_64bit)
-        elif is_add_bytes_shifted_register(instruction_data):
-            rd, rn, rm, is_64bit, shift, amount = decode_add_bytes_shifted_register(instruction_data)
-            if shift == HMShift.unknow:
-                break
-            if rd == 31:  # xzr
-                continue
-            if (not register_list.has_value(rn)) and rn != 31:
-                break
-            if (not register_list.has_value(rm)) and rm != 31:
-                break
-            rn_raw_value = 0 if rn == 31 else register_list.get_raw_value(rn, is_64bit)
-            rm_raw_value = 0 if rm == 31 else register_list.get_raw_value(rm, is_64bit)
-            bit_width = 64 if is_64bit else 32
-            if amount == 0:
-                rd_raw_value = rn_raw_value + rm_raw_value
-            else:
-                if shift == HMShift.lsl:
-                    rm_value_shift = (rm_raw_value << amount) & ((1 << bit_width) - 1)
-                elif shift == HMShift.lsr:
-                    rm_value_shift = logical_shift_right(rm_raw_value, amount, bit_width)
-                elif shift == HMShift.asr:
-                    rm_value_shift = (rm_raw_value >> amount) & ((1 << bit_width) - 1)
-                else:  # HMShift.unknow
-                    break
-                rd_raw_value = rn_raw_value + rm_value_shift
-
-            register_list.set_raw_value(rd, rd_raw_value, is_64bit)
-            address_target_dic[instruction_load_address] = HMRegister.twos_complement_to_int(rd_raw_value, bit_width)
-
-        # ldr
-        elif is_ldr_bytes_immediate_post_index(instruction_data):
-            rt, rn, is_64bit, simm = decode_ldr_bytes_immediate_post_index(instruction_data)
-            if not register_list.has_value(rn):
-                break
-            rn_value = register_list.get_value(rn, True)
-            load_address = rn_value
-            ldr_result = HM.load_address_value(exe_ctx, load_address)
-            if ldr_result == -1:
-                break
-            if rt != 31:  # xzr
-                register_list.set_raw_value(rt, ldr_result, is_64bit)
-            rn_value += simm
-            register_list.set_value(rn, rn_value, True)
-            # The ldr instruction records the loading address, and records the result address in memory
-            bit_width = 64 if is_64bit else 32
-            address_target_dic[instruction_load_address] = load_address
-            address_ldr_dic[instruction_load_address] = HMRegister.twos_complement_to_int(ldr_result, bit_width)
-        elif is_ldr_bytes_immediate_pre_index(instruction_data):
-            rt, rn, is_64bit, simm = decode_ldr_bytes_immediate_pre_index(instruction_data)
-            if not register_list.has_value(rn):
-                break
-            rn_value = register_list.get_value(rn, True)
-            rn_value += simm
-            register_list.set_value(rn, rn_value, True)
-            ldr_result = HM.load_address_value(exe_ctx, rn_value)
-            if ldr_result == -1:
-                break
-            if rt != 31:  # xzr
-                register_list.set_raw_value(rt, ldr_result, is_64bit)
-
-            bit_width = 64 if is_64bit else 32
-            address_target_dic[instruction_load_address] = rn_value
-            address_ldr_dic[instruction_load_address] = HMRegister.twos_complement_to_int(ldr_result, bit_width)
-        elif is_ldr_bytes_immediate_unsigned_offset(instruction_data):
-            rt, rn, is_64bit, pimm = decode_ldr_bytes_immediate_unsigned_offset(instruction_data)
-            if not register_list.has_value(rn):
-                break
-            rn_value = register_list.get_value(rn, True)
-            load_address = rn_value + pimm
-            ldr_result = HM.load_address_value(exe_ctx, load_address)
-            if ldr_result == -1:
-                break
-            if rt != 31:  # xzr
-                register_list.set_raw_value(rt, ldr_result, is_64bit)
-
-            bit_width = 64 if is_64bit else 32
-            address_target_dic[instruction_load_address] = load_address
-            address_ldr_dic[instruction_load_address] = HMRegister.twos_complement_to_int(ldr_result, bit_width)
-        elif is_ldr_bytes_literal(instruction_data):
-            rt, is_64bit, label = decode_ldr_bytes_literal(instruction_data)
-            load_address = label + instruction_load_address
-            ldr_result = HM.load_address_value(exe_ctx, load_address)
-            if ldr_result == -1:
-                break
-            if rt != 31:  # xzr
-                register_list.set_raw_value(rt, ldr_result, is_64bit)
-
-            bit_width = 64 if is_64bit else 32
-            address_target_dic[instruction_load_address] = load_address
-            address_ldr_dic[instruction_load_address] = HMRegister.twos_complement_to_int(ldr_result, bit_width)
-        elif is_ldr_bytes_register(instruction_data):
-            rt, rn, rm, is_64bit, extend, amount = decode_ldr_bytes_register(instruction_data)
-            if rt == 31:  # xzr
-                continue
-            if extend == HMExtendOption.unknow or extend == HMExtendOption.sxtx:
-                break
-            if not register_list.has_value(rn):
-                break
-            if rm != 31 and (not register_list.has_value(rm)):
-                break
-            rn_raw_value = register_list.get_raw_value(rn, True)
-            if extend == HMExtendOption.uxtw:
-                rm_raw_value = 0 if rm == 31 else register_list.get_raw_value(rm, False)
-                temp = unsigned_extend_word(rm_raw_value) << amount
-            elif extend == HMExtendOption.lsl:
-                rm_raw_value = 0 if rm == 31 else register_list.get_raw_value(rm, True)
-                temp = rm_raw_value << amount
-            elif extend == HMExtendOption.sxtw:
-                rm_raw_value = 0 if rm == 31 else register_list.get_value(rm, False)
-                temp = signed_extend_word(rm_raw_value) << amount
-            else:
-                break
-            load_address = HMRegister.twos_complement_to_int(rn_raw_value + temp, 64)
-            ldr_result = HM.load_address_value(exe_ctx, load_address)
-            if ldr_result == -1:
-                break
-            register_list.set_raw_value(rt, ldr_result, is_64bit)
-
-            bit_width = 64 if is_64bit else 32
-            address_target_dic[instruction_load_address] = load_address
-            address_ldr_dic[instruction_load_address] = HMRegister.twos_complement_to_int(ldr_result, bit_width)
-
-        # ldrsw
-        elif is_ldrsw_bytes_immediate_post_index(instruction_data):
-            rt, rn, simm = decode_ldrsw_bytes_immediate_post_index(instruction_data)
-            if not register_list.has_value(rn):
-                break
-            rn_value = register_list.get_value(rn, True)
-            load_address = rn_value
-            ldrsw_result = HM.load_address_value_signed_word(exe_ctx, load_address)
-            if ldrsw_result == -1:
-                break
-            if rt != 31:  # xzr
-                register_list.set_raw_value(rt, ldrsw_result, True)
-            rn_value += simm
-            register_list.set_value(rn, rn_value, True)
+def find_module(target: lldb.SBTarget, image_name: str) -> Optional[lldb.SBModule]:
+    # The module whose file name is image_name, it is shared by the commands that take an image name
+    for i in range(target.GetNumModules()):
+        module = target.GetModuleAtIndex(i)
+        if get_module_name(module) == image_name:
+            return module
+    return None
 
-            address_target_dic[instruction_load_address] = load_address
-            address_ldr_dic[instruction_load_address] = HMRegister.twos_complement_to_int(ldrsw_result, 64)
 
-        elif is_ldrsw_bytes_immediate_pre_index(instruction_data):
-            rt, rn, simm = decode_ldrsw_bytes_immediate_pre_index(instruction_data)
-            if not register_list.has_value(rn):
-                break
-            rn_value = register_list.get_value(rn, True)
-            rn_value += simm
-            register_list.set_value(rn, rn_value, True)
-            ldrsw_result = HM.load_address_value_signed_word(exe_ctx, rn_value)
-            if ldrsw_result == -1:
-                break
-            if rt != 31:  # xzr
-                register_list.set_raw_value(rt, ldrsw_result, True)
-
-            address_target_dic[instruction_load_address] = rn_value
-            address_ldr_dic[instruction_load_address] = HMRegister.twos_complement_to_int(ldrsw_result, 64)
-        elif is_ldrsw_bytes_immediate_unsigned_offset(instruction_data):
-            rt, rn, pimm = decode_ldrsw_bytes_immediate_unsigned_offset(instruction_data)
-            if not register_list.has_value(rn):
-                break
-            rn_value = register_list.get_value(rn, True)
-            load_address = rn_value + pimm
-            ldrsw_result = HM.load_address_value_signed_word(exe_ctx, load_address)
-            if ldrsw_result == -1:
-                break
-            if rt != 31:  # xzr
-                register_list.set_raw_value(rt, ldrsw_result, True)
-
-            address_target_dic[instruction_load_address] = load_address
-            address_ldr_dic[instruction_load_address] = HMRegister.twos_complement_to_int(ldrsw_result, 64)
-        elif is_ldrsw_bytes_register(instruction_data):
-            rt, rn, rm, extend, amount = decode_ldrsw_bytes_register(instruction_data)
-            if rt == 31:  # xzr
-                continue
-            if extend == HMExtendOption.unknow or extend == HMExtendOption.sxtx:
-                break
-            if not register_list.has_value(rn):
-                break
-            if rm != 31 and (not register_list.has_value(rm)):
-                break
-            rn_raw_value = register_list.get_raw_value(rn, True)
-            if extend == HMExtendOption.uxtw:
-                rm_raw_value = 0 if rm == 31 else register_list.get_raw_value(rm, False)
-                temp = unsigned_extend_word(rm_raw_value) << amount
-            elif extend == HMExtendOption.lsl:
-                rm_raw_value = 0 if rm == 31 else register_list.get_raw_value(rm, True)
-                temp = rm_raw_value << amount
-            elif extend == HMExtendOption.sxtw:
-                rm_raw_value = 0 if rm == 31 else register_list.get_value(rm, False)
-                temp = signed_extend_word(rm_raw_value) << amount
-            else:
-                break
-            load_address = HMRegister.twos_complement_to_int(rn_raw_value + temp, 64)
-            ldrsw_result = HM.load_address_value_signed_word(exe_ctx, load_address)
-            if ldrsw_result == -1:
-                break
-            register_list.set_raw_value(rt, ldrsw_result, True)
+def get_module_base_address(target: lldb.SBTarget, module: lldb.SBModule) -> int:
+    return module.GetObjectFileHeaderAddress().GetLoadAddress(target)
 
-            address_target_dic[instruction_load_address] = load_address
-            address_ldr_dic[instruction_load_address] = HMRegister.twos_complement_to_int(ldrsw_result, 64)
 
-        # mov
-        elif is_mov_bytes_inverted_wide_immediate(instruction_data):
-            rd, is_64bit, immediate = decode_mov_bytes_inverted_wide_immediate(instruction_data)
-            if rd == 31:  # xzr
-                address_target_dic[instruction_load_address] = immediate
-                continue
-            register_list.set_value(rd, immediate, is_64bit)
-            address_target_dic[instruction_load_address] = register_list.get_value(rd, is_64bit)
-        elif is_mov_bytes_register(instruction_data):
-            rd, rm, is_64bit = decode_mov_bytes_register(instruction_data)
-            if rd == 31:  # xzr
-                continue
-            if rm != 31 and (not register_list.has_value(rm)):
-                break
-            rm_raw_value = 0 if rm == 31 else register_list.get_raw_value(rm, is_64bit)
-            register_list.set_raw_value(rd, rm_raw_value, is_64bit)
-            bit_width = 64 if is_64bit else 32
-            address_target_dic[instruction_load_address] = HMRegister.twos_complement_to_int(rm_raw_value, bit_width)
-        elif is_mov_bytes_to_from_sp(instruction_data):
-            rd, rn, is_64bit = decode_mov_bytes_to_from_sp(instruction_data)
-            if not register_list.has_value(rn):
-                break
-            rn_raw_value = register_list.get_raw_value(rn, is_64bit)
-            register_list.set_raw_value(rd, rn_raw_value, is_64bit)
-            bit_width = 64 if is_64bit else 32
-            address_target_dic[instruction_load_address] = HMRegister.twos_complement_to_int(rn_raw_value, bit_width)
-        elif is_mov_bytes_wide_immediate(instruction_data):
-            rd, is_64bit, immediate = decode_mov_bytes_wide_immediate(instruction_data)
-            if rd == 31:  # xzr
-                address_target_dic[instruction_load_address] = immediate
-                continue
-            register_list.set_value(rd, immediate, is_64bit)
-            address_target_dic[instruction_load_address] = register_list.get_value(rd, is_64bit)
+def get_base_address_dic(target: lldb.SBTarget) -> Dict[str, int]:
+    # [UUID, base address] of the loaded images
+    base_address_dic: Dict[str, int] = {}
+    for i in range(target.GetNumModules()):
+        module = target.GetModuleAtIndex(i)
+        module_uuid = module.GetUUIDString()
+        if module_uuid:
+            base_address_dic[module_uuid] = get_module_base_address(target, module)
+    return base_address_dic
 
-        # str
-        elif is_str_bytes_immediate_post_index(instruction_data):
-            rt, rn, is_64bit, simm = decode_str_bytes_immediate_post_index(instruction_data)
-            if not register_list.has_value(rn):
-                break
-            rn_value = register_list.get_value(rn, True)
-            load_address = rn_value
-            rn_value += simm
-            register_list.set_value(rn, rn_value, is_64bit)
-            address_target_dic[instruction_load_address] = load_address
-        elif is_str_bytes_immediate_pre_index(instruction_data):
-            rt, rn, is_64bit, simm = decode_str_bytes_immediate_pre_index(instruction_data)
-            if not register_list.has_value(rn):
-                break
-            rn_value = register_list.get_value(rn, True)
-            rn_value += simm
-            register_list.set_value(rn, rn_value, is_64bit)
-            address_target_dic[instruction_load_address] = rn_value
-        elif is_str_bytes_immediate_unsigned_offset(instruction_data):
-            rt, rn, is_64bit, pimm = decode_str_bytes_immediate_unsigned_offset(instruction_data)
-            if not register_list.has_value(rn):
-                continue
-            rn_value = register_list.get_value(rn, True)
-            load_address = rn_value + pimm
-            address_target_dic[instruction_load_address] = load_address
-        elif is_str_bytes_register(instruction_data):
-            rt, rn, rm, is_64bit, extend, amount = decode_str_bytes_register(instruction_data)
-            if extend == HMExtendOption.unknow or extend == HMExtendOption.sxtx:
-                break
-            if not register_list.has_value(rn):
-                continue
-            if rm != 31 and (not register_list.has_value(rm)):
-                continue
-            rn_raw_value = register_list.get_raw_value(rn, True)
-            if extend == HMExtendOption.uxtw:
-                rm_raw_value = 0 if rm == 31 else register_list.get_raw_value(rm, False)
-                temp = unsigned_extend_word(rm_raw_value) << amount
-            elif extend == HMExtendOption.lsl:
-                rm_raw_value = 0 if rm == 31 else register_list.get_raw_value(rm, True)
-                temp = rm_raw_value << amount
-            elif extend == HMExtendOption.sxtw:
-                rm_raw_value = 0 if rm == 31 else register_list.get_value(rm, False)
-                temp = signed_extend_word(rm_raw_value) << amount
-            else:
-                continue
-            load_address = HMRegister.twos_complement_to_int(rn_raw_value + temp, 64)
 
-            address_target_dic[instruction_load_address] = load_address
+def get_module_range_list(target: lldb.SBTarget) -> List[Tuple[int, int, int, str]]:
+    # Return [(start_address, end_address, base_address, uuid_str)] of the segments of the loaded images, sorted by start address.
+    # The scanned values inside them are saved relative to their images, see HMReferenceRecorder.convert_module_values.
+    module_range_list: List[Tuple[int, int, int, str]] = []
+    for i in range(target.GetNumModules()):
+        module = target.GetModuleAtIndex(i)
+        module_uuid = module.GetUUIDString()
+        base_address = get_module_base_address(target, module)
+        if not module_uuid or base_address == lldb.LLDB_INVALID_ADDRESS:
             continue
-
-        # stp
-        elif is_stp_bytes_signed_offset(instruction_data):
-            rt, rt2, rn, is_64bit, imm = decode_stp_bytes_signed_offset(instruction_data)
-            if not register_list.has_value(rn):
+        for j in range(module.GetNumSections()):
+            section = module.GetSectionAtIndex(j)
+            section_load_address = section.GetLoadAddress(target)
+            if section.GetName() == "__PAGEZERO" or section_load_address == lldb.LLDB_INVALID_ADDRESS or section.GetByteSize() == 0:
                 continue
-            rn_value = register_list.get_value(rn, True)
-            load_address = rn_value + imm
-            address_target_dic[instruction_load_address] = load_address
-
-        # nop
-        elif is_nop_bytes(instruction_data):
+            module_range_list.append((section_load_address, section_load_address + section.GetByteSize(), base_address, module_uuid))
+    module_range_list.sort()
+    return module_range_list
+
+
+def get_module_address_range(target: lldb.SBTarget, module: lldb.SBModule) -> Tuple[int, int]:
+    # Return the [start, end) load address range of the segments, excluding __PAGEZERO
+    start_address = lldb.LLDB_INVALID_ADDRESS
+    end_address = 0
+    for i in range(module.GetNumSections()):
+        section = module.GetSectionAtIndex(i)
+        if section.GetName() == "__PAGEZERO":
             continue
-        else:
-            break
-
-
-    # If the next instruction is nop, record the current adr/adrp result
-    next_instruction_data = data[0:4]
-    if is_nop_bytes(next_instruction_data):
-        address_target_dic[adrp_instruction_load_address] = adrp_result
-
+        section_load_address = section.GetLoadAddress(target)
+        if section_load_address == lldb.LLDB_INVALID_ADDRESS:
+            continue
+        start_address = min(start_address, section_load_address)
+        end_address = max(end_address, section_load_address + section.GetByteSize())
+    if end_address == 0:
+        return 0, 0
+    return start_address, end_address
@@ -0,0 +1,674 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2024 Huimao Chen
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# https://github.com/chenhuimao/HMLLDB
+
+from array import array
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+import bisect
+import copy
+import mmap
+import os
+import struct
+import uuid
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+g_index_directory: str = os.path.join(os.path.expanduser("~"), ".hmlldb", "reference")
+
+# Index file:
+# header: magic, version, reserved, uuid, count, relative_count, module_value_count, module_count
+# module table: uuid[16s] * module_count
+# body: sources[Q], values[Q], value_order[I], kinds[B]
+# All arrays are in the native byte order(little endian), see HMReferenceIndex.
+index_magic = b'HMREFIDX'
+index_version = 4
+index_header_format = '<8sII16sQQQQ'
+index_header_size = struct.calcsize(index_header_format)
+index_record_size = 8 + 8 + 4 + 1
+
+# Checkpoint file of an unfinished scan:
+# header: magic, version, reserved, uuid, cursor_offset, count, module_count
+# module table: uuid[16s] * module_count
+# body: sources[Q], values[Q], kinds[B] of HMReferenceRecorder
+checkpoint_magic = b'HMREFCKP'
+checkpoint_version = 2
+checkpoint_header_format = '<8sII16sQQQ'
+checkpoint_header_size = struct.calcsize(checkpoint_header_format)
+
+# Objective-C metadata file:
+# header: magic, version, reserved, uuid, count
+# body: records of (offset[Q], kind[B], name_size[H], name[utf-8])
+objc_metadata_magic = b'HMREFOBJ'
+objc_metadata_version = 1
+objc_metadata_header_format = '<8sII16sQ'
+objc_metadata_header_size = struct.calcsize(objc_metadata_header_format)
+objc_metadata_record_format = '<QBH'
+objc_metadata_record_size = struct.calcsize(objc_metadata_record_format)
+
+uint64_mask = 0xffffffffffffffff
+
+# The kind of a record, saved in the low bits of "kinds"
+kind_mask = 0b11
+kind_branch = 0b01  # The target of b/bl
+kind_adrp = 0b10  # The address computed by the instructions after adr/adrp
+kind_ldr = 0b11  # The value loaded by ldr/ldrsw
+# The value is saved as an offset relative to the image base
+flag_relative_value = 0b100
+# The value points into another image, e.g. a GOT or __objc_* pointer into libobjc.
+# It is saved as (module index << module_offset_bits) | offset, and the offset is relative to the base of module_uuid_list[module index].
+flag_module_value = 0b1000
+module_offset_bits = 40
+module_offset_mask = (1 << module_offset_bits) - 1
+
+
+class HMReferenceRecorder:
+    # Append-only columns filled by the scanner, about 17 bytes per record.
+    # As with a dict, a later record of the same source address replaces the earlier one. ldr records are replaced separately.
+    base_address: int
+    image_start: int
+    image_end: int
+    sources: array
+    values: array
+    kinds: array
+    module_uuid_list: List[str]  # The images of the values with flag_module_value
+
+    def __init__(self, base_address: int, image_range: Tuple[int, int]):
+        self.base_address = base_address
+        self.image_start, self.image_end = image_range
+        self.sources = array('Q')
+        self.values = array('Q')
+        self.kinds = array('B')
+        self.module_uuid_list = []
+
+    def __len__(self) -> int:
+        return len(self.sources)
+
+    def record(self, source_address: int, value: int, kind: int) -> None:
+        self.sources.append(source_address - self.base_address)
+        if self.image_start <= value < self.image_end:
+            self.values.append(value - self.base_address)
+            self.kinds.append(kind | flag_relative_value)
+        else:
+            self.values.append(value & uint64_mask)
+            self.kinds.append(kind)
+
+    def record_branch(self, source_address: int, target_address: int) -> None:
+        self.record(source_address, target_address, kind_branch)
+
+    def record_adrp(self, source_address: int, value: int) -> None:
+        self.record(source_address, value, kind_adrp)
+
+    def record_ldr(self, source_address: int, value: int) -> None:
+        self.record(source_address, value, kind_ldr)
+
+    def record_vectorized(self, source_addresses, values, kind: int) -> None:
+        # source_addresses and values are NumPy int64 arrays
+        is_relative = (values >= self.image_start) & (values < self.image_end)
+        self.sources.frombytes((source_addresses - self.base_address).astype(numpy.uint64).tobytes())
+        self.values.frombytes(numpy.where(is_relative, values - self.base_address, values).astype(numpy.uint64).tobytes())
+        self.kinds.frombytes(numpy.where(is_relative, kind | flag_relative_value, kind).astype(numpy.uint8).tobytes())
+
+    def extend(self, recorder: 'HMReferenceRecorder') -> None:
+        # The recorder must have the same base address and image range, and its values are not converted to module values
+        self.sources.extend(recorder.sources)
+        self.values.extend(recorder.values)
+        self.kinds.extend(recorder.kinds)
+
+    def save_checkpoint(self, path: str, uuid_str: str, cursor_offset: int, module_range_list: List[Tuple[int, int, int, str]]) -> None:
+        # cursor_offset: the offset relative to the image base, the code before it has been scanned
+        # The values inside the images of module_range_list are converted to module values first, the checkpoint may be resumed after relaunching.
+        self.convert_module_values(module_range_list)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        header = struct.pack(checkpoint_header_format, checkpoint_magic, checkpoint_version, 0, uuid.UUID(uuid_str).bytes, cursor_offset, len(self), len(self.module_uuid_list))
+        with open(temp_path, 'wb') as checkpoint_file:
+            checkpoint_file.write(header)
+            for module_uuid in self.module_uuid_list:
+                checkpoint_file.write(uuid.UUID(module_uuid).bytes)
+            for data in [self.sources, self.values, self.kinds]:
+                checkpoint_file.write(data)
+        os.replace(temp_path, path)
+
+    @staticmethod
+    def load_checkpoint(path: str, uuid_str: str, base_address: int, image_range: Tuple[int, int]) -> Optional[Tuple[int, 'HMReferenceRecorder']]:
+        # Return (cursor_offset, recorder), or None if the checkpoint is invalid
+        if not os.path.isfile(path):
+            return None
+        with open(path, 'rb') as checkpoint_file:
+            buffer = checkpoint_file.read()
+        if len(buffer) < checkpoint_header_size:
+            return None
+        magic, version, _, uuid_bytes, cursor_offset, count, module_count = struct.unpack_from(checkpoint_header_format, buffer)
+        if magic != checkpoint_magic or version != checkpoint_version or uuid_bytes != uuid.UUID(uuid_str).bytes:
+            return None
+        if len(buffer) != checkpoint_header_size + module_count * 16 + count * 17:
+            return None
+
+        # The values inside the image and other images are relative, so the recorder is still valid after the images slide.
+        recorder = HMReferenceRecorder(base_address, image_range)
+        offset = checkpoint_header_size
+        for _ in range(module_count):
+            recorder.module_uuid_list.append(str(uuid.UUID(bytes=buffer[offset:offset + 16])).upper())
+            offset += 16
+        recorder.sources.frombytes(buffer[offset:offset + count * 8])
+        offset += count * 8
+        recorder.values.frombytes(buffer[offset:offset + count * 8])
+        offset += count * 8
+        recorder.kinds.frombytes(buffer[offset:offset + count])
+        return cursor_offset, recorder
+
+    def get_module_index(self, uuid_str: str) -> int:
+        if uuid_str not in self.module_uuid_list:
+            self.module_uuid_list.append(uuid_str)
+        return self.module_uuid_list.index(uuid_str)
+
+    def convert_module_values(self, module_range_list: List[Tuple[int, int, int, str]]) -> None:
+        # Convert the absolute values inside other images to module values, so they are still valid after those images slide.
+        # module_range_list: [(start_address, end_address, base_address, uuid_str)] of the segments of the loaded images, sorted by start address
+        if len(module_range_list) == 0:
+            return
+        if numpy is not None:
+            self.convert_module_values_with_numpy(module_range_list)
+            return
+        start_address_list = [start_address for start_address, _, _, _ in module_range_list]
+        values = self.values
+        kinds = self.kinds
+        for i in range(len(kinds)):
+            if kinds[i] & (flag_relative_value | flag_module_value):
+                continue
+            value = values[i]
+            range_index = bisect.bisect_right(start_address_list, value) - 1
+            if range_index < 0:
+                continue
+            _, end_address, base_address, uuid_str = module_range_list[range_index]
+            if value >= end_address or value < base_address or value - base_address > module_offset_mask:
+                continue
+            values[i] = (self.get_module_index(uuid_str) << module_offset_bits) | (value - base_address)
+            kinds[i] |= flag_module_value
+
+    def convert_module_values_with_numpy(self, module_range_list: List[Tuple[int, int, int, str]]) -> None:
+        start_addresses = numpy.array([item[0] for item in module_range_list], dtype=numpy.uint64)
+        end_addresses = numpy.array([item[1] for item in module_range_list], dtype=numpy.uint64)
+        base_addresses = numpy.array([item[2] for item in module_range_list], dtype=numpy.uint64)
+        values = numpy.frombuffer(self.values, dtype=numpy.uint64)
+        kinds = numpy.frombuffer(self.kinds, dtype=numpy.uint8)
+        range_indexes = numpy.searchsorted(start_addresses, values, side='right').astype(numpy.int64) - 1
+        is_converted = ((kinds & (flag_relative_value | flag_module_value)) == 0) & (range_indexes >= 0)
+        range_indexes = numpy.maximum(range_indexes, 0)
+        base_address_of_values = base_addresses[range_indexes]
+        is_converted &= (values < end_addresses[range_indexes]) & (values >= base_address_of_values)
+        offsets = values - base_address_of_values
+        is_converted &= offsets <= numpy.uint64(module_offset_mask)
+        # Only the referenced images are added to module_uuid_list
+        module_indexes = numpy.zeros(len(module_range_list), dtype=numpy.uint64)
+        for range_index in numpy.unique(range_indexes[is_converted]):
+            module_indexes[range_index] = self.get_module_index(module_range_list[range_index][3])
+        module_values = (module_indexes[range_indexes] << numpy.uint64(module_offset_bits)) | offsets
+        self.values = array('Q', numpy.where(is_converted, module_values, values).astype(numpy.uint64).tobytes())
+        self.kinds = array('B', numpy.where(is_converted, kinds | flag_module_value, kinds).astype(numpy.uint8).tobytes())
+
+    def create_index(self, uuid_str: str, module_range_list: Optional[List[Tuple[int, int, int, str]]] = None) -> 'HMReferenceIndex':
+        # Sort the records by source address and remove the replaced records.
+        # The values inside the images of module_range_list are saved as module values, see convert_module_values.
+        if module_range_list is not None:
+            self.convert_module_values(module_range_list)
+        if numpy is not None:
+            sources, values, kinds, value_order, relative_count, module_value_count = self.sort_records_with_numpy()
+        else:
+            sources, values, kinds, value_order, relative_count, module_value_count = self.sort_records()
+        return HMReferenceIndex(uuid_str, self.base_address, sources, values, kinds, value_order, relative_count, list(self.module_uuid_list), module_value_count)
+
+    def sort_records(self) -> Tuple[array, array, array, array, int, int]:
+        record_sources = self.sources
+        record_values = self.values
+        record_kinds = self.kinds
+        # Records with the same key replace each other, and the sort is stable.
+        keys = [(record_sources[i] << 1) | ((record_kinds[i] & kind_mask) == kind_ldr) for i in range(len(record_sources))]
+        order = sorted(range(len(keys)), key=keys.__getitem__)
+        sources = array('Q')
+        values = array('Q')
+        kinds = array('B')
+        for position, i in enumerate(order):
+            if position + 1 < len(order) and keys[order[position + 1]] == keys[i]:
+                continue
+            sources.append(record_sources[i])
+            values.append(record_values[i])
+            kinds.append(record_kinds[i])
+        del keys, order
+
+        # The relative values come first, then the module values, then the absolute values
+        relative_count = 0
+        module_value_count = 0
+        value_keys: List[int] = []
+        for i in range(len(values)):
+            if kinds[i] & flag_relative_value:
+                relative_count += 1
+                value_keys.append(values[i])
+            elif kinds[i] & flag_module_value:
+                module_value_count += 1
+                value_keys.append(values[i] | (1 << 64))
+            else:
+                value_keys.append(values[i] | (2 << 64))
+        value_order = array('I', sorted(range(len(value_keys)), key=value_keys.__getitem__))
+        return sources, values, kinds, value_order, relative_count, module_value_count
+
+    def sort_records_with_numpy(self) -> Tuple[array, array, array, array, int, int]:
+        record_sources = numpy.frombuffer(self.sources, dtype=numpy.uint64)
+        record_kinds = numpy.frombuffer(self.kinds, dtype=numpy.uint8)
+        keys = (record_sources << numpy.uint64(1)) | ((record_kinds & kind_mask) == kind_ldr).astype(numpy.uint64)
+        order = numpy.argsort(keys, kind='stable')
+        sorted_keys = keys[order]
+        # Keep the last record of the same key, an image may have no records
+        is_last = numpy.ones(len(sorted_keys), dtype=bool)
+        is_last[:-1] = sorted_keys[1:] != sorted_keys[:-1]
+        order = order[is_last]
+        sources = record_sources[order]
+        values = numpy.frombuffer(self.values, dtype=numpy.uint64)[order]
+        kinds = record_kinds[order]
+
+        is_relative = (kinds & flag_relative_value) != 0
+        is_module_value = (kinds & flag_module_value) != 0
+        # 0: relative values, 1: module values, 2: absolute values
+        value_group = numpy.where(is_relative, 0, numpy.where(is_module_value, 1, 2))
+        value_order = numpy.lexsort((values, value_group)).astype(numpy.uint32)
+        relative_count = int(numpy.count_nonzero(is_relative))
+        module_value_count = int(numpy.count_nonzero(is_module_value))
+        return array('Q', sources.tobytes()), array('Q', values.tobytes()), array('B', kinds.tobytes()), array('I', value_order.tobytes()), relative_count, module_value_count
+
+
+class HMSortedValues:
+    # A read-only sequence of the values in value_order, used by bisect
+    values: memoryview
+    value_order: memoryview
+
+    def __init__(self, values: memoryview, value_order: memoryview):
+        self.values = values
+        self.value_order = value_order
+
+    def __len__(self) -> int:
+        return len(self.value_order)
+
+    def __getitem__(self, index: int) -> int:
+        return self.values[self.value_order[index]]
+
+
+class HMReferenceIndex:
+    # Scan results of an image, keyed by the UUID of the image. Each record is "source address -> value" with a kind.
+    # sources/values/kinds are parallel columns sorted by source address, the sources are saved as offsets relative to the image base.
+    # Values inside the image are saved as offsets too(flag_relative_value), so the index is still valid after the image slides(ASLR).
+    # Values inside other images are saved relative to those images(flag_module_value), and rebased with module_base_list.
+    # value_order is the inverted index: row indexes sorted by value, the relative values come first, then the module values, then the absolute values.
+    uuid_str: str
+    base_address: int
+    sources: memoryview
+    values: memoryview
+    kinds: memoryview
+    value_order: memoryview
+    relative_count: int
+    module_uuid_list: List[str]
+    module_value_count: int
+    module_base_list: List[int]  # The base addresses of module_uuid_list, uint64_mask(LLDB_INVALID_ADDRESS) if the image is not loaded
+    is_mapped: bool  # The arrays are memory mapped from the index file
+
+    def __init__(self, uuid_str: str, base_address: int, sources, values, kinds, value_order, relative_count: int, module_uuid_list: List[str], module_value_count: int):
+        self.uuid_str = uuid_str
+        self.base_address = base_address
+        self.sources = memoryview(sources)
+        self.values = memoryview(values)
+        self.kinds = memoryview(kinds)
+        self.value_order = memoryview(value_order)
+        self.relative_count = relative_count
+        self.module_uuid_list = module_uuid_list
+        self.module_value_count = module_value_count
+        self.module_base_list = [uint64_mask] * len(module_uuid_list)
+        self.is_mapped = False
+
+    def __len__(self) -> int:
+        return len(self.sources)
+
+    def rebase(self, base_address: int, module_base_list: List[int]) -> 'HMReferenceIndex':
+        # Return the index of the image loaded at base_address, and the images of module_uuid_list loaded at module_base_list.
+        # The columns are shared, so the index in memory serves every target and relaunch.
+        if base_address == self.base_address and module_base_list == self.module_base_list:
+            return self
+        index = copy.copy(self)
+        index.base_address = base_address
+        index.module_base_list = module_base_list
+        return index
+
+    def get_memory_size(self) -> int:
+        return len(self) * index_record_size
+
+    def find_target_sources(self, target_address: int) -> List[int]:
+        # The results of b/bl and adr/adrp logic
+        return [source_address for source_address, _ in self.find_target_sources_in_range(target_address, target_address + 1)]
+
+    def find_ldr_sources(self, target_address: int) -> List[int]:
+        # The values loaded by ldr/ldrsw
+        return [source_address for source_address, _ in self.find_ldr_sources_in_range(target_address, target_address + 1)]
+
+    def find_target_sources_in_range(self, start_address: int, end_address: int) -> List[Tuple[int, int]]:
+        return self.find_sources_in_range(start_address, end_address, False)
+
+    def find_ldr_sources_in_range(self, start_address: int, end_address: int) -> List[Tuple[int, int]]:
+        return self.find_sources_in_range(start_address, end_address, True)
+
+    def find_sources_in_range(self, start_value: int, end_value: int, is_ldr: bool) -> List[Tuple[int, int]]:
+        # Return [(source_address, value)] whose value is in [start_value, end_value), sorted by source address
+        return self.find_sources_in_ranges([(start_value, end_value)], is_ldr)[0]
+
+    def find_sources_in_ranges(self, value_range_list: List[Tuple[int, int]], is_ldr: bool) -> List[List[Tuple[int, int]]]:
+        # Answer a batch of [start_value, end_value) queries with a sorted merge: the queries are sorted, so each bisect starts from the previous position.
+        # Return the results in the order of value_range_list
+        base_address = self.base_address
+        value_order = self.value_order
+        sorted_values = HMSortedValues(self.values, value_order)
+        value_count = len(sorted_values)
+        module_value_end = self.relative_count + self.module_value_count
+        # [(row, value_base_address, value_mask)] of each query, the value is (values[row] & value_mask) + value_base_address
+        row_list_list: List[List[Tuple[int, int, int]]] = [[] for _ in value_range_list]
+
+        # Values relative to the image base
+        relative_query_list = []
+        for i, (start_value, end_value) in enumerate(value_range_list):
+            relative_end = end_value - base_address
+            if relative_end > 0:
+                relative_query_list.append((max(start_value - base_address, 0), relative_end, i))
+        relative_query_list.sort()
+        lo = 0
+        for relative_start, relative_end, i in relative_query_list:
+            lo = bisect.bisect_left(sorted_values, relative_start, lo, self.relative_count)
+            hi = bisect.bisect_left(sorted_values, relative_end, lo, self.relative_count)
+            row_list_list[i].extend((value_order[j], base_address, uint64_mask) for j in range(lo, hi))
+
+        # Values relative to other images, the images that are not loaded are skipped
+        module_query_list = sorted((start_value, end_value, i) for i, (start_value, end_value) in enumerate(value_range_list))
+        for module_index, module_base_address in enumerate(self.module_base_list):
+            if module_base_address == uint64_mask:
+                continue
+            key_base = module_index << module_offset_bits
+            module_lo = bisect.bisect_left(sorted_values, key_base, self.relative_count, module_value_end)
+            module_hi = bisect.bisect_left(sorted_values, key_base + module_offset_mask + 1, module_lo, module_value_end)
+            if module_lo == module_hi:
+                continue
+            # Skip the queries outside the values of the image
+            min_value = module_base_address + (sorted_values[module_lo] & module_offset_mask)
+            max_value = module_base_address + (sorted_values[module_hi - 1] & module_offset_mask)
+            lo = module_lo
+            for start_value, end_value, i in module_query_list:
+                if start_value > max_value:
+                    break
+                if end_value <= min_value:
+                    continue
+                lo = bisect.bisect_left(sorted_values, key_base | max(start_value - module_base_address, 0), lo, module_hi)
+                hi = bisect.bisect_left(sorted_values, key_base + min(end_value - module_base_address, module_offset_mask + 1), lo, module_hi)
+                row_list_list[i].extend((value_order[j], module_base_address, module_offset_mask) for j in range(lo, hi))
+
+        # Absolute values, negative values are saved as two's complement
+        absolute_query_list = []
+        for i, (start_value, end_value) in enumerate(value_range_list):
+            absolute_start = start_value & uint64_mask
+            absolute_query_list.append((absolute_start, min(absolute_start + (end_value - start_value), uint64_mask + 1), i))
+        absolute_query_list.sort()
+        lo = module_value_end
+        for absolute_start, absolute_end, i in absolute_query_list:
+            lo = bisect.bisect_left(sorted_values, absolute_start, lo, value_count)
+            hi = bisect.bisect_left(sorted_values, absolute_end, lo, value_count)
+            row_list_list[i].extend((value_order[j], 0, uint64_mask) for j in range(lo, hi))
+
+        result_list: List[List[Tuple[int, int]]] = []
+        for row_list in row_list_list:
+            result: List[Tuple[int, int]] = []
+            for row, value_base_address, value_mask in row_list:
+                if ((self.kinds[row] & kind_mask) == kind_ldr) != is_ldr:
+                    continue
+                value = (self.values[row] & value_mask) + value_base_address
+                result.append((self.sources[row] + base_address, value))
+            result.sort()
+            result_list.append(result)
+        return result_list
+
+    def save(self, path: str) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        header = struct.pack(index_header_format, index_magic, index_version, 0, uuid.UUID(self.uuid_str).bytes, len(self), self.relative_count, self.module_value_count, len(self.module_uuid_list))
+        with open(temp_path, 'wb') as index_file:
+            index_file.write(header)
+            for module_uuid in self.module_uuid_list:
+                index_file.write(uuid.UUID(module_uuid).bytes)
+            for data in [self.sources, self.values, self.value_order, self.kinds]:
+                index_file.write(data)
+        # Replace the old file atomically
+        os.replace(temp_path, path)
+
+    @staticmethod
+    def load(path: str, base_address: int) -> Optional['HMReferenceIndex']:
+        # The arrays are memory mapped, so loading the index does not read the whole file.
+        if not os.path.isfile(path):
+            return None
+        with open(path, 'rb') as index_file:
+            if os.fstat(index_file.fileno()).st_size < index_header_size:
+                return None
+            buffer = memoryview(mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ))
+        magic, version, _, uuid_bytes, count, relative_count, module_value_count, module_count = struct.unpack_from(index_header_format, buffer)
+        if magic != index_magic or version != index_version:
+            return None
+        if len(buffer) != index_header_size + module_count * 16 + count * index_record_size:
+            return None
+
+        offset = index_header_size
+        module_uuid_list: List[str] = []
+        for _ in range(module_count):
+            module_uuid_list.append(str(uuid.UUID(bytes=bytes(buffer[offset:offset + 16]))).upper())
+            offset += 16
+        array_list: List[memoryview] = []
+        for item_format, item_size in [('Q', 8), ('Q', 8), ('I', 4), ('B', 1)]:
+            array_list.append(buffer[offset:offset + count * item_size].cast(item_format))
+            offset += count * item_size
+        sources, values, value_order, kinds = array_list
+        index = HMReferenceIndex(str(uuid.UUID(bytes=bytes(uuid_bytes))).upper(), base_address, sources, values, kinds, value_order, relative_count, module_uuid_list, module_value_count)
+        index.is_mapped = True
+        return index
+
+
+class HMIndexCache:
+    # The indexes kept in memory, keyed by the UUID of the image(the image name if there is no UUID), so the same image in another target
+    # or after relaunching hits the same index. When the total size exceeds the budget, the least recently queried indexes are evicted.
+    # An evicted index is saved to disk first if it has a UUID and its file does not exist, so it is loaded instead of scanned next time.
+    budget: int  # bytes
+    index_dic: OrderedDict  # [key, (image_name, HMReferenceIndex)], from the least recently queried to the most
+
+    def __init__(self, budget: int):
+        self.budget = budget
+        self.index_dic = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self.index_dic)
+
+    def get(self, uuid_str: str, image_name: str) -> Optional[HMReferenceIndex]:
+        key = get_index_cache_key(uuid_str, image_name)
+        item = self.index_dic.get(key)
+        if item is None:
+            return None
+        self.index_dic.move_to_end(key)
+        return item[1]
+
+    def put(self, image_name: str, index: HMReferenceIndex) -> List[str]:
+        # Return the names of the evicted indexes. The latest index is never evicted.
+        key = get_index_cache_key(index.uuid_str, image_name)
+        self.index_dic[key] = (image_name, index)
+        self.index_dic.move_to_end(key)
+        return self.evict()
+
+    def drop(self, image_name: str) -> List[HMReferenceIndex]:
+        # Drop the indexes of all UUIDs of the image
+        key_list = [key for key, (name, _) in self.index_dic.items() if name == image_name]
+        return [self.index_dic.pop(key)[1] for key in key_list]
+
+    def clear(self) -> None:
+        self.index_dic.clear()
+
+    def set_budget(self, budget: int) -> List[str]:
+        self.budget = budget
+        return self.evict()
+
+    def get_memory_size(self) -> int:
+        return sum(index.get_memory_size() for _, index in self.index_dic.values())
+
+    def items(self) -> List[Tuple[str, HMReferenceIndex]]:
+        return list(self.index_dic.values())
+
+    def evict(self) -> List[str]:
+        evicted_name_list: List[str] = []
+        memory_size = self.get_memory_size()
+        while memory_size > self.budget and len(self.index_dic) > 1:
+            _, (image_name, index) = self.index_dic.popitem(last=False)
+            if index.uuid_str and not os.path.isfile(get_index_path(index.uuid_str)):
+                index.save(get_index_path(index.uuid_str))
+            memory_size -= index.get_memory_size()
+            evicted_name_list.append(image_name)
+        return evicted_name_list
+
+
+def get_index_cache_key(uuid_str: str, image_name: str) -> str:
+    return uuid_str if uuid_str else f"name:{image_name}"
+
+
+# The kind of an Objective-C metadata slot, the same as the section name
+objc_kind_selref = 1  # __objc_selrefs, the name is the selector
+objc_kind_classref = 2  # __objc_classrefs, the name is the class name
+objc_kind_superref = 3  # __objc_superrefs, the name is the class name
+objc_kind_cfstring = 4  # __cfstring, the name is the string
+objc_kind_section_name_dic: Dict[int, str] = {
+    objc_kind_selref: "__objc_selrefs",
+    objc_kind_classref: "__objc_classrefs",
+    objc_kind_superref: "__objc_superrefs",
+    objc_kind_cfstring: "__cfstring",
+}
+
+
+class HMObjCMetadata:
+    # The slots of the Objective-C metadata sections in an image. The code references a slot instead of the selector, class or string,
+    # so a name is resolved to its slots here, and the slots are queried in HMReferenceIndex.
+    # The offsets are relative to the image base.
+    uuid_str: str
+    base_address: int
+    offsets: array
+    kinds: array
+    names: List[str]
+    name_dic: Optional[Dict[Tuple[int, str], List[int]]]  # [(kind, name), [row]], built on the first query
+
+    def __init__(self, uuid_str: str, base_address: int):
+        self.uuid_str = uuid_str
+        self.base_address = base_address
+        self.offsets = array('Q')
+        self.kinds = array('B')
+        self.names = []
+        self.name_dic = None
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    def rebase(self, base_address: int) -> 'HMObjCMetadata':
+        # See HMReferenceIndex.rebase, the names are shared too
+        if base_address == self.base_address:
+            return self
+        self.build_name_dic()
+        metadata = copy.copy(self)
+        metadata.base_address = base_address
+        return metadata
+
+    def record(self, slot_address: int, kind: int, name: str) -> None:
+        self.offsets.append(slot_address - self.base_address)
+        self.kinds.append(kind)
+        self.names.append(name)
+        self.name_dic = None
+
+    def build_name_dic(self) -> None:
+        if self.name_dic is None:
+            self.name_dic = {}
+            for row, (kind, slot_name) in enumerate(zip(self.kinds, self.names)):
+                self.name_dic.setdefault((kind, slot_name), []).append(row)
+
+    def find_slots(self, name: str, kind_list: List[int]) -> List[Tuple[int, int]]:
+        # Return [(slot_address, kind)] sorted by address
+        self.build_name_dic()
+        result: List[Tuple[int, int]] = []
+        for kind in kind_list:
+            for row in self.name_dic.get((kind, name), []):
+                result.append((self.offsets[row] + self.base_address, kind))
+        result.sort()
+        return result
+
+    def save(self, path: str) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, 'wb') as metadata_file:
+            metadata_file.write(struct.pack(objc_metadata_header_format, objc_metadata_magic, objc_metadata_version, 0, uuid.UUID(self.uuid_str).bytes, len(self)))
+            for offset, kind, name in zip(self.offsets, self.kinds, self.names):
+                name_data = name.encode('utf-8', errors='replace')[:0xffff]
+                metadata_file.write(struct.pack(objc_metadata_record_format, offset, kind, len(name_data)))
+                metadata_file.write(name_data)
+        os.replace(temp_path, path)
+
+    @staticmethod
+    def load(path: str, uuid_str: str, base_address: int) -> Optional['HMObjCMetadata']:
+        if not os.path.isfile(path):
+            return None
+        with open(path, 'rb') as metadata_file:
+            buffer = metadata_file.read()
+        if len(buffer) < objc_metadata_header_size:
+            return None
+        magic, version, _, uuid_bytes, count = struct.unpack_from(objc_metadata_header_format, buffer)
+        if magic != objc_metadata_magic or version != objc_metadata_version or uuid_bytes != uuid.UUID(uuid_str).bytes:
+            return None
+
+        metadata = HMObjCMetadata(uuid_str, base_address)
+        offset = objc_metadata_header_size
+        for _ in range(count):
+            if offset + objc_metadata_record_size > len(buffer):
+                return None
+            slot_offset, kind, name_size = struct.unpack_from(objc_metadata_record_format, buffer, offset)
+            offset += objc_metadata_record_size
+            metadata.offsets.append(slot_offset)
+            metadata.kinds.append(kind)
+            metadata.names.append(buffer[offset:offset + name_size].decode('utf-8', errors='replace'))
+            offset += name_size
+        return metadata
+
+
+def get_index_path(uuid_str: str) -> str:
+    return os.path.join(g_index_directory, f"{uuid_str}.hmref")
+
+
+def get_checkpoint_path(uuid_str: str) -> str:
+    return os.path.join(g_index_directory, f"{uuid_str}.hmckpt")
+
+
+def get_objc_metadata_path(uuid_str: str) -> str:
+    return os.path.join(g_index_directory, f"{uuid_str}.hmobjc")
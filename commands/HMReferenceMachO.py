@@ -0,0 +1,445 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2024 Huimao Chen
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# https://github.com/chenhuimao/HMLLDB
+
+from array import array
+from typing import Callable, List, Optional, Tuple
+import bisect
+import copy
+import mmap
+import struct
+import uuid
+
+
+# Mach-O constants, see <mach-o/loader.h>, <mach-o/fat.h> and <mach-o/fixup-chains.h>
+MH_MAGIC_64 = 0xfeedfacf
+FAT_MAGIC = 0xcafebabe
+FAT_MAGIC_64 = 0xcafebabf
+CPU_TYPE_ARM64 = 0x0100000c
+LC_SEGMENT_64 = 0x19
+LC_UUID = 0x1b
+LC_FUNCTION_STARTS = 0x26
+LC_DATA_IN_CODE = 0x29
+LC_DYLD_CHAINED_FIXUPS = 0x80000034
+S_ATTR_PURE_INSTRUCTIONS = 0x80000000
+S_ATTR_SOME_INSTRUCTIONS = 0x00000400
+
+DYLD_CHAINED_PTR_ARM64E = 1
+DYLD_CHAINED_PTR_64 = 2
+DYLD_CHAINED_PTR_64_OFFSET = 6
+DYLD_CHAINED_PTR_ARM64E_USERLAND = 9
+DYLD_CHAINED_PTR_ARM64E_USERLAND24 = 12
+DYLD_CHAINED_PTR_START_NONE = 0xffff
+DYLD_CHAINED_PTR_START_MULTI = 0x8000
+
+mach_header_64_format = '<IiiIIIII'
+segment_command_64_format = '<II16sQQQQiiII'
+section_64_format = '<16s16sQQIIIIIIII'
+chained_fixups_header_format = '<IIIIIII'
+chained_starts_in_segment_format = '<IHHQIH'
+linkedit_data_command_format = '<IIII'
+data_in_code_entry_format = '<IHH'
+
+
+class HMCodeLayout:
+    # The functions and the data in code(jump tables, literal pools) of an image, from LC_FUNCTION_STARTS and LC_DATA_IN_CODE.
+    # The offsets are relative to the image base, so the layout is valid after relaunching.
+    base_address: int
+    function_start_offsets: array  # Sorted
+    function_end_offset: int  # The end of the last function, the end of its section
+    data_in_code_list: List[Tuple[int, int]]  # [(start_offset, end_offset)], sorted
+
+    def __init__(self, base_address: int, function_start_offsets: array, code_section_list: List[Tuple[int, int]], data_in_code_list: List[Tuple[int, int]]):
+        # code_section_list: [(start_offset, end_offset)] of the code sections
+        self.base_address = base_address
+        self.function_start_offsets = function_start_offsets
+        self.function_end_offset = function_start_offsets[-1] if len(function_start_offsets) > 0 else 0
+        for section_start, section_end in code_section_list:
+            if section_start <= self.function_end_offset < section_end:
+                self.function_end_offset = section_end
+        self.data_in_code_list = sorted(data_in_code_list)
+
+    def __len__(self) -> int:
+        return len(self.function_start_offsets)
+
+    def rebase(self, base_address: int) -> 'HMCodeLayout':
+        # Return the layout of the image loaded at base_address, the offsets are shared
+        if base_address == self.base_address:
+            return self
+        code_layout = copy.copy(self)
+        code_layout.base_address = base_address
+        return code_layout
+
+    def get_code_range_list(self, section_start: int, section_end: int) -> List[Tuple[int, int]]:
+        # Return [(start_address, end_address)], the functions in the section without the data in code.
+        # The functions are contiguous, so the section is only split by the data in code and the code before the first function.
+        # A section without function starts(such as __stubs) is code entirely.
+        start_offset = section_start - self.base_address
+        end_offset = section_end - self.base_address
+        index = bisect.bisect_left(self.function_start_offsets, start_offset)
+        if index == len(self.function_start_offsets) or self.function_start_offsets[index] >= end_offset:
+            return [(section_start, section_end)]
+
+        range_list: List[Tuple[int, int]] = []
+        cursor = self.function_start_offsets[index]
+        data_index = max(0, bisect.bisect_left(self.data_in_code_list, (cursor, 0)) - 1)
+        while data_index < len(self.data_in_code_list) and self.data_in_code_list[data_index][0] < end_offset:
+            data_start, data_end = self.data_in_code_list[data_index]
+            data_index += 1
+            if data_end <= cursor:
+                continue
+            if data_start > cursor:
+                range_list.append((cursor + self.base_address, data_start + self.base_address))
+            cursor = data_end
+        if cursor < end_offset:
+            range_list.append((cursor + self.base_address, section_end))
+        return range_list
+
+    def find_function_start(self, address: int) -> int:
+        # Return the start address of the function containing the address, or -1
+        offset = address - self.base_address
+        if offset < 0 or offset >= self.function_end_offset:
+            return -1
+        index = bisect.bisect_right(self.function_start_offsets, offset) - 1
+        if index < 0:
+            return -1
+        return self.function_start_offsets[index] + self.base_address
+
+
+def decode_function_starts(data: bytes, text_offset: int = 0) -> array:
+    # LC_FUNCTION_STARTS is a zero terminated sequence of ULEB128 deltas, the first one is relative to the start of __TEXT
+    function_start_offsets = array('Q')
+    offset = text_offset
+    delta = 0
+    shift = 0
+    for byte in data:
+        delta |= (byte & 0x7f) << shift
+        if byte & 0x80:
+            shift += 7
+            continue
+        if delta == 0:
+            break
+        offset += delta
+        function_start_offsets.append(offset)
+        delta = 0
+        shift = 0
+    return function_start_offsets
+
+
+def decode_data_in_code(data: bytes) -> List[Tuple[int, int]]:
+    # [(start_offset, end_offset)], the offsets of data_in_code_entry are relative to the mach header
+    entry_size = struct.calcsize(data_in_code_entry_format)
+    data_in_code_list: List[Tuple[int, int]] = []
+    for entry_offset in range(0, len(data) - entry_size + 1, entry_size):
+        offset, length, _ = struct.unpack_from(data_in_code_entry_format, data, entry_offset)
+        if length > 0:
+            data_in_code_list.append((offset, offset + length))
+    return data_in_code_list
+
+
+def parse_code_layout_in_memory(read_memory: Callable[[int, int], Optional[bytes]], header_address: int) -> Optional[HMCodeLayout]:
+    # Read the load commands of a loaded image. The linkedit data is at the same offset from __LINKEDIT as in the file,
+    # this is also true for the images in the dyld shared cache.
+    header_size = struct.calcsize(mach_header_64_format)
+    header_data = read_memory(header_address, header_size)
+    if header_data is None or len(header_data) < header_size:
+        return None
+    magic, cputype, _, _, ncmds, sizeofcmds, _, _ = struct.unpack_from(mach_header_64_format, header_data)
+    if magic != MH_MAGIC_64 or cputype != CPU_TYPE_ARM64:
+        return None
+    command_data = read_memory(header_address + header_size, sizeofcmds)
+    if command_data is None or len(command_data) < sizeofcmds:
+        return None
+
+    text_vmaddr = -1
+    linkedit_vmaddr = -1
+    linkedit_fileoff = 0
+    function_starts_command: Optional[Tuple[int, int]] = None  # (dataoff, datasize)
+    data_in_code_command: Optional[Tuple[int, int]] = None
+    code_section_list: List[Tuple[int, int]] = []  # [(start_vmaddr, end_vmaddr)]
+    command_offset = 0
+    for _ in range(ncmds):
+        if command_offset + 8 > len(command_data):
+            break
+        cmd, cmdsize = struct.unpack_from('<II', command_data, command_offset)
+        if cmd == LC_SEGMENT_64:
+            _, _, segname, vmaddr, _, fileoff, _, _, _, nsects, _ = struct.unpack_from(segment_command_64_format, command_data, command_offset)
+            segment_name = segname.rstrip(b'\x00').decode()
+            code_section_list += get_code_section_range_list(command_data, command_offset + struct.calcsize(segment_command_64_format), nsects)
+            if segment_name == "__TEXT":
+                text_vmaddr = vmaddr
+            elif segment_name == "__LINKEDIT":
+                linkedit_vmaddr = vmaddr
+                linkedit_fileoff = fileoff
+        elif cmd in [LC_FUNCTION_STARTS, LC_DATA_IN_CODE]:
+            _, _, dataoff, datasize = struct.unpack_from(linkedit_data_command_format, command_data, command_offset)
+            if cmd == LC_FUNCTION_STARTS:
+                function_starts_command = (dataoff, datasize)
+            else:
+                data_in_code_command = (dataoff, datasize)
+        if cmdsize == 0:
+            break
+        command_offset += cmdsize
+
+    if text_vmaddr == -1 or linkedit_vmaddr == -1 or function_starts_command is None:
+        return None
+    slide = header_address - text_vmaddr
+
+    def read_linkedit_data(dataoff: int, datasize: int) -> bytes:
+        if datasize == 0:
+            return b''
+        data = read_memory(linkedit_vmaddr + slide + dataoff - linkedit_fileoff, datasize)
+        return bytes(data) if data is not None else b''
+
+    function_start_offsets = decode_function_starts(read_linkedit_data(*function_starts_command))
+    if len(function_start_offsets) == 0:
+        return None
+    data_in_code_list = decode_data_in_code(read_linkedit_data(*data_in_code_command)) if data_in_code_command is not None else []
+    code_section_offset_list = [(start_vmaddr - text_vmaddr, end_vmaddr - text_vmaddr) for start_vmaddr, end_vmaddr in code_section_list]
+    return HMCodeLayout(header_address, function_start_offsets, code_section_offset_list, data_in_code_list)
+
+
+def get_code_section_range_list(buffer, section_offset: int, nsects: int) -> List[Tuple[int, int]]:
+    # [(start_vmaddr, end_vmaddr)] of the sections with instructions in a segment
+    section_size = struct.calcsize(section_64_format)
+    section_range_list: List[Tuple[int, int]] = []
+    for i in range(nsects):
+        if section_offset + (i + 1) * section_size > len(buffer):
+            break
+        _, _, addr, size, _, _, _, _, flags, _, _, _ = struct.unpack_from(section_64_format, buffer, section_offset + i * section_size)
+        if flags & (S_ATTR_PURE_INSTRUCTIONS | S_ATTR_SOME_INSTRUCTIONS) and size > 0:
+            section_range_list.append((addr, addr + size))
+    return section_range_list
+
+
+class HMMachOImage:
+    # An arm64 image in a Mach-O file. The addresses are the virtual addresses in the file(the image is not slid).
+    path: str
+    uuid_str: str
+    base_address: int  # The address of the mach header
+    image_range: Tuple[int, int]  # The [start, end) address range of the segments, excluding __PAGEZERO
+    region_info_list: List[Tuple[int, int, int]]  # [(start_address, file_offset, size)], the segment contents in the file
+    code_section_list: List[Tuple[int, int, str]]  # [(start_address, end_address, description)]
+    code_layout: Optional[HMCodeLayout]  # None if there is no LC_FUNCTION_STARTS
+    # The pointers fixed up by dyld, sorted by address. The rebase targets are saved in fixup_values, and the binds are saved as 0.
+    fixup_addresses: array
+    fixup_values: array
+
+    def __init__(self, path: str):
+        self.path = path
+        self.uuid_str = ""
+        self.base_address = 0
+        self.image_range = (0, 0)
+        self.region_info_list = []
+        self.code_section_list = []
+        self.code_layout = None
+        self.fixup_addresses = array('Q')
+        self.fixup_values = array('Q')
+
+
+def parse_macho_file(path: str) -> List[HMMachOImage]:
+    # Return the arm64 images of a thin or fat Mach-O file.
+    # Raise ValueError if the file is truncated or malformed, the offsets and sizes in the headers are checked against the file size.
+    with open(path, 'rb') as macho_file:
+        buffer = mmap.mmap(macho_file.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        if len(buffer) < 8:
+            return []
+        magic = struct.unpack_from('>I', buffer)[0]
+        slice_offset_list: List[int] = []
+        if magic in [FAT_MAGIC, FAT_MAGIC_64]:
+            arch_count = struct.unpack_from('>I', buffer, 4)[0]
+            arch_size = 20 if magic == FAT_MAGIC else 32
+            if 8 + arch_count * arch_size > len(buffer):
+                raise ValueError(f"The fat header has {arch_count} architectures, but the file size is {len(buffer)}")
+            for i in range(arch_count):
+                if magic == FAT_MAGIC:
+                    cputype, _, offset, size, _ = struct.unpack_from('>iiIII', buffer, 8 + i * 20)
+                else:
+                    cputype, _, offset, size, _, _ = struct.unpack_from('>iiQQII', buffer, 8 + i * 32)
+                if cputype != CPU_TYPE_ARM64:
+                    continue
+                if offset + size > len(buffer):
+                    raise ValueError(f"The arm64 slice [{hex(offset)}, {hex(offset + size)}) is out of the file, the file size is {hex(len(buffer))}")
+                slice_offset_list.append(offset)
+        else:
+            slice_offset_list.append(0)
+
+        image_list: List[HMMachOImage] = []
+        for slice_offset in slice_offset_list:
+            image = parse_macho_slice(path, buffer, slice_offset)
+            if image is not None:
+                image_list.append(image)
+        return image_list
+    finally:
+        buffer.close()
+
+
+def parse_macho_slice(path: str, buffer: mmap.mmap, slice_offset: int) -> Optional[HMMachOImage]:
+    if len(buffer) < slice_offset + struct.calcsize(mach_header_64_format):
+        return None
+    magic, cputype, _, _, ncmds, sizeofcmds, _, _ = struct.unpack_from(mach_header_64_format, buffer, slice_offset)
+    if magic != MH_MAGIC_64 or cputype != CPU_TYPE_ARM64:
+        return None
+    command_offset = slice_offset + struct.calcsize(mach_header_64_format)
+    commands_end = command_offset + sizeofcmds
+    if commands_end > len(buffer):
+        raise ValueError(f"The load commands end at {hex(commands_end)}, but the file size is {hex(len(buffer))}")
+    if ncmds * 8 > sizeofcmds:
+        raise ValueError(f"{ncmds} load commands do not fit in sizeofcmds({sizeofcmds})")
+
+    image = HMMachOImage(path)
+    # [(vmaddr, fileoff)] in the order of the load commands, used by chained fixups
+    segment_list: List[Tuple[int, int]] = []
+    chained_fixups_offset = -1
+    function_starts_command: Optional[Tuple[int, int]] = None  # (dataoff, datasize)
+    data_in_code_command: Optional[Tuple[int, int]] = None
+    image_start = -1
+    image_end = 0
+    for command_index in range(ncmds):
+        if command_offset + 8 > commands_end:
+            raise ValueError(f"The load command {command_index} is out of sizeofcmds")
+        cmd, cmdsize = struct.unpack_from('<II', buffer, command_offset)
+        if cmdsize < get_min_command_size(cmd) or command_offset + cmdsize > commands_end:
+            raise ValueError(f"The load command {command_index}({hex(cmd)}) has an invalid cmdsize({cmdsize})")
+        if cmd == LC_SEGMENT_64:
+            _, _, segname, vmaddr, vmsize, fileoff, filesize, _, _, nsects, _ = struct.unpack_from(segment_command_64_format, buffer, command_offset)
+            segment_name = segname.rstrip(b'\x00').decode()
+            if struct.calcsize(segment_command_64_format) + nsects * struct.calcsize(section_64_format) > cmdsize:
+                raise ValueError(f"The {nsects} sections of {segment_name} do not fit in its cmdsize({cmdsize})")
+            if slice_offset + fileoff + filesize > len(buffer):
+                raise ValueError(f"The contents of {segment_name} are out of the file")
+            segment_list.append((vmaddr, fileoff))
+            if segment_name != "__PAGEZERO":
+                image_start = vmaddr if image_start == -1 else min(image_start, vmaddr)
+                image_end = max(image_end, vmaddr + vmsize)
+                if filesize > 0:
+                    image.region_info_list.append((vmaddr, slice_offset + fileoff, filesize))
+                if fileoff == 0 and filesize > 0:
+                    image.base_address = vmaddr
+            section_offset = command_offset + struct.calcsize(segment_command_64_format)
+            for i in range(nsects):
+                sectname, _, addr, size, _, _, _, _, flags, _, _, _ = struct.unpack_from(section_64_format, buffer, section_offset + i * struct.calcsize(section_64_format))
+                if flags & (S_ATTR_PURE_INSTRUCTIONS | S_ATTR_SOME_INSTRUCTIONS) and size > 0:
+                    section_name = sectname.rstrip(b'\x00').decode()
+                    image.code_section_list.append((addr, addr + size, f"{segment_name}.{section_name}"))
+        elif cmd == LC_UUID:
+            image.uuid_str = str(uuid.UUID(bytes=bytes(buffer[command_offset + 8:command_offset + 24]))).upper()
+        elif cmd == LC_DYLD_CHAINED_FIXUPS:
+            chained_fixups_offset = slice_offset + struct.unpack_from('<I', buffer, command_offset + 8)[0]
+        elif cmd in [LC_FUNCTION_STARTS, LC_DATA_IN_CODE]:
+            _, _, dataoff, datasize = struct.unpack_from(linkedit_data_command_format, buffer, command_offset)
+            if cmd == LC_FUNCTION_STARTS:
+                function_starts_command = (slice_offset + dataoff, datasize)
+            else:
+                data_in_code_command = (slice_offset + dataoff, datasize)
+        command_offset += cmdsize
+
+    if image_start != -1:
+        image.image_range = (image_start, image_end)
+    if chained_fixups_offset != -1:
+        parse_chained_fixups(image, buffer, slice_offset, chained_fixups_offset, segment_list)
+    if function_starts_command is not None:
+        dataoff, datasize = function_starts_command
+        function_start_offsets = decode_function_starts(buffer[dataoff:dataoff + datasize])
+        if len(function_start_offsets) > 0:
+            data_in_code_list = []
+            if data_in_code_command is not None:
+                dataoff, datasize = data_in_code_command
+                data_in_code_list = decode_data_in_code(buffer[dataoff:dataoff + datasize])
+            code_section_offset_list = [(start_address - image.base_address, end_address - image.base_address) for start_address, end_address, _ in image.code_section_list]
+            image.code_layout = HMCodeLayout(image.base_address, function_start_offsets, code_section_offset_list, data_in_code_list)
+    return image
+
+
+def get_min_command_size(cmd: int) -> int:
+    # The size of the fields read from the load command
+    if cmd == LC_SEGMENT_64:
+        return struct.calcsize(segment_command_64_format)
+    if cmd == LC_UUID:
+        return 24
+    if cmd in [LC_DYLD_CHAINED_FIXUPS, LC_FUNCTION_STARTS, LC_DATA_IN_CODE]:
+        return struct.calcsize(linkedit_data_command_format)
+    return 8
+
+
+def parse_chained_fixups(image: HMMachOImage, buffer: mmap.mmap, slice_offset: int, chained_fixups_offset: int, segment_list: List[Tuple[int, int]]) -> None:
+    # Walk the fixup chains of each page and decode the rebase targets. Unsupported pointer formats are skipped.
+    _, starts_offset, _, _, _, _, _ = struct.unpack_from(chained_fixups_header_format, buffer, chained_fixups_offset)
+    starts_in_image_offset = chained_fixups_offset + starts_offset
+    segment_count = struct.unpack_from('<I', buffer, starts_in_image_offset)[0]
+    base_address = image.base_address
+    for segment_index in range(min(segment_count, len(segment_list))):
+        segment_info_offset = struct.unpack_from('<I', buffer, starts_in_image_offset + 4 + segment_index * 4)[0]
+        if segment_info_offset == 0:
+            continue
+        starts_in_segment_offset = starts_in_image_offset + segment_info_offset
+        _, page_size, pointer_format, _, _, page_count = struct.unpack_from(chained_starts_in_segment_format, buffer, starts_in_segment_offset)
+        if pointer_format not in [DYLD_CHAINED_PTR_ARM64E, DYLD_CHAINED_PTR_64, DYLD_CHAINED_PTR_64_OFFSET, DYLD_CHAINED_PTR_ARM64E_USERLAND, DYLD_CHAINED_PTR_ARM64E_USERLAND24]:
+            continue
+        is_arm64e = pointer_format in [DYLD_CHAINED_PTR_ARM64E, DYLD_CHAINED_PTR_ARM64E_USERLAND, DYLD_CHAINED_PTR_ARM64E_USERLAND24]
+        stride = 8 if is_arm64e else 4
+        segment_vmaddr, segment_fileoff = segment_list[segment_index]
+        page_start_offset = starts_in_segment_offset + struct.calcsize(chained_starts_in_segment_format)
+        for page_index in range(page_count):
+            page_start = struct.unpack_from('<H', buffer, page_start_offset + page_index * 2)[0]
+            if page_start == DYLD_CHAINED_PTR_START_NONE or page_start & DYLD_CHAINED_PTR_START_MULTI:
+                continue
+            offset = page_index * page_size + page_start
+            while True:
+                raw_value = struct.unpack_from('<Q', buffer, slice_offset + segment_fileoff + offset)[0]
+                image.fixup_addresses.append(segment_vmaddr + offset)
+                image.fixup_values.append(decode_chained_pointer(raw_value, pointer_format, base_address))
+                if is_arm64e:
+                    next_value = (raw_value >> 51) & 0x7ff
+                else:
+                    next_value = (raw_value >> 51) & 0xfff
+                if next_value == 0:
+                    break
+                offset += next_value * stride
+
+
+def decode_chained_pointer(raw_value: int, pointer_format: int, base_address: int) -> int:
+    # Return the rebase target of the pointer, or 0 if it is a bind(the value is unknown before loading)
+    if pointer_format in [DYLD_CHAINED_PTR_64, DYLD_CHAINED_PTR_64_OFFSET]:
+        if raw_value >> 63:
+            return 0
+        target = raw_value & 0xfffffffff
+        high8 = (raw_value >> 36) & 0xff
+        if pointer_format == DYLD_CHAINED_PTR_64_OFFSET:
+            target += base_address
+        return (high8 << 56) | target
+
+    # arm64e
+    is_auth = (raw_value >> 63) & 1
+    is_bind = (raw_value >> 62) & 1
+    if is_bind:
+        return 0
+    if is_auth:
+        # The runtime offset, the signature is added when the image is loaded
+        return base_address + (raw_value & 0xffffffff)
+    target = raw_value & 0x7ffffffffff
+    high8 = (raw_value >> 43) & 0xff
+    if pointer_format != DYLD_CHAINED_PTR_ARM64E:
+        target += base_address
+    return (high8 << 56) | target
@@ -0,0 +1,140 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2024 Huimao Chen
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# https://github.com/chenhuimao/HMLLDB
+
+from collections import Counter
+from typing import Callable, Dict, List, Optional, Tuple
+import threading
+import time
+
+
+# The class of an instruction, classified by the top byte(little endian data[3])
+instruction_class_name_list: List[str] = ["other", "b", "bl", "adr", "adrp"]
+instruction_class_table: List[int] = [1 if top_byte & 0xfc == 0x14 else 2 if top_byte & 0xfc == 0x94 else 3 if top_byte & 0x9f == 0x10 else 4 if top_byte & 0x9f == 0x90 else 0 for top_byte in range(256)]
+
+# The reasons of the end of an adr/adrp window
+stop_reason_window_end = "end of window"
+stop_reason_unsupported = "unsupported instruction"
+stop_reason_unreadable = "memory unreadable"
+
+
+class HMScanProfile:
+    # The counters of a scan, see "reference --profile".
+    # Only the thread that creates the profile is counted, so a background scan does not mix into it.
+    thread_id: int
+    top_byte_counter: Counter  # [top_byte, count]
+    follow_up_counter: Counter  # [handler_name, count], the instructions analyzed after adr/adrp
+    window_count: int
+    window_instruction_count: int
+    stop_reason_counter: Counter  # [reason, count]
+    section_list: List[Tuple[str, int, float, int, int, int]]  # [(description, size, seconds, records, loads, SB reads)]
+    section_start: Optional[Tuple[float, int, int, int]]  # (start_time, records, loads, SB reads) of the section being scanned
+
+    def __init__(self):
+        self.thread_id = threading.get_ident()
+        self.top_byte_counter = Counter()
+        self.follow_up_counter = Counter()
+        self.window_count = 0
+        self.window_instruction_count = 0
+        self.stop_reason_counter = Counter()
+        self.section_list = []
+        self.section_start = None
+
+    def is_current_thread(self) -> bool:
+        return self.thread_id == threading.get_ident()
+
+    def count_instructions(self, data: memoryview) -> None:
+        # The top bytes are counted in C, then classified in get_summary
+        self.top_byte_counter.update(data[3::4].tobytes())
+
+    def count_follow_up(self, handler: Callable) -> None:
+        self.follow_up_counter[handler.__name__] += 1
+
+    def record_window(self, instruction_count: int, stop_reason: str) -> None:
+        self.window_count += 1
+        self.window_instruction_count += instruction_count
+        self.stop_reason_counter[stop_reason] += 1
+
+    def record_window_stop(self, index: int, handler: Optional[Callable]) -> None:
+        # The window stops at the instruction of the index, it is analyzed if there is a handler
+        if handler is None:
+            self.record_window(index, stop_reason_unsupported)
+        else:
+            self.record_window(index + 1, f"{get_handler_description(handler.__name__)} stops")
+
+    def begin_section(self, record_count: int, load_count: int, read_count: int) -> None:
+        self.section_start = (time.perf_counter(), record_count, load_count, read_count)
+
+    def end_section(self, description: str, size: int, record_count: int, load_count: int, read_count: int) -> None:
+        start_time, start_record_count, start_load_count, start_read_count = self.section_start
+        self.section_list.append((description, size, time.perf_counter() - start_time, record_count - start_record_count, load_count - start_load_count, read_count - start_read_count))
+        self.section_start = None
+
+    def get_instruction_count_dic(self) -> Dict[str, int]:
+        instruction_count_dic = {name: 0 for name in instruction_class_name_list}
+        for top_byte, count in self.top_byte_counter.items():
+            instruction_count_dic[instruction_class_name_list[instruction_class_table[top_byte]]] += count
+        return instruction_count_dic
+
+    def get_summary(self) -> str:
+        line_list: List[str] = []
+        instruction_count_dic = self.get_instruction_count_dic()
+        total_instruction_count = sum(instruction_count_dic.values())
+        line_list.append(f"{'Instruction class':<40}{'count':>12}{'ratio':>10}")
+        for name, count in instruction_count_dic.items():
+            line_list.append(f"{name:<40}{count:>12}{get_ratio(count, total_instruction_count):>10}")
+        line_list.append(f"{'total':<40}{total_instruction_count:>12}")
+
+        line_list.append("")
+        average_length = self.window_instruction_count / self.window_count if self.window_count > 0 else 0.0
+        line_list.append(f"adr/adrp windows: {self.window_count}, analyzed instructions: {self.window_instruction_count}, average: {average_length:.2f}")
+        line_list.append(f"{'Stop reason':<40}{'count':>12}{'ratio':>10}")
+        for reason, count in self.stop_reason_counter.most_common():
+            line_list.append(f"{reason:<40}{count:>12}{get_ratio(count, self.window_count):>10}")
+
+        line_list.append("")
+        line_list.append(f"{'Instruction after adr/adrp':<40}{'count':>12}{'ratio':>10}")
+        for handler_name, count in self.follow_up_counter.most_common():
+            line_list.append(f"{get_handler_description(handler_name):<40}{count:>12}{get_ratio(count, self.window_instruction_count):>10}")
+
+        line_list.append("")
+        line_list.append(f"{'Section':<40}{'size':>12}{'seconds':>10}{'inst/s':>12}{'records':>12}{'loads':>12}{'SB reads':>10}")
+        for description, size, seconds, record_count, load_count, read_count in self.section_list:
+            instructions_per_second = f"{size / 4 / seconds:.0f}" if seconds > 0 else "-"
+            line_list.append(f"{description[:39]:<40}{size:>12}{seconds:>10.3f}{instructions_per_second:>12}{record_count:>12}{load_count:>12}{read_count:>10}")
+        total_seconds = sum(section[2] for section in self.section_list)
+        line_list.append(f"{'total':<40}{sum(section[1] for section in self.section_list):>12}{total_seconds:>10.3f}")
+        return "\n".join(line_list)
+
+
+def get_ratio(count: int, total: int) -> str:
+    if total == 0:
+        return "-"
+    return f"{count / total * 100:.2f}%"
+
+
+def get_handler_description(handler_name: str) -> str:
+    # emulate_ldr_immediate_unsigned_offset -> ldr immediate unsigned offset
+    if handler_name.startswith("emulate_"):
+        handler_name = handler_name[len("emulate_"):]
+    return handler_name.replace("_", " ")
@@ -0,0 +1,290 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2024 Huimao Chen
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# https://github.com/chenhuimao/HMLLDB
+
+# The scanner of "reference". It does not import lldb, so the worker processes of "reference --jobs" only import the pure Python modules.
+
+from typing import List, Optional, Protocol, Tuple
+import bisect
+import mmap
+import HMA64Decoder
+import HMA64Emulator
+import HMReferenceIndex
+import HMReferenceMachO
+import HMReferenceProfile
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# The profile of the scan of "reference --profile"
+g_scan_profile: Optional[HMReferenceProfile.HMScanProfile] = None
+
+# The size of the instructions analyzed after adr/adrp, see record_adrp_follow_up_logic
+adrp_look_ahead_size = 4 * 10
+
+# The class of an instruction in instruction_analysis, classified by the top byte(little endian data[3])
+instruction_class_other = 0
+instruction_class_adr = 1  # adr/adrp
+instruction_class_branch = 2  # b/bl
+scan_instruction_class_table: List[int] = [instruction_class_adr if top_byte & 0x1f == 0x10 else instruction_class_branch if top_byte & 0x7c == 0x14 else instruction_class_other for top_byte in range(256)]
+
+
+# The memory read by the scanner, implemented by HMReference.HMTargetMemory and HMSnapshotMemory
+class HMScanMemory(Protocol):
+    emulator: HMA64Emulator.HMA64Emulator  # Reused by the adr/adrp windows of the scan
+
+    def read_memory(self, address_int: int, size: int) -> Optional[bytes]:
+        # Returns None if the memory cannot be read
+        ...
+
+    def load_address_value(self, address_int: int) -> int:
+        # Same as HM.load_address_value
+        ...
+
+
+# The memory used by the scanner. Read a copy of the image that was saved to a file, it is used by worker processes that cannot access the SB API.
+class HMSnapshotMemory:
+    region_start_list: List[int]
+    region_list: List[Tuple[int, int, memoryview]]  # [(start_address, end_address, data)]
+    emulator: HMA64Emulator.HMA64Emulator
+
+    def __init__(self, snapshot_path: str, region_info_list: List[Tuple[int, int, int]]):
+        # region_info_list: [(start_address, file_offset, size)]
+        with open(snapshot_path, 'rb') as snapshot_file:
+            # The mapping remains valid after the file is closed
+            snapshot_buffer = memoryview(mmap.mmap(snapshot_file.fileno(), 0, access=mmap.ACCESS_READ))
+        region_info_list = sorted(region_info_list)
+        self.region_start_list = [start_address for start_address, _, _ in region_info_list]
+        self.region_list = [(start_address, start_address + size, snapshot_buffer[file_offset:file_offset + size]) for start_address, file_offset, size in region_info_list]
+        self.emulator = HMA64Emulator.HMA64Emulator(self.load_address_value)
+
+    def read_memory(self, address_int: int, size: int) -> Optional[memoryview]:
+        index = bisect.bisect_right(self.region_start_list, address_int) - 1
+        if index < 0:
+            return None
+        start_address, end_address, data = self.region_list[index]
+        if address_int >= end_address:
+            return None
+        # Returns fewer bytes when reading beyond the end of the region
+        return data[address_int - start_address:address_int - start_address + size]
+
+    def load_address_value(self, address_int: int) -> int:
+        # Same as HM.load_address_value
+        if address_int <= 0:
+            return -1
+        data = self.read_memory(address_int, 8)
+        if data is None or len(data) < 8:
+            return -1
+        return int.from_bytes(data, 'little')
+
+
+# The memory used by the scanner. Read the Mach-O file on disk, the pointers are fixed up like dyld does, see HMReferenceMachO.
+class HMMachOFileMemory(HMSnapshotMemory):
+    image: HMReferenceMachO.HMMachOImage
+
+    def __init__(self, image: HMReferenceMachO.HMMachOImage):
+        super().__init__(image.path, image.region_info_list)
+        self.image = image
+
+    def load_address_value(self, address_int: int) -> int:
+        value = super().load_address_value(address_int)
+        if value == -1:
+            return -1
+        # Replace the bytes of the fixed up pointers that overlap [address_int, address_int + 8)
+        fixup_addresses = self.image.fixup_addresses
+        index = bisect.bisect_right(fixup_addresses, address_int - 8)
+        if index == len(fixup_addresses) or fixup_addresses[index] >= address_int + 8:
+            return value
+        data = bytearray(value.to_bytes(8, 'little'))
+        while index < len(fixup_addresses) and fixup_addresses[index] < address_int + 8:
+            fixup_data = self.image.fixup_values[index].to_bytes(8, 'little')
+            shift = fixup_addresses[index] - address_int
+            for i in range(max(0, shift), min(8, shift + 8)):
+                data[i] = fixup_data[i - shift]
+            index += 1
+        return int.from_bytes(data, 'little')
+
+
+# Memory and (base_address, image_range) of each image in the worker process, see HMReference.scan_modules_code_in_parallel
+g_worker_memory_list: List[HMSnapshotMemory] = []
+g_worker_image_info_list: List[Tuple[int, Tuple[int, int]]] = []
+
+
+def scan_code_range(memory: HMScanMemory, section_load_address_start: int, section_load_address_end: int, recorder: HMReferenceIndex.HMReferenceRecorder, use_numpy: bool = False) -> None:
+    # Analyze the code section in snippets
+    current_address = section_load_address_start
+    span = 4 * 10000
+    snippet_count = int((section_load_address_end - section_load_address_start) / span)
+    analyzing_snippet_count = 0
+    last_percentage: float = 0.0
+    while current_address + span < section_load_address_end:
+        instruction_analysis(memory, current_address, current_address + span, recorder, use_numpy, section_load_address_end)
+        current_address = current_address + span
+        # print percentage if necessary
+        if snippet_count > 120:
+            analyzing_snippet_count += 1
+            percentage = (analyzing_snippet_count / snippet_count) * 100
+            # Print every 5 percent
+            if percentage - last_percentage > 5.0:
+                last_percentage = percentage
+                print(f"{percentage:.2f}%")
+
+    # analysis last snippet
+    if section_load_address_end - current_address >= 4:
+        instruction_analysis(memory, current_address, section_load_address_end, recorder, use_numpy, section_load_address_end)
+
+
+def init_worker_memory(snapshot_path: str, region_info_list_list: List[List[Tuple[int, int, int]]], image_info_list: List[Tuple[int, Tuple[int, int]]]) -> None:
+    global g_worker_memory_list
+    global g_worker_image_info_list
+    g_worker_memory_list = [HMSnapshotMemory(snapshot_path, region_info_list) for region_info_list in region_info_list_list]
+    g_worker_image_info_list = image_info_list
+
+
+def scan_chunk_in_worker(task: Tuple[int, int, int, int, bool]) -> HMReferenceIndex.HMReferenceRecorder:
+    module_index, start_address, end_address, section_end_address, use_numpy = task
+    base_address, image_range = g_worker_image_info_list[module_index]
+    recorder = HMReferenceIndex.HMReferenceRecorder(base_address, image_range)
+    instruction_analysis(g_worker_memory_list[module_index], start_address, end_address, recorder, use_numpy, section_end_address)
+    return recorder
+
+
+def instruction_analysis(memory: HMScanMemory, start_address: int, end_address: int, recorder: HMReferenceIndex.HMReferenceRecorder, use_numpy: bool = False, section_end_address: int = 0) -> None:
+    # The snippet is read together with the instructions analyzed after the last adr/adrp(the look-ahead), but not beyond the end of the section.
+    # So the adr/adrp logic reads the following instructions from the snippet, and only reads the memory again at the end of the section.
+    read_end_address = max(end_address, min(end_address + adrp_look_ahead_size, section_end_address))
+    read_data = memory.read_memory(start_address, read_end_address - start_address)
+    if read_data is None:
+        return
+    data = memoryview(read_data)
+    snippet_size = min(len(data), end_address - start_address)
+    profile = g_scan_profile
+    if profile is not None and profile.is_current_thread():
+        profile.count_instructions(data[:snippet_size & ~0b11])
+    if use_numpy:
+        instruction_analysis_vectorized(memory, data, snippet_size, start_address, recorder)
+        return
+    # Each instruction is converted to an integer once, and classified by its top byte
+    words = data[:snippet_size & ~0b11].cast('I')
+    for index, word in enumerate(words):
+        instruction_class = scan_instruction_class_table[word >> 24]
+        if instruction_class == instruction_class_other:
+            continue
+        i = index * 4
+        if instruction_class == instruction_class_adr:
+            # Record all adr/adrp logic
+            record_adrp_logic(memory, data[i:i+4], start_address + i, recorder, data[i+4:i+4+adrp_look_ahead_size])
+        else:
+            # Record all b/bl logic
+            imm26 = word & 0x3ffffff
+            label = (imm26 - ((imm26 & 0x2000000) << 1)) * 4
+            recorder.record_branch(start_address + i, start_address + i + label)
+
+
+def instruction_analysis_vectorized(memory: HMScanMemory, data: memoryview, snippet_size: int, start_address: int, recorder: HMReferenceIndex.HMReferenceRecorder) -> None:
+    # Classify all instructions of the snippet at once, only the instructions after adr/adrp are analyzed one by one.
+    # The result is the same as the loop in instruction_analysis, because the adr/adrp logic never records a b/bl instruction.
+    words = numpy.frombuffer(data, dtype='<u4', count=snippet_size // 4).astype(numpy.int64)
+    addresses = numpy.arange(len(words), dtype=numpy.int64) * 4 + start_address
+
+    # b/bl: B <label>, BL <label>
+    branch_mask = (words & 0x7c000000) == 0x14000000
+    branch_words = words[branch_mask]
+    imm26 = branch_words & 0x3ffffff
+    labels = (imm26 - ((imm26 & 0x2000000) << 1)) * 4
+    branch_addresses = addresses[branch_mask]
+    recorder.record_vectorized(branch_addresses, branch_addresses + labels, HMReferenceIndex.kind_branch)
+
+    # adr/adrp: ADR <Xd>, <label>, ADRP <Xd>, <label>
+    adr_mask = (words & 0x9f000000) == 0x10000000
+    adrp_mask = (words & 0x9f000000) == 0x90000000
+    adr_or_adrp_mask = adr_mask | adrp_mask
+    adr_words = words[adr_or_adrp_mask]
+    adr_addresses = addresses[adr_or_adrp_mask]
+    rds = adr_words & 0b11111
+    imm21 = (((adr_words >> 5) & 0x7ffff) << 2) | ((adr_words >> 29) & 0b11)
+    offsets = imm21 - ((imm21 & 0x100000) << 1)
+    results = numpy.where(adrp_mask[adr_or_adrp_mask], (adr_addresses & ~0xfff) + offsets * 4096, adr_addresses + offsets)
+    for rd, adrp_result, adrp_address in zip(rds.tolist(), results.tolist(), adr_addresses.tolist()):
+        following_offset = adrp_address - start_address + 4
+        record_adrp_follow_up_logic(memory, rd, adrp_result, adrp_address, recorder, data[following_offset:following_offset + adrp_look_ahead_size])
+
+
+def record_adrp_logic(memory: HMScanMemory, adrp_data: bytes, adrp_instruction_load_address: int, recorder: HMReferenceIndex.HMReferenceRecorder, following_data: Optional[memoryview] = None) -> None:
+    # Calculate the value of adr/adrp instruction
+    adrp_rd, adrp_offset = HMA64Decoder.decode_adr_bytes(adrp_data)
+    if HMA64Decoder.is_adr_bytes(adrp_data):
+        adrp_result = adrp_instruction_load_address + adrp_offset
+    else:
+        adrp_result = HMA64Decoder.calculate_adrp_result(adrp_offset, adrp_instruction_load_address)
+    record_adrp_follow_up_logic(memory, adrp_rd, adrp_result, adrp_instruction_load_address, recorder, following_data)
+
+
+def record_adrp_follow_up_logic(memory: HMScanMemory, adrp_rd: int, adrp_result: int, adrp_instruction_load_address: int, recorder: HMReferenceIndex.HMReferenceRecorder, following_data: Optional[memoryview] = None) -> None:
+    # Analyze the specified instructions after adrp in sequence, and analyze up to 10 instructions.
+    emulator = memory.emulator
+    emulator.reset()
+
+    # Save the value of adr/adrp instruction
+    emulator.set_value(adrp_rd, adrp_result, True)
+
+    profile = g_scan_profile
+    if profile is not None and not profile.is_current_thread():
+        profile = None
+
+    # Analyze the specified instructions after adr/adrp
+    # following_data is the instructions after adr/adrp in the snippet, read the memory if it is incomplete
+    data = following_data
+    if data is None or len(data) < adrp_look_ahead_size:
+        data = memory.read_memory(adrp_instruction_load_address + 4, adrp_look_ahead_size)
+        if data is None:
+            if profile is not None:
+                profile.record_window(0, HMReferenceProfile.stop_reason_unreadable)
+            return
+    kind_value, kind_load, kind_load_signed_word, kind_store = HMA64Emulator.effect_kind_value, HMA64Emulator.effect_kind_load, HMA64Emulator.effect_kind_load_signed_word, HMA64Emulator.effect_kind_store
+    for effect in emulator.run(data, adrp_instruction_load_address + 4):
+        kind = effect.kind
+        if kind == kind_value:
+            recorder.record_adrp(effect.address, effect.value)
+        elif kind == kind_load or kind == kind_load_signed_word:
+            # The ldr instruction records the loading address, and records the result address in memory
+            if effect.value is not None:
+                recorder.record_adrp(effect.address, effect.memory_address)
+                recorder.record_ldr(effect.address, effect.value)
+        elif kind == kind_store:
+            recorder.record_adrp(effect.address, effect.memory_address)
+        if profile is not None:
+            profile.count_follow_up(effect.handler)
+    if profile is not None:
+        if emulator.stop_index == -1:
+            profile.record_window(len(data) // 4, HMReferenceProfile.stop_reason_window_end)
+        else:
+            profile.record_window_stop(emulator.stop_index, emulator.stop_handler)
+
+    # If the next instruction is nop, record the current adr/adrp result
+    next_instruction_data = data[0:4]
+    if HMA64Decoder.is_nop_bytes(next_instruction_data):
+        recorder.record_adrp(adrp_instruction_load_address, adrp_result)
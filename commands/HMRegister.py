@@ -27,6 +27,7 @@ import math
 import optparse
 import shlex
 from typing import Dict, List, Tuple
+import HMA64Decoder
 import HMLLDBClassInfo
 import HMLLDBHelpers as HM
 
@@ -117,14 +118,7 @@ def convert_twos_complement(debugger, command, exe_ctx, result, internal_dict):
 
 
 def twos_complement_to_int(twos_complement: int, bit_width: int) -> int:
-    mask = (1 << bit_width) - 1
-    twos_complement = twos_complement & mask
-    sign_bit_mask = 1 << (bit_width - 1)
-    if twos_complement & sign_bit_mask == 0:
-        result = twos_complement
-    else:
-        result = twos_complement - (1 << bit_width)
-    return result
+    return HMA64Decoder.twos_complement_to_int(twos_complement, bit_width)
 
 
 def int_to_twos_complement(value: int, bit_width: int) -> int:
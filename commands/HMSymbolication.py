@@ -0,0 +1,218 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2024 Huimao Chen
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# https://github.com/chenhuimao/HMLLDB
+
+import lldb
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set, Tuple
+import bisect
+import HMLLDBHelpers as HM
+
+
+# The capacities of the LRU caches
+address_cache_capacity = 8192
+symbol_range_cache_capacity = 4096
+
+
+class HMSymbolicationCache:
+    # Symbolicate addresses with SBTarget.ResolveLoadAddress instead of the "image lookup -a" command.
+    # The summaries have the same format as the "Summary" line of "image lookup -a", such as:
+    # UIKitCore`-[UIControl sendAction:to:forEvent:] + 108
+    # DemoApp`-[ViewController viewDidLoad] + 68 at ViewController.mm:27:6
+    # A cache belongs to a process of a target, see get_symbolication_cache.
+    stop_id: int  # The stop ID of the process when the misses were checked
+    address_cache: OrderedDict  # [address, summary]
+    miss_address_set: Set[int]  # The addresses in address_cache without symbols, they may be resolved after a dlopen
+    # [start_address, (end_address, "module`symbol")], the symbols without debug info, so the summary of any address in the range can be computed
+    symbol_range_cache: OrderedDict
+    symbol_range_start_list: List[int]  # The sorted keys of symbol_range_cache
+
+    def __init__(self):
+        self.stop_id = -1
+        self.address_cache = OrderedDict()
+        self.miss_address_set = set()
+        self.symbol_range_cache = OrderedDict()
+        self.symbol_range_start_list = []
+
+    def check_stop_id(self, stop_id: int) -> None:
+        # Images are only loaded while the process is running, so the misses are dropped once per stop
+        if stop_id == self.stop_id:
+            return
+        for address in self.miss_address_set:
+            self.address_cache.pop(address, None)
+        self.miss_address_set.clear()
+        self.stop_id = stop_id
+
+    def get_summary_list(self, address_list: List[int], target: lldb.SBTarget) -> List[str]:
+        # The addresses are resolved in ascending order, so the adjacent addresses hit the same symbol range
+        summary_dic = {}
+        for address in sorted(set(address_list)):
+            summary_dic[address] = self.get_summary(address, target)
+        return [summary_dic[address] for address in address_list]
+
+    def get_symbol_description_list(self, address_list: List[int], target: lldb.SBTarget) -> List[str]:
+        description_dic = {}
+        for address in sorted(set(address_list)):
+            description_dic[address] = self.get_symbol_description(address, target)
+        return [description_dic[address] for address in address_list]
+
+    def get_summary(self, address: int, target: lldb.SBTarget) -> str:
+        summary = self.address_cache.get(address)
+        if summary is not None:
+            self.address_cache.move_to_end(address)
+            return summary
+
+        summary = self.get_summary_in_symbol_range(address)
+        if summary is None:
+            summary = self.resolve_summary(address, target)
+        self.address_cache[address] = summary
+        if len(self.address_cache) > address_cache_capacity:
+            evicted_address, _ = self.address_cache.popitem(last=False)
+            self.miss_address_set.discard(evicted_address)
+        return summary
+
+    def get_summary_in_symbol_range(self, address: int) -> Optional[str]:
+        symbol_range = self.find_symbol_range(address)
+        if symbol_range is None:
+            return None
+        start_address, symbol_description = symbol_range
+        return get_summary_with_offset(symbol_description, address - start_address)
+
+    def find_symbol_range(self, address: int) -> Optional[Tuple[int, str]]:
+        # Return (start_address, "module`symbol") of the cached symbol range containing the address
+        index = bisect.bisect_right(self.symbol_range_start_list, address) - 1
+        if index < 0:
+            return None
+        start_address = self.symbol_range_start_list[index]
+        end_address, symbol_description = self.symbol_range_cache[start_address]
+        if address >= end_address:
+            return None
+        self.symbol_range_cache.move_to_end(start_address)
+        return start_address, symbol_description
+
+    def add_symbol_range(self, start_address: int, end_address: int, symbol_description: str) -> None:
+        if start_address in self.symbol_range_cache:
+            return
+        self.symbol_range_cache[start_address] = (end_address, symbol_description)
+        bisect.insort(self.symbol_range_start_list, start_address)
+        if len(self.symbol_range_cache) > symbol_range_cache_capacity:
+            evicted_start_address, _ = self.symbol_range_cache.popitem(last=False)
+            del self.symbol_range_start_list[bisect.bisect_left(self.symbol_range_start_list, evicted_start_address)]
+
+    def get_symbol_description(self, address: int, target: lldb.SBTarget) -> str:
+        # Return "module`symbol" of the containing symbol without the offset, used to group addresses by function
+        symbol_range = self.find_symbol_range(address)
+        if symbol_range is not None:
+            return symbol_range[1]
+        symbol_info = self.resolve_symbol(address, target)
+        if symbol_info is None:
+            return self.get_summary(address, target)
+        symbol_description, start_address, end_address, _ = symbol_info
+        if end_address != lldb.LLDB_INVALID_ADDRESS and address < end_address:
+            self.add_symbol_range(start_address, end_address, symbol_description)
+        return symbol_description
+
+    def resolve_symbol(self, address: int, target: lldb.SBTarget) -> Optional[Tuple[str, int, int, lldb.SBAddress]]:
+        # Return ("module`symbol", start_address, end_address, sb_address), or None if there is no symbol
+        sb_address: lldb.SBAddress = target.ResolveLoadAddress(address)
+        module: lldb.SBModule = sb_address.GetModule()
+        function: lldb.SBFunction = sb_address.GetFunction()
+        symbol: lldb.SBSymbol = sb_address.GetSymbol()
+        if not module.IsValid() or not (function.IsValid() or symbol.IsValid()):
+            return None
+
+        if function.IsValid():
+            symbol_name = function.GetName()
+            start_address = function.GetStartAddress().GetLoadAddress(target)
+            end_address = function.GetEndAddress().GetLoadAddress(target)
+        else:
+            symbol_name = symbol.GetName()
+            if symbol.GetType() == lldb.eSymbolTypeTrampoline:
+                symbol_name = f"symbol stub for: {symbol_name}"
+            start_address = symbol.GetStartAddress().GetLoadAddress(target)
+            end_address = symbol.GetEndAddress().GetLoadAddress(target)
+        if start_address == lldb.LLDB_INVALID_ADDRESS or start_address > address:
+            return None
+        return f"{module.GetFileSpec().GetFilename()}`{symbol_name}", start_address, end_address, sb_address
+
+    def resolve_summary(self, address: int, target: lldb.SBTarget) -> str:
+        symbol_info = self.resolve_symbol(address, target)
+        if symbol_info is None:
+            # Addresses without symbols, such as the sections of data
+            self.miss_address_set.add(address)
+            return HM.get_image_lookup_summary_from_address(address, target)
+
+        symbol_description, start_address, end_address, sb_address = symbol_info
+        summary = get_summary_with_offset(symbol_description, address - start_address)
+        line_entry: lldb.SBLineEntry = sb_address.GetLineEntry()
+        if line_entry.IsValid() and line_entry.GetLine() > 0:
+            summary += f" at {line_entry.GetFileSpec().GetFilename()}:{line_entry.GetLine()}"
+            if line_entry.GetColumn() > 0:
+                summary += f":{line_entry.GetColumn()}"
+        elif not sb_address.GetCompileUnit().IsValid() and end_address != lldb.LLDB_INVALID_ADDRESS and address < end_address:
+            # No debug info, every address in the range has the same symbol
+            self.add_symbol_range(start_address, end_address, symbol_description)
+        return summary
+
+
+def get_summary_with_offset(symbol_description: str, offset: int) -> str:
+    if offset == 0:
+        return symbol_description
+    return f"{symbol_description} + {offset}"
+
+
+# [(target index, process unique ID), cache], the process unique ID is 0 if there is no process
+g_symbolication_cache_dic: Dict[Tuple[int, int], HMSymbolicationCache] = {}
+
+
+def get_symbolication_cache(target: lldb.SBTarget) -> HMSymbolicationCache:
+    process = target.GetProcess()
+    is_valid_process = process.IsValid()
+    key = (target.GetDebugger().GetIndexOfTarget(target), process.GetUniqueID() if is_valid_process else 0)
+    cache = g_symbolication_cache_dic.get(key)
+    if cache is None:
+        # Drop the cache of the previous process of the target, the addresses are meaningless after relaunching
+        for old_key in [old_key for old_key in g_symbolication_cache_dic if old_key[0] == key[0]]:
+            del g_symbolication_cache_dic[old_key]
+        cache = HMSymbolicationCache()
+        g_symbolication_cache_dic[key] = cache
+    cache.check_stop_id(process.GetStopID() if is_valid_process else 0)
+    return cache
+
+
+def get_summary(address: int, target: lldb.SBTarget = None) -> str:
+    return get_summary_list([address], target)[0]
+
+
+def get_summary_list(address_list: List[int], target: lldb.SBTarget = None) -> List[str]:
+    # Symbolicate a batch of addresses, the results are in the order of address_list
+    if target is None:
+        target = lldb.debugger.GetSelectedTarget()
+    return get_symbolication_cache(target).get_summary_list(address_list, target)
+
+
+def get_symbol_description_list(address_list: List[int], target: lldb.SBTarget = None) -> List[str]:
+    # The containing symbols("module`symbol") of a batch of addresses, the results are in the order of address_list
+    if target is None:
+        target = lldb.debugger.GetSelectedTarget()
+    return get_symbolication_cache(target).get_symbol_description_list(address_list, target)
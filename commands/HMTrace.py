@@ -27,9 +27,10 @@ from datetime import datetime
 import optparse
 import shlex
 import time
+import HMA64Decoder
 import HMLLDBClassInfo
 import HMLLDBHelpers as HM
-import HMReference
+import HMSymbolication
 
 
 def __lldb_init_module(debugger, internal_dict):
@@ -173,10 +174,10 @@ class TraceFunctionStep:
             else:
                 current_instruction_data = data[0:4]
                 next_instruction_data = data[4:8]
-                if HMReference.is_stlxr_bytes(current_instruction_data) or HMReference.is_stxr_bytes(current_instruction_data):
-                    if HMReference.is_ret_bytes(next_instruction_data):
+                if HMA64Decoder.is_stlxr_bytes(current_instruction_data) or HMA64Decoder.is_stxr_bytes(current_instruction_data):
+                    if HMA64Decoder.is_ret_bytes(next_instruction_data):
                         return False
-                    elif HMReference.is_cbnz_bytes(next_instruction_data):
+                    elif HMA64Decoder.is_cbnz_bytes(next_instruction_data):
                         HM.DPrint("Skipping special atomic sequences!")
                         self.will_stop = True
                         bp = target.BreakpointCreateByAddress(pc_address_value + 8)
@@ -340,10 +341,10 @@ class TraceInstructionStep:
             else:
                 current_instruction_data = data[0:4]
                 next_instruction_data = data[4:8]
-                if HMReference.is_stlxr_bytes(current_instruction_data) or HMReference.is_stxr_bytes(current_instruction_data):
-                    if HMReference.is_ret_bytes(next_instruction_data):
+                if HMA64Decoder.is_stlxr_bytes(current_instruction_data) or HMA64Decoder.is_stxr_bytes(current_instruction_data):
+                    if HMA64Decoder.is_ret_bytes(next_instruction_data):
                         return False
-                    elif HMReference.is_cbnz_bytes(next_instruction_data):
+                    elif HMA64Decoder.is_cbnz_bytes(next_instruction_data):
                         HM.DPrint("Skipping special atomic sequences!")
                         self.will_stop = True
                         bp = target.BreakpointCreateByAddress(pc_address_value + 8)
@@ -428,8 +429,8 @@ def trace_step_over_instruction(debugger, command, exe_ctx, result, internal_dic
             else:
                 current_instruction_data = data[0:4]
                 next_instruction_data = data[4:8]
-                if HMReference.is_stlxr_bytes(current_instruction_data) or HMReference.is_stxr_bytes(current_instruction_data):
-                    if not HMReference.is_ret_bytes(next_instruction_data):
+                if HMA64Decoder.is_stlxr_bytes(current_instruction_data) or HMA64Decoder.is_stxr_bytes(current_instruction_data):
+                    if not HMA64Decoder.is_ret_bytes(next_instruction_data):
                         has_atomic_sequences = True
                         break
 
@@ -505,8 +506,9 @@ def complete_backtrace(debugger, command, exe_ctx, result, internal_dict):
     general_purpose_registers: lldb.SBValue = current_registers.GetFirstValueByName("General Purpose Registers")
 
     # print pc register information
+    target = exe_ctx.GetTarget()
     pc_value_int = general_purpose_registers.GetChildMemberWithName('pc').GetValueAsUnsigned()
-    first_lr_desc = HM.get_image_lookup_summary_from_address(pc_value_int)
+    first_lr_desc = HMSymbolication.get_summary(pc_value_int, target)
     frame_count = 0
     print(f"\tframe #{frame_count}:\t{hex(pc_value_int)}\t{first_lr_desc}")
     frame_count += 1
@@ -515,7 +517,7 @@ def complete_backtrace(debugger, command, exe_ctx, result, internal_dict):
     process = exe_ctx.GetProcess()
     lr_value_int = general_purpose_registers.GetChildMemberWithName('lr').GetValueAsUnsigned()
     lr_value_int = HM.strip_pac_sign_address(lr_value_int, process)
-    first_lr_desc = HM.get_image_lookup_summary_from_address(lr_value_int)
+    first_lr_desc = HMSymbolication.get_summary(lr_value_int, target)
     print(f"\tframe #{frame_count}:\t{hex(lr_value_int)}\t{first_lr_desc}")
     frame_count += 1
 
@@ -528,7 +530,7 @@ def complete_backtrace(debugger, command, exe_ctx, result, internal_dict):
             HM.DPrint(f"load address value: Invalid result: {hex(current_fp_value_int + 8)}")
             break
         current_lr_value_int = HM.strip_pac_sign_address(current_lr_value_int, process)
-        current_lr_desc = HM.get_image_lookup_summary_from_address(current_lr_value_int)
+        current_lr_desc = HMSymbolication.get_summary(current_lr_value_int, target)
         print(f"\tframe #{frame_count}:\t{hex(current_lr_value_int)}\t{current_lr_desc}")
         frame_count += 1
         current_fp_value_int = previous_fp_value_int